@@ -9,13 +9,13 @@ import io
 import json
 import os
 import sqlite3
-from contextlib import closing
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 import time
 from pathlib import Path
-from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Tuple
 
-from flask import Flask, jsonify, render_template, request, send_from_directory, redirect, url_for, make_response, session, send_file
+from flask import Flask, jsonify, render_template, request, send_from_directory, redirect, url_for, make_response, session, send_file, g
 from flask_login import (
     LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 )
@@ -31,6 +31,16 @@ import pyotp
 import qrcode
 import base64
 import queue
+import multiprocessing
+import ctypes
+import errno
+import select
+import struct
+import sys
+import itertools
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait as futures_wait
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
 try:
     # Enable HEIC/HEIF support via pillow-heif if available
     from pillow_heif import register_heif_opener, HeifFile  # type: ignore
@@ -57,6 +67,7 @@ CONVERT_DIR = DATA_DIR / "converted"
 UPLOAD_DIR = DATA_DIR / "uploads"
 TUS_TMP_DIR = DATA_DIR / "tus_uploads"
 DB_PATH = DATA_DIR / "fjordlens.db"
+ANN_INDEX_PATH = DATA_DIR / "ann_ivf.npz"
 AI_URL = os.environ.get("AI_URL", "http://localhost:8001").rstrip("/")
 SHARE_DUCKDNS_BASE_URL = str(os.environ.get("SHARE_DUCKDNS_BASE_URL", "")).strip()
 AI_ENV_ENABLED_DEFAULT = (os.environ.get("AI_ENABLED", "1") not in {"0", "false", "False"})
@@ -129,6 +140,68 @@ VIDEO_FACE_SAMPLE_START_SEC = float(os.environ.get("VIDEO_FACE_SAMPLE_START_SEC"
 VIDEO_FACE_DEDUPE_THRESHOLD = float(os.environ.get("VIDEO_FACE_DEDUPE_THRESHOLD", "0.92"))
 AI_INGEST_THROTTLE_SEC = max(0.0, float(os.environ.get("AI_INGEST_THROTTLE_SEC", "0.04")))
 FACES_INDEX_THROTTLE_SEC = max(0.0, float(os.environ.get("FACES_INDEX_THROTTLE_SEC", "0.06")))
+# How often (seconds) the in-memory embedding index replays embedding changes written by other workers
+EMBED_INDEX_RECHECK_SEC = max(0.0, float(os.environ.get("EMBED_INDEX_RECHECK_SEC", "30")))
+# Model tags stored next to binary (float32) embeddings so vectors from different models are never mixed
+CLIP_EMBED_MODEL_TAG = f'{os.environ.get("CLIP_MODEL", "ViT-B-32")}/{os.environ.get("CLIP_PRETRAINED", "openai")}'
+FACE_EMBED_MODEL_TAG = os.environ.get("FACE_EMBED_MODEL", "insightface/buffalo_l")
+EMBED_BACKFILL_BATCH = 500
+# Optional IVF (inverted file) index for CLIP search on very large libraries.
+# nlist = number of coarse clusters (0 = auto, ~4*sqrt(rows)); nprobe = clusters scanned per query
+# (higher = better recall, slower). Below AI_ANN_MIN_ROWS exact search is used regardless.
+AI_ANN_ENABLED = os.environ.get("AI_ANN_ENABLED", "0") in {"1", "true", "True"}
+AI_ANN_NLIST = max(0, int(os.environ.get("AI_ANN_NLIST", "0")))
+AI_ANN_NPROBE = max(1, int(os.environ.get("AI_ANN_NPROBE", "16")))
+AI_ANN_MIN_ROWS = max(0, int(os.environ.get("AI_ANN_MIN_ROWS", "50000")))
+AI_ANN_TRAIN_ITERS = max(1, int(os.environ.get("AI_ANN_TRAIN_ITERS", "10")))
+# SQLite connection tuning (applied to every new connection; journal_mode=WAL is set in init_db)
+SQLITE_CACHE_SIZE_KB = max(0, int(os.environ.get("SQLITE_CACHE_SIZE_KB", "65536")))
+SQLITE_MMAP_SIZE = max(0, int(os.environ.get("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))))
+# Idle connections kept per thread by db_conn(), and the hold time that gets logged as slow
+DB_POOL_IDLE_PER_THREAD = max(1, int(os.environ.get("DB_POOL_IDLE_PER_THREAD", "4")))
+DB_SLOW_HOLD_SEC = max(0.0, float(os.environ.get("DB_SLOW_HOLD_SEC", "5.0")))
+# Library scan pipeline: worker processes for decode/thumbnail/hash (0 or 1 = inline),
+# and how many rows / seconds the single writer thread batches per transaction
+SCAN_WORKERS = max(0, int(os.environ.get("SCAN_WORKERS", str(min(4, os.cpu_count() or 1)))))
+SCAN_WRITE_BATCH = max(1, int(os.environ.get("SCAN_WRITE_BATCH", "200")))
+SCAN_WRITE_FLUSH_SEC = max(0.1, float(os.environ.get("SCAN_WRITE_FLUSH_SEC", "2.0")))
+# Full-file SHA-256 is filled in by a throttled background job (pause per file),
+# started after each scan unless CHECKSUM_BACKFILL_AUTO=0
+CHECKSUM_BACKFILL_AUTO = os.environ.get("CHECKSUM_BACKFILL_AUTO", "1").strip().lower() in {"1", "true", "yes", "on"}
+CHECKSUM_THROTTLE_SEC = max(0.0, float(os.environ.get("CHECKSUM_THROTTLE_SEC", "0.05")))
+# Embedding duplicate mode: CLIP cosine for "similar" groups, and bursts = photos taken within
+# DUPES_BURST_SECONDS of each other with cosine >= DUPES_BURST_SIMILARITY. The self-join scores
+# DUPES_EMBED_TILE x DUPES_EMBED_TILE blocks at a time (4 bytes per cell).
+DUPES_SIMILARITY = min(1.0, max(0.5, float(os.environ.get("DUPES_SIMILARITY", "0.95"))))
+DUPES_BURST_SIMILARITY = min(1.0, max(0.5, float(os.environ.get("DUPES_BURST_SIMILARITY", "0.80"))))
+DUPES_BURST_SECONDS = max(0, int(os.environ.get("DUPES_BURST_SECONDS", "10")))
+DUPES_EMBED_TILE = max(64, int(os.environ.get("DUPES_EMBED_TILE", "2048")))
+# Persistent work queue for AI embeddings/descriptions/faces and upload post-processing.
+# WORK_QUEUE_WORKER=embedded runs a queue worker thread in every web process; =external
+# leaves the queue to `python worker.py`. Tasks are leased for WORK_LEASE_SEC (renewed while
+# running) and retried with exponential backoff (WORK_RETRY_BASE_SEC, doubling) up to
+# WORK_MAX_ATTEMPTS times; finished rows are kept for WORK_KEEP_DONE_SEC.
+WORK_QUEUE_WORKER = (os.environ.get("WORK_QUEUE_WORKER", "embedded").strip().lower() or "embedded")
+WORK_LEASE_SEC = max(15.0, float(os.environ.get("WORK_LEASE_SEC", "300")))
+WORK_MAX_ATTEMPTS = max(1, int(os.environ.get("WORK_MAX_ATTEMPTS", "5")))
+WORK_RETRY_BASE_SEC = max(1.0, float(os.environ.get("WORK_RETRY_BASE_SEC", "30")))
+WORK_KEEP_DONE_SEC = max(0, int(os.environ.get("WORK_KEEP_DONE_SEC", str(7 * 86400))))
+# WORK_CONCURRENCY_<KIND> caps how many tasks of that kind run at once across all web and
+# worker processes (enforced when a task is claimed); anything beyond that waits in work_queue.
+WORK_CONCURRENCY = {
+    kind: max(1, int(os.environ.get(f"WORK_CONCURRENCY_{kind.upper()}", str(default))))
+    for kind, default in (("embed", 2), ("describe", 1), ("faces", 1), ("postprocess", 1), ("fts", 1))
+}
+# Optional library watcher: inotify on local filesystems, polling of directory mtimes
+# otherwise (WATCH_MODE=auto|inotify|poll); events are indexed after a quiet period
+WATCH_ENABLE = os.environ.get("WATCH_ENABLE", "0").strip().lower() in {"1", "true", "yes", "on"}
+WATCH_MODE = (os.environ.get("WATCH_MODE", "auto").strip().lower() or "auto")
+WATCH_DEBOUNCE_SEC = max(0.2, float(os.environ.get("WATCH_DEBOUNCE_SEC", "3.0")))
+WATCH_POLL_SEC = max(5.0, float(os.environ.get("WATCH_POLL_SEC", "60")))
+# How often (seconds) the in-process settings cache checks the DB generation counter
+SETTINGS_CACHE_RECHECK_SEC = max(0.0, float(os.environ.get("SETTINGS_CACHE_RECHECK_SEC", "2")))
+# /api/photos paging: upper bound for ?limit= (requests without limit still get the full list)
+PHOTOS_PAGE_MAX_LIMIT = max(1, int(os.environ.get("PHOTOS_PAGE_MAX_LIMIT", "1000")))
 
 RAW_EXTS = {".dng", ".cr2", ".cr3", ".nef", ".arw", ".rw2", ".raf", ".orf", ".srw", ".pef"}
 IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp", ".bmp", ".gif", ".heic", ".heif"} | RAW_EXTS
@@ -428,10 +501,6 @@ scan_stop_event = threading.Event()
 from collections import deque
 LOG_BUFFER: deque[Dict[str, Any]] = deque(maxlen=1000)
 LOG_SEQ: int = 0
-UPLOAD_PENDING_BY_USER: Dict[str, list[str]] = {}
-UPLOAD_PENDING_LOCK = threading.Lock()
-UPLOAD_POSTPROCESS_BY_USER: Dict[str, Dict[str, Any]] = {}
-UPLOAD_POSTPROCESS_LOCK = threading.Lock()
 
 
 def log_event(event: str, **data: Any) -> None:
@@ -674,6 +743,222 @@ def _ai_detect_faces_video_path(path: Path, rel_path: str) -> list[Dict[str, Any
     return unique_faces
 
 
+def _embedding_to_blob(vec: Any) -> Optional[bytes]:
+    """Pack a vector as raw little-endian float32 bytes for the BLOB embedding columns."""
+    try:
+        arr = np.asarray(vec, dtype="<f4").reshape(-1)
+    except Exception:
+        return None
+    if arr.size == 0:
+        return None
+    return arr.tobytes()
+
+
+def _embedding_from_blob(blob: Any) -> Optional[np.ndarray]:
+    if not blob:
+        return None
+    try:
+        arr = np.frombuffer(blob, dtype="<f4")
+    except Exception:
+        return None
+    return arr if arr.size else None
+
+
+def _row_embedding(row: sqlite3.Row, blob_key: str = "embedding", json_key: str = "embedding_json") -> Optional[np.ndarray]:
+    """Vector from a row's BLOB column, falling back to the legacy JSON text column."""
+    keys = row.keys()
+    if blob_key in keys:
+        arr = _embedding_from_blob(row[blob_key])
+        if arr is not None:
+            return arr
+    if json_key in keys and row[json_key]:
+        try:
+            arr = np.asarray(json.loads(row[json_key]), dtype=np.float32).reshape(-1)
+            return arr if arr.size else None
+        except Exception:
+            return None
+    return None
+
+
+# --- Faces: cached match matrices ---
+# Normalized person centroids and face embeddings kept in memory so matching a new face is
+# two matrix-vector products instead of decoding every row. Inserts and centroid updates are
+# applied in place; bulk reassignments/deletes just invalidate and the next match reloads.
+_FACE_CACHE_LOCK = threading.RLock()
+_FACE_CACHE: Optional[Dict[str, Any]] = None
+
+
+def _face_cache_invalidate() -> None:
+    global _FACE_CACHE
+    with _FACE_CACHE_LOCK:
+        _FACE_CACHE = None
+
+
+def _face_cache_signature(conn: sqlite3.Connection) -> tuple:
+    f = conn.execute("SELECT COUNT(*) AS c, MAX(id) AS m FROM faces").fetchone()
+    p = conn.execute("SELECT COUNT(*) AS c, MAX(id) AS m FROM people").fetchone()
+    return (int(f["c"] or 0), int(f["m"] or 0), int(p["c"] or 0), int(p["m"] or 0))
+
+
+def _face_cache_load_locked(conn: sqlite3.Connection) -> Dict[str, Any]:
+    global _FACE_CACHE
+    dim = 0
+    fids: list[int] = []
+    fpids: list[int] = []
+    fvecs: list[np.ndarray] = []
+    for r in conn.execute("SELECT id, person_id, embedding FROM faces WHERE embedding IS NOT NULL"):
+        v = _normalize_embedding(_embedding_from_blob(r["embedding"]))
+        if v is None:
+            continue
+        if not dim:
+            dim = int(v.size)
+        if int(v.size) != dim:
+            continue
+        fids.append(int(r["id"]))
+        fpids.append(int(r["person_id"]) if r["person_id"] is not None else -1)
+        fvecs.append(v)
+    cpids: list[int] = []
+    cvecs: list[np.ndarray] = []
+    for r in conn.execute("SELECT id, centroid FROM people WHERE centroid IS NOT NULL"):
+        v = _normalize_embedding(_embedding_from_blob(r["centroid"]))
+        if v is None:
+            continue
+        if not dim:
+            dim = int(v.size)
+        if int(v.size) != dim:
+            continue
+        cpids.append(int(r["id"]))
+        cvecs.append(v)
+    n = len(fids)
+    cap = max(256, n + n // 4)
+    face_mat = np.zeros((cap, dim or 1), dtype=np.float32)
+    if n:
+        face_mat[:n] = np.stack(fvecs)
+    face_pids = np.full(cap, -1, dtype=np.int64)
+    face_pids[:n] = fpids
+    _FACE_CACHE = {
+        "dim": dim,
+        "face_mat": face_mat,
+        "face_pids": face_pids,
+        "face_pos": {fid: i for i, fid in enumerate(fids)},
+        "face_ids": fids,
+        "n": n,
+        "cent_mat": np.stack(cvecs) if cvecs else np.zeros((0, dim or 1), dtype=np.float32),
+        "cent_pids": np.asarray(cpids, dtype=np.int64),
+        "sig": _face_cache_signature(conn),
+        "checked_at": time.time(),
+    }
+    return _FACE_CACHE
+
+
+def _face_cache_get_locked(conn: sqlite3.Connection) -> Dict[str, Any]:
+    cache = _FACE_CACHE
+    if cache is None:
+        return _face_cache_load_locked(conn)
+    # Other workers index faces too; reload when the table signature drifts
+    now = time.time()
+    if EMBED_INDEX_RECHECK_SEC and (now - cache["checked_at"]) >= EMBED_INDEX_RECHECK_SEC:
+        cache["checked_at"] = now
+        if _face_cache_signature(conn) != cache["sig"]:
+            return _face_cache_load_locked(conn)
+    return cache
+
+
+def _face_cache_add_face(conn: sqlite3.Connection, face_id: int, person_id: Optional[int], emb: Any) -> None:
+    with _FACE_CACHE_LOCK:
+        cache = _FACE_CACHE
+        if cache is None:
+            return
+        v = _normalize_embedding(emb)
+        if v is None:
+            return
+        if not cache["dim"]:
+            cache["dim"] = int(v.size)
+            cache["face_mat"] = np.zeros((cache["face_mat"].shape[0], v.size), dtype=np.float32)
+            cache["cent_mat"] = np.zeros((0, v.size), dtype=np.float32)
+        if int(v.size) != cache["dim"]:
+            _face_cache_invalidate()
+            return
+        n = cache["n"]
+        if n >= cache["face_mat"].shape[0]:
+            cap = cache["face_mat"].shape[0] * 2
+            mat = np.zeros((cap, cache["dim"]), dtype=np.float32)
+            mat[:n] = cache["face_mat"][:n]
+            pids = np.full(cap, -1, dtype=np.int64)
+            pids[:n] = cache["face_pids"][:n]
+            cache["face_mat"], cache["face_pids"] = mat, pids
+        cache["face_mat"][n] = v
+        cache["face_pids"][n] = int(person_id) if person_id is not None else -1
+        cache["face_pos"][int(face_id)] = n
+        cache["face_ids"].append(int(face_id))
+        cache["n"] = n + 1
+        cache["sig"] = _face_cache_signature(conn)
+
+
+def _face_cache_remove_faces(conn: sqlite3.Connection, face_ids: Iterable[int]) -> None:
+    with _FACE_CACHE_LOCK:
+        cache = _FACE_CACHE
+        if cache is None:
+            return
+        for fid in face_ids or []:
+            pos = cache["face_pos"].pop(int(fid), None)
+            if pos is None:
+                continue
+            last = cache["n"] - 1
+            if pos != last:
+                moved = cache["face_ids"][last]
+                cache["face_mat"][pos] = cache["face_mat"][last]
+                cache["face_pids"][pos] = cache["face_pids"][last]
+                cache["face_ids"][pos] = moved
+                cache["face_pos"][moved] = pos
+            cache["face_ids"].pop()
+            cache["n"] = last
+        cache["sig"] = _face_cache_signature(conn)
+
+
+def _face_cache_set_centroid(conn: sqlite3.Connection, person_id: int, centroid: Optional[np.ndarray]) -> None:
+    with _FACE_CACHE_LOCK:
+        cache = _FACE_CACHE
+        if cache is None:
+            return
+        keep = cache["cent_pids"] != int(person_id)
+        mat = cache["cent_mat"][keep]
+        pids = cache["cent_pids"][keep]
+        v = _normalize_embedding(centroid)
+        if v is not None:
+            if cache["dim"] and int(v.size) != cache["dim"]:
+                _face_cache_invalidate()
+                return
+            mat = np.vstack([mat.reshape(-1, v.size), v[None, :]])
+            pids = np.append(pids, int(person_id))
+        cache["cent_mat"], cache["cent_pids"] = mat, pids
+        cache["sig"] = _face_cache_signature(conn)
+
+
+def _face_cache_match(conn: sqlite3.Connection, emb: Any) -> tuple[Optional[int], float, Optional[int], float]:
+    """Return (centroid_pid, centroid_score, nearest_face_pid, nearest_face_score)."""
+    q = _normalize_embedding(emb)
+    if q is None:
+        return None, -1.0, None, -1.0
+    with _FACE_CACHE_LOCK:
+        cache = _face_cache_get_locked(conn)
+        if cache["dim"] and int(q.size) != cache["dim"]:
+            return None, -1.0, None, -1.0
+        c_pid, c_score = None, -1.0
+        if cache["cent_pids"].size:
+            sc = cache["cent_mat"] @ q
+            i = int(np.argmax(sc))
+            c_pid, c_score = int(cache["cent_pids"][i]), float(sc[i])
+        f_pid, f_score = None, -1.0
+        n = cache["n"]
+        if n:
+            sc = cache["face_mat"][:n] @ q
+            i = int(np.argmax(sc))
+            pid = int(cache["face_pids"][i])
+            f_pid, f_score = (pid if pid >= 0 else None), float(sc[i])
+    return c_pid, c_score, f_pid, f_score
+
+
 def _find_or_create_person_id(conn: sqlite3.Connection, emb: list[float]) -> tuple[int, bool, float]:
     """Return (person_id, created_new, score).
     1) Try matching against person centroids (if available)
@@ -681,47 +966,16 @@ def _find_or_create_person_id(conn: sqlite3.Connection, emb: list[float]) -> tup
     3) If below threshold, create new 'Ukendt-*' person
     """
     # 1) Try person centroids first (fewer comparisons; reflects prior merges = training)
-    best_pid: Optional[int] = None
-    best_score = -1.0
     try:
-        rows = conn.execute("SELECT id, centroid_json FROM people WHERE centroid_json IS NOT NULL AND TRIM(centroid_json) != ''").fetchall()
-        for row in rows:
-            try:
-                cvec = json.loads(row["centroid_json"]) if row["centroid_json"] else None
-            except Exception:
-                cvec = None
-            if not cvec:
-                continue
-            sc = _cosine(emb, cvec)
-            if sc > best_score:
-                best_score = sc
-                best_pid = int(row["id"]) if row["id"] is not None else None
+        best_pid, best_score, face_pid, face_score = _face_cache_match(conn, emb)
     except Exception:
-        pass
+        best_pid, best_score, face_pid, face_score = None, -1.0, None, -1.0
 
     if best_pid is not None and best_score >= FACE_MATCH_THRESHOLD_CENTROID:
         return int(best_pid), False, float(best_score)
 
     # 2) Fallback: nearest neighbor among all face embeddings
-    best_pid = None
-    best_score = -1.0
-    try:
-        rows = conn.execute("SELECT embedding_json, person_id FROM faces WHERE embedding_json IS NOT NULL").fetchall()
-        for row in rows:
-            try:
-                vec = json.loads(row["embedding_json"]) if row["embedding_json"] else None
-            except Exception:
-                vec = None
-            if not vec:
-                continue
-            sc = _cosine(emb, vec)
-            if sc > best_score:
-                best_score = sc
-                best_pid = row["person_id"]
-    except Exception:
-        best_pid = None
-        best_score = -1.0
-
+    best_pid, best_score = face_pid, face_score
     if best_pid is not None and best_score >= FACE_MATCH_THRESHOLD:
         return int(best_pid), False, float(best_score)
 
@@ -740,71 +994,63 @@ def _find_or_create_person_id(conn: sqlite3.Connection, emb: list[float]) -> tup
             i += 1
 
 
-def _compute_centroid(vectors: list[list[float]]) -> Optional[list[float]]:
+def _compute_centroid(vectors: list[np.ndarray]) -> Optional[np.ndarray]:
     try:
         if not vectors:
             return None
-        L = max((len(v) for v in vectors if isinstance(v, list)), default=0)
+        L = max((int(v.size) for v in vectors), default=0)
         if L <= 0:
             return None
-        acc = [0.0] * L
-        n = 0
-        for v in vectors:
-            if not isinstance(v, list) or len(v) != L:
-                continue
-            for i, x in enumerate(v):
-                acc[i] += float(x or 0.0)
-            n += 1
-        if n <= 0:
+        same = [v for v in vectors if int(v.size) == L]
+        if not same:
             return None
-        return [x / float(n) for x in acc]
+        return np.mean(np.stack(same), axis=0).astype(np.float32)
     except Exception:
         return None
 
 
 def _recompute_person_centroid(conn: sqlite3.Connection, pid: int) -> dict:
-    """Recompute centroid from all face embeddings for a given person and store on people.centroid_json."""
+    """Recompute centroid from all face embeddings for a given person and store on people.centroid."""
     try:
-        rows = conn.execute("SELECT embedding_json FROM faces WHERE person_id=? AND embedding_json IS NOT NULL", (pid,)).fetchall()
-        vecs: list[list[float]] = []
+        rows = conn.execute("SELECT embedding FROM faces WHERE person_id=? AND embedding IS NOT NULL", (pid,)).fetchall()
+        vecs: list[np.ndarray] = []
         for r in rows:
-            try:
-                v = json.loads(r["embedding_json"]) if r["embedding_json"] else None
-            except Exception:
-                v = None
-            if isinstance(v, list) and v:
-                vecs.append([float(x or 0.0) for x in v])
+            v = _row_embedding(r)
+            if v is not None:
+                vecs.append(v)
         centroid = _compute_centroid(vecs)
         if centroid is None:
-            conn.execute("UPDATE people SET centroid_json=NULL WHERE id=?", (pid,))
+            conn.execute("UPDATE people SET centroid=NULL, centroid_dim=NULL, centroid_json=NULL WHERE id=?", (pid,))
             conn.commit()
+            _face_cache_set_centroid(conn, pid, None)
             return {"ok": True, "id": pid, "faces": 0, "updated": False}
-        conn.execute("UPDATE people SET centroid_json=? WHERE id=?", (json.dumps(centroid), pid))
+        conn.execute(
+            "UPDATE people SET centroid=?, centroid_dim=?, centroid_json=NULL WHERE id=?",
+            (_embedding_to_blob(centroid), int(centroid.size), pid),
+        )
         conn.commit()
+        _face_cache_set_centroid(conn, pid, centroid)
         return {"ok": True, "id": pid, "faces": len(vecs), "updated": True}
     except Exception as e:
         return {"ok": False, "error": str(e)}
 
-def _load_person_centroids(conn: sqlite3.Connection) -> list[tuple[int, list[float]]]:
+def _load_person_centroids(conn: sqlite3.Connection) -> list[tuple[int, np.ndarray]]:
     """Return list of (person_id, centroid_vec). Recompute missing on the fly."""
-    out: list[tuple[int, list[float]]] = []
+    out: list[tuple[int, np.ndarray]] = []
     try:
-        rows = conn.execute("SELECT id, centroid_json FROM people").fetchall()
+        rows = conn.execute("SELECT id, centroid FROM people").fetchall()
         for r in rows:
             pid = int(r["id"]) if r and r["id"] is not None else None
             if pid is None:
                 continue
-            try:
-                c = json.loads(r["centroid_json"]) if r["centroid_json"] else None
-            except Exception:
-                c = None
-            if not (isinstance(c, list) and c):
+            c = _row_embedding(r, "centroid", "centroid_json")
+            if c is None:
                 # Recompute on demand
                 res = _recompute_person_centroid(conn, pid)
                 if res.get("ok") and res.get("updated"):
-                    c = json.loads(conn.execute("SELECT centroid_json FROM people WHERE id=?", (pid,)).fetchone()["centroid_json"])  # type: ignore[index]
-            if isinstance(c, list) and c:
-                out.append((pid, [float(x or 0.0) for x in c]))
+                    c = _row_embedding(conn.execute("SELECT centroid FROM people WHERE id=?", (pid,)).fetchone(), "centroid")  # type: ignore[arg-type]
+            if c is not None:
+                out.append((pid, c))
     except Exception:
         pass
     return out
@@ -824,15 +1070,17 @@ def index_faces_for_photo(rel_path: str) -> int:
         else:
             faces = _ai_detect_faces_path(disk_path) or []
             log_event("faces_detect", rel_path=rel_path, media="image", count=len(faces))
-        with closing(get_conn()) as conn:
+        with db_conn() as conn:
             row = conn.execute("SELECT id, metadata_json FROM photos WHERE rel_path=?", (rel_path,)).fetchone()
             if not row:
                 return 0
             photo_id = int(row["id"])
             # Clear previous faces for this photo (re-index)
             try:
+                old_face_ids = [int(r["id"]) for r in conn.execute("SELECT id FROM faces WHERE photo_id=?", (photo_id,)).fetchall()]
                 conn.execute("DELETE FROM faces WHERE photo_id=?", (photo_id,))
                 conn.commit()
+                _face_cache_remove_faces(conn, old_face_ids)
             except Exception:
                 pass
             count = 0
@@ -859,21 +1107,25 @@ def index_faces_for_photo(rel_path: str) -> int:
                 except Exception:
                     pid, created, score = (None, False, -1.0)
                 try:
-                    conn.execute(
+                    cur = conn.execute(
                         """
-                        INSERT INTO faces(photo_id, person_id, bbox_x, bbox_y, bbox_w, bbox_h, embedding_json, confidence, created_at)
-                        VALUES (?,?,?,?,?,?,?,?,?)
+                        INSERT INTO faces(photo_id, person_id, bbox_x, bbox_y, bbox_w, bbox_h, embedding, embedding_dim, embedding_model, confidence, created_at)
+                        VALUES (?,?,?,?,?,?,?,?,?,?,?)
                         """,
                         (
                             photo_id,
                             pid,
                             bx, by, bw, bh,
-                            json.dumps(emb, ensure_ascii=False),
+                            _embedding_to_blob(emb),
+                            len(emb) if emb else None,
+                            FACE_EMBED_MODEL_TAG if emb else None,
                             float(fc.get("confidence") or 1.0),
                             now_iso(),
                         ),
                     )
                     count += 1
+                    if emb and cur.lastrowid is not None:
+                        _face_cache_add_face(conn, int(cur.lastrowid), pid, emb)
                     log_event(
                         "face_saved",
                         rel_path=rel_path,
@@ -1144,7 +1396,7 @@ def _row_to_user(row: sqlite3.Row) -> Optional[User]:
 @login_manager.user_loader
 def load_user(user_id: str) -> Optional[User]:
     try:
-        with closing(get_conn()) as conn:
+        with db_conn() as conn:
             row = conn.execute(
                 "SELECT id, username, is_admin, role, ui_language, search_language FROM users WHERE id = ?",
                 (user_id,),
@@ -1155,7 +1407,7 @@ def load_user(user_id: str) -> Optional[User]:
 
 
 def users_count() -> int:
-    with closing(get_conn()) as conn:
+    with db_conn() as conn:
         row = conn.execute("SELECT COUNT(*) AS c FROM users").fetchone()
         return int(row["c"]) if row else 0
 
@@ -1178,85 +1430,73 @@ def ensure_dirs() -> None:
 # Startup initialization is deferred to usage sites (e.g., first upload).
 
 
+# Uploaded files wait as one queued "postprocess" task per user (rel_paths in its
+# payload); the running task absorbs files queued meanwhile into its own payload and
+# keeps its progress in the task row, so any process can report it.
+def _upload_postprocess_key(uploaded_by: str) -> str:
+    return f"postprocess:{str(uploaded_by or '').strip() or '__unknown__'}"
+
+
 def _queue_uploaded_rel(uploaded_by: str, rel_path: str) -> None:
     user = str(uploaded_by or "").strip() or "__unknown__"
     rel = str(rel_path or "").strip()
     if not rel:
         return
-    with UPLOAD_PENDING_LOCK:
-        bucket = UPLOAD_PENDING_BY_USER.setdefault(user, [])
-        bucket.append(rel)
+    _work_append("postprocess", _upload_postprocess_key(user), {"uploaded_by": user}, "rel_paths", [rel], WORK_PRIORITY_UPLOAD)
 
 
-def _is_upload_postprocess_running(uploaded_by: str) -> bool:
-    user = str(uploaded_by or "").strip() or "__unknown__"
-    with UPLOAD_POSTPROCESS_LOCK:
-        st = UPLOAD_POSTPROCESS_BY_USER.get(user) or {}
-        return bool(st.get("running"))
+def _upload_pending_count(uploaded_by: str) -> int:
+    with db_conn() as conn:
+        row = conn.execute(
+            "SELECT payload FROM work_queue WHERE task_key=? AND state='queued'", (_upload_postprocess_key(uploaded_by),)
+        ).fetchone()
+    return len(json.loads(row["payload"] or "{}").get("rel_paths") or []) if row else 0
 
 
-def _ensure_upload_postprocess_running(uploaded_by: str) -> bool:
-    """Start per-user upload postprocess worker if it is not already running."""
-    user = str(uploaded_by or "").strip() or "__unknown__"
-    with UPLOAD_POSTPROCESS_LOCK:
-        st = dict(UPLOAD_POSTPROCESS_BY_USER.get(user) or {})
-        if bool(st.get("running")):
-            return False
-        st.update(
-            {
-                "running": True,
-                "started_at": now_iso(),
-                "finished_at": None,
-                "error": None,
-                "result": None,
-                "phase": "starting",
-                "current_rel": None,
-                "stage_processed": 0,
-                "stage_total": 0,
-            }
-        )
-        UPLOAD_POSTPROCESS_BY_USER[user] = st
+def _is_upload_postprocess_running(uploaded_by: str) -> bool:
+    with db_conn() as conn:
+        row = conn.execute(
+            "SELECT 1 FROM work_queue WHERE task_key=? AND state='running' LIMIT 1", (_upload_postprocess_key(uploaded_by),)
+        ).fetchone()
+    return row is not None
 
-    rels = _pop_uploaded_rels(user)
-    if not rels:
-        _set_upload_postprocess_state(
-            user,
-            {
-                "running": False,
-                "phase": "idle",
-                "finished_at": now_iso(),
-            },
-        )
-        return False
 
-    try:
-        threading.Thread(target=_upload_postprocess_worker, args=(user, rels), daemon=True).start()
-        return True
-    except Exception as e:
-        _set_upload_postprocess_state(
-            user,
-            {
-                "running": False,
-                "phase": "error",
-                "error": f"Unable to start postprocess worker: {e}",
-                "finished_at": now_iso(),
-            },
-        )
+def _ensure_upload_postprocess_running(uploaded_by: str) -> bool:
+    """Make sure queued upload post-processing gets picked up; True if there is any."""
+    with db_conn() as conn:
+        row = conn.execute(
+            "SELECT 1 FROM work_queue WHERE task_key=? AND state IN ('queued','running') LIMIT 1",
+            (_upload_postprocess_key(uploaded_by),),
+        ).fetchone()
+    if row is None:
         return False
+    _work_wake.set()
+    _ensure_work_worker()
+    return True
 
 
 def _set_upload_postprocess_state(uploaded_by: str, patch: Dict[str, Any]) -> None:
-    user = str(uploaded_by or "").strip() or "__unknown__"
-    with UPLOAD_POSTPROCESS_LOCK:
-        cur = dict(UPLOAD_POSTPROCESS_BY_USER.get(user) or {})
-        cur.update(patch)
-        UPLOAD_POSTPROCESS_BY_USER[user] = cur
+    _work_set_progress(_upload_postprocess_key(uploaded_by), patch)
 
 
 def _get_upload_postprocess_state(uploaded_by: str) -> Dict[str, Any]:
-    user = str(uploaded_by or "").strip() or "__unknown__"
-    with UPLOAD_POSTPROCESS_LOCK:
-        return dict(UPLOAD_POSTPROCESS_BY_USER.get(user) or {})
+    """Progress of the newest post-processing run; running while any task is queued or running."""
+    key = _upload_postprocess_key(uploaded_by)
+    with db_conn() as conn:
+        active = conn.execute(
+            "SELECT 1 FROM work_queue WHERE task_key=? AND state IN ('queued','running') LIMIT 1", (key,)
+        ).fetchone()
+        row = conn.execute(
+            "SELECT progress, last_error FROM work_queue WHERE task_key=? AND progress IS NOT NULL ORDER BY id DESC LIMIT 1", (key,)
+        ).fetchone()
+    state: Dict[str, Any] = json.loads(row["progress"]) if row else {}
+    if active is not None:
+        state["running"] = True
+    elif state:
+        state["running"] = False
+        if row and row["last_error"] and not state.get("error"):
+            state["error"] = row["last_error"]
+    return state
 
 
 def _request_client_ip() -> str:
@@ -1333,7 +1573,7 @@ def _log_login_attempt(
         ua = str(request.headers.get("User-Agent") or "").strip()[:500]
         device = _describe_device(ua)[:120]
         country = _request_client_country()
-        with closing(get_conn()) as conn:
+        with db_conn() as conn:
             conn.execute(
                 """
                 INSERT INTO login_audit(
@@ -1360,13 +1600,11 @@ def _log_login_attempt(
         pass
 
 
-def _pop_uploaded_rels(uploaded_by: str) -> list[str]:
-    user = str(uploaded_by or "").strip() or "__unknown__"
-    with UPLOAD_PENDING_LOCK:
-        rels = list(UPLOAD_PENDING_BY_USER.pop(user, []))
+def _pop_uploaded_rels(uploaded_by: str, task_id: Optional[int] = None) -> list[str]:
+    payload = _work_take_queued(_upload_postprocess_key(uploaded_by), into_task_id=task_id) or {}
     out: list[str] = []
     seen: set[str] = set()
-    for rel in rels:
+    for rel in payload.get("rel_paths") or []:
         key = str(rel or "").strip()
         if not key or key in seen:
             continue
@@ -1412,6 +1650,13 @@ def _postprocess_uploaded_rels(
     indexed_ok: list[str] = []
     heic_converted_count = 0
     index_errors = 0
+
+    def _on_indexed(meta: Dict[str, Any]) -> None:
+        indexed_ok.append(meta["rel_path"])
+        log_event("upload_indexed", rel_path=meta["rel_path"], width=meta.get("width"), height=meta.get("height"), has_gps=bool(meta.get("gps_lat") and meta.get("gps_lon")))
+
+    # Rows are committed in batches; indexed_ok fills in as each batch commits
+    writes = _PhotoUpsertBatch(on_written=_on_indexed)
     for i, rel in enumerate(rels, start=1):
         _emit_progress({
             "phase": "metadata",
@@ -1509,7 +1754,7 @@ def _postprocess_uploaded_rels(
                     heic_converted_count += 1
                     # Remove any stub row created under the original HEIC rel (originals path)
                     try:
-                        with closing(get_conn()) as conn:
+                        with db_conn() as conn:
                             conn.execute("DELETE FROM photos WHERE rel_path=?", (orig_rel_for_convert,))
                             conn.commit()
                     except Exception:
@@ -1540,12 +1785,7 @@ def _postprocess_uploaded_rels(
         try:
             meta = extract_metadata(disk_path, rel, generate_thumb=False)
             meta["uploaded_by"] = user
-            upsert_photo(meta)
-            indexed_ok.append(rel)
-            try:
-                log_event("upload_indexed", rel_path=rel, width=meta.get("width"), height=meta.get("height"), has_gps=bool(meta.get("gps_lat") and meta.get("gps_lon")))
-            except Exception:
-                pass
+            writes.add(meta)
             # Emit progress after finishing this item
             _emit_progress({
                 "phase": "metadata",
@@ -1559,6 +1799,8 @@ def _postprocess_uploaded_rels(
                 log_event("error", rel_path=rel, error=f"postprocess_index: {e}")
             except Exception:
                 pass
+    writes.flush()
+    index_errors += writes.errors
 
     thumb_errors = 0
     _emit_progress({
@@ -1585,13 +1827,9 @@ def _postprocess_uploaded_rels(
                 thumb_name = _make_video_thumb(disk_path, rel, stat.st_mtime, stat.st_size)
             else:
                 with Image.open(disk_path) as img:
-                    try:
-                        img = ImageOps.exif_transpose(img)
-                    except Exception:
-                        pass
-                    thumb_name = make_thumb(img, rel, stat.st_mtime, stat.st_size)
+                    thumb_name = make_thumb(_decode_reduced(img), rel, stat.st_mtime, stat.st_size)
             if thumb_name:
-                with closing(get_conn()) as conn:
+                with db_conn() as conn:
                     conn.execute("UPDATE photos SET thumb_name=?, last_scanned_at=? WHERE rel_path=?", (thumb_name, now_iso(), rel))
                     conn.commit()
             else:
@@ -1609,102 +1847,9 @@ def _postprocess_uploaded_rels(
             except Exception:
                 pass
 
-    faces_done = 0
-    faces_found = 0
-    faces_errors = 0
-    if faces_enabled:
-        _emit_progress({
-            "phase": "faces",
-            "current_rel": None,
-            "stage_processed": 0,
-            "stage_total": len(indexed_ok),
-        })
-        for i, rel in enumerate(indexed_ok, start=1):
-            _emit_progress({
-                "phase": "faces",
-                "current_rel": rel,
-                "stage_processed": max(0, i - 1),
-                "stage_total": len(indexed_ok),
-            })
-            try:
-                fc = index_faces_for_photo(rel)
-                faces_done += 1
-                try:
-                    if int(fc or 0) > 0:
-                        faces_found += 1
-                except Exception:
-                    pass
-                _emit_progress({
-                    "phase": "faces",
-                    "current_rel": rel,
-                    "stage_processed": i,
-                    "stage_total": len(indexed_ok),
-                })
-            except Exception as e:
-                faces_errors += 1
-                try:
-                    log_event("error", rel_path=rel, error=f"postprocess_faces: {e}")
-                except Exception:
-                    pass
-
-    ai_done = 0
-    ai_errors = 0
-    if ai_enabled:
-        _emit_progress({
-            "phase": "embeddings",
-            "current_rel": None,
-            "stage_processed": 0,
-            "stage_total": len(indexed_ok),
-        })
-        for i, rel in enumerate(indexed_ok, start=1):
-            _emit_progress({
-                "phase": "embeddings",
-                "current_rel": rel,
-                "stage_processed": max(0, i - 1),
-                "stage_total": len(indexed_ok),
-            })
-            try:
-                _embed_uploaded_photo_if_needed(rel)
-                ai_done += 1
-                _emit_progress({
-                    "phase": "embeddings",
-                    "current_rel": rel,
-                    "stage_processed": i,
-                    "stage_total": len(indexed_ok),
-                })
-            except Exception as e:
-                ai_errors += 1
-                try:
-                    log_event("error", rel_path=rel, error=f"postprocess_ai: {e}")
-                except Exception:
-                    pass
-
-    ai_desc_done = 0
-    ai_desc_errors = 0
-    if ai_desc_enabled:
-        desc_total = len(indexed_ok)
-        _emit_progress({
-            "phase": "descriptions",
-            "current_rel": None,
-            "stage_processed": 0,
-            "stage_total": desc_total,
-        })
-        for i, rel in enumerate(indexed_ok, start=1):
-            _emit_progress({
-                "phase": "descriptions",
-                "current_rel": rel,
-                "stage_processed": i,
-                "stage_total": desc_total,
-            })
-            try:
-                _describe_uploaded_photo_if_needed(rel)
-                ai_desc_done += 1
-            except Exception as e:
-                ai_desc_errors += 1
-                try:
-                    log_event("error", rel_path=rel, error=f"postprocess_ai_desc: {e}")
-                except Exception:
-                    pass
+    # Faces, embeddings and descriptions run as their own queued tasks (per-kind
+    # WORK_CONCURRENCY caps, dedupe on task_key) instead of holding this task's slot
+    queued = _work_enqueue_follow_up(indexed_ok) if indexed_ok else {}
 
     _emit_progress({
         "phase": "done",
@@ -1721,19 +1866,15 @@ def _postprocess_uploaded_rels(
         "thumb_errors": thumb_errors,
         "heic_converted": heic_converted_count,
         "faces_enabled": faces_enabled,
-        "faces_done": faces_done,
-        "faces_found": faces_found,
-        "faces_errors": faces_errors,
+        "faces_queued": queued.get("faces", 0),
         "ai_enabled": ai_enabled,
-        "ai_done": ai_done,
-        "ai_errors": ai_errors,
+        "ai_queued": queued.get("embed", 0),
         "ai_desc_enabled": ai_desc_enabled,
-        "ai_desc_done": ai_desc_done,
-        "ai_desc_errors": ai_desc_errors,
+        "ai_desc_queued": queued.get("describe", 0),
     }
 
 
-def _upload_postprocess_worker(uploaded_by: str, initial_rels: list[str]) -> None:
+def _upload_postprocess_worker(uploaded_by: str, initial_rels: list[str], task_id: Optional[int] = None) -> None:
     user = str(uploaded_by or "").strip() or "__unknown__"
     _set_upload_postprocess_state(
         user,
@@ -1757,15 +1898,11 @@ def _upload_postprocess_worker(uploaded_by: str, initial_rels: list[str]) -> Non
         "index_errors": 0,
         "heic_converted": 0,
         "faces_enabled": faces_auto_index_enabled(),
-        "faces_done": 0,
-        "faces_found": 0,
-        "faces_errors": 0,
+        "faces_queued": 0,
         "ai_enabled": ai_auto_ingest_enabled(),
-        "ai_done": 0,
-        "ai_errors": 0,
+        "ai_queued": 0,
         "ai_desc_enabled": ai_desc_auto_ingest_enabled(),
-        "ai_desc_done": 0,
-        "ai_desc_errors": 0,
+        "ai_desc_queued": 0,
     }
 
     batch = list(initial_rels or [])
@@ -1785,13 +1922,9 @@ def _upload_postprocess_worker(uploaded_by: str, initial_rels: list[str]) -> Non
             aggregate["indexed"] += int(result["indexed"] if "indexed" in result and result["indexed"] is not None else 0)
             aggregate["index_errors"] += int(result["index_errors"] if "index_errors" in result and result["index_errors"] is not None else 0)
             aggregate["heic_converted"] += int(result["heic_converted"] if "heic_converted" in result and result["heic_converted"] is not None else 0)
-            aggregate["faces_done"] += int(result["faces_done"] if "faces_done" in result and result["faces_done"] is not None else 0)
-            aggregate["faces_found"] += int(result["faces_found"] if "faces_found" in result and result["faces_found"] is not None else 0)
-            aggregate["faces_errors"] += int(result["faces_errors"] if "faces_errors" in result and result["faces_errors"] is not None else 0)
-            aggregate["ai_done"] += int(result["ai_done"] if "ai_done" in result and result["ai_done"] is not None else 0)
-            aggregate["ai_errors"] += int(result["ai_errors"] if "ai_errors" in result and result["ai_errors"] is not None else 0)
-            aggregate["ai_desc_done"] += int(result["ai_desc_done"] if "ai_desc_done" in result and result["ai_desc_done"] is not None else 0)
-            aggregate["ai_desc_errors"] += int(result["ai_desc_errors"] if "ai_desc_errors" in result and result["ai_desc_errors"] is not None else 0)
+            aggregate["faces_queued"] += int(result["faces_queued"] if "faces_queued" in result and result["faces_queued"] is not None else 0)
+            aggregate["ai_queued"] += int(result["ai_queued"] if "ai_queued" in result and result["ai_queued"] is not None else 0)
+            aggregate["ai_desc_queued"] += int(result["ai_desc_queued"] if "ai_desc_queued" in result and result["ai_desc_queued"] is not None else 0)
             aggregate["faces_enabled"] = bool(result["faces_enabled"] if "faces_enabled" in result else False)
             aggregate["ai_enabled"] = bool(result["ai_enabled"] if "ai_enabled" in result else False)
             aggregate["ai_desc_enabled"] = bool(result["ai_desc_enabled"] if "ai_desc_enabled" in result else False)
@@ -1803,20 +1936,15 @@ def _upload_postprocess_worker(uploaded_by: str, initial_rels: list[str]) -> Non
                     files=result["received"] if "received" in result else None,
                     indexed=result["indexed"] if "indexed" in result else None,
                     heic_converted=result["heic_converted"] if "heic_converted" in result else None,
-                    faces_scanned=result["faces_done"] if "faces_done" in result else None,
-                    faces_found=result["faces_found"] if "faces_found" in result else None,
                     index_errors=result["index_errors"] if "index_errors" in result else None,
-                    faces_done=result["faces_done"] if "faces_done" in result else None,
-                    faces_errors=result["faces_errors"] if "faces_errors" in result else None,
-                    ai_done=result["ai_done"] if "ai_done" in result else None,
-                    ai_errors=result["ai_errors"] if "ai_errors" in result else None,
-                    ai_desc_done=result["ai_desc_done"] if "ai_desc_done" in result else None,
-                    ai_desc_errors=result["ai_desc_errors"] if "ai_desc_errors" in result else None,
+                    faces_queued=result["faces_queued"] if "faces_queued" in result else None,
+                    ai_queued=result["ai_queued"] if "ai_queued" in result else None,
+                    ai_desc_queued=result["ai_desc_queued"] if "ai_desc_queued" in result else None,
                 )
             except Exception:
                 pass
 
-            batch = _pop_uploaded_rels(user)
+            batch = _pop_uploaded_rels(user, task_id)
 
         _set_upload_postprocess_state(
             user,
@@ -1838,14 +1966,10 @@ def _upload_postprocess_worker(uploaded_by: str, initial_rels: list[str]) -> Non
                 files=aggregate["received"] if "received" in aggregate else None,
                 indexed=aggregate["indexed"] if "indexed" in aggregate else None,
                 heic_converted=aggregate["heic_converted"] if "heic_converted" in aggregate else None,
-                faces_scanned=aggregate["faces_done"] if "faces_done" in aggregate else None,
-                faces_found=aggregate["faces_found"] if "faces_found" in aggregate else None,
                 index_errors=aggregate["index_errors"] if "index_errors" in aggregate else None,
-                faces_errors=aggregate["faces_errors"] if "faces_errors" in aggregate else None,
-                ai_done=aggregate["ai_done"] if "ai_done" in aggregate else None,
-                ai_errors=aggregate["ai_errors"] if "ai_errors" in aggregate else None,
-                ai_desc_done=aggregate["ai_desc_done"] if "ai_desc_done" in aggregate else None,
-                ai_desc_errors=aggregate["ai_desc_errors"] if "ai_desc_errors" in aggregate else None,
+                faces_queued=aggregate["faces_queued"] if "faces_queued" in aggregate else None,
+                ai_queued=aggregate["ai_queued"] if "ai_queued" in aggregate else None,
+                ai_desc_queued=aggregate["ai_desc_queued"] if "ai_desc_queued" in aggregate else None,
             )
         except Exception:
             pass
@@ -1860,6 +1984,8 @@ def _upload_postprocess_worker(uploaded_by: str, initial_rels: list[str]) -> Non
                 "phase": "error",
             },
         )
+        # Let the work queue schedule a retry with backoff instead of marking the task done
+        raise
 
 
 def _tus_headers(extra: Optional[Dict[str, str]] = None) -> Dict[str, str]:
@@ -1957,7 +2083,7 @@ def _upsert_uploaded_stub(rel_path: str, disk_path: Path, uploaded_by: str) -> N
     }
 
     try:
-        with closing(get_conn()) as conn:
+        with db_conn() as conn:
             conn.execute(
                 """
                 INSERT INTO photos (
@@ -2041,13 +2167,151 @@ def _commit_uploaded_file(target_dir: Path, rel_prefix: str, subdir: str, source
 
 
 def get_conn() -> sqlite3.Connection:
+    """Open a new tuned connection. Request/worker code should use db_conn()."""
     conn = sqlite3.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
+    for pragma in (
+        "PRAGMA synchronous=NORMAL",
+        f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}",
+        f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}",
+        "PRAGMA temp_store=MEMORY",
+    ):
+        try:
+            conn.execute(pragma)
+        except sqlite3.DatabaseError:
+            pass
     return conn
 
 
+# Per-thread connection reuse. Each thread keeps a few idle connections;
+# nested db_conn() blocks in the same thread get their own connection so an
+# inner block can never commit or roll back the outer one's transaction.
+_db_local = threading.local()
+_DB_POOL_STATS_LOCK = threading.Lock()
+_db_pool_stats: Dict[str, Any] = {
+    "opened": 0,
+    "closed": 0,
+    "checkouts": 0,
+    "reused": 0,
+    "in_use": 0,
+    "max_in_use": 0,
+    "rollbacks": 0,
+    "slow_holds": 0,
+    "hold_sec_total": 0.0,
+    "hold_sec_max": 0.0,
+}
+
+
+@contextmanager
+def db_conn() -> Iterator[sqlite3.Connection]:
+    """Borrow a pooled connection for this thread.
+
+    Behaves like ``closing(get_conn())``: anything not committed when the
+    block exits is rolled back before the connection is reused.
+    """
+    idle = getattr(_db_local, "idle", None)
+    if idle is None:
+        idle = _db_local.idle = []
+    reused = bool(idle)
+    conn = idle.pop() if reused else get_conn()
+    with _DB_POOL_STATS_LOCK:
+        st = _db_pool_stats
+        st["checkouts"] += 1
+        st["reused" if reused else "opened"] += 1
+        st["in_use"] += 1
+        st["max_in_use"] = max(st["max_in_use"], st["in_use"])
+    t0 = time.monotonic()
+    try:
+        yield conn
+    finally:
+        held = time.monotonic() - t0
+        keep = True
+        rolled_back = False
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+                rolled_back = True
+        except sqlite3.Error:
+            keep = False
+        if keep and len(idle) < DB_POOL_IDLE_PER_THREAD:
+            idle.append(conn)
+        else:
+            keep = False
+            try:
+                conn.close()
+            except Exception:
+                pass
+        with _DB_POOL_STATS_LOCK:
+            st = _db_pool_stats
+            st["in_use"] -= 1
+            st["hold_sec_total"] += held
+            st["hold_sec_max"] = max(st["hold_sec_max"], held)
+            if rolled_back:
+                st["rollbacks"] += 1
+            if not keep:
+                st["closed"] += 1
+            if DB_SLOW_HOLD_SEC and held > DB_SLOW_HOLD_SEC:
+                st["slow_holds"] += 1
+        if DB_SLOW_HOLD_SEC and held > DB_SLOW_HOLD_SEC:
+            log_event("db_slow_hold", seconds=round(held, 2), thread=threading.current_thread().name)
+
+
+def _db_pool_status() -> Dict[str, Any]:
+    with _DB_POOL_STATS_LOCK:
+        st = dict(_db_pool_stats)
+    st["hold_sec_total"] = round(st["hold_sec_total"], 3)
+    st["hold_sec_max"] = round(st["hold_sec_max"], 3)
+    st["hold_ms_avg"] = round(1000.0 * st["hold_sec_total"] / st["checkouts"], 2) if st["checkouts"] else 0.0
+    st["idle_this_thread"] = len(getattr(_db_local, "idle", None) or [])
+    return st
+
+
+def _backfill_binary_embeddings(conn: sqlite3.Connection) -> None:
+    """Move legacy JSON embeddings into the float32 BLOB columns, EMBED_BACKFILL_BATCH rows at a time."""
+    specs = (
+        ("photos", "embedding_json", "embedding", "embedding_dim", "embedding_model", CLIP_EMBED_MODEL_TAG),
+        ("faces", "embedding_json", "embedding", "embedding_dim", "embedding_model", FACE_EMBED_MODEL_TAG),
+        ("people", "centroid_json", "centroid", "centroid_dim", None, None),
+    )
+    for table, json_col, blob_col, dim_col, model_col, tag in specs:
+        moved = 0
+        while True:
+            rows = conn.execute(
+                f"SELECT id, {json_col} AS j FROM {table} WHERE {json_col} IS NOT NULL LIMIT ?",
+                (EMBED_BACKFILL_BATCH,),
+            ).fetchall()
+            if not rows:
+                break
+            updates: list[tuple] = []
+            for r in rows:
+                try:
+                    blob = _embedding_to_blob(json.loads(r["j"]))
+                except Exception:
+                    blob = None
+                if blob:
+                    dim = len(blob) // 4
+                    updates.append((blob, dim, tag, int(r["id"])) if model_col else (blob, dim, int(r["id"])))
+            if updates:
+                if model_col:
+                    conn.executemany(
+                        f"UPDATE {table} SET {blob_col}=?, {dim_col}=?, {model_col}=? WHERE id=? AND {blob_col} IS NULL",
+                        updates,
+                    )
+                else:
+                    conn.executemany(
+                        f"UPDATE {table} SET {blob_col}=?, {dim_col}=? WHERE id=? AND {blob_col} IS NULL",
+                        updates,
+                    )
+            # Unparseable JSON is dropped too; photos are simply re-embedded by the next AI ingest
+            conn.executemany(f"UPDATE {table} SET {json_col}=NULL WHERE id=?", [(int(r["id"]),) for r in rows])
+            conn.commit()
+            moved += len(updates)
+        if moved:
+            log_event("embedding_backfill", table=table, rows=moved)
+
+
 def init_db() -> None:
-    with closing(get_conn()) as conn:
+    with db_conn() as conn:
         conn.executescript(
             """
             PRAGMA journal_mode=WAL;
@@ -2082,6 +2346,9 @@ def init_db() -> None:
                 ai_desc_tags TEXT,
                 ai_desc_caption TEXT,
                 embedding_json TEXT,
+                embedding BLOB,
+                embedding_dim INTEGER,
+                embedding_model TEXT,
                 metadata_json TEXT,
                 exif_json TEXT,
                 uploaded_by TEXT,
@@ -2091,6 +2358,7 @@ def init_db() -> None:
 
             CREATE INDEX IF NOT EXISTS idx_photos_captured_at ON photos(captured_at);
             CREATE INDEX IF NOT EXISTS idx_photos_filename ON photos(filename);
+            CREATE INDEX IF NOT EXISTS idx_photos_sort_date ON photos(COALESCE(captured_at, modified_fs, created_fs, ''), id);
                 CREATE INDEX IF NOT EXISTS idx_photos_phash ON photos(phash);
 
                 CREATE TABLE IF NOT EXISTS geo_cache (
@@ -2121,6 +2389,9 @@ def init_db() -> None:
                 bbox_w INTEGER,
                 bbox_h INTEGER,
                 embedding_json TEXT,
+                embedding BLOB,
+                embedding_dim INTEGER,
+                embedding_model TEXT,
                 confidence REAL,
                 created_at TEXT NOT NULL,
                 FOREIGN KEY(photo_id) REFERENCES photos(id),
@@ -2218,6 +2489,14 @@ def init_db() -> None:
                 folder_path TEXT PRIMARY KEY,
                 user_id INTEGER NOT NULL
             );
+
+            -- Directory mtimes from the last completed scan (unchanged directories are not listed again)
+            CREATE TABLE IF NOT EXISTS scan_dirs (
+                rel_dir TEXT PRIMARY KEY,
+                mtime_ns INTEGER NOT NULL,
+                subdirs_json TEXT NOT NULL DEFAULT '[]',
+                scanned_at TEXT
+            );
             """
         )
         conn.commit()
@@ -2238,6 +2517,34 @@ def init_db() -> None:
                 conn.commit()
         except Exception:
             pass
+        # Binary float32 embeddings replace the JSON text columns (backfilled below)
+        for table, col, typ in (
+            ("photos", "embedding", "BLOB"),
+            ("photos", "embedding_dim", "INTEGER"),
+            ("photos", "embedding_model", "TEXT"),
+            ("faces", "embedding", "BLOB"),
+            ("faces", "embedding_dim", "INTEGER"),
+            ("faces", "embedding_model", "TEXT"),
+            ("people", "centroid", "BLOB"),
+            ("people", "centroid_dim", "INTEGER"),
+        ):
+            try:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {col} {typ}")
+                conn.commit()
+            except Exception:
+                pass
+        try:
+            _backfill_binary_embeddings(conn)
+        except Exception as e:
+            log_event("error", rel_path="embedding_backfill", error=str(e))
+        _init_photos_fts(conn)
+        try:
+            _init_duplicate_groups(conn)
+        except Exception as e:
+            log_event("error", rel_path="duplicate_groups", error=str(e))
+        _init_work_queue(conn)
+        _init_process_leases(conn)
+        _init_embedding_changes(conn)
         try:
             conn.execute("ALTER TABLE users ADD COLUMN totp_secret TEXT")
         except Exception:
@@ -2299,6 +2606,30 @@ def init_db() -> None:
             conn.execute("ALTER TABLE photos ADD COLUMN ai_desc_caption TEXT")
         except Exception:
             pass
+        # Cheap content fingerprint (size + head/tail hash) used to recognise moved files
+        try:
+            conn.execute("ALTER TABLE photos ADD COLUMN quick_hash TEXT")
+        except Exception:
+            pass
+        try:
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_photos_size_hash ON photos(file_size, quick_hash)")
+        except Exception:
+            pass
+        # 64-bit DCT pHash / dHash as signed integers (phash holds the legacy aHash hex)
+        for col in ("phash64", "dhash64"):
+            try:
+                conn.execute(f"ALTER TABLE photos ADD COLUMN {col} INTEGER")
+            except Exception:
+                pass
+        # Multi-index hashing: one index per 16-bit substring of phash64 (see phash_neighbors)
+        for j, shift in enumerate(_PHASH_CHUNK_SHIFTS):
+            try:
+                conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS idx_photos_phash_q{j} ON photos({_phash_chunk_sql(shift)})"
+                    " WHERE phash64 IS NOT NULL"
+                )
+            except Exception:
+                pass
         try:
             conn.execute("ALTER TABLE share_links ADD COLUMN require_visitor_name INTEGER DEFAULT 0")
         except Exception:
@@ -2578,6 +2909,7 @@ def _set_user_allowed_folders(conn: sqlite3.Connection, user_id: int, folders: l
             "INSERT INTO user_folder_access(user_id, folder_path, permission, created_at) VALUES(?,?,?,?)",
             [(user_id, p, perm, now) for (p, perm) in reduced],
         )
+    _bump_acl_generation(conn)
     return [{"folder_path": p, "permission": perm} for (p, perm) in reduced]
 
 
@@ -2601,6 +2933,160 @@ def _get_user_allowed_folders(conn: sqlite3.Connection, user_id: int) -> list[di
     return out
 
 
+class _PathTrie:
+    """Segment trie over folder paths for prefix / longest-match lookups in O(depth)."""
+
+    __slots__ = ("root",)
+
+    def __init__(self, items: Iterable[Tuple[str, Any]] = ()):
+        self.root: Dict[Any, Any] = {}
+        for path, value in items:
+            self.add(path, value)
+
+    def add(self, path: str, value: Any = True) -> None:
+        node = self.root
+        for part in path.split("/"):
+            node = node.setdefault(part, {})
+        node[None] = value  # None marks a stored path
+
+    def longest(self, path: str) -> Any:
+        """Value of the longest stored path equal to or above ``path`` (None if none)."""
+        node = self.root
+        found = None
+        for part in path.split("/"):
+            node = node.get(part)
+            if node is None:
+                break
+            if None in node:
+                found = node[None]
+        return found
+
+
+# Process-level ACL cache. Entries are stamped with the ACL generation, a row
+# in settings that every ACL / folder-owner write bumps in its own transaction
+# (_bump_acl_generation). Each request reads that row once (memoized on flask.g
+# with its lookups, see _acl_request_memo) and drops the process caches when it
+# moved, so writes from other gunicorn workers take effect on their next request.
+_ACL_GENERATION_KEY = "__acl_generation"
+_ACL_CACHE_LOCK = threading.Lock()
+_acl_version: Optional[str] = None
+_acl_user_cache: Dict[int, Tuple[Optional[str], list[str], _PathTrie]] = {}
+_acl_owner_cache: Optional[Tuple[Optional[str], list[Tuple[str, int]], _PathTrie]] = None
+
+
+def _bump_acl_generation(conn: sqlite3.Connection) -> None:
+    """Bump the ACL generation inside the caller's transaction (the caller commits)."""
+    conn.execute(
+        "INSERT INTO settings(key, value) VALUES(?, '1') "
+        "ON CONFLICT(key) DO UPDATE SET value=CAST(value AS INTEGER) + 1",
+        (_ACL_GENERATION_KEY,),
+    )
+
+
+def _acl_sync_version(conn: Optional[sqlite3.Connection] = None) -> Optional[str]:
+    """Read the ACL generation and drop the process caches if it changed."""
+    global _acl_version, _acl_owner_cache
+    try:
+        if conn is not None:
+            row = conn.execute("SELECT value FROM settings WHERE key=?", (_ACL_GENERATION_KEY,)).fetchone()
+        else:
+            with db_conn() as c:
+                row = c.execute("SELECT value FROM settings WHERE key=?", (_ACL_GENERATION_KEY,)).fetchone()
+    except sqlite3.Error:
+        return None  # None never matches a cached stamp: read through
+    gen = str(row["value"]) if row else "0"
+    with _ACL_CACHE_LOCK:
+        if gen != _acl_version:
+            _acl_version = gen
+            _acl_user_cache.clear()
+            _acl_owner_cache = None
+    return gen
+
+
+def _acl_request_memo(conn: Optional[sqlite3.Connection] = None) -> Dict[Any, Any]:
+    """Per-request memo dict, stamped with the ACL generation read at its creation."""
+    try:
+        memo = g.get("_acl_memo")
+        if memo is None:
+            memo = {"version": _acl_sync_version(conn)}
+            g._acl_memo = memo
+        return memo
+    except RuntimeError:
+        return {"version": _acl_sync_version(conn)}
+
+
+def _acl_after_write() -> None:
+    """Forget this request's ACL memo once an ACL write has been committed."""
+    try:
+        g.pop("_acl_memo", None)
+    except RuntimeError:
+        pass
+
+
+def _acl_entry_for_user(uid: int, conn: Optional[sqlite3.Connection] = None) -> Tuple[list[str], _PathTrie]:
+    """Canonical ACL prefixes (under 'uploads/') for a user, plus a trie over them."""
+    memo = _acl_request_memo(conn)
+    key = ("user", uid)
+    if key in memo:
+        return memo[key]
+    version = memo["version"]
+    with _ACL_CACHE_LOCK:
+        cached = _acl_user_cache.get(uid)
+    if cached is None or version is None or cached[0] != version:
+        def _load(c: sqlite3.Connection) -> list[str]:
+            items = _get_user_allowed_folders(c, uid)
+            out: list[str] = []
+            for it in items:
+                p = _normalize_folder_acl_path((it or {}).get("folder_path")) if isinstance(it, dict) else _normalize_folder_acl_path(it)
+                # Ignore accidental or legacy entries that grant the root 'uploads'
+                # folder, which would make all subfolders visible.
+                if p and p != "uploads":
+                    # Canonicalize to rel path under 'uploads/' so checks align
+                    canon = p if p.startswith("uploads/") else f"uploads/{p}"
+                    out.append(canon)
+            return out
+
+        if conn is not None:
+            prefixes = _load(conn)
+        else:
+            with db_conn() as conn2:
+                prefixes = _load(conn2)
+        cached = (version, prefixes, _PathTrie((p, True) for p in prefixes))
+        with _ACL_CACHE_LOCK:
+            if version is not None and _acl_version == version:
+                _acl_user_cache[uid] = cached
+    memo[key] = (cached[1], cached[2])
+    return memo[key]
+
+
+def _folder_owner_entry(conn: Optional[sqlite3.Connection] = None) -> Tuple[list[Tuple[str, int]], _PathTrie]:
+    """All (normalized folder_path, user_id) owner rows, plus a trie mapping path -> owner."""
+    global _acl_owner_cache
+    memo = _acl_request_memo(conn)
+    if "owners" in memo:
+        return memo["owners"]
+    version = memo["version"]
+    with _ACL_CACHE_LOCK:
+        cached = _acl_owner_cache
+    if cached is None or version is None or cached[0] != version:
+        if conn is not None:
+            rows = conn.execute("SELECT folder_path, user_id FROM folder_owners").fetchall()
+        else:
+            with db_conn() as c:
+                rows = c.execute("SELECT folder_path, user_id FROM folder_owners").fetchall()
+        owners: list[Tuple[str, int]] = []
+        for r in rows:
+            path = _normalize_rel_path_for_acl(r["folder_path"]).rstrip("/")
+            if path:
+                owners.append((path, int(r["user_id"] or 0)))
+        cached = (version, owners, _PathTrie(owners))
+        with _ACL_CACHE_LOCK:
+            if version is not None and _acl_version == version:
+                _acl_owner_cache = cached
+    memo["owners"] = (cached[1], cached[2])
+    return memo["owners"]
+
+
 def _current_user_acl_prefixes(conn: Optional[sqlite3.Connection] = None) -> Optional[list[str]]:
     try:
         if getattr(current_user, "is_admin", False):
@@ -2610,42 +3096,23 @@ def _current_user_acl_prefixes(conn: Optional[sqlite3.Connection] = None) -> Opt
             return None
     except Exception:
         return None
-
-    def _load(c: sqlite3.Connection) -> list[str]:
-        items = _get_user_allowed_folders(c, uid)
-        out: list[str] = []
-        for it in items:
-            p = _normalize_folder_acl_path((it or {}).get("folder_path")) if isinstance(it, dict) else _normalize_folder_acl_path(it)
-            # Ignore accidental or legacy entries that grant the root 'uploads'
-            # folder, which would make all subfolders visible.
-            if p and p != "uploads":
-                # Canonicalize to rel path under 'uploads/' so checks align
-                canon = p if p.startswith("uploads/") else f"uploads/{p}"
-                out.append(canon)
-        return out
-
-    if conn is not None:
-        rows = _load(conn)
-    else:
-        with closing(get_conn()) as conn2:
-            rows = _load(conn2)
-    if not rows:
-        # No explicit ACLs → no access (non-admin users)
-        return []
-    return rows
+    # No explicit ACLs → no access (non-admin users)
+    return list(_acl_entry_for_user(uid, conn)[0])
 
 
 def _is_rel_path_allowed_for_current_user(rel_path: Optional[str], conn: Optional[sqlite3.Connection] = None) -> bool:
     rel = _normalize_rel_path_for_acl(rel_path)
     if not rel:
         return False
-    prefixes = _current_user_acl_prefixes(conn)
-    if prefixes is None:
-        return True
-    for p in prefixes:
-        if rel == p or rel.startswith(p + "/"):
+    try:
+        if getattr(current_user, "is_admin", False):
             return True
-    return False
+        uid = int(getattr(current_user, "id", 0) or 0)
+        if uid <= 0:
+            return True
+    except Exception:
+        return True
+    return _acl_entry_for_user(uid, conn)[1].longest(rel) is not None
 
 
 def _folder_owner_user_id_for_rel(rel_path: Optional[str], conn: Optional[sqlite3.Connection] = None) -> Optional[int]:
@@ -2653,22 +3120,9 @@ def _folder_owner_user_id_for_rel(rel_path: Optional[str], conn: Optional[sqlite
     if not rel:
         return None
     try:
-        if conn is None:
-            with closing(get_conn()) as c:
-                row = c.execute(
-                    "SELECT user_id FROM folder_owners WHERE ? = folder_path OR ? LIKE folder_path || '/%' ORDER BY LENGTH(folder_path) DESC LIMIT 1",
-                    (rel, rel),
-                ).fetchone()
-        else:
-            row = conn.execute(
-                "SELECT user_id FROM folder_owners WHERE ? = folder_path OR ? LIKE folder_path || '/%' ORDER BY LENGTH(folder_path) DESC LIMIT 1",
-                (rel, rel),
-            ).fetchone()
-        if row:
-            return int(row[0])
+        return _folder_owner_entry(conn)[1].longest(rel)
     except Exception:
         return None
-    return None
 
 
 def _is_rel_visible_for_current_user(rel_path: Optional[str], conn: Optional[sqlite3.Connection] = None) -> bool:
@@ -2705,6 +3159,75 @@ def _filter_public_items_by_current_user_acl(items: list[Dict[str, Any]]) -> lis
     return out
 
 
+def _acl_storage_prefixes(prefix: str) -> list[str]:
+    """Raw rel_path prefixes covered by a canonical ACL prefix.
+
+    Mirrors _normalize_rel_path_for_acl: 'uploads/X' also covers the
+    'uploads/originals/X' and 'uploads/converted/X' storage mirrors.
+    """
+    out = [prefix]
+    if prefix.startswith("uploads/"):
+        rest = prefix[len("uploads/"):]
+        out.extend([f"uploads/originals/{rest}", f"uploads/converted/{rest}"])
+    return out
+
+
+def _rel_prefix_sql(prefixes: Iterable[str], column: str = "rel_path") -> Tuple[str, list[Any]]:
+    """OR of index-friendly range tests for "column is prefix or below it".
+
+    ``p/ <= col < p0`` selects everything under ``p/`` ('0' sorts right after
+    '/') and, unlike LIKE, can use the rel_path index.
+    """
+    clauses: list[str] = []
+    params: list[Any] = []
+    for pref in prefixes:
+        for raw in _acl_storage_prefixes(pref):
+            clauses.append(f"({column} = ? OR ({column} >= ? AND {column} < ?))")
+            params.extend([raw, raw + "/", raw + "0"])
+    if not clauses:
+        return "0", []
+    return "(" + " OR ".join(clauses) + ")", params
+
+
+def _current_user_acl_sql(
+    conn: Optional[sqlite3.Connection] = None,
+    column: str = "rel_path",
+    owned: bool = True,
+) -> Optional[Tuple[str, list[Any]]]:
+    """Compile the current user's photo visibility into a WHERE predicate.
+
+    With ``owned`` this matches _is_rel_visible_for_current_user (explicit ACL
+    or the most specific folder owner is the user); without it, only
+    _is_rel_path_allowed_for_current_user. Returns None when unrestricted.
+    """
+    prefixes = _current_user_acl_prefixes(conn)
+    if prefixes is None:
+        return None
+    sql, params = _rel_prefix_sql(prefixes, column)
+    if not owned:
+        return sql, params
+    try:
+        uid = int(getattr(current_user, "id", 0) or 0)
+    except Exception:
+        uid = 0
+    mine: list[str] = []
+    others: list[str] = []
+    for path, owner_uid in _folder_owner_entry(conn)[0]:
+        (mine if owner_uid == uid else others).append(path)
+    terms = [sql]
+    for own in mine:
+        own_sql, own_params = _rel_prefix_sql([own], column)
+        # A deeper folder owned by someone else takes precedence (longest match wins)
+        nested = [o for o in others if o.startswith(own + "/")]
+        if nested:
+            nested_sql, nested_params = _rel_prefix_sql(nested, column)
+            own_sql = f"({own_sql} AND NOT {nested_sql})"
+            own_params = own_params + nested_params
+        terms.append(own_sql)
+        params = params + own_params
+    return ("(" + " OR ".join(terms) + ")" if len(terms) > 1 else sql), params
+
+
 def _filter_folders_by_current_user_acl(folders: list[str], conn: Optional[sqlite3.Connection] = None) -> list[str]:
     out: list[str] = []
     for raw in folders:
@@ -2757,7 +3280,7 @@ def _current_user_folder_permission_for_rel(rel_path: Optional[str], conn: Optio
     # Load ACL rows and find the most specific match
     try:
         if conn is None:
-            with closing(get_conn()) as c:
+            with db_conn() as c:
                 rows = _get_user_allowed_folders(c, int(getattr(current_user, "id", 0) or 0))
         else:
             rows = _get_user_allowed_folders(conn, int(getattr(current_user, "id", 0) or 0))
@@ -2826,7 +3349,7 @@ def enforce_login_for_app():
         return redirect(url_for("login", next=request.path))
     # Enforce initial 2FA setup only when 2FA is enabled but not completed
     try:
-        with closing(get_conn()) as conn:
+        with db_conn() as conn:
             row = conn.execute("SELECT totp_enabled, totp_setup_done FROM users WHERE id= ?", (current_user.id,)).fetchone()
         if row and int(row["totp_enabled"] or 0) == 1 and int(row["totp_setup_done"] or 0) == 0 and request.endpoint not in {"setup_2fa", "logout", "static"}:
             return redirect(url_for("setup_2fa"))
@@ -2856,7 +3379,7 @@ def _current_user_pref_languages() -> tuple[str, str]:
     ui_lang = _normalize_language(getattr(current_user, "ui_language", None), DEFAULT_UI_LANGUAGE)
     search_lang = _normalize_language(getattr(current_user, "search_language", None), DEFAULT_SEARCH_LANGUAGE)
     try:
-        with closing(get_conn()) as conn:
+        with db_conn() as conn:
             row = conn.execute("SELECT ui_language, search_language FROM users WHERE id=?", (current_user.id,)).fetchone()
         if row:
             ui_lang = _normalize_language(row["ui_language"], ui_lang)
@@ -2867,30 +3390,65 @@ def _current_user_pref_languages() -> tuple[str, str]:
 
 
 # --- App settings helpers ---
+# The settings table is cached in-process. _set_setting bumps a generation
+# row in the same transaction; readers re-check that single row at most every
+# SETTINGS_CACHE_RECHECK_SEC and reload the table when it changed, so writes
+# from other gunicorn workers are picked up too.
+_SETTINGS_GENERATION_KEY = "__settings_generation"
+_SETTINGS_CACHE_LOCK = threading.Lock()
+_settings_cache: Dict[str, Any] = {}
+_settings_cache_gen: Optional[str] = None
+_settings_cache_checked_at = 0.0
+
+
+def _settings_snapshot() -> Dict[str, Any]:
+    global _settings_cache, _settings_cache_gen, _settings_cache_checked_at
+    if _settings_cache_gen is not None and time.monotonic() - _settings_cache_checked_at < SETTINGS_CACHE_RECHECK_SEC:
+        return _settings_cache
+    with _SETTINGS_CACHE_LOCK:
+        now = time.monotonic()
+        if _settings_cache_gen is not None and now - _settings_cache_checked_at < SETTINGS_CACHE_RECHECK_SEC:
+            return _settings_cache
+        with db_conn() as conn:
+            row = conn.execute("SELECT value FROM settings WHERE key=?", (_SETTINGS_GENERATION_KEY,)).fetchone()
+            gen = str(row["value"]) if row else "0"
+            if gen != _settings_cache_gen:
+                rows = conn.execute("SELECT key, value FROM settings").fetchall()
+                _settings_cache = {r["key"]: r["value"] for r in rows}
+                _settings_cache_gen = gen
+        _settings_cache_checked_at = now
+        return _settings_cache
+
+
 def _get_setting(key: str, default: Optional[str] = None) -> Optional[str]:
     try:
-        with closing(get_conn()) as conn:
-            row = conn.execute("SELECT value FROM settings WHERE key=?", (key,)).fetchone()
-            if not row:
-                return default
-            try:
-                return row["value"]  # sqlite3.Row
-            except Exception:
-                return row[0]
+        snapshot = _settings_snapshot()
     except Exception:
         return default
+    if key not in snapshot:
+        return default
+    return snapshot[key]
 
 
 def _set_setting(key: str, value: str) -> None:
+    global _settings_cache_gen
     try:
-        with closing(get_conn()) as conn:
+        with db_conn() as conn:
             conn.execute(
                 "INSERT INTO settings(key, value) VALUES(?,?) ON CONFLICT(key) DO UPDATE SET value=excluded.value",
                 (key, value),
             )
+            conn.execute(
+                "INSERT INTO settings(key, value) VALUES(?, '1') "
+                "ON CONFLICT(key) DO UPDATE SET value=CAST(value AS INTEGER) + 1",
+                (_SETTINGS_GENERATION_KEY,),
+            )
             conn.commit()
     except Exception:
         pass
+    # Reload on the next read in this worker
+    with _SETTINGS_CACHE_LOCK:
+        _settings_cache_gen = None
 
 
 def _get_setting_bool(key: str, default: bool = False) -> bool:
@@ -3143,7 +3701,7 @@ def _normalize_folder_preview_key(value: Optional[str]) -> Optional[str]:
 
 def _ensure_folder_previews_table() -> None:
     try:
-        with closing(get_conn()) as conn:
+        with db_conn() as conn:
             conn.execute(
                 """
                 CREATE TABLE IF NOT EXISTS folder_previews (
@@ -3180,7 +3738,7 @@ def _compute_and_store_folder_previews(folder_key: str) -> list[str]:
         f"uploads/converted/{f}" if f else "uploads/converted",
     ]
     where = " OR ".join(["rel_path LIKE ? || '/%'"] * len(prefixes))
-    with closing(get_conn()) as conn:
+    with db_conn() as conn:
         rows = conn.execute(
             f"SELECT * FROM photos WHERE {where} ORDER BY COALESCE(captured_at, modified_fs, created_fs) DESC",
             prefixes,
@@ -3215,7 +3773,7 @@ def _compute_and_store_folder_previews(folder_key: str) -> list[str]:
         pick = ordered[:1]
     payload = json.dumps(pick, ensure_ascii=False)
     now = now_iso()
-    with closing(get_conn()) as conn:
+    with db_conn() as conn:
         conn.execute(
             """
             INSERT INTO folder_previews(folder_path, previews_json, updated_at)
@@ -3248,7 +3806,7 @@ def api_folder_previews_get():
     if not keys:
         return jsonify({"ok": True, "items": {}})
     placeholders = ",".join(["?"] * len(keys))
-    with closing(get_conn()) as conn:
+    with db_conn() as conn:
         rows = conn.execute(
             f"SELECT folder_path, previews_json FROM folder_previews WHERE folder_path IN ({placeholders})",
             keys,
@@ -3295,7 +3853,7 @@ def api_folder_previews_set():
         return jsonify({"ok": False, "error": "invalid_count"}), 400
     payload = json.dumps(urls, ensure_ascii=False)
     now = now_iso()
-    with closing(get_conn()) as conn:
+    with db_conn() as conn:
         conn.execute(
             """
             INSERT INTO folder_previews(folder_path, previews_json, updated_at)
@@ -3310,6 +3868,16 @@ def api_folder_previews_set():
     return jsonify({"ok": True, "folder": folder, "previews": urls, "updated_at": now})
 
 
+@app.route("/api/debug/db-pool", methods=["GET"])
+def api_debug_db_pool():
+    try:
+        if not getattr(current_user, "is_admin", False):
+            return jsonify({"ok": False, "error": "forbidden"}), 403
+    except Exception:
+        return jsonify({"ok": False, "error": "forbidden"}), 403
+    return jsonify({"ok": True, **_db_pool_status()})
+
+
 @app.route("/api/debug/acl", methods=["GET"])
 def api_debug_acl():
     try:
@@ -3347,7 +3915,7 @@ def _delete_indexed_photos_for_prefixes(rel_prefixes: Iterable[str]) -> dict:
         params.extend([pref, pref + "/%"])
 
     q = "SELECT id, thumb_name FROM photos WHERE " + " OR ".join(where_parts)
-    with closing(get_conn()) as conn:
+    with db_conn() as conn:
         rows = conn.execute(q, params).fetchall()
         if not rows:
             return {"photos": 0, "faces": 0, "thumbs": 0}
@@ -3360,6 +3928,8 @@ def _delete_indexed_photos_for_prefixes(rel_prefixes: Iterable[str]) -> dict:
         conn.execute(f"DELETE FROM faces WHERE photo_id IN ({ph})", photo_ids)
         conn.execute(f"DELETE FROM photos WHERE id IN ({ph})", photo_ids)
         conn.commit()
+    _face_cache_invalidate()
+    _embedding_index_remove(photo_ids)
 
     thumbs_removed = 0
     for tn in thumbs:
@@ -3379,7 +3949,7 @@ def _delete_indexed_photos_by_ids(photo_ids: Iterable[int]) -> dict:
     if not ids:
         return {"photos": 0, "faces": 0, "thumbs": 0, "files": 0}
 
-    with closing(get_conn()) as conn:
+    with db_conn() as conn:
         ph = ",".join(["?"] * len(ids))
         rows = conn.execute(
             f"SELECT id, rel_path, thumb_name FROM photos WHERE id IN ({ph})",
@@ -3403,6 +3973,8 @@ def _delete_indexed_photos_by_ids(photo_ids: Iterable[int]) -> dict:
         conn.execute(f"DELETE FROM faces WHERE photo_id IN ({ph2})", resolved_ids)
         conn.execute(f"DELETE FROM photos WHERE id IN ({ph2})", resolved_ids)
         conn.commit()
+    _face_cache_invalidate()
+    _embedding_index_remove(resolved_ids)
 
     thumbs_removed = 0
     for tn in thumbs:
@@ -3505,7 +4077,7 @@ def _load_share_from_token(token: str, touch: bool = False) -> Optional[sqlite3.
     token_hash = _share_token_digest(token)
     if not token_hash:
         return None
-    with closing(get_conn()) as conn:
+    with db_conn() as conn:
         row = conn.execute(
             "SELECT * FROM share_links WHERE token_hash=? LIMIT 1",
             (token_hash,),
@@ -3650,7 +4222,7 @@ def setup():
         if p != p2:
             return render_template("setup.html", error=_ui_text("setup_password_mismatch"), require_token=require_token)
         try:
-            with closing(get_conn()) as conn:
+            with db_conn() as conn:
                 conn.execute(
                     "INSERT INTO users(username, password_hash, is_admin, created_at) VALUES (?,?,?,?)",
                     (u, generate_password_hash(p), 1, now_iso()),
@@ -3678,13 +4250,226 @@ def sha256_file(path: Path, chunk_size: int = 1024 * 1024) -> str:
     return h.hexdigest()
 
 
+def quick_hash_file(path: Path, sample_size: int = 64 * 1024) -> str:
+    """SHA-256 over the file size plus its first and last ``sample_size`` bytes."""
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        h.update(str(size).encode())
+        f.seek(0)
+        h.update(f.read(sample_size))
+        if size > sample_size:
+            f.seek(max(sample_size, size - sample_size))
+            h.update(f.read(sample_size))
+    return h.hexdigest()
+
+
 def average_hash(img: Image.Image, hash_size: int = 8) -> str:
-    gray = img.convert("L").resize((hash_size, hash_size))
-    pixels = list(gray.getdata())
-    avg = sum(pixels) / len(pixels)
-    bits = "".join("1" if p > avg else "0" for p in pixels)
-    # binary -> hex string
-    return f"{int(bits, 2):0{hash_size*hash_size//4}x}"
+    """Legacy aHash as hex (the ``phash`` column); see perceptual_hashes for the DCT hash."""
+    px = np.asarray(img.convert("L").resize((hash_size, hash_size)), dtype=np.uint8)
+    bits = (px > px.mean()).ravel()
+    value = int.from_bytes(np.packbits(bits).tobytes(), "big") >> (-bits.size % 8)
+    return f"{value:0{hash_size*hash_size//4}x}"
+
+
+# --- Perceptual hashes (phash64 / dhash64) ---
+# 64-bit DCT pHash and difference hash, stored as signed SQLite integers. Both are
+# computed from a small grayscale copy, so a thumbnail is as good an input as the
+# original; batches of images are hashed with one vectorised DCT.
+_PHASH_DCT_SIZE = 32
+_HASH64_MASK = (1 << 64) - 1
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)[:, None]
+    m = np.cos(np.pi * (2 * np.arange(n)[None, :] + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    m[0] /= np.sqrt(2.0)
+    return m.astype(np.float32)
+
+
+_PHASH_DCT = _dct_matrix(_PHASH_DCT_SIZE)
+
+
+def _hash_planes(img: Image.Image) -> Tuple[np.ndarray, np.ndarray]:
+    """Grayscale 32x32 (pHash) and 9x8 (dHash) planes of an image."""
+    small = img.convert("L").resize(
+        (_PHASH_DCT_SIZE, _PHASH_DCT_SIZE), Image.Resampling.LANCZOS, reducing_gap=2.0
+    )
+    d = np.asarray(small.resize((9, 8), Image.Resampling.LANCZOS), dtype=np.int16)
+    return np.asarray(small, dtype=np.float32), d
+
+
+def _pack_hash64(bits: np.ndarray) -> np.ndarray:
+    """(N, 64) booleans -> (N,) signed int64, first bit most significant."""
+    return np.packbits(bits, axis=1).view(">i8").ravel().astype(np.int64)
+
+
+def perceptual_hashes_batch(images: list[Image.Image]) -> list[Tuple[int, int]]:
+    """(phash64, dhash64) for each image."""
+    if not images:
+        return []
+    planes = [_hash_planes(im) for im in images]
+    p = np.stack([x[0] for x in planes])
+    d = np.stack([x[1] for x in planes])
+    # 2-D DCT-II of every plane at once; keep the 8x8 lowest frequencies
+    coeffs = (_PHASH_DCT @ p @ _PHASH_DCT.T)[:, :8, :8].reshape(len(images), 64)
+    phash = _pack_hash64(coeffs > np.median(coeffs, axis=1, keepdims=True))
+    dhash = _pack_hash64((d[:, :, 1:] > d[:, :, :-1]).reshape(len(images), 64))
+    return [(int(a), int(b)) for a, b in zip(phash, dhash)]
+
+
+def perceptual_hashes(img: Image.Image) -> Tuple[int, int]:
+    return perceptual_hashes_batch([img])[0]
+
+
+def _hamdist64(a: int, b: int) -> int:
+    return ((a ^ b) & _HASH64_MASK).bit_count()
+
+
+# --- pHash radius search (multi-index hashing) ---
+# A 64-bit hash is split into four 16-bit substrings. Two hashes within Hamming
+# distance r differ in at most r // 4 bits in at least one substring, so a radius
+# query only has to probe substring values that close to the query's. The
+# substrings of photos.phash64 are SQLite expression indexes (kept current by every
+# upsert/delete); whole-library grouping runs the same join over NumPy arrays.
+_PHASH_CHUNK_SHIFTS = (48, 32, 16, 0)
+_PHASH_MAX_RADIUS = 16
+_POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _popcount64(x: np.ndarray) -> np.ndarray:
+    x = np.ascontiguousarray(x, dtype=np.uint64)
+    return _POPCOUNT8[x.view(np.uint8)].reshape(-1, 8).sum(axis=1, dtype=np.int32)
+
+
+def _phash_chunk_masks(bits: int) -> list[int]:
+    """All 16-bit XOR masks with at most ``bits`` bits set (0 first)."""
+    return [sum(1 << b for b in c) for k in range(bits + 1) for c in itertools.combinations(range(16), k)]
+
+
+def _phash_chunk_sql(shift: int) -> str:
+    # Must match the idx_photos_phash_q* index expressions exactly
+    return f"((phash64 >> {shift}) & 65535)"
+
+
+def _phash_radius_rows(conn: sqlite3.Connection, h: int, radius: int) -> list[Tuple[int, int, int]]:
+    """(photo_id, phash64, distance) of every row whose phash64 is within ``radius`` bits of h."""
+    radius = max(0, min(int(radius), _PHASH_MAX_RADIUS))
+    masks = _phash_chunk_masks(radius // 4)
+    parts = []
+    for shift in _PHASH_CHUNK_SHIFTS:
+        q = (h >> shift) & 0xFFFF
+        values = ",".join(str(q ^ m) for m in masks)
+        parts.append(f"SELECT id, phash64 FROM photos WHERE phash64 IS NOT NULL AND {_phash_chunk_sql(shift)} IN ({values})")
+    out = []
+    for r in conn.execute(" UNION ".join(parts)):
+        d = _hamdist64(h, int(r["phash64"]))
+        if d <= radius:
+            out.append((int(r["id"]), int(r["phash64"]), d))
+    return out
+
+
+def phash_neighbors(conn: sqlite3.Connection, h: int, radius: int, exclude_id: Optional[int] = None) -> list[Tuple[int, int]]:
+    """(photo_id, distance) of rows whose phash64 is within ``radius`` bits of h, nearest first."""
+    out = [(pid, d) for pid, _, d in _phash_radius_rows(conn, h, radius) if exclude_id is None or pid != int(exclude_id)]
+    out.sort(key=lambda x: (x[1], x[0]))
+    return out
+
+
+def _phash_near_pairs(hashes: np.ndarray, radius: int, budget: int = 2_000_000) -> Tuple[np.ndarray, np.ndarray]:
+    """Index pairs (a, b) of distinct entries of ``hashes`` (uint64) within ``radius`` bits.
+
+    Each pair is reported once. Candidates are expanded in slices of at most
+    ``budget`` pairs to bound memory.
+    """
+    n = int(hashes.size)
+    t = max(0, min(int(radius), _PHASH_MAX_RADIUS)) // 4
+    masks = _phash_chunk_masks(t)
+    out_a: list[np.ndarray] = []
+    out_b: list[np.ndarray] = []
+    for j, shift in enumerate(_PHASH_CHUNK_SHIFTS):
+        chunk = ((hashes >> np.uint64(shift)) & np.uint64(0xFFFF)).astype(np.int64)
+        order = np.argsort(chunk, kind="stable")
+        starts = np.zeros(65537, dtype=np.int64)
+        np.cumsum(np.bincount(chunk, minlength=65536), out=starts[1:])
+        for m in masks:
+            if m == 0:
+                # Same substring value: pair each entry with the ones after it in its bucket
+                left = order
+                lo = np.arange(1, n + 1)
+                hi = starts[chunk[order] + 1]
+            else:
+                target = chunk ^ m
+                left = np.nonzero(chunk < target)[0]
+                lo = starts[target[left]]
+                hi = starts[target[left] + 1]
+            cnt = hi - lo
+            keep = cnt > 0
+            left, lo, cnt = left[keep], lo[keep], cnt[keep]
+            ends = np.cumsum(cnt)
+            s = 0
+            while s < cnt.size:
+                base = int(ends[s - 1]) if s else 0
+                e = max(s + 1, int(np.searchsorted(ends, base + budget, side="right")))
+                cc = cnt[s:e]
+                offs = np.arange(int(ends[e - 1]) - base) - np.repeat(np.cumsum(cc) - cc, cc)
+                a = np.repeat(left[s:e], cc)
+                b = order[np.repeat(lo[s:e], cc) + offs]
+                x = hashes[a] ^ hashes[b]
+                ok = _popcount64(x) <= radius
+                a, b, x = a[ok], b[ok], x[ok]
+                # Report a pair only from the first substring that matched it
+                for prev in _PHASH_CHUNK_SHIFTS[:j]:
+                    ok = _popcount64((x >> np.uint64(prev)) & np.uint64(0xFFFF)) > t
+                    a, b, x = a[ok], b[ok], x[ok]
+                out_a.append(a)
+                out_b.append(b)
+                s = e
+    if not out_a:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(out_a), np.concatenate(out_b)
+
+
+def _exif_payload(img: Image.Image) -> Optional[bytes]:
+    """Raw EXIF block Pillow already read from the file header, if any."""
+    raw = img.info.get("exif")
+    if isinstance(raw, (bytes, bytearray)) and raw:
+        return bytes(raw)
+    return None
+
+
+def _oriented_size(img: Image.Image) -> tuple[int, int]:
+    """Full-resolution (width, height) after EXIF orientation, without decoding."""
+    w, h = img.size
+    try:
+        if img.getexif().get(0x0112) in (5, 6, 7, 8):
+            return h, w
+    except Exception:
+        pass
+    return w, h
+
+
+def _decode_reduced(img: Image.Image, size: tuple[int, int] = THUMB_SIZE) -> Image.Image:
+    """Decode an opened image once, as small as possible while still covering ``size``.
+
+    JPEG uses DCT scaling via draft() (1/2, 1/4 or 1/8), other formats decode at
+    full size. The result is EXIF-transposed; thumbnail and hashes share it.
+    """
+    try:
+        if getattr(img, "is_animated", False):
+            img.seek(0)
+    except Exception:
+        pass
+    try:
+        img.draft("RGB", size)
+    except Exception:
+        pass
+    try:
+        return ImageOps.exif_transpose(img)
+    except Exception:
+        img.load()
+        return img
 
 
 def _rational_to_float(v: Any) -> Optional[float]:
@@ -3807,15 +4592,16 @@ def _piexif_get_first(exif_dict: dict, ifd: str, tag: int) -> Optional[Any]:
         return None
 
 
-def extract_exif_via_heif(path: Path) -> Dict[str, Any]:
+def extract_exif_via_heif(path: Path, exif_bytes: Optional[bytes] = None) -> Dict[str, Any]:
     out: Dict[str, Any] = {}
     try:
-        # If pillow_heif is unavailable, skip gracefully
-        try:
-            hf = HeifFile(path)  # type: ignore[name-defined]
-        except NameError:
-            return out
-        exif_bytes = hf.info.get("exif") if isinstance(hf.info, dict) else None
+        if exif_bytes is None:
+            # If pillow_heif is unavailable, skip gracefully
+            try:
+                hf = HeifFile(path)  # type: ignore[name-defined]
+            except NameError:
+                return out
+            exif_bytes = hf.info.get("exif") if isinstance(hf.info, dict) else None
         if not exif_bytes:
             return out
         exif_dict = piexif.load(exif_bytes)
@@ -3870,11 +4656,16 @@ def extract_exif_via_heif(path: Path) -> Dict[str, Any]:
     return out
 
 
-def extract_exif_via_exifread(path: Path) -> Dict[str, Any]:
+def extract_exif_via_exifread(path: Path, exif_bytes: Optional[bytes] = None) -> Dict[str, Any]:
     out: Dict[str, Any] = {}
     try:
-        with path.open("rb") as f:
-            tags = exifread.process_file(f, details=False)
+        if exif_bytes:
+            # Raw EXIF payload is a TIFF structure behind the "Exif\0\0" marker
+            tiff = exif_bytes[6:] if exif_bytes.startswith(b"Exif") else exif_bytes
+            tags = exifread.process_file(io.BytesIO(tiff), details=False)
+        else:
+            with path.open("rb") as f:
+                tags = exifread.process_file(f, details=False)
         # DateTimeOriginal
         for key in ("EXIF DateTimeOriginal", "EXIF DateTimeDigitized", "Image DateTime"):
             if key in tags:
@@ -3912,10 +4703,10 @@ def extract_exif_via_exifread(path: Path) -> Dict[str, Any]:
     return out
 
 
-def extract_exif_via_piexif_file(path: Path) -> Dict[str, Any]:
+def extract_exif_via_piexif_file(path: Path, exif_bytes: Optional[bytes] = None) -> Dict[str, Any]:
     out: Dict[str, Any] = {}
     try:
-        exif_dict = piexif.load(str(path))
+        exif_dict = piexif.load(exif_bytes or str(path))
         dto = _piexif_get_first(exif_dict, "Exif", piexif.ExifIFD.DateTimeOriginal)
         if dto:
             out["captured_at"] = parse_captured_at({"DateTimeOriginal": dto.decode() if isinstance(dto, bytes) else str(dto)}, path.stat().st_mtime)
@@ -4024,7 +4815,8 @@ def make_thumb(img: Image.Image, rel_path: str, file_mtime: float, file_size: in
     except Exception:
         pass
 
-    thumb = img.convert("RGB").copy()
+    # Callers usually pass the output of _decode_reduced (already transposed)
+    thumb = img.convert("RGB") if img.mode != "RGB" else img.copy()
     try:
         thumb = ImageOps.exif_transpose(thumb)
     except Exception:
@@ -4108,7 +4900,38 @@ def ensure_viewable_copy(path: Path, rel_path: str) -> Path:
         return path
 
 
-def extract_metadata(path: Path, rel_path: str, *, generate_thumb: bool = True) -> Dict[str, Any]:
+def _apply_reverse_geocode(metadata: Dict[str, Any], rel_path: str) -> None:
+    """Reverse geocode (country, city) into metadata_json["geo"] and gps_name if GPS is present."""
+    try:
+        lat_raw = metadata.get("gps_lat")
+        lon_raw = metadata.get("gps_lon")
+        if GEOCODE_ENABLE and (lat_raw is not None) and (lon_raw is not None):
+            lat = float(lat_raw)
+            lon = float(lon_raw)
+            country, city = reverse_geocode_with_cache(lat, lon)
+            # Save into metadata_json and gps_name for quick display
+            if country or city:
+                mj = metadata.get("metadata_json") or {}
+                geo = mj.get("geo", {})
+                if country and not geo.get("country"):
+                    geo["country"] = country
+                if city and not geo.get("city"):
+                    geo["city"] = city
+                mj["geo"] = geo
+                metadata["metadata_json"] = mj
+                if not metadata.get("gps_name"):
+                    metadata["gps_name"] = ", ".join([x for x in [city, country] if x])
+    except Exception as e:
+        log_event("error", rel_path=rel_path, error=f"geocode_outer: {e}")
+
+
+def extract_metadata(path: Path, rel_path: str, *, generate_thumb: bool = True, geocode: bool = True) -> Dict[str, Any]:
+    """Read file, image and EXIF metadata for one file (plus thumbnail and hashes).
+
+    ``geocode=False`` skips reverse geocoding so the caller can run it later
+    with _apply_reverse_geocode (the scan pipeline does this outside the
+    worker processes).
+    """
     stat = path.stat()
     metadata: Dict[str, Any] = {
         "rel_path": rel_path,
@@ -4123,6 +4946,11 @@ def extract_metadata(path: Path, rel_path: str, *, generate_thumb: bool = True)
     exif_map: Dict[str, Any] = {}
     thumb_name = None
     phash = None
+    phash64 = dhash64 = None
+    # EXIF block as read by Pillow; header_read marks that the header was parsed
+    # so the fallbacks below don't re-read the file to find nothing
+    exif_bytes: Optional[bytes] = None
+    header_read = False
     # Ensure all DB-bound fields exist (videos may not populate them)
     for k in (
         "width", "height", "camera_make", "camera_model", "lens_model",
@@ -4172,18 +5000,20 @@ def extract_metadata(path: Path, rel_path: str, *, generate_thumb: bool = True)
                         thumb_name = make_thumb(img, rel_path, stat.st_mtime, stat.st_size)
                     try:
                         phash = average_hash(img)
+                        phash64, dhash64 = perceptual_hashes(img)
                     except Exception:
                         phash = None
                 else:
                     # Could not decode; still set captured_at; ensure a viewable will be produced lazily
                     metadata.setdefault("captured_at", datetime.fromtimestamp(stat.st_mtime).isoformat(timespec="seconds"))
             else:
-                with Image.open(path) as img:
-                    try:
-                        img = ImageOps.exif_transpose(img)
-                    except Exception:
-                        pass
-                    metadata["width"], metadata["height"] = img.size
+                with Image.open(path) as src:
+                    # Size and EXIF come from the header; pixels are decoded once,
+                    # reduced, and shared by the thumbnail and the hash
+                    metadata["width"], metadata["height"] = _oriented_size(src)
+                    exif_bytes = _exif_payload(src)
+                    header_read = True
+                    img = _decode_reduced(src)
                     exif_map = parse_exif(img)
                     metadata["captured_at"] = parse_captured_at(exif_map, stat.st_mtime)
                     metadata["camera_make"] = exif_map.get("Make")
@@ -4199,6 +5029,7 @@ def extract_metadata(path: Path, rel_path: str, *, generate_thumb: bool = True)
                     thumb_name = make_thumb(img, rel_path, stat.st_mtime, stat.st_size) if generate_thumb else None
                     try:
                         phash = average_hash(img)
+                        phash64, dhash64 = perceptual_hashes(img)
                     except Exception:
                         phash = None
         except Exception as e:
@@ -4209,16 +5040,18 @@ def extract_metadata(path: Path, rel_path: str, *, generate_thumb: bool = True)
     # Fallbacks to enrich missing EXIF (camera, lens, GPS, date)
     try:
         ext = path.suffix.lower()
-        if ext in {".heic", ".heif"}:
-            extra = extract_exif_via_heif(path)
+        if header_read and exif_bytes is None and ext in {".heic", ".heif", ".jpg", ".jpeg"}:
+            extra = {}
+        elif ext in {".heic", ".heif"}:
+            extra = extract_exif_via_heif(path, exif_bytes)
         elif ext in {".jpg", ".jpeg", ".tif", ".tiff"}:
             # prefer piexif on file (robust GPS), then exifread as backup
-            extra = extract_exif_via_piexif_file(path)
+            extra = extract_exif_via_piexif_file(path, exif_bytes)
             if not extra.get("gps_lat") and not extra.get("gps_lon"):
-                more = extract_exif_via_exifread(path)
+                more = extract_exif_via_exifread(path, exif_bytes)
                 extra.update({k: v for k, v in more.items() if v is not None})
         else:
-            extra = extract_exif_via_exifread(path)
+            extra = extract_exif_via_exifread(path, exif_bytes)
         for k in ("captured_at", "camera_make", "camera_model", "lens_model", "iso", "f_number", "focal_length", "exposure_time", "gps_lat", "gps_lon"):
             if metadata.get(k) in (None, "") and extra.get(k) is not None:
                 metadata[k] = extra[k]
@@ -4228,27 +5061,8 @@ def extract_metadata(path: Path, rel_path: str, *, generate_thumb: bool = True)
         log_event("error", rel_path=rel_path, error=f"exif_fallback: {e}")
 
     # Reverse geocoding (country, city) if GPS present
-    try:
-        lat_raw = metadata.get("gps_lat")
-        lon_raw = metadata.get("gps_lon")
-        if GEOCODE_ENABLE and (lat_raw is not None) and (lon_raw is not None):
-            lat = float(lat_raw)
-            lon = float(lon_raw)
-            country, city = reverse_geocode_with_cache(lat, lon)
-            # Save into metadata_json and gps_name for quick display
-            if country or city:
-                mj = metadata.get("metadata_json") or {}
-                geo = mj.get("geo", {})
-                if country and not geo.get("country"):
-                    geo["country"] = country
-                if city and not geo.get("city"):
-                    geo["city"] = city
-                mj["geo"] = geo
-                metadata["metadata_json"] = mj
-                if not metadata.get("gps_name"):
-                    metadata["gps_name"] = ", ".join([x for x in [city, country] if x])
-    except Exception as e:
-        log_event("error", rel_path=rel_path, error=f"geocode_outer: {e}")
+    if geocode:
+        _apply_reverse_geocode(metadata, rel_path)
 
     # If critical EXIF is missing (common when HEIC was re-encoded as JPG without metadata),
     # try to enrich from a sibling HEIC/HEIF with same basename — but ONLY if the images
@@ -4256,15 +5070,11 @@ def extract_metadata(path: Path, rel_path: str, *, generate_thumb: bool = True)
     try:
         if (not metadata.get("gps_lat") and not metadata.get("gps_lon")) or (not metadata.get("lens_model")):
             # Consider any sibling with the same basename but different extension (supported types)
-            cur_phash = phash
+            cur_phash = phash64
             if cur_phash is None:
                 try:
                     with Image.open(path) as _img_tmp:
-                        try:
-                            _img_tmp = ImageOps.exif_transpose(_img_tmp)
-                        except Exception:
-                            pass
-                        cur_phash = average_hash(_img_tmp)
+                        cur_phash = perceptual_hashes(_decode_reduced(_img_tmp))[0]
                 except Exception:
                     cur_phash = None
 
@@ -4280,18 +5090,13 @@ def extract_metadata(path: Path, rel_path: str, *, generate_thumb: bool = True)
                         continue
                     try:
                         with Image.open(cand) as himg:
-                            try:
-                                himg = ImageOps.exif_transpose(himg)
-                            except Exception:
-                                pass
+                            himg = _decode_reduced(himg)
                             h_exif = parse_exif(himg)
                             try:
-                                cand_phash = average_hash(himg)
+                                cand_phash = perceptual_hashes(himg)[0]
                             except Exception:
-                                cand_phash = None
-                            if not cand_phash:
                                 continue
-                            dist = _hamdist_hex(cur_phash, cand_phash)
+                            dist = _hamdist64(cur_phash, cand_phash)
                             if dist <= PHASH_MATCH_THRESHOLD:  # visual match threshold
                                 log_event("enrich", rel_path=rel_path, from_path=str(cand), distance=dist)
                                 if not metadata.get("captured_at"):
@@ -4318,8 +5123,13 @@ def extract_metadata(path: Path, rel_path: str, *, generate_thumb: bool = True)
     except Exception:
         pass
 
-    metadata["checksum_sha256"] = sha256_file(path)
+    # Full SHA-256 is computed lazily (see _store_full_checksums); the upsert keeps a
+    # stored checksum while the file's modified_fs/file_size are unchanged
+    metadata["checksum_sha256"] = None
+    metadata["quick_hash"] = quick_hash_file(path)
     metadata["phash"] = phash
+    metadata["phash64"] = phash64
+    metadata["dhash64"] = dhash64
     metadata["thumb_name"] = thumb_name
     metadata["ai_tags"] = build_ai_tags(metadata["filename"], exif_map, metadata.get("gps_lat"), metadata.get("gps_lon"))
     metadata["exif_json"] = exif_map
@@ -4354,7 +5164,7 @@ def reverse_geocode_with_cache(lat: float, lon: float) -> tuple[Optional[str], O
     """Return (country, city) using cache and provider fallbacks."""
     lat_r = int(round(lat * 10000))
     lon_r = int(round(lon * 10000))
-    with closing(get_conn()) as conn:
+    with db_conn() as conn:
         row = conn.execute(
             "SELECT country, city FROM geo_cache WHERE lat_rounded=? AND lon_rounded=?",
             (lat_r, lon_r),
@@ -4364,7 +5174,7 @@ def reverse_geocode_with_cache(lat: float, lon: float) -> tuple[Optional[str], O
 
     country, city = reverse_geocode_providers(lat, lon)
     if country or city:
-        with closing(get_conn()) as conn:
+        with db_conn() as conn:
             conn.execute(
                 "INSERT INTO geo_cache(lat_rounded, lon_rounded, country, city, created_at) VALUES (?,?,?,?,?)",
                 (lat_r, lon_r, country, city, now_iso()),
@@ -4467,12 +5277,11 @@ def rescan_metadata(stop_event=None) -> Dict[str, Any]:
     init_db()
     log_event("rescan_start")
     scanned = 0
-    updated = 0
     errors = 0
     missing = 0
     samples: list[str] = []
 
-    with closing(get_conn()) as conn:
+    with db_conn() as conn:
         rows = conn.execute(
             """
             SELECT id, rel_path, thumb_name,
@@ -4483,6 +5292,8 @@ def rescan_metadata(stop_event=None) -> Dict[str, Any]:
             """
         ).fetchall()
 
+    # Changed rows are committed in batches (SCAN_WRITE_BATCH / SCAN_WRITE_FLUSH_SEC)
+    writes = _PhotoUpsertBatch(event="rescan_updated")
     for row in rows:
         if stop_event and stop_event.is_set():
             break
@@ -4529,9 +5340,7 @@ def rescan_metadata(stop_event=None) -> Dict[str, Any]:
                 elif (meta.get("gps_name") or None) != (row["gps_name"] or None):
                     changed = True
             if changed:
-                upsert_photo(meta)
-                updated += 1
-                log_event("rescan_updated", rel_path=rel_path)
+                writes.add(meta)
             else:
                 log_event("no_new", rel_path=rel_path)
         except Exception as e:
@@ -4539,6 +5348,12 @@ def rescan_metadata(stop_event=None) -> Dict[str, Any]:
             log_event("error", rel_path=rel_path, error=str(e))
             if len(samples) < 5:
                 samples.append(f"{rel_path}: {e}")
+    writes.flush()
+    updated = writes.written
+    errors += writes.errors
+    for sample in writes.error_samples:
+        if len(samples) < 5:
+            samples.append(sample)
 
     result = {
         "ok": True,
@@ -4553,259 +5368,1390 @@ def rescan_metadata(stop_event=None) -> Dict[str, Any]:
 
 
 # --- Face indexing API ---
-_faces_running = threading.Event()
-faces_counts: Dict[str, int] = {"processed": 0, "total": 0}
-last_faces_result: Optional[Dict[str, Any]] = None
-
-
-def _index_faces_worker(all_photos: bool = False):
-    global faces_counts, last_faces_result
-    try:
-        with closing(get_conn()) as conn:
-            if all_photos:
-                rows = conn.execute("SELECT rel_path FROM photos").fetchall()
-            else:
-                rows = conn.execute("SELECT rel_path FROM photos WHERE people_count=0").fetchall()
-        total = len(rows)
-        faces_counts = {"processed": 0, "total": total}
-        for row in rows:
-            if not _faces_running.is_set():
-                break
-            rel = row["rel_path"]
-            log_event("faces_index", rel_path=rel)
-            index_faces_for_photo(rel)
-            faces_counts["processed"] += 1
-            face_delay = faces_index_throttle_enabled_sec()
-            if face_delay > 0:
-                time.sleep(face_delay)
-        last_faces_result = {"ok": True, **faces_counts}
-    finally:
-        _faces_running.clear()
-
-
 @app.route("/api/faces/index", methods=["POST"])
 def api_faces_index():
-    global faces_counts
-    if _faces_running.is_set():
+    if _work_batch_status("faces")[0]:
         return jsonify({"ok": False, "error": "Faces indexing already running"}), 409
     scope = (request.args.get("scope") or "").strip().lower()
     _set_setting("faces_auto_index", "1")
     if scope == "new":
         return jsonify({"ok": True, "running": False, "auto_index": True, "scope": "new"})
 
-    _faces_running.set()
-    faces_counts = {"processed": 0, "total": 0}
     all_photos = True if scope == "all" else (request.args.get("all") in {"1", "true", "True"})
-    threading.Thread(target=_index_faces_worker, args=(all_photos,), daemon=True).start()
+    with db_conn() as conn:
+        if all_photos:
+            rows = conn.execute("SELECT rel_path FROM photos").fetchall()
+        else:
+            rows = conn.execute("SELECT rel_path FROM photos WHERE people_count=0").fetchall()
+    _work_start_batch("faces", ((f"faces:{r['rel_path']}", {"rel_path": r["rel_path"]}) for r in rows))
     return jsonify({"ok": True, "running": True, "auto_index": True, "scope": (scope or ("all" if all_photos else "missing"))})
 
 
 @app.route("/api/faces/stop", methods=["POST"])
 def api_faces_stop():
     _set_setting("faces_auto_index", "0")
-    if _faces_running.is_set():
-        _faces_running.clear()
+    if _work_batch_status("faces")[0]:
+        _work_cancel_batch("faces")
         return jsonify({"ok": True, "running": True, "stopping": True, "auto_index": False})
     return jsonify({"ok": True, "running": False, "auto_index": False})
 
 
 @app.route("/api/faces/status")
 def api_faces_status():
-    resp: Dict[str, Any] = {"ok": True, "running": _faces_running.is_set(), "auto_index": faces_auto_index_enabled(), **faces_counts}
-    if not _faces_running.is_set() and last_faces_result:
-        resp["last"] = last_faces_result
+    running, c = _work_batch_status("faces")
+    counts = {"processed": c["done"] + c["failed"], "total": c["queued"] + c["running"] + c["done"] + c["failed"]}
+    resp: Dict[str, Any] = {"ok": True, "running": running, "auto_index": faces_auto_index_enabled(), **counts}
+    if not running and counts["total"]:
+        resp["last"] = {"ok": True, **counts}
     return jsonify(resp)
 
 
-def upsert_photo(meta: Dict[str, Any]) -> None:
-    with closing(get_conn()) as conn:
-        conn.execute(
-            """
-            INSERT INTO photos (
-                rel_path, filename, ext, file_size, width, height, created_fs, modified_fs,
-                captured_at, camera_make, camera_model, lens_model, iso, focal_length, f_number,
-                exposure_time, gps_lat, gps_lon, gps_name, checksum_sha256, phash, thumb_name,
-                favorite, people_count, ai_tags, embedding_json, metadata_json, exif_json,
-                uploaded_by, imported_at, last_scanned_at
-            ) VALUES (
-                :rel_path, :filename, :ext, :file_size, :width, :height, :created_fs, :modified_fs,
-                :captured_at, :camera_make, :camera_model, :lens_model, :iso, :focal_length, :f_number,
-                :exposure_time, :gps_lat, :gps_lon, :gps_name, :checksum_sha256, :phash, :thumb_name,
-                COALESCE((SELECT favorite FROM photos WHERE rel_path=:rel_path), 0),
-                COALESCE((SELECT people_count FROM photos WHERE rel_path=:rel_path), 0),
-                :ai_tags, COALESCE((SELECT embedding_json FROM photos WHERE rel_path=:rel_path), NULL),
-                :metadata_json, :exif_json,
-                COALESCE((SELECT uploaded_by FROM photos WHERE rel_path=:rel_path), :uploaded_by),
-                COALESCE((SELECT imported_at FROM photos WHERE rel_path=:rel_path), :imported_at),
-                :last_scanned_at
-            )
-            ON CONFLICT(rel_path) DO UPDATE SET
-                filename=excluded.filename,
-                ext=excluded.ext,
-                file_size=excluded.file_size,
-                width=excluded.width,
-                height=excluded.height,
-                created_fs=excluded.created_fs,
-                modified_fs=excluded.modified_fs,
-                captured_at=excluded.captured_at,
-                camera_make=excluded.camera_make,
-                camera_model=excluded.camera_model,
-                lens_model=excluded.lens_model,
-                iso=excluded.iso,
-                focal_length=excluded.focal_length,
-                f_number=excluded.f_number,
-                exposure_time=excluded.exposure_time,
-                gps_lat=excluded.gps_lat,
-                gps_lon=excluded.gps_lon,
-                gps_name=excluded.gps_name,
-                checksum_sha256=excluded.checksum_sha256,
-                phash=excluded.phash,
-                thumb_name=excluded.thumb_name,
-                ai_tags=excluded.ai_tags,
-                metadata_json=excluded.metadata_json,
-                exif_json=excluded.exif_json,
-                uploaded_by=COALESCE(excluded.uploaded_by, uploaded_by),
-                last_scanned_at=excluded.last_scanned_at
-            """,
-            {
-                **meta,
-                "ai_tags": json.dumps(meta.get("ai_tags", []), ensure_ascii=False),
-                "metadata_json": json.dumps(meta.get("metadata_json", {}), ensure_ascii=False, default=str),
-                "exif_json": json.dumps(meta.get("exif_json", {}), ensure_ascii=False, default=str),
-                "uploaded_by": _sanitize_share_visitor_name(meta.get("uploaded_by") or "") or None,
-                "imported_at": now_iso(),
-                "last_scanned_at": now_iso(),
-            },
-        )
+# No correlated subqueries: on insert favorite/people_count start at 0 and
+# imported_at/uploaded_by come from the caller; on conflict the DO UPDATE list
+# leaves favorite, people_count, embedding_json and imported_at untouched, keeps
+# an existing uploaded_by, and keeps checksum_sha256 while mtime/size match.
+_PHOTO_UPSERT_SQL = """
+    INSERT INTO photos (
+        rel_path, filename, ext, file_size, width, height, created_fs, modified_fs,
+        captured_at, camera_make, camera_model, lens_model, iso, focal_length, f_number,
+        exposure_time, gps_lat, gps_lon, gps_name, checksum_sha256, quick_hash, phash, phash64, dhash64, thumb_name,
+        favorite, people_count, ai_tags, embedding_json, metadata_json, exif_json,
+        uploaded_by, imported_at, last_scanned_at
+    ) VALUES (
+        :rel_path, :filename, :ext, :file_size, :width, :height, :created_fs, :modified_fs,
+        :captured_at, :camera_make, :camera_model, :lens_model, :iso, :focal_length, :f_number,
+        :exposure_time, :gps_lat, :gps_lon, :gps_name, :checksum_sha256, :quick_hash, :phash, :phash64, :dhash64, :thumb_name,
+        0, 0, :ai_tags, NULL, :metadata_json, :exif_json,
+        :uploaded_by, :imported_at, :last_scanned_at
+    )
+    ON CONFLICT(rel_path) DO UPDATE SET
+        filename=excluded.filename,
+        ext=excluded.ext,
+        file_size=excluded.file_size,
+        width=excluded.width,
+        height=excluded.height,
+        created_fs=excluded.created_fs,
+        modified_fs=excluded.modified_fs,
+        captured_at=excluded.captured_at,
+        camera_make=excluded.camera_make,
+        camera_model=excluded.camera_model,
+        lens_model=excluded.lens_model,
+        iso=excluded.iso,
+        focal_length=excluded.focal_length,
+        f_number=excluded.f_number,
+        exposure_time=excluded.exposure_time,
+        gps_lat=excluded.gps_lat,
+        gps_lon=excluded.gps_lon,
+        gps_name=excluded.gps_name,
+        checksum_sha256=CASE
+            WHEN excluded.checksum_sha256 IS NOT NULL THEN excluded.checksum_sha256
+            WHEN photos.modified_fs IS excluded.modified_fs AND photos.file_size IS excluded.file_size THEN photos.checksum_sha256
+            ELSE NULL
+        END,
+        quick_hash=excluded.quick_hash,
+        phash=excluded.phash,
+        phash64=excluded.phash64,
+        dhash64=excluded.dhash64,
+        thumb_name=excluded.thumb_name,
+        ai_tags=excluded.ai_tags,
+        metadata_json=excluded.metadata_json,
+        exif_json=excluded.exif_json,
+        uploaded_by=COALESCE(photos.uploaded_by, excluded.uploaded_by),
+        last_scanned_at=excluded.last_scanned_at
+"""
+
+_PHOTO_UPSERT_KEYS = (
+    "rel_path", "filename", "ext", "file_size", "width", "height", "created_fs", "modified_fs",
+    "captured_at", "camera_make", "camera_model", "lens_model", "iso", "focal_length", "f_number",
+    "exposure_time", "gps_lat", "gps_lon", "gps_name", "checksum_sha256", "quick_hash", "phash", "phash64", "dhash64", "thumb_name",
+)
+
+
+def _photo_upsert_params(meta: Dict[str, Any], now: Optional[str] = None) -> Dict[str, Any]:
+    now = now or now_iso()
+    params = {k: meta.get(k) for k in _PHOTO_UPSERT_KEYS}
+    params.update({
+        "ai_tags": json.dumps(meta.get("ai_tags", []), ensure_ascii=False),
+        "metadata_json": json.dumps(meta.get("metadata_json", {}), ensure_ascii=False, default=str),
+        "exif_json": json.dumps(meta.get("exif_json", {}), ensure_ascii=False, default=str),
+        "uploaded_by": _sanitize_share_visitor_name(meta.get("uploaded_by") or "") or None,
+        "imported_at": now,
+        "last_scanned_at": now,
+    })
+    return params
+
+
+def _upsert_photo_rows(conn: sqlite3.Connection, metas: list[Dict[str, Any]]) -> None:
+    """Insert or update photo rows on ``conn`` with one executemany, without committing."""
+    if not metas:
+        return
+    now = now_iso()
+    conn.executemany(_PHOTO_UPSERT_SQL, [_photo_upsert_params(m, now) for m in metas])
+
+
+def upsert_photos(metas: list[Dict[str, Any]]) -> int:
+    """Write a batch of metadata dicts in a single transaction. Returns rows written."""
+    if not metas:
+        return 0
+    with db_conn() as conn:
+        _upsert_photo_rows(conn, metas)
         conn.commit()
+    return len(metas)
 
 
-def iter_photo_files(root: Path, prefix: str = "") -> Iterable[Tuple[Path, str]]:
+def upsert_photo(meta: Dict[str, Any]) -> None:
+    upsert_photos([meta])
+
+
+class _PhotoUpsertBatch:
+    """Buffers photo metadata and flushes it with upsert_photos-style batches.
+
+    add() flushes once SCAN_WRITE_BATCH rows are pending or the oldest pending
+    row is SCAN_WRITE_FLUSH_SEC old; callers must flush() at the end. A failing
+    batch is retried row by row so one bad row does not drop the rest.
+    ``on_written`` is called with each meta after its transaction commits.
+    """
+
+    def __init__(
+        self,
+        event: Optional[str] = None,
+        on_written: Optional[Callable[[Dict[str, Any]], None]] = None,
+        conn: Optional[sqlite3.Connection] = None,
+    ):
+        self.event = event
+        self.on_written = on_written
+        self.conn = conn
+        self.written = 0
+        self.errors = 0
+        self.error_samples: list[str] = []
+        self.failed_rels: list[str] = []
+        self.pending: list[Dict[str, Any]] = []
+        self.deadline = 0.0
+
+    def add(self, meta: Dict[str, Any]) -> None:
+        if not self.pending:
+            self.deadline = time.monotonic() + SCAN_WRITE_FLUSH_SEC
+        self.pending.append(meta)
+        if self.due():
+            self.flush()
+
+    def due(self) -> bool:
+        return bool(self.pending) and (len(self.pending) >= SCAN_WRITE_BATCH or time.monotonic() >= self.deadline)
+
+    def flush(self) -> None:
+        batch, self.pending = self.pending, []
+        if not batch:
+            return
+        if self.conn is not None:
+            done = self._write(self.conn, batch)
+        else:
+            with db_conn() as conn:
+                done = self._write(conn, batch)
+        self.written += len(done)
+        for meta in done:
+            if self.event:
+                log_event(self.event, rel_path=meta.get("rel_path"))
+            if self.on_written:
+                try:
+                    self.on_written(meta)
+                except Exception:
+                    pass
+
+    def _write(self, conn: sqlite3.Connection, batch: list[Dict[str, Any]]) -> list[Dict[str, Any]]:
+        try:
+            _upsert_photo_rows(conn, batch)
+            conn.commit()
+            return batch
+        except Exception:
+            conn.rollback()
+        done = []
+        for meta in batch:
+            try:
+                _upsert_photo_rows(conn, [meta])
+                conn.commit()
+                done.append(meta)
+            except Exception as e:
+                conn.rollback()
+                self.errors += 1
+                self.failed_rels.append(str(meta.get("rel_path") or ""))
+                log_event("error", rel_path=meta.get("rel_path"), error=str(e))
+                if len(self.error_samples) < 5:
+                    self.error_samples.append(f"{meta.get('rel_path')}: {e}")
+        return done
+
+
+def _skip_scan_entry(name: str) -> bool:
+    # Synology metadata folders/thumbnails and macOS resource forks
+    if name == "@eaDir" or name.startswith("._"):
+        return True
+    name_upper = name.upper()
+    return name_upper.startswith("SYNOPHOTO_THUMB_") or name_upper.startswith("SYNOPHOTO_CACHE_")
+
+
+def walk_photo_files(
+    root: Path,
+    prefix: str = "",
+    known_dirs: Optional[Dict[str, Tuple[int, list[str]]]] = None,
+    visited: Optional[Dict[str, Tuple[int, list[str]]]] = None,
+) -> Iterable[Tuple[Path, str, os.stat_result]]:
+    """Yield (path, rel_path, stat) for supported files below ``root`` using os.scandir.
+
+    Skipped entries are pruned before any stat, and each file's stat comes from
+    its DirEntry. ``known_dirs`` maps rel_dir -> (mtime_ns, subdirs) from a
+    previous scan: a directory whose mtime is unchanged has the same entries,
+    so its files are not listed again and only its known subdirectories are
+    visited. Every directory reached is recorded in ``visited`` the same way.
+    """
     if not root.exists():
         return
-    for p in root.rglob("*"):
-        if not p.is_file():
-            continue
-        if p.suffix.lower() not in SUPPORTED_EXTS:
-            continue
-        # Skip Synology generated thumbnails and special folders
-        name_upper = p.name.upper()
-        if any(part == "@eaDir" for part in p.parts):
-            continue
-        if name_upper.startswith("SYNOPHOTO_THUMB_") or name_upper.startswith("SYNOPHOTO_CACHE_"):
+    base = prefix.strip("/")
+    stack: list[str] = [""]
+    while stack:
+        sub = stack.pop()
+        key = "/".join(x for x in (base, sub) if x)
+        dir_path = os.path.join(str(root), sub) if sub else str(root)
+        try:
+            mtime_ns = os.stat(dir_path).st_mtime_ns
+        except OSError:
             continue
-        if p.name.startswith("._"):  # macOS resource forks
+        prev = known_dirs.get(key) if known_dirs else None
+        if prev and prev[0] == mtime_ns:
+            if visited is not None:
+                visited[key] = prev
+            stack.extend(f"{sub}/{d}" if sub else d for d in prev[1])
             continue
+        subdirs: list[str] = []
+        files: list[Tuple[Path, str, os.stat_result]] = []
         try:
-            rel = str(p.relative_to(root)).replace("\\", "/")
-        except Exception:
-            rel = p.name
-        if prefix:
-            rel = f"{prefix.rstrip('/')}/{rel}"
-        yield p, rel
+            with os.scandir(dir_path) as it:
+                for entry in it:
+                    name = entry.name
+                    if _skip_scan_entry(name):
+                        continue
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(name)
+                            continue
+                        if os.path.splitext(name)[1].lower() not in SUPPORTED_EXTS or not entry.is_file():
+                            continue
+                        rel = f"{sub}/{name}" if sub else name
+                        files.append((Path(entry.path), f"{base}/{rel}" if base else rel, entry.stat()))
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+        subdirs.sort()
+        if visited is not None:
+            visited[key] = (mtime_ns, subdirs)
+        yield from files
+        stack.extend(f"{sub}/{d}" if sub else d for d in reversed(subdirs))
 
 
-def scan_library(stop_event=None) -> Dict[str, Any]:
-    init_db()
-    log_event("scan_start")
+def iter_photo_files(root: Path, prefix: str = "") -> Iterable[Tuple[Path, str]]:
+    for path, rel, _ in walk_photo_files(root, prefix):
+        yield path, rel
 
-    if not PHOTO_DIR.exists():
-        return {
-            "ok": False,
-            "error": f"Photo folder not found: {PHOTO_DIR}",
-            "scanned": 0,
-            "updated": 0,
-            "errors": 0,
-        }
 
-    scanned = 0
-    updated = 0
-    errors = 0
-    error_samples: list[str] = []
+def _load_scan_dirs() -> Dict[str, Tuple[int, list[str]]]:
+    out: Dict[str, Tuple[int, list[str]]] = {}
+    with db_conn() as conn:
+        for row in conn.execute("SELECT rel_dir, mtime_ns, subdirs_json FROM scan_dirs"):
+            try:
+                subdirs = json.loads(row["subdirs_json"] or "[]")
+            except Exception:
+                continue
+            out[row["rel_dir"]] = (int(row["mtime_ns"]), list(subdirs))
+    return out
 
-    with closing(get_conn()) as conn:
-        existing = {
-            row["rel_path"]: row
-            for row in conn.execute(
-                "SELECT rel_path, modified_fs, file_size, gps_lat, gps_lon, lens_model FROM photos"
-            )
-        }
 
+def _save_scan_dirs(
+    visited: Dict[str, Tuple[int, list[str]]],
+    failed_rels: Iterable[str],
+    prune: bool = True,
+) -> None:
+    """Persist directory mtimes after a completed scan.
 
-    # Scan primary photo directory
-    for path, rel_path in iter_photo_files(PHOTO_DIR):
-        if stop_event and stop_event.is_set():
-            break
-        scanned += 1
-        try:
-            log_event("scan_check", rel_path=rel_path)
-            stat = path.stat()
-            modified_fs = datetime.fromtimestamp(stat.st_mtime).isoformat(timespec="seconds")
-            file_size = stat.st_size
-            prev = existing.get(rel_path)
-            if prev:
-                unchanged = (prev["modified_fs"] == modified_fs and prev["file_size"] == file_size)
-                missing_meta = (prev["lens_model"] in (None, "")) or (prev["gps_lat"] is None and prev["gps_lon"] is None)
-                if unchanged and not missing_meta:
-                    log_event("skip_unchanged", rel_path=rel_path)
-                    log_event("no_new", rel_path=rel_path)
-                    continue
+    Directories holding a file that failed are left out so the next scan lists
+    them again; with ``prune`` rows for directories not visited are dropped.
+    """
+    failed_dirs = {r.rsplit("/", 1)[0] if "/" in r else "" for r in failed_rels if r}
+    now = now_iso()
+    with db_conn() as conn:
+        if prune:
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS _scan_seen (rel_dir TEXT PRIMARY KEY)")
+            conn.execute("DELETE FROM _scan_seen")
+            conn.executemany("INSERT OR IGNORE INTO _scan_seen(rel_dir) VALUES (?)", [(k,) for k in visited])
+            conn.execute("DELETE FROM scan_dirs WHERE rel_dir NOT IN (SELECT rel_dir FROM _scan_seen)")
+            conn.execute("DELETE FROM _scan_seen")
+        if failed_dirs:
+            conn.executemany("DELETE FROM scan_dirs WHERE rel_dir=?", [(d,) for d in failed_dirs])
+        conn.executemany(
+            """
+            INSERT INTO scan_dirs(rel_dir, mtime_ns, subdirs_json, scanned_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT(rel_dir) DO UPDATE SET
+                mtime_ns=excluded.mtime_ns, subdirs_json=excluded.subdirs_json, scanned_at=excluded.scanned_at
+            """,
+            [
+                (k, mtime_ns, json.dumps(subdirs, ensure_ascii=False), now)
+                for k, (mtime_ns, subdirs) in visited.items()
+                if k not in failed_dirs
+            ],
+        )
+        conn.commit()
 
-            meta = extract_metadata(path, rel_path)
-            upsert_photo(meta)
-            updated += 1
-            log_event("indexed", rel_path=rel_path)
-        except Exception as e:
-            errors += 1
-            log_event("error", rel_path=rel_path, error=str(e))
-            if len(error_samples) < 5:
-                error_samples.append(f"{rel_path}: {e}")
 
-    # Also scan uploaded files stored under DATA_DIR/uploads (prefixed as 'uploads/...')
-    for path, rel_path in iter_photo_files(UPLOAD_DIR, prefix="uploads"):
-        if stop_event and stop_event.is_set():
-            break
-        scanned += 1
+def _scan_extract_one(path_str: str, rel_path: str) -> Dict[str, Any]:
+    """Scan worker (runs in a child process): decode, thumbnail, EXIF and hashes for one file.
+
+    No DB access here; geocoding and the upsert happen in the parent.
+    """
+    try:
+        meta = extract_metadata(Path(path_str), rel_path, geocode=False)
+        # EXIF values can be Pillow types; reduce to plain JSON before pickling back
+        for key in ("exif_json", "metadata_json"):
+            meta[key] = json.loads(json.dumps(meta.get(key) or {}, ensure_ascii=False, default=str))
+        return {"ok": True, "rel_path": rel_path, "meta": meta}
+    except Exception as e:
+        return {"ok": False, "rel_path": rel_path, "error": str(e)}
+
+
+class _PhotoUpsertWriter:
+    """Single writer thread feeding a _PhotoUpsertBatch.
+
+    put() queues a metadata dict; close() flushes and joins. Counters are
+    read from ``batch`` once closed.
+    """
+
+    def __init__(self, event: str = "indexed"):
+        self.batch = _PhotoUpsertBatch(event=event)
+        self._q: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(maxsize=SCAN_WRITE_BATCH * 4)
+        self._thread = threading.Thread(target=self._run, name="photo-writer", daemon=True)
+        self._thread.start()
+
+    def put(self, meta: Dict[str, Any]) -> None:
+        self._q.put(meta)
+
+    def close(self) -> None:
+        self._q.put(None)
+        self._thread.join()
+
+    def _run(self) -> None:
+        # Dedicated connection for the lifetime of the writer (not a pooled checkout)
+        conn = get_conn()
+        batch = self.batch
+        batch.conn = conn
         try:
-            log_event("scan_check", rel_path=rel_path)
-            stat = path.stat()
-            modified_fs = datetime.fromtimestamp(stat.st_mtime).isoformat(timespec="seconds")
-            file_size = stat.st_size
-            prev = existing.get(rel_path)
-            if prev:
-                unchanged = (prev["modified_fs"] == modified_fs and prev["file_size"] == file_size)
-                missing_meta = (prev["lens_model"] in (None, "")) or (prev["gps_lat"] is None and prev["gps_lon"] is None)
-                if unchanged and not missing_meta:
-                    log_event("skip_unchanged", rel_path=rel_path)
-                    log_event("no_new", rel_path=rel_path)
+            while True:
+                timeout = max(0.0, batch.deadline - time.monotonic()) if batch.pending else None
+                try:
+                    item = self._q.get(timeout=timeout)
+                except queue.Empty:
+                    batch.flush()
                     continue
+                if item is None:
+                    batch.flush()
+                    return
+                batch.add(item)
+        finally:
+            batch.conn = None
+            conn.close()
 
-            meta = extract_metadata(path, rel_path)
-            upsert_photo(meta)
-            updated += 1
-            log_event("indexed", rel_path=rel_path)
-        except Exception as e:
+
+def scan_library(stop_event=None, full: bool = False) -> Dict[str, Any]:
+    """Index new and changed files under PHOTO_DIR and DATA_DIR/uploads.
+
+    Directories whose mtime matches the previous completed scan are not listed
+    again (new, removed and renamed entries all bump the directory mtime);
+    ``full=True`` lists every directory, e.g. after files were edited in place.
+    """
+    init_db()
+    log_event("scan_start", workers=SCAN_WORKERS, full=full)
+
+    if not PHOTO_DIR.exists():
+        return {
+            "ok": False,
+            "error": f"Photo folder not found: {PHOTO_DIR}",
+            "scanned": 0,
+            "updated": 0,
+            "errors": 0,
+        }
+
+    scanned = 0
+    moved = 0
+    errors = 0
+    error_samples: list[str] = []
+    failed_rels: list[str] = []
+    claimed_ids: set[int] = set()
+    known_dirs = {} if full else _load_scan_dirs()
+    visited_dirs: Dict[str, Tuple[int, list[str]]] = {}
+
+    with db_conn() as conn:
+        existing = {
+            row["rel_path"]: row
+            for row in conn.execute(
+                "SELECT rel_path, modified_fs, file_size, gps_lat, gps_lon, lens_model FROM photos"
+            )
+        }
+
+    # Pipeline: this thread walks the tree and feeds a process pool (decode,
+    # thumbnail, EXIF, SHA-256); finished files are geocoded here and handed to
+    # a single writer thread that commits them in batches.
+    writer = _PhotoUpsertWriter()
+    pool: Optional[ProcessPoolExecutor] = None
+    inflight: set = set()
+    max_inflight = max(1, SCAN_WORKERS) * 4
+    # A worker killed mid-file (decoder crash, OOM) breaks the whole pool: the files in
+    # flight are counted as errors and a fresh pool is started, up to this many times,
+    # after which the rest of the scan extracts in this process.
+    pool_restarts_left = 3
+    pool_broken = False
+
+    def _finish(res: Dict[str, Any]) -> None:
+        nonlocal errors
+        rel = res.get("rel_path")
+        if not res.get("ok"):
             errors += 1
-            log_event("error", rel_path=rel_path, error=str(e))
+            failed_rels.append(str(rel or ""))
+            log_event("error", rel_path=rel, error=res.get("error"))
             if len(error_samples) < 5:
-                error_samples.append(f"{rel_path}: {e}")
+                error_samples.append(f"{rel}: {res.get('error')}")
+            return
+        meta = res["meta"]
+        _apply_reverse_geocode(meta, rel)
+        writer.put(meta)
+
+    def _collect(done: Iterable[Any]) -> None:
+        nonlocal pool_broken
+        for fut in done:
+            inflight.discard(fut)
+            if fut.cancelled():
+                continue
+            try:
+                res = fut.result()
+            except BrokenProcessPool as e:
+                pool_broken = True
+                res = {"ok": False, "rel_path": getattr(fut, "rel_path", None), "error": f"worker process died: {e}"}
+            except Exception as e:
+                res = {"ok": False, "rel_path": getattr(fut, "rel_path", None), "error": str(e)}
+            _finish(res)
+
+    def _drop_broken_pool() -> None:
+        nonlocal pool, pool_broken, pool_restarts_left
+        if pool is not None:
+            pool.shutdown(wait=True)
+            _collect(list(inflight))
+        pool = None
+        pool_broken = False
+        pool_restarts_left -= 1
+        log_event("error", rel_path="scan", error="process_pool: worker died" + ("" if pool_restarts_left >= 0 else ", extracting in-process"))
+
+    try:
+        # Scan primary photo directory, then uploaded files stored under
+        # DATA_DIR/uploads (prefixed as 'uploads/...')
+        sources = [
+            walk_photo_files(PHOTO_DIR, known_dirs=known_dirs, visited=visited_dirs),
+            walk_photo_files(UPLOAD_DIR, prefix="uploads", known_dirs=known_dirs, visited=visited_dirs),
+        ]
+        def _submit(path: Path, rel_path: str) -> None:
+            nonlocal pool
+            if SCAN_WORKERS > 1 and pool is None and pool_restarts_left >= 0:
+                # Started lazily so no-change rescans never pay for worker start-up
+                try:
+                    pool = ProcessPoolExecutor(max_workers=SCAN_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+                except Exception as e:
+                    log_event("error", rel_path="scan", error=f"process_pool: {e}")
+            if pool is None:
+                _finish(_scan_extract_one(str(path), rel_path))
+                return
+            try:
+                fut = pool.submit(_scan_extract_one, str(path), rel_path)
+            except BrokenProcessPool:
+                _drop_broken_pool()
+                _submit(path, rel_path)
+                return
+            fut.rel_path = rel_path  # type: ignore[attr-defined]
+            inflight.add(fut)
+            if len(inflight) >= max_inflight:
+                done, _ = futures_wait(inflight, return_when=FIRST_COMPLETED)
+                _collect(done)
+            if pool_broken:
+                _drop_broken_pool()
+
+        # New paths in an existing library may be moves of indexed files. Moves that
+        # keep the file name are re-pointed right away; other new files wait until
+        # the walk is done so a copy cannot take the row of an original listed later.
+        deferred: list[Tuple[Path, str, os.stat_result]] = []
+        for path, rel_path, stat in (item for src in sources for item in src):
+            if stop_event and stop_event.is_set():
+                break
+            scanned += 1
+            try:
+                log_event("scan_check", rel_path=rel_path)
+                modified_fs = datetime.fromtimestamp(stat.st_mtime).isoformat(timespec="seconds")
+                file_size = stat.st_size
+                prev = existing.get(rel_path)
+                if prev is None and existing:
+                    if _repoint_moved_files([(path, rel_path, stat)], claimed_ids, same_name_only=True):
+                        moved += 1
+                    else:
+                        deferred.append((path, rel_path, stat))
+                    continue
+                if prev:
+                    unchanged = (prev["modified_fs"] == modified_fs and prev["file_size"] == file_size)
+                    missing_meta = (prev["lens_model"] in (None, "")) or (prev["gps_lat"] is None and prev["gps_lon"] is None)
+                    if unchanged and not missing_meta:
+                        log_event("skip_unchanged", rel_path=rel_path)
+                        log_event("no_new", rel_path=rel_path)
+                        continue
+            except Exception as e:
+                _finish({"ok": False, "rel_path": rel_path, "error": str(e)})
+                continue
+            _submit(path, rel_path)
+
+        if deferred and not (stop_event and stop_event.is_set()):
+            matched = _repoint_moved_files(deferred, claimed_ids, same_name_only=False)
+            moved += len(matched)
+            for path, rel_path, _ in deferred:
+                if stop_event and stop_event.is_set():
+                    break
+                if rel_path not in matched:
+                    _submit(path, rel_path)
+    finally:
+        if pool is not None:
+            # On stop, drop queued work but keep files that were already processed
+            stopping = bool(stop_event and stop_event.is_set())
+            pool.shutdown(wait=True, cancel_futures=stopping)
+            _collect(list(inflight))
+        writer.close()
+
+    updated = writer.batch.written
+    errors += writer.batch.errors
+    for sample in writer.batch.error_samples:
+        if len(error_samples) < 5:
+            error_samples.append(sample)
+
+    stopped = bool(stop_event.is_set()) if stop_event else False
+    if not stopped:
+        try:
+            _save_scan_dirs(visited_dirs, failed_rels + writer.batch.failed_rels)
+        except Exception as e:
+            log_event("error", rel_path="scan_dirs", error=str(e))
 
     result = {
         "ok": True,
         "photo_dir": str(PHOTO_DIR),
         "scanned": scanned,
         "updated": updated,
+        "moved": moved,
         "errors": errors,
         "error_samples": error_samples,
-        "stopped": bool(stop_event.is_set()) if stop_event else False,
+        "dirs": len(visited_dirs),
+        "dirs_skipped": sum(1 for k, v in visited_dirs.items() if known_dirs.get(k) == v),
+        "stopped": stopped,
     }
-    log_event("scan_done", scanned=scanned, updated=updated, errors=errors)
+    log_event("scan_done", scanned=scanned, updated=updated, moved=moved, errors=errors)
+    _fts_schedule()
     return result
 
 
-def row_to_public(row: sqlite3.Row) -> Dict[str, Any]:
+# --- Library watcher ---
+# Keeps PHOTO_DIR indexed between scans (DATA_DIR/uploads is indexed by upload
+# post-processing and is not watched). inotify events, or directory-mtime polls
+# on network mounts, are collected and applied after WATCH_DEBOUNCE_SEC of quiet:
+# renames re-point existing rows, deletions drop rows, and new or changed files
+# go through the scan worker and a _PhotoUpsertBatch like scan_library.
+#
+# Every web process runs a small supervisor thread, but only the holder of the
+# "library_watcher" row in process_leases watches; the others stand by and take
+# over when its lease runs out. Whether watching is wanted is the watch_enabled
+# setting (default WATCH_ENABLE), so start/stop from any process reach the owner.
+WATCH_LEASE_SEC = 30.0
+_watch_thread: Optional[threading.Thread] = None
+_watch_stop_event = threading.Event()
+_watch_wake = threading.Event()
+_watch_run_stop: Optional[threading.Event] = None
+_watch_owner_ids: Dict[int, str] = {}
+_watch_autostarted = False
+_watch_status: Dict[str, Any] = {
+    "running": False,
+    "mode": None,
+    "watches": 0,
+    "events": 0,
+    "indexed": 0,
+    "removed": 0,
+    "renamed": 0,
+    "errors": 0,
+    "last_flush_at": None,
+    "last_error": None,
+}
+
+_NETWORK_FS_TYPES = {"nfs", "nfs4", "cifs", "smb3", "smbfs", "9p", "afpfs", "davfs", "ceph", "glusterfs"}
+
+
+def _rel_join(rel_dir: str, name: str) -> str:
+    return f"{rel_dir}/{name}" if rel_dir else name
+
+
+def _mount_fstype(path: Path) -> Optional[str]:
+    """Filesystem type of the mount holding ``path`` (from /proc/mounts), if known."""
+    best_mnt, best_type = "", None
+    target = str(path)
+    try:
+        with open("/proc/mounts", "r", encoding="utf-8", errors="ignore") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) < 3:
+                    continue
+                mnt = parts[1].replace("\\040", " ")
+                if (target == mnt or target.startswith(mnt.rstrip("/") + "/")) and len(mnt) >= len(best_mnt):
+                    best_mnt, best_type = mnt, parts[2]
+    except OSError:
+        return None
+    return best_type
+
+
+def _watch_pick_mode() -> str:
+    if WATCH_MODE in {"inotify", "poll"}:
+        return WATCH_MODE
+    if not sys.platform.startswith("linux"):
+        return "poll"
+    # inotify only sees changes made through this kernel; remote writers need polling
+    fstype = (_mount_fstype(PHOTO_DIR) or "").lower()
+    if fstype in _NETWORK_FS_TYPES or fstype.startswith("fuse"):
+        return "poll"
+    return "inotify"
+
+
+def _repoint_photo_paths(conn: sqlite3.Connection, old_rel: str, new_rel: str) -> Tuple[int, list[int]]:
+    """Move indexed rows from ``old_rel`` to ``new_rel`` (a file or a folder) without committing.
+
+    Rows keep their id, so embeddings, faces, favorites and thumbnails stay
+    attached. Returns (rows moved, ids of rows dropped because the move
+    replaced an indexed file).
+    """
+    old_rel = old_rel.strip("/")
+    new_rel = new_rel.strip("/")
+    if not old_rel or not new_rel or old_rel == new_rel:
+        return 0, []
+    row = conn.execute("SELECT id FROM photos WHERE rel_path=?", (old_rel,)).fetchone()
+    if row:
+        dropped: list[int] = []
+        stale = conn.execute("SELECT id FROM photos WHERE rel_path=?", (new_rel,)).fetchone()
+        if stale:
+            dropped.append(int(stale["id"]))
+            conn.execute("DELETE FROM faces WHERE photo_id=?", (stale["id"],))
+            conn.execute("DELETE FROM photos WHERE id=?", (stale["id"],))
+        conn.execute(
+            "UPDATE photos SET rel_path=?, filename=? WHERE id=?",
+            (new_rel, new_rel.rsplit("/", 1)[-1], row["id"]),
+        )
+        return 1, dropped
+    cur = conn.execute(
+        "UPDATE photos SET rel_path = ? || substr(rel_path, ?) WHERE rel_path >= ? AND rel_path < ?",
+        (new_rel, len(old_rel) + 1, old_rel + "/", old_rel + "0"),
+    )
+    return int(cur.rowcount or 0), []
+
+
+def _find_moved_photo(
+    conn: sqlite3.Connection,
+    path: Path,
+    st: os.stat_result,
+    claimed: set[int],
+    same_name_only: bool = False,
+) -> Optional[sqlite3.Row]:
+    """Indexed row whose file has vanished and whose content matches ``path``, if any.
+
+    Candidates share the file size. Their stored quick_hash is compared first;
+    the full SHA-256 of ``path`` is only computed for rows indexed before
+    quick_hash existed. Among identical copies a row with the same file name wins.
+    """
+    rows = conn.execute(
+        "SELECT id, rel_path, filename, quick_hash, checksum_sha256 FROM photos WHERE file_size=?",
+        (st.st_size,),
+    ).fetchall()
+    quick = full = None
+    matches: list[sqlite3.Row] = []
+    for row in rows:
+        if int(row["id"]) in claimed or (same_name_only and row["filename"] != path.name):
+            continue
+        if _disk_path_from_rel_path(row["rel_path"]).exists():
+            continue
+        if row["quick_hash"]:
+            quick = quick or quick_hash_file(path)
+            if row["quick_hash"] == quick:
+                matches.append(row)
+        elif row["checksum_sha256"]:
+            full = full or sha256_file(path)
+            if row["checksum_sha256"] == full:
+                matches.append(row)
+    for row in matches:
+        if row["filename"] == path.name:
+            return row
+    return matches[0] if matches else None
+
+
+def _repoint_moved_files(
+    items: Iterable[Tuple[Path, str, os.stat_result]],
+    claimed: Optional[set[int]] = None,
+    same_name_only: Optional[bool] = None,
+) -> Dict[str, str]:
+    """Re-point rows of vanished files to unindexed paths with the same content.
+
+    The row keeps its id, embedding, faces, favorite and thumbnail instead of
+    being rebuilt. Paths keeping their file name are matched first, so copies
+    of the same picture keep their own rows; ``same_name_only`` True/False
+    runs only that pass. ``claimed`` collects row ids already matched.
+    Returns {new_rel: old_rel}.
+    """
+    claimed = claimed if claimed is not None else set()
+    moved: Dict[str, str] = {}
+    pending = [it for it in items if it[2].st_size > 0]
+    with db_conn() as conn:
+        passes = (True, False) if same_name_only is None else (same_name_only,)
+        for name_pass in passes:
+            for path, rel, st in pending:
+                if rel in moved or conn.execute("SELECT 1 FROM photos WHERE rel_path=?", (rel,)).fetchone():
+                    continue
+                try:
+                    row = _find_moved_photo(conn, path, st, claimed, same_name_only=name_pass)
+                except OSError:
+                    continue
+                if not row:
+                    continue
+                claimed.add(int(row["id"]))
+                old_rel = str(row["rel_path"])
+                _repoint_photo_paths(conn, old_rel, rel)
+                conn.execute(
+                    "UPDATE photos SET modified_fs=?, file_size=?, last_scanned_at=? WHERE id=?",
+                    (datetime.fromtimestamp(st.st_mtime).isoformat(timespec="seconds"), st.st_size, now_iso(), row["id"]),
+                )
+                conn.commit()
+                moved[rel] = old_rel
+                log_event("moved", rel_path=rel, old_rel_path=old_rel)
+    return moved
+
+
+def _index_changed_files(rels: Iterable[str], stop_event=None) -> Tuple[int, list[str]]:
+    """Index new/changed files under PHOTO_DIR inline; unchanged rows are skipped.
+
+    Returns (rows written, rel_paths that failed).
+    """
+    items: list[Tuple[Path, str, os.stat_result]] = []
+    for rel in dict.fromkeys(rels):
+        path = PHOTO_DIR / rel
+        try:
+            st = path.stat()
+        except OSError:
+            continue
+        if path.is_file():
+            items.append((path, rel, st))
+    if not items:
+        return 0, []
+    existing: Dict[str, Any] = {}
+    with db_conn() as conn:
+        for i in range(0, len(items), 500):
+            chunk = [rel for _, rel, _ in items[i:i + 500]]
+            ph = ",".join(["?"] * len(chunk))
+            for row in conn.execute(f"SELECT rel_path, modified_fs, file_size FROM photos WHERE rel_path IN ({ph})", chunk):
+                existing[row["rel_path"]] = row
+    failed: list[str] = []
+    batch = _PhotoUpsertBatch(event="indexed")
+    for path, rel, st in items:
+        if stop_event and stop_event.is_set():
+            break
+        prev = existing.get(rel)
+        modified_fs = datetime.fromtimestamp(st.st_mtime).isoformat(timespec="seconds")
+        if prev and prev["modified_fs"] == modified_fs and prev["file_size"] == st.st_size:
+            continue
+        res = _scan_extract_one(str(path), rel)
+        if not res.get("ok"):
+            failed.append(rel)
+            log_event("error", rel_path=rel, error=res.get("error"))
+            continue
+        _apply_reverse_geocode(res["meta"], rel)
+        batch.add(res["meta"])
+    batch.flush()
+    return batch.written, failed + batch.failed_rels
+
+
+def _watch_apply(renames: list[Tuple[str, str]], removed: list[str], changed: Dict[str, None], stop_event=None) -> Dict[str, Any]:
+    """Apply collected watcher operations: renames, then deletions, then indexing."""
+    stats: Dict[str, Any] = {"renamed": 0, "removed": 0, "indexed": 0, "errors": 0, "failed": []}
+    dropped: list[int] = []
+    if changed and removed:
+        # A move seen as delete + create (polling, or a move in from outside the tree)
+        items = []
+        for rel in changed:
+            try:
+                items.append((PHOTO_DIR / rel, rel, (PHOTO_DIR / rel).stat()))
+            except OSError:
+                continue
+        for rel in _repoint_moved_files(items):
+            changed.pop(rel, None)
+            stats["renamed"] += 1
+    if renames:
+        with db_conn() as conn:
+            for old_rel, new_rel in renames:
+                try:
+                    moved, gone = _repoint_photo_paths(conn, old_rel, new_rel)
+                    conn.commit()
+                except sqlite3.Error as e:
+                    conn.rollback()
+                    log_event("error", rel_path=new_rel, error=f"watch_rename: {e}")
+                    moved, gone = 0, []
+                    removed.append(old_rel)
+                dropped.extend(gone)
+                if moved:
+                    stats["renamed"] += moved
+                    log_event("watch_renamed", rel_path=new_rel, old_rel_path=old_rel, photos=moved)
+                # Nothing indexed under the old name (e.g. temp file renamed into place): index the target
+                new_path = PHOTO_DIR / new_rel
+                if new_path.is_dir():
+                    if not moved:
+                        for _, rel, _ in walk_photo_files(new_path, prefix=new_rel):
+                            changed[rel] = None
+                elif not moved and os.path.splitext(new_rel)[1].lower() in SUPPORTED_EXTS:
+                    changed[new_rel] = None
+    if dropped:
+        _face_cache_invalidate()
+        _embedding_index_remove(dropped)
+    if removed:
+        # Only drop rows whose files are really gone (a delete may be followed by a re-create)
+        gone_rels = [r for r in dict.fromkeys(removed) if not (PHOTO_DIR / r).exists()]
+        if gone_rels:
+            res = _delete_indexed_photos_for_prefixes(gone_rels)
+            stats["removed"] = int(res.get("photos") or 0)
+            for rel in gone_rels:
+                log_event("watch_removed", rel_path=rel)
+    if changed:
+        written, failed = _index_changed_files(list(changed), stop_event=stop_event)
+        stats["indexed"] = written
+        stats["errors"] = len(failed)
+        stats["failed"] = failed
+    return stats
+
+
+def _watch_poll_once(stop_event=None) -> Dict[str, Any]:
+    """One incremental pass over PHOTO_DIR using the stored directory mtimes."""
+    known = _load_scan_dirs()
+    visited: Dict[str, Tuple[int, list[str]]] = {}
+    changed: Dict[str, None] = {}
+    for _, rel, _ in walk_photo_files(PHOTO_DIR, known_dirs=known, visited=visited):
+        changed[rel] = None
+    changed_dirs = [k for k, v in visited.items() if known.get(k) != v]
+    removed: list[str] = []
+    removed_dirs: list[str] = []
+    if changed_dirs:
+        with db_conn() as conn:
+            for d in changed_dirs:
+                prev = known.get(d)
+                if prev:
+                    removed_dirs.extend(_rel_join(d, sub) for sub in set(prev[1]) - set(visited[d][1]))
+                # Indexed files directly in this directory that were not listed any more
+                if d:
+                    rows = conn.execute(
+                        "SELECT rel_path FROM photos WHERE rel_path >= ? AND rel_path < ? AND instr(substr(rel_path, ?), '/') = 0",
+                        (d + "/", d + "0", len(d) + 2),
+                    )
+                else:
+                    rows = conn.execute("SELECT rel_path FROM photos WHERE instr(rel_path, '/') = 0")
+                removed.extend(r["rel_path"] for r in rows if r["rel_path"] not in changed)
+    stats = _watch_apply([], removed + removed_dirs, changed, stop_event=stop_event)
+    if stop_event and stop_event.is_set():
+        return stats
+    _save_scan_dirs({k: visited[k] for k in changed_dirs}, stats["failed"], prune=False)
+    if removed_dirs:
+        with db_conn() as conn:
+            for d in removed_dirs:
+                conn.execute("DELETE FROM scan_dirs WHERE rel_dir = ? OR (rel_dir >= ? AND rel_dir < ?)", (d, d + "/", d + "0"))
+            conn.commit()
+    return stats
+
+
+class _Inotify:
+    """Recursive inotify watch of a directory tree through libc (Linux only)."""
+
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+    MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+    def __init__(self, root: Path):
+        libc = ctypes.CDLL(None, use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"inotify_init1: {os.strerror(err)}")
+        self._libc = libc
+        self.fd = fd
+        self.root = root
+        self.wds: Dict[int, str] = {}
+
+    def close(self) -> None:
+        try:
+            os.close(self.fd)
+        except OSError:
+            pass
+
+    def add_tree(self, rel_dir: str) -> list[str]:
+        """Watch ``rel_dir`` and every directory below it; returns the directories watched."""
+        added: list[str] = []
+        stack = [rel_dir]
+        while stack:
+            d = stack.pop()
+            path = os.path.join(str(self.root), d) if d else str(self.root)
+            wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), self.MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                if err == errno.ENOSPC:
+                    raise OSError(err, "inotify watch limit reached (raise fs.inotify.max_user_watches)")
+                continue
+            self.wds[wd] = d
+            added.append(d)
+            try:
+                with os.scandir(path) as it:
+                    for entry in it:
+                        if not _skip_scan_entry(entry.name) and entry.is_dir(follow_symlinks=False):
+                            stack.append(_rel_join(d, entry.name))
+            except OSError:
+                pass
+        return added
+
+    def move_tree(self, old_rel: str, new_rel: str) -> None:
+        for wd, d in list(self.wds.items()):
+            if d == old_rel or d.startswith(old_rel + "/"):
+                self.wds[wd] = new_rel + d[len(old_rel):]
+
+    def remove_tree(self, rel_dir: str) -> None:
+        for wd, d in list(self.wds.items()):
+            if d == rel_dir or d.startswith(rel_dir + "/"):
+                self._libc.inotify_rm_watch(self.fd, wd)
+                self.wds.pop(wd, None)
+
+    def read(self, timeout: float) -> list[Tuple[int, int, int, str]]:
+        """Return pending (wd, mask, cookie, name) events, waiting up to ``timeout``."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 256 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        off = 0
+        while off + 16 <= len(data):
+            wd, mask, cookie, length = struct.unpack_from("iIII", data, off)
+            off += 16
+            name = data[off:off + length].split(b"\0", 1)[0]
+            off += length
+            events.append((wd, mask, cookie, os.fsdecode(name)))
+        return events
+
+
+def _watch_record(stats: Dict[str, Any]) -> None:
+    for key in ("indexed", "removed", "renamed", "errors"):
+        _watch_status[key] = int(_watch_status.get(key) or 0) + int(stats.get(key) or 0)
+    _watch_status["last_flush_at"] = now_iso()
+    if stats.get("indexed") or stats.get("renamed"):
+        _fts_schedule()
+
+
+def _watch_run_inotify(stop_event: threading.Event) -> None:
+    ino = _Inotify(PHOTO_DIR)
+    try:
+        ino.add_tree("")
+        _watch_status["watches"] = len(ino.wds)
+        renames: list[Tuple[str, str]] = []
+        removed: list[str] = []
+        changed: Dict[str, None] = {}
+        moves: Dict[int, Tuple[str, bool, float]] = {}
+        first_event = last_event = 0.0
+        resync = False
+        while not stop_event.is_set():
+            events = ino.read(0.5)
+            now = time.monotonic()
+            for wd, mask, cookie, name in events:
+                _watch_status["events"] = int(_watch_status.get("events") or 0) + 1
+                if mask & ino.IN_Q_OVERFLOW:
+                    resync = True
+                    continue
+                if mask & ino.IN_IGNORED:
+                    ino.wds.pop(wd, None)
+                    continue
+                d = ino.wds.get(wd)
+                if d is None or not name or _skip_scan_entry(name):
+                    continue
+                rel = _rel_join(d, name)
+                is_dir = bool(mask & ino.IN_ISDIR)
+                supported = os.path.splitext(name)[1].lower() in SUPPORTED_EXTS
+                if not (is_dir or supported or mask & ino.IN_MOVED_FROM):
+                    continue
+                first_event = first_event or now
+                last_event = now
+                if mask & ino.IN_MOVED_FROM:
+                    moves[cookie] = (rel, is_dir, now)
+                elif mask & ino.IN_MOVED_TO:
+                    src = moves.pop(cookie, None)
+                    if src:
+                        old_rel = src[0]
+                        renames.append((old_rel, rel))
+                        if is_dir:
+                            ino.move_tree(old_rel, rel)
+                        for key in [k for k in changed if k == old_rel or k.startswith(old_rel + "/")]:
+                            del changed[key]
+                            changed[rel + key[len(old_rel):]] = None
+                    elif is_dir:
+                        ino.add_tree(rel)
+                        for _, frel, _ in walk_photo_files(PHOTO_DIR / rel, prefix=rel):
+                            changed[frel] = None
+                    else:
+                        changed[rel] = None
+                elif mask & ino.IN_CREATE:
+                    if is_dir:
+                        # Files may land before the new watch exists, so list the new tree once
+                        ino.add_tree(rel)
+                        for _, frel, _ in walk_photo_files(PHOTO_DIR / rel, prefix=rel):
+                            changed[frel] = None
+                elif mask & ino.IN_CLOSE_WRITE:
+                    changed[rel] = None
+                elif mask & ino.IN_DELETE:
+                    removed.append(rel)
+                    changed.pop(rel, None)
+            # A move out of the tree never gets its MOVED_TO half
+            for cookie, (old_rel, is_dir, t) in list(moves.items()):
+                if now - t > 1.0:
+                    del moves[cookie]
+                    removed.append(old_rel)
+                    if is_dir:
+                        ino.remove_tree(old_rel)
+                    first_event = first_event or now
+                    last_event = now
+            pending = bool(renames or removed or changed or resync)
+            quiet = now - last_event >= WATCH_DEBOUNCE_SEC
+            overdue = first_event and now - first_event >= WATCH_DEBOUNCE_SEC * 10
+            if pending and not moves and (quiet or overdue):
+                stats = _watch_apply(renames, removed, changed, stop_event=stop_event)
+                renames, removed, changed = [], [], {}
+                first_event = 0.0
+                _watch_record(stats)
+                if resync:
+                    # Events were lost; re-read changed directories from their mtimes
+                    resync = False
+                    ino.add_tree("")
+                    _watch_record(_watch_poll_once(stop_event))
+                _watch_status["watches"] = len(ino.wds)
+    finally:
+        ino.close()
+
+
+def _watch_worker(stop_event: threading.Event) -> None:
+    mode = _watch_pick_mode()
+    _watch_status.update({"running": True, "mode": mode, "started_at": now_iso(), "last_error": None})
+    log_event("watch_start", mode=mode)
+    try:
+        init_db()
+        # Catch up on changes made while nothing was watching
+        if _load_scan_dirs():
+            _watch_record(_watch_poll_once(stop_event))
+        else:
+            scan_library(stop_event=stop_event)
+        if mode == "inotify" and not stop_event.is_set():
+            try:
+                _watch_run_inotify(stop_event)
+            except (OSError, AttributeError) as e:
+                log_event("error", rel_path="watch", error=f"inotify unavailable, polling instead: {e}")
+                mode = "poll"
+                _watch_status.update({"mode": mode, "watches": 0, "last_error": str(e)})
+        while mode == "poll" and not stop_event.wait(WATCH_POLL_SEC):
+            _watch_record(_watch_poll_once(stop_event))
+    except Exception as e:
+        _watch_status["last_error"] = str(e)
+        log_event("error", rel_path="watch", error=str(e))
+    finally:
+        _watch_status["running"] = False
+        log_event("watch_stop", mode=mode)
+
+
+def _init_process_leases(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS process_leases (
+            name TEXT PRIMARY KEY,
+            owner TEXT,
+            lease_until REAL NOT NULL DEFAULT 0,
+            status TEXT,
+            updated_at TEXT
+        )
+        """
+    )
+    conn.commit()
+
+
+def _lease_acquire(name: str, owner: str, ttl: float, status: Optional[Dict[str, Any]] = None) -> bool:
+    """Take or renew the named lease; False while another owner holds it."""
+    now = time.time()
+    with db_conn() as conn:
+        row = conn.execute(
+            """
+            INSERT INTO process_leases(name, owner, lease_until, status, updated_at) VALUES (?,?,?,?,?)
+            ON CONFLICT(name) DO UPDATE SET
+                owner = excluded.owner,
+                lease_until = excluded.lease_until,
+                status = COALESCE(excluded.status, process_leases.status),
+                updated_at = excluded.updated_at
+            WHERE process_leases.owner = excluded.owner OR process_leases.lease_until < ?
+            RETURNING owner
+            """,
+            (name, owner, now + ttl, json.dumps(status) if status is not None else None, now_iso(), now),
+        ).fetchone()
+        conn.commit()
+    return row is not None
+
+
+def _lease_release(name: str, owner: str, status: Optional[Dict[str, Any]] = None) -> None:
+    with db_conn() as conn:
+        conn.execute(
+            "UPDATE process_leases SET lease_until=0, status=COALESCE(?, status), updated_at=? WHERE name=? AND owner=?",
+            (json.dumps(status) if status is not None else None, now_iso(), name, owner),
+        )
+        conn.commit()
+
+
+def _lease_get(name: str) -> Optional[Dict[str, Any]]:
+    with db_conn() as conn:
+        row = conn.execute("SELECT owner, lease_until, status FROM process_leases WHERE name=?", (name,)).fetchone()
+    return dict(row) if row else None
+
+
+def _watch_owner() -> str:
+    """Lease owner id of this process (per pid, so forked workers never share one)."""
+    pid = os.getpid()
+    if pid not in _watch_owner_ids:
+        _watch_owner_ids[pid] = f"{pid}-{secrets.token_hex(4)}"
+    return _watch_owner_ids[pid]
+
+
+def _watch_wanted() -> bool:
+    return _get_setting_bool("watch_enabled", WATCH_ENABLE)
+
+
+def _watch_supervisor() -> None:
+    """Stand by until watching is wanted and this process holds the watcher lease, then watch."""
+    global _watch_run_stop
+    try:
+        init_db()
+    except Exception as e:
+        log_event("error", rel_path="watch", error=str(e))
+    while not _watch_stop_event.is_set():
+        try:
+            acquired = _watch_wanted() and _lease_acquire("library_watcher", _watch_owner(), WATCH_LEASE_SEC)
+        except Exception as e:
+            log_event("error", rel_path="watch", error=f"lease: {e}")
+            acquired = False
+        if not acquired:
+            _watch_wake.wait(WATCH_LEASE_SEC / 3)
+            _watch_wake.clear()
+            continue
+        run_stop = _watch_run_stop = threading.Event()
+
+        def _heartbeat(run_stop: threading.Event = run_stop) -> None:
+            # Renew the lease and publish progress; give up when stopped or the lease was lost
+            renewed = time.monotonic()
+            while not run_stop.wait(1.0):
+                if _watch_stop_event.is_set():
+                    run_stop.set()
+                    break
+                if time.monotonic() - renewed < WATCH_LEASE_SEC / 3:
+                    continue
+                renewed = time.monotonic()
+                try:
+                    keep = (
+                        not _watch_stop_event.is_set()
+                        and _watch_wanted()
+                        and _lease_acquire("library_watcher", _watch_owner(), WATCH_LEASE_SEC, dict(_watch_status))
+                    )
+                except Exception as e:
+                    log_event("error", rel_path="watch", error=f"lease: {e}")
+                    keep = True  # a busy database is not a lost lease; the next renewal decides
+                if not keep:
+                    run_stop.set()
+
+        hb = threading.Thread(target=_heartbeat, name="library-watcher-lease", daemon=True)
+        hb.start()
+        try:
+            _watch_worker(run_stop)
+        finally:
+            run_stop.set()
+            hb.join()
+            _watch_run_stop = None
+            try:
+                _lease_release("library_watcher", _watch_owner(), dict(_watch_status))
+            except Exception as e:
+                log_event("error", rel_path="watch", error=f"lease: {e}")
+        # A watcher that ended on its own (error) is retried after a pause
+        _watch_wake.wait(WATCH_LEASE_SEC / 3)
+        _watch_wake.clear()
+
+
+def _start_library_watcher() -> bool:
+    """Start this process's watcher supervisor (returns False if it is already running)."""
+    global _watch_thread
+    _watch_wake.set()
+    if _watch_thread and _watch_thread.is_alive():
+        return False
+    _watch_stop_event.clear()
+    _watch_thread = threading.Thread(target=_watch_supervisor, name="library-watcher", daemon=True)
+    _watch_thread.start()
+    return True
+
+
+def _watch_owner_state() -> Tuple[Optional[str], Dict[str, Any]]:
+    """(owner, status) of the live watcher lease; (None, last published status) if nobody watches."""
+    lease = _lease_get("library_watcher") or {}
+    try:
+        status = json.loads(lease.get("status") or "{}")
+    except ValueError:
+        status = {}
+    if float(lease.get("lease_until") or 0) < time.time():
+        return None, status
+    if lease.get("owner") == _watch_owner():
+        status = dict(_watch_status)
+    return lease.get("owner"), status
+
+
+@app.before_request
+def _autostart_library_watcher():
+    # Every process stands by, so a restarted or recycled owner is replaced
+    global _watch_autostarted
+    if not _watch_autostarted:
+        _watch_autostarted = True
+        _start_library_watcher()
+
+
+@app.route("/api/watch/status")
+def api_watch_status():
+    fb = _forbid_user_role_for_maintenance()
+    if fb:
+        return jsonify(fb[0]), fb[1]
+    owner, status = _watch_owner_state()
+    return jsonify({
+        "ok": True,
+        **status,
+        "enabled": _watch_wanted(),
+        "running": owner is not None,
+        "owner": owner,
+        "owner_is_self": owner == _watch_owner(),
+    })
+
+
+@app.route("/api/watch/start", methods=["POST"])
+def api_watch_start():
+    fb = _forbid_user_role_for_maintenance()
+    if fb:
+        return jsonify(fb[0]), fb[1]
+    owner, _ = _watch_owner_state()
+    _set_setting("watch_enabled", "1")
+    _start_library_watcher()
+    return jsonify({"ok": True, "started": owner is None, "running": True, "owner": owner})
+
+
+@app.route("/api/watch/stop", methods=["POST"])
+def api_watch_stop():
+    fb = _forbid_user_role_for_maintenance()
+    if fb:
+        return jsonify(fb[0]), fb[1]
+    _set_setting("watch_enabled", "0")
+    run_stop = _watch_run_stop
+    if run_stop is not None:
+        run_stop.set()
+    # Another process's watcher sees the setting at its next lease renewal
+    owner, _ = _watch_owner_state()
+    return jsonify({"ok": True, "stopping": owner is not None, "owner": owner})
+
+
+# Columns left out of list responses by default: raw EXIF and the embedding are
+# large and only needed by the detail / AI endpoints.
+_PHOTO_LIST_EXCLUDED_COLUMNS = {"exif_json", "embedding_json", "embedding", "embedding_dim", "embedding_model", "quick_hash", "phash64", "dhash64"}
+# Public fields computed by row_to_public, and the columns each one is built from
+_PHOTO_DERIVED_FIELDS = {
+    "thumb_url": ("thumb_name",),
+    "original_url": ("rel_path", "filename"),
+    "download_url": ("rel_path", "filename"),
+    "is_video": ("ext",),
+    "device_label": ("camera_make", "camera_model"),
+    "lens_label": ("lens_model", "camera_make", "camera_model"),
+}
+# Fields read by matches_search (the non-FTS search fallback)
+_PHOTO_SEARCH_FIELDS = {
+    "filename", "rel_path", "captured_at", "camera_make", "camera_model", "lens_model", "gps_name",
+    "ai_tags", "ai_desc_tags", "ai_desc_caption", "metadata_json", "people_names",
+}
+_photo_columns_cache: Optional[list[str]] = None
+
+
+def _photo_columns(conn: sqlite3.Connection) -> list[str]:
+    global _photo_columns_cache
+    if _photo_columns_cache is None:
+        _photo_columns_cache = [r["name"] for r in conn.execute("PRAGMA table_info(photos)").fetchall()]
+    return _photo_columns_cache
+
+
+def _parse_photo_fields(raw: Optional[str]) -> Optional[set[str]]:
+    """Parse ``?fields=id,thumb_url,...``; None means the default list projection."""
+    if not raw:
+        return None
+    names = {f.strip() for f in str(raw).split(",") if f.strip()}
+    return names or None
+
+
+def _photo_select_columns(conn: sqlite3.Connection, fields: Optional[set[str]] = None, alias: str = "photos") -> str:
+    """SQL column list for a photo list query.
+
+    Without ``fields`` this is every column except raw EXIF and embeddings.
+    With ``fields`` only the requested columns plus the ones derived fields
+    need are read; id and rel_path are always included (cursors and ACL).
+    """
+    all_cols = _photo_columns(conn)
+    if fields is None:
+        cols = [c for c in all_cols if c not in _PHOTO_LIST_EXCLUDED_COLUMNS]
+    else:
+        want = {"id", "rel_path"}
+        for f in fields:
+            want.add(f)
+            want.update(_PHOTO_DERIVED_FIELDS.get(f, ()))
+            if f == "embedding_json":
+                want.add("embedding")
+        cols = [c for c in all_cols if c in want]
+    return ", ".join(f"{alias}.{c}" for c in cols)
+
+
+def _project_photo_fields(items: list[Dict[str, Any]], fields: Optional[set[str]]) -> list[Dict[str, Any]]:
+    """Trim public photo dicts to the requested fields (id is always kept)."""
+    if fields is None:
+        return items
+    keep = set(fields) | {"id"}
+    return [{k: v for k, v in it.items() if k in keep} for it in items]
+
+
+def row_to_public(row: sqlite3.Row, fields: Optional[set[str]] = None) -> Dict[str, Any]:
     d = dict(row)
+
+    def want(name: str) -> bool:
+        return fields is None or name in fields
+
     for key in ("ai_tags", "ai_desc_tags", "embedding_json", "metadata_json", "exif_json"):
+        if key not in d or not want(key):
+            # Column left out of the projection, or not requested
+            continue
         if d.get(key):
             try:
                 d[key] = json.loads(d[key])
@@ -4813,62 +6759,76 @@ def row_to_public(row: sqlite3.Row) -> Dict[str, Any]:
                 pass
         else:
             d[key] = [] if key in {"ai_tags", "ai_desc_tags"} else None
-    if d.get("ai_desc_caption"):
-        d["ai_desc_caption"] = str(d.get("ai_desc_caption") or "").strip()
-    else:
-        d["ai_desc_caption"] = None
-    d["favorite"] = bool(d.get("favorite", 0))
-    if d.get("thumb_name"):
-        d["thumb_url"] = f"/api/thumbs/{d['thumb_name']}"
-    else:
-        d["thumb_url"] = None
+    # Binary embedding is not JSON serializable; expose it under the old key
+    emb_blob = d.pop("embedding", None)
+    d.pop("embedding_dim", None)
+    d.pop("embedding_model", None)
+    if emb_blob is not None and want("embedding_json"):
+        emb_arr = _embedding_from_blob(emb_blob)
+        if emb_arr is not None:
+            d["embedding_json"] = emb_arr.tolist()
+    if "ai_desc_caption" in d:
+        if d.get("ai_desc_caption"):
+            d["ai_desc_caption"] = str(d.get("ai_desc_caption") or "").strip()
+        else:
+            d["ai_desc_caption"] = None
+    if "favorite" in d:
+        d["favorite"] = bool(d.get("favorite", 0))
+    if want("thumb_url"):
+        if d.get("thumb_name"):
+            d["thumb_url"] = f"/api/thumbs/{d['thumb_name']}"
+        else:
+            d["thumb_url"] = None
     # Public URL to original (for viewer)
-    rel = d.get("rel_path") or d.get("filename")
-    if rel:
-        try:
-            # Serve a browser-friendly copy when needed
-            d["original_url"] = f"/api/viewable/{quote(rel)}"
-            d["download_url"] = f"/api/original/{quote(rel)}"
-        except Exception:
+    if want("original_url") or want("download_url"):
+        rel = d.get("rel_path") or d.get("filename")
+        if rel:
+            try:
+                # Serve a browser-friendly copy when needed
+                d["original_url"] = f"/api/viewable/{quote(rel)}"
+                d["download_url"] = f"/api/original/{quote(rel)}"
+            except Exception:
+                d["original_url"] = None
+                d["download_url"] = None
+        else:
             d["original_url"] = None
             d["download_url"] = None
-    else:
-        d["original_url"] = None
-        d["download_url"] = None
     # Annotate media type
-    try:
-        ext = (d.get("ext") or "").lower()
-        d["is_video"] = ext in VIDEO_EXTS
-    except Exception:
-        d["is_video"] = False
+    if want("is_video"):
+        try:
+            ext = (d.get("ext") or "").lower()
+            d["is_video"] = ext in VIDEO_EXTS
+        except Exception:
+            d["is_video"] = False
     # Friendly device and lens labels
-    try:
-        make = (d.get("camera_make") or "").strip()
-        model = (d.get("camera_model") or "").strip()
-        dev_label = " ".join([x for x in [make, model] if x]).strip()
-        d["device_label"] = dev_label if dev_label else None
-        lens = (d.get("lens_model") or "").strip()
-        if lens and dev_label:
-            # remove occurrences of device make/model in lens text (case-insensitive)
-            lm = lens
-            for s in {make, model, dev_label}:
-                if s:
-                    try:
-                        lm = re.sub(re.escape(s), "", lm, flags=re.IGNORECASE)
-                    except re.error:
-                        pass
-            lm = re.sub(r"\s{2,}", " ", lm).strip(" -,")
-            d["lens_label"] = lm if lm else lens
-        else:
-            d["lens_label"] = lens or None
-    except Exception:
-        d["device_label"] = (d.get("camera_model") or d.get("camera_make"))
-        d["lens_label"] = d.get("lens_model")
+    if want("device_label") or want("lens_label"):
+        try:
+            make = (d.get("camera_make") or "").strip()
+            model = (d.get("camera_model") or "").strip()
+            dev_label = " ".join([x for x in [make, model] if x]).strip()
+            d["device_label"] = dev_label if dev_label else None
+            lens = (d.get("lens_model") or "").strip()
+            if lens and dev_label and want("lens_label"):
+                # remove occurrences of device make/model in lens text (case-insensitive)
+                lm = lens
+                for s in {make, model, dev_label}:
+                    if s:
+                        try:
+                            lm = re.sub(re.escape(s), "", lm, flags=re.IGNORECASE)
+                        except re.error:
+                            pass
+                lm = re.sub(r"\s{2,}", " ", lm).strip(" -,")
+                d["lens_label"] = lm if lm else lens
+            else:
+                d["lens_label"] = lens or None
+        except Exception:
+            d["device_label"] = (d.get("camera_model") or d.get("camera_make"))
+            d["lens_label"] = d.get("lens_model")
     return d
 
 
-def _row_to_share_public(row: sqlite3.Row, token: str) -> Dict[str, Any]:
-    d = row_to_public(row)
+def _row_to_share_public(row: sqlite3.Row, token: str, fields: Optional[set[str]] = None) -> Dict[str, Any]:
+    d = row_to_public(row, fields)
     pid = int(d.get("id") or 0)
     if pid > 0:
         d["thumb_url"] = url_for("api_share_thumb", token=token, photo_id=pid)
@@ -4881,8 +6841,8 @@ def _row_to_share_public(row: sqlite3.Row, token: str) -> Dict[str, Any]:
 def api_people_list():
     """List people with face counts and a sample thumbnail."""
     include_hidden = request.args.get("include_hidden") in {"1", "true", "True"}
-    with closing(get_conn()) as conn:
-        acl_prefixes = _current_user_acl_prefixes(conn)
+    with db_conn() as conn:
+        acl = _current_user_acl_sql(conn, "ph.rel_path", owned=False)
         where = "" if include_hidden else "WHERE COALESCE(p.hidden,0)=0"
         rows = conn.execute(
             f"""
@@ -4901,7 +6861,7 @@ def api_people_list():
             name = r["name"]
             hidden = bool(int(r["hidden"] or 0))
 
-            if acl_prefixes is None:
+            if acl is None:
                 cnt_row = conn.execute("SELECT COUNT(*) AS c FROM faces WHERE person_id=?", (pid,)).fetchone()
                 cnt = int(cnt_row["c"] or 0) if cnt_row else 0
                 face_row = conn.execute(
@@ -4923,12 +6883,8 @@ def api_people_list():
                     (pid,),
                 ).fetchone()
             else:
-                clauses = []
-                params: list[Any] = [pid]
-                for pref in acl_prefixes:
-                    clauses.append("(ph.rel_path=? OR ph.rel_path LIKE ?)")
-                    params.extend([pref, pref + "/%"])
-                where_acl = " OR ".join(clauses) if clauses else "0=1"
+                where_acl = acl[0]
+                params: list[Any] = [pid, *acl[1]]
                 cnt_row = conn.execute(
                     f"""
                     SELECT COUNT(*) AS c
@@ -4967,7 +6923,7 @@ def api_people_list():
             if cnt > 0:
                 people.append({"id": pid, "name": name, "count": cnt, "thumb_url": thumb_url, "hidden": hidden})
 
-        if acl_prefixes is None:
+        if acl is None:
             unk = conn.execute(
                 "SELECT COUNT(DISTINCT photo_id) AS c FROM faces WHERE person_id IS NULL"
             ).fetchone()
@@ -4990,12 +6946,8 @@ def api_people_list():
                 """
             ).fetchone()
         else:
-            clauses = []
-            params2: list[Any] = []
-            for pref in acl_prefixes:
-                clauses.append("(ph.rel_path=? OR ph.rel_path LIKE ?)")
-                params2.extend([pref, pref + "/%"])
-            where_acl = " OR ".join(clauses) if clauses else "0=1"
+            where_acl = acl[0]
+            params2: list[Any] = list(acl[1])
             unk = conn.execute(
                 f"""
                 SELECT COUNT(DISTINCT f.photo_id) AS c
@@ -5043,7 +6995,7 @@ def api_people_train_one(pid: int):
     if fb:
         return jsonify(fb[0]), fb[1]
     try:
-        with closing(get_conn()) as conn:
+        with db_conn() as conn:
             person = conn.execute("SELECT id FROM people WHERE id=?", (pid,)).fetchone()
             if not person:
                 return jsonify({"ok": False, "error": "Person not found"}), 404
@@ -5060,7 +7012,7 @@ def api_people_train_all():
         return jsonify(fb[0]), fb[1]
     out = {"ok": True, "trained": 0}
     try:
-        with closing(get_conn()) as conn:
+        with db_conn() as conn:
             rows = conn.execute("SELECT id FROM people").fetchall()
             for r in rows:
                 pid = int(r["id"]) if r and r["id"] is not None else None
@@ -5074,67 +7026,107 @@ def api_people_train_all():
         return jsonify({"ok": False, "error": str(e)}), 500
 
 
+# --- Unknown-face matching job ---
+_match_unknown_running = threading.Event()
+match_unknown_counts: Dict[str, int] = {"scanned": 0, "matched": 0, "total": 0}
+last_match_unknown_result: Optional[Dict[str, Any]] = None
+MATCH_UNKNOWN_CHUNK = 4096
+
+
+def _match_unknown_faces_worker(limit: Optional[int] = None):
+    """Match unknown faces to person centroids chunk by chunk; apply all reassignments in one transaction."""
+    global match_unknown_counts, last_match_unknown_result
+    try:
+        log_event("faces_match_unknown_start")
+        with db_conn() as conn:
+            # Ensure centroids ready
+            cents = [(pid, _normalize_embedding(c)) for (pid, c) in _load_person_centroids(conn)]
+            dim = next((int(c.size) for (_, c) in cents if c is not None), 0)
+            cents = [(pid, c) for (pid, c) in cents if c is not None and int(c.size) == dim]
+            if not cents:
+                last_match_unknown_result = {"ok": True, **match_unknown_counts}
+                return
+            cent_pids = np.asarray([pid for (pid, _) in cents], dtype=np.int64)
+            cent_mat = np.stack([c for (_, c) in cents])
+            where = "WHERE person_id IS NULL AND embedding IS NOT NULL"
+            lim = f" LIMIT {int(limit)}" if isinstance(limit, int) and limit > 0 else ""
+            total = int(conn.execute(f"SELECT COUNT(*) AS c FROM (SELECT id FROM faces {where}{lim})").fetchone()["c"] or 0)
+            match_unknown_counts = {"scanned": 0, "matched": 0, "total": total}
+            updates: list[tuple[int, int]] = []
+            cur = conn.execute(f"SELECT id, embedding FROM faces {where}{lim}")
+            while _match_unknown_running.is_set():
+                rows = cur.fetchmany(MATCH_UNKNOWN_CHUNK)
+                if not rows:
+                    break
+                fids: list[int] = []
+                vecs: list[np.ndarray] = []
+                for r in rows:
+                    v = _normalize_embedding(_row_embedding(r))
+                    if v is None or int(v.size) != dim:
+                        continue
+                    fids.append(int(r["id"]))
+                    vecs.append(v)
+                if vecs:
+                    sims = np.stack(vecs) @ cent_mat.T
+                    best = np.argmax(sims, axis=1)
+                    best_sc = sims[np.arange(best.size), best]
+                    hit = np.flatnonzero(best_sc >= FACE_MATCH_THRESHOLD_CENTROID)
+                    updates.extend((int(cent_pids[best[i]]), fids[i]) for i in hit)
+                    match_unknown_counts["matched"] += int(hit.size)
+                match_unknown_counts["scanned"] += len(fids)
+            cur.close()
+            if updates:
+                conn.executemany("UPDATE faces SET person_id=? WHERE id=? AND person_id IS NULL", updates)
+                conn.commit()
+                _face_cache_invalidate()
+        last_match_unknown_result = {"ok": True, **match_unknown_counts}
+        log_event("faces_match_unknown_done", **match_unknown_counts)
+    except Exception as e:
+        log_event("error", rel_path="faces_match_unknown", error=str(e))
+        last_match_unknown_result = {"ok": False, "error": str(e), **match_unknown_counts}
+    finally:
+        _match_unknown_running.clear()
+
+
 @app.route("/api/faces/match-unknown", methods=["POST"])
 def api_faces_match_unknown():
-    """Try to match previously unknown faces (person_id IS NULL) against known person centroids."""
+    """Start a background pass matching unknown faces (person_id IS NULL) against known person centroids."""
+    global match_unknown_counts, last_match_unknown_result
     fb = _forbid_user_role_for_maintenance()
     if fb:
         return jsonify(fb[0]), fb[1]
+    if _match_unknown_running.is_set():
+        return jsonify({"ok": False, "error": "Unknown-face matching already running"}), 409
     body = request.get_json(silent=True) or {}
     try:
         limit_val = body.get("limit")
         limit = int(limit_val) if (limit_val is not None) else None
     except Exception:
         limit = None
-    scanned = 0
-    matched = 0
-    try:
-        with closing(get_conn()) as conn:
-            # Ensure centroids ready
-            cents = _load_person_centroids(conn)
-            if not cents:
-                return jsonify({"ok": True, "scanned": 0, "matched": 0})
-            # Load unknown faces
-            sql = "SELECT id, embedding_json FROM faces WHERE person_id IS NULL AND embedding_json IS NOT NULL"
-            if isinstance(limit, int) and limit > 0:
-                sql += f" LIMIT {int(limit)}"
-            rows = conn.execute(sql).fetchall()
-            for r in rows:
-                try:
-                    fid = int(r["id"]) if r and r["id"] is not None else None
-                    if fid is None:
-                        continue
-                    try:
-                        vec = json.loads(r["embedding_json"]) if r["embedding_json"] else None
-                    except Exception:
-                        vec = None
-                    if not (isinstance(vec, list) and vec):
-                        continue
-                    scanned += 1
-                    # Find best centroid match
-                    best_pid = None
-                    best_sc = -1.0
-                    for pid, cvec in cents:
-                        sc = _cosine(vec, cvec)
-                        if sc > best_sc:
-                            best_sc = sc
-                            best_pid = pid
-                    if best_pid is not None and best_sc >= FACE_MATCH_THRESHOLD_CENTROID:
-                        try:
-                            conn.execute("UPDATE faces SET person_id=? WHERE id=?", (int(best_pid), fid))
-                            matched += 1
-                        except Exception:
-                            pass
-                except Exception:
-                    # Ignore malformed rows and continue matching others
-                    pass
-            try:
-                conn.commit()
-            except Exception:
-                pass
-        return jsonify({"ok": True, "scanned": scanned, "matched": matched})
-    except Exception as e:
-        return jsonify({"ok": False, "error": str(e)}), 500
+    _match_unknown_running.set()
+    match_unknown_counts = {"scanned": 0, "matched": 0, "total": 0}
+    last_match_unknown_result = None
+    threading.Thread(target=_match_unknown_faces_worker, args=(limit,), daemon=True).start()
+    return jsonify({"ok": True, "running": True})
+
+
+@app.route("/api/faces/match-unknown/stop", methods=["POST"])
+def api_faces_match_unknown_stop():
+    fb = _forbid_user_role_for_maintenance()
+    if fb:
+        return jsonify(fb[0]), fb[1]
+    if _match_unknown_running.is_set():
+        _match_unknown_running.clear()
+        return jsonify({"ok": True, "running": True, "stopping": True})
+    return jsonify({"ok": True, "running": False})
+
+
+@app.route("/api/faces/match-unknown/status")
+def api_faces_match_unknown_status():
+    resp: Dict[str, Any] = {"ok": True, "running": _match_unknown_running.is_set(), **match_unknown_counts}
+    if not _match_unknown_running.is_set() and last_match_unknown_result:
+        resp["last"] = last_match_unknown_result
+    return jsonify(resp)
 
 
 @app.route("/api/people/<int:pid>/hide", methods=["POST"])
@@ -5146,7 +7138,7 @@ def api_people_hide(pid: int):
         data = request.get_json(silent=True) or {}
         val = data.get("hidden")
         hidden = 1 if (val in (1, True, "1", "true", "True", None)) else 0
-        with closing(get_conn()) as conn:
+        with db_conn() as conn:
             conn.execute("UPDATE people SET hidden=? WHERE id=?", (hidden, pid))
             conn.commit()
         return jsonify({"ok": True, "id": pid, "hidden": bool(hidden)})
@@ -5157,42 +7149,44 @@ def api_people_hide(pid: int):
 @app.route("/api/people/<int:pid>/photos")
 def api_people_photos(pid: int):
     """List photos that include a given person id."""
+    fields = _parse_photo_fields(request.args.get("fields"))
     items: list[Dict[str, Any]] = []
-    with closing(get_conn()) as conn:
+    with db_conn() as conn:
+        acl = _current_user_acl_sql(conn, "p.rel_path", owned=False)
+        acl_sql, acl_params = (f"AND {acl[0]}", acl[1]) if acl else ("", [])
         rows = conn.execute(
-            """
-            SELECT p.*
+            f"""
+            SELECT {_photo_select_columns(conn, fields, alias="p")}
             FROM photos p
             INNER JOIN faces f ON f.photo_id = p.id
-            WHERE f.person_id = ?
+            WHERE f.person_id = ? {acl_sql}
             ORDER BY COALESCE(p.captured_at, p.modified_fs, p.created_fs) DESC
             """,
-            (pid,),
+            [pid, *acl_params],
         ).fetchall()
-        for r in rows:
-            if _is_rel_path_allowed_for_current_user(r["rel_path"], conn):
-                items.append(row_to_public(r))
-    return jsonify({"ok": True, "items": items})
+        items = [row_to_public(r, fields) for r in rows]
+    return jsonify({"ok": True, "items": _project_photo_fields(items, fields)})
 
 
 @app.route("/api/people/unknown/photos-faces")
 def api_people_unknown_photos_faces():
     items: list[Dict[str, Any]] = []
-    with closing(get_conn()) as conn:
+    with db_conn() as conn:
+        acl = _current_user_acl_sql(conn, "p.rel_path", owned=False)
+        acl_sql, acl_params = (f"AND {acl[0]}", acl[1]) if acl else ("", [])
         rows = conn.execute(
-            """
-            SELECT p.*, f.id as face_id, f.bbox_x, f.bbox_y, f.bbox_w, f.bbox_h
+            f"""
+            SELECT {_photo_select_columns(conn, alias="p")}, f.id as face_id, f.bbox_x, f.bbox_y, f.bbox_w, f.bbox_h
             FROM photos p
             INNER JOIN faces f ON f.photo_id = p.id
-            WHERE f.person_id IS NULL
+            WHERE f.person_id IS NULL {acl_sql}
             ORDER BY COALESCE(p.captured_at, p.modified_fs, p.created_fs) DESC, f.id DESC
-            """
+            """,
+            acl_params,
         ).fetchall()
         # Group faces per photo
         by_photo: Dict[int, Dict[str, Any]] = {}
         for r in rows:
-            if not _is_rel_path_allowed_for_current_user(r["rel_path"], conn):
-                continue
             pid_ = int(r["id"])  # photo id
             if pid_ not in by_photo:
                 by_photo[pid_] = row_to_public(r)
@@ -5215,7 +7209,7 @@ def api_people_unknown_photos_faces():
 def api_face_thumb(face_id: int):
     # Serve cached face thumbnail; if missing/stale, queue background generation and return a lightweight placeholder.
     try:
-        with closing(get_conn()) as conn:
+        with db_conn() as conn:
             r = conn.execute(
                 "SELECT f.bbox_x, f.bbox_y, f.bbox_w, f.bbox_h, p.rel_path, p.thumb_name FROM faces f INNER JOIN photos p ON p.id = f.photo_id WHERE f.id=?",
                 (face_id,),
@@ -5285,7 +7279,7 @@ def _face_thumb_name(face_id: int) -> str:
 
 def _build_face_thumb(face_id: int) -> bool:
     try:
-        with closing(get_conn()) as conn:
+        with db_conn() as conn:
             r = conn.execute(
                 "SELECT f.bbox_x, f.bbox_y, f.bbox_w, f.bbox_h, p.rel_path, p.thumb_name, p.width, p.height FROM faces f INNER JOIN photos p ON p.id = f.photo_id WHERE f.id=?",
                 (face_id,),
@@ -5451,7 +7445,7 @@ def api_face_thumb_status(face_id: int):
     version param based on mtime when ready.
     """
     try:
-        with closing(get_conn()) as conn:
+        with db_conn() as conn:
             r = conn.execute(
                 "SELECT f.bbox_x, f.bbox_y, f.bbox_w, f.bbox_h, p.rel_path, p.thumb_name FROM faces f INNER JOIN photos p ON p.id = f.photo_id WHERE f.id=?",
                 (face_id,),
@@ -5489,19 +7483,20 @@ def api_face_thumb_status(face_id: int):
 @app.route("/api/people/unknown/photos")
 def api_people_unknown_photos():
     items: list[Dict[str, Any]] = []
-    with closing(get_conn()) as conn:
+    with db_conn() as conn:
+        acl = _current_user_acl_sql(conn, "p.rel_path", owned=False)
+        acl_sql, acl_params = (f"AND {acl[0]}", acl[1]) if acl else ("", [])
         rows = conn.execute(
-            """
-            SELECT DISTINCT p.*
+            f"""
+            SELECT DISTINCT {_photo_select_columns(conn, alias="p")}
             FROM photos p
             INNER JOIN faces f ON f.photo_id = p.id
-            WHERE f.person_id IS NULL
+            WHERE f.person_id IS NULL {acl_sql}
             ORDER BY COALESCE(p.captured_at, p.modified_fs, p.created_fs) DESC
-            """
+            """,
+            acl_params,
         ).fetchall()
-        for r in rows:
-            if _is_rel_path_allowed_for_current_user(r["rel_path"], conn):
-                items.append(row_to_public(r))
+        items = [row_to_public(r) for r in rows]
     return jsonify({"ok": True, "items": items})
 
 
@@ -5515,7 +7510,7 @@ def api_people_rename(pid: int):
     if not new_name:
         return jsonify({"ok": False, "error": "Missing name"}), 400
     try:
-        with closing(get_conn()) as conn:
+        with db_conn() as conn:
             src = conn.execute("SELECT id, name FROM people WHERE id=?", (pid,)).fetchone()
             if not src:
                 return jsonify({"ok": False, "error": "Person not found"}), 404
@@ -5526,6 +7521,7 @@ def api_people_rename(pid: int):
                 conn.execute("UPDATE faces SET person_id=? WHERE person_id=?", (target_id, pid))
                 conn.execute("DELETE FROM people WHERE id=?", (pid,))
                 conn.commit()
+                _face_cache_invalidate()
                 # Recompute centroid for target person after merge
                 try:
                     _recompute_person_centroid(conn, target_id)
@@ -5543,7 +7539,7 @@ def api_people_rename(pid: int):
             conn.commit()
         # Recompute centroid for renamed person as well (no-op if unchanged)
         try:
-            with closing(get_conn()) as conn2:
+            with db_conn() as conn2:
                 _recompute_person_centroid(conn2, pid)
         except Exception:
             pass
@@ -5554,15 +7550,17 @@ def api_people_rename(pid: int):
         return jsonify({"ok": False, "error": str(e)}), 500
 
 
-def _cosine(a: list[float], b: list[float]) -> float:
+def _cosine(a: Any, b: Any) -> float:
     try:
-        import math
-        if not a or not b:
+        if a is None or b is None or len(a) == 0 or len(b) == 0:
+            return -1.0
+        va = np.asarray(a, dtype=np.float32).reshape(-1)
+        vb = np.asarray(b, dtype=np.float32).reshape(-1)
+        if va.size != vb.size:
             return -1.0
-        s = sum(x*y for x, y in zip(a, b))
-        na = math.sqrt(sum(x*x for x in a)) or 1.0
-        nb = math.sqrt(sum(y*y for y in b)) or 1.0
-        return s / (na * nb)
+        na = float(np.linalg.norm(va)) or 1.0
+        nb = float(np.linalg.norm(vb)) or 1.0
+        return float(np.dot(va, vb)) / (na * nb)
     except Exception:
         return -1.0
 
@@ -5662,16 +7660,309 @@ def matches_search(photo: Dict[str, Any], q: str, search_language: str = DEFAULT
     return True
 
 
-def query_photos(view: str, sort: str, folder: Optional[str] = None) -> list[Dict[str, Any]]:
-    sort_map = {
-        "date_desc": "COALESCE(captured_at, modified_fs, created_fs) DESC",
-        "date_asc": "COALESCE(captured_at, modified_fs, created_fs) ASC",
-        "name_asc": "filename ASC",
-        "name_desc": "filename DESC",
-        "size_desc": "file_size DESC",
-        "size_asc": "file_size ASC",
-    }
-    order_by = sort_map.get(sort, sort_map["date_desc"])
+# --- Full-text search (FTS5) ---
+# photos_fts holds a Danish-folded copy (see _fold_danish) of the searchable text per photo,
+# keyed by rowid = photos.id. Pure-SQL triggers delete rows and queue changed photo ids in
+# photos_fts_dirty; _fts_refresh folds and (re)indexes queued ids. Bulk changes (first
+# creation, scans, watcher flushes, AI batches, uploads) are drained by the "fts" work-queue
+# task; a search indexes at most one FTS_REFRESH_BATCH itself and otherwise uses the index
+# as it is. The trigram tokenizer keeps the old substring semantics for terms of 3+ characters.
+_FTS_AVAILABLE = False
+_FTS_LOCK = threading.Lock()
+FTS_REFRESH_BATCH = 2000
+
+def _sync_triggers(conn: sqlite3.Connection, name_like: str, script: str) -> None:
+    """Bring the triggers whose names match name_like in line with script.
+
+    script holds CREATE TABLE IF NOT EXISTS / CREATE TRIGGER statements. Everything runs in one
+    BEGIN IMMEDIATE transaction, and a trigger is only dropped and recreated when its stored SQL
+    differs, so concurrent init_db() calls (scan, backfills, queue workers) serialize instead of
+    racing on the DDL.
+    """
+    statements: list[str] = []
+    buf = ""
+    for line in script.splitlines(keepends=True):
+        buf += line
+        if sqlite3.complete_statement(buf):
+            statements.append(buf.strip().rstrip(";").strip())
+            buf = ""
+
+    def _norm(sql: Any) -> str:
+        return " ".join(str(sql or "").split())
+
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        have = {
+            r["name"]: _norm(r["sql"])
+            for r in conn.execute(
+                "SELECT name, sql FROM sqlite_master WHERE type='trigger' AND name LIKE ? ESCAPE '\\'", (name_like,)
+            ).fetchall()
+        }
+        wanted: set[str] = set()
+        for stmt in statements:
+            m = re.match(r"CREATE\s+TRIGGER\s+(\w+)", stmt, re.IGNORECASE)
+            if not m:
+                conn.execute(stmt)
+                continue
+            name = m.group(1)
+            wanted.add(name)
+            if have.get(name) != _norm(stmt):
+                conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+                conn.execute(stmt)
+        for name in set(have) - wanted:
+            conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+_FTS_TRIGGERS_SQL = """
+    CREATE TABLE IF NOT EXISTS photos_fts_dirty (photo_id INTEGER PRIMARY KEY);
+    CREATE TRIGGER trg_photos_fts_ins AFTER INSERT ON photos BEGIN
+        INSERT INTO photos_fts_dirty(photo_id) SELECT new.id
+        WHERE NOT EXISTS (SELECT 1 FROM photos_fts_dirty WHERE photo_id = new.id);
+    END;
+    CREATE TRIGGER trg_photos_fts_upd AFTER UPDATE OF
+        filename, rel_path, camera_make, camera_model, lens_model, gps_name,
+        ai_tags, ai_desc_tags, ai_desc_caption, captured_at ON photos BEGIN
+        INSERT INTO photos_fts_dirty(photo_id) SELECT new.id
+        WHERE NOT EXISTS (SELECT 1 FROM photos_fts_dirty WHERE photo_id = new.id);
+    END;
+    CREATE TRIGGER trg_photos_fts_del AFTER DELETE ON photos BEGIN
+        DELETE FROM photos_fts WHERE rowid = old.id;
+        DELETE FROM photos_fts_dirty WHERE photo_id = old.id;
+    END;
+    CREATE TRIGGER trg_faces_fts_ins AFTER INSERT ON faces BEGIN
+        INSERT INTO photos_fts_dirty(photo_id) SELECT new.photo_id
+        WHERE NOT EXISTS (SELECT 1 FROM photos_fts_dirty WHERE photo_id = new.photo_id);
+    END;
+    CREATE TRIGGER trg_faces_fts_del AFTER DELETE ON faces BEGIN
+        INSERT INTO photos_fts_dirty(photo_id) SELECT old.photo_id
+        WHERE NOT EXISTS (SELECT 1 FROM photos_fts_dirty WHERE photo_id = old.photo_id);
+    END;
+    CREATE TRIGGER trg_faces_fts_upd AFTER UPDATE OF person_id, photo_id ON faces BEGIN
+        INSERT INTO photos_fts_dirty(photo_id) SELECT old.photo_id
+        WHERE NOT EXISTS (SELECT 1 FROM photos_fts_dirty WHERE photo_id = old.photo_id);
+        INSERT INTO photos_fts_dirty(photo_id) SELECT new.photo_id
+        WHERE NOT EXISTS (SELECT 1 FROM photos_fts_dirty WHERE photo_id = new.photo_id);
+    END;
+    CREATE TRIGGER trg_people_fts_upd AFTER UPDATE OF name, hidden ON people BEGIN
+        INSERT INTO photos_fts_dirty(photo_id) SELECT DISTINCT photo_id FROM faces
+        WHERE person_id = new.id AND photo_id NOT IN (SELECT photo_id FROM photos_fts_dirty);
+    END;
+    CREATE TRIGGER trg_people_fts_del AFTER DELETE ON people BEGIN
+        INSERT INTO photos_fts_dirty(photo_id) SELECT DISTINCT photo_id FROM faces
+        WHERE person_id = old.id AND photo_id NOT IN (SELECT photo_id FROM photos_fts_dirty);
+    END;
+"""
+
+
+def _init_photos_fts(conn: sqlite3.Connection) -> None:
+    """Create the FTS table and sync triggers; queue every photo on first creation."""
+    global _FTS_AVAILABLE
+    try:
+        existed = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='photos_fts'").fetchone() is not None
+        conn.execute(
+            """
+            CREATE VIRTUAL TABLE IF NOT EXISTS photos_fts USING fts5(
+                filename, rel_path, camera, lens, gps_name, tags, caption, people, captured_at,
+                tokenize='trigram'
+            )
+            """
+        )
+        conn.commit()
+    except Exception as e:
+        # Older SQLite builds without FTS5/trigram: search falls back to matches_search
+        _FTS_AVAILABLE = False
+        log_event("error", rel_path="photos_fts", error=str(e))
+        return
+    _FTS_AVAILABLE = True
+    try:
+        # The triggers avoid "INSERT OR IGNORE": inside a trigger fired by an UPSERT, the outer
+        # statement's conflict handling overrides OR IGNORE.
+        _sync_triggers(conn, "trg\\_%\\_fts\\_%", _FTS_TRIGGERS_SQL)
+        if not existed:
+            conn.execute("INSERT OR IGNORE INTO photos_fts_dirty(photo_id) SELECT id FROM photos")
+            conn.commit()
+    except Exception as e:
+        # FTS itself works; the next init_db() retries the trigger sync
+        log_event("error", rel_path="photos_fts_triggers", error=str(e))
+
+
+def _fts_refresh(conn: sqlite3.Connection, max_batches: Optional[int] = None) -> int:
+    """Re-index photos queued in photos_fts_dirty, FTS_REFRESH_BATCH at a time.
+
+    Each batch is read and written in one BEGIN IMMEDIATE transaction, so a concurrent
+    refresh in another process cannot index a row that changed after it was read.
+    Returns the number of rows indexed.
+    """
+    done = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        with _FTS_LOCK:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                ids = [int(r["photo_id"]) for r in conn.execute("SELECT photo_id FROM photos_fts_dirty LIMIT ?", (FTS_REFRESH_BATCH,)).fetchall()]
+                if not ids:
+                    conn.rollback()
+                    break
+                ph = ",".join(["?"] * len(ids))
+                rows = conn.execute(
+                    f"""
+                    SELECT
+                        photos.id, filename, rel_path, camera_make, camera_model, lens_model, gps_name,
+                        ai_tags, ai_desc_tags, ai_desc_caption, captured_at,
+                        COALESCE((
+                            SELECT GROUP_CONCAT(name, ' ')
+                            FROM (
+                                SELECT DISTINCT p2.name AS name
+                                FROM faces f2
+                                INNER JOIN people p2 ON p2.id = f2.person_id
+                                WHERE f2.photo_id = photos.id
+                                  AND COALESCE(p2.hidden, 0) = 0
+                            )
+                        ), '') AS people_names
+                    FROM photos
+                    WHERE photos.id IN ({ph})
+                    """,
+                    ids,
+                ).fetchall()
+                docs = []
+                for r in rows:
+                    tags: list[str] = []
+                    for key in ("ai_tags", "ai_desc_tags"):
+                        try:
+                            tags.extend(str(t) for t in (json.loads(r[key]) if r[key] else []) or [])
+                        except Exception:
+                            pass
+                    docs.append((
+                        int(r["id"]),
+                        _fold_danish(str(r["filename"] or "")),
+                        _fold_danish(str(r["rel_path"] or "")),
+                        _fold_danish(f"{r['camera_make'] or ''} {r['camera_model'] or ''}"),
+                        _fold_danish(str(r["lens_model"] or "")),
+                        _fold_danish(str(r["gps_name"] or "")),
+                        _fold_danish(" ".join(tags)),
+                        _fold_danish(str(r["ai_desc_caption"] or "")),
+                        _fold_danish(str(r["people_names"] or "")),
+                        str(r["captured_at"] or "").lower(),
+                    ))
+                conn.execute(f"DELETE FROM photos_fts WHERE rowid IN ({ph})", ids)
+                conn.executemany(
+                    "INSERT INTO photos_fts(rowid, filename, rel_path, camera, lens, gps_name, tags, caption, people, captured_at) VALUES (?,?,?,?,?,?,?,?,?,?)",
+                    docs,
+                )
+                conn.execute(f"DELETE FROM photos_fts_dirty WHERE photo_id IN ({ph})", ids)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        batches += 1
+        done += len(docs)
+    return done
+
+
+def _fts_schedule() -> None:
+    """Queue the background FTS refresh if photos are waiting (a no-op while one is queued or running)."""
+    if not _FTS_AVAILABLE:
+        return
+    try:
+        with db_conn() as conn:
+            if not conn.execute("SELECT 1 FROM photos_fts_dirty LIMIT 1").fetchone():
+                return
+            if conn.execute("SELECT 1 FROM work_queue WHERE task_key='fts:refresh' AND state IN ('queued','running') LIMIT 1").fetchone():
+                return
+        _work_enqueue("fts", "fts:refresh", {}, priority=WORK_PRIORITY_BULK)
+    except Exception as e:
+        log_event("error", rel_path="photos_fts", error=f"schedule: {e}")
+
+
+def _fts_refresh_for_search(conn: sqlite3.Connection) -> None:
+    """Index a small backlog before a search; leave a large one to the background task."""
+    pending = conn.execute(
+        "SELECT COUNT(*) FROM (SELECT 1 FROM photos_fts_dirty LIMIT ?)", (FTS_REFRESH_BATCH + 1,)
+    ).fetchone()[0]
+    if not pending:
+        return
+    if pending > FTS_REFRESH_BATCH:
+        _fts_schedule()
+        return
+    _fts_refresh(conn, max_batches=1)
+
+
+def _fts_match_query(q: str, search_language: str = DEFAULT_SEARCH_LANGUAGE) -> Optional[str]:
+    """Build an FTS5 MATCH expression: AND across query words, OR across each word's synonyms.
+    Returns None when the query cannot be expressed (FTS unavailable or a term shorter than
+    3 characters, which the trigram index cannot match); callers then use matches_search.
+    """
+    if not _FTS_AVAILABLE:
+        return None
+    groups = _query_term_groups(q, search_language)
+    if not groups:
+        return ""
+    parts: list[str] = []
+    for group in groups:
+        terms = sorted({_fold_danish(t) for t in group})
+        if any(len(t) < 3 for t in terms):
+            return None
+        parts.append("(" + " OR ".join('"' + t.replace('"', '""') + '"' for t in terms) + ")")
+    return " AND ".join(parts)
+
+
+# Sort key expressions for /api/photos. NULLs are folded to a sentinel so the
+# (key, id) pair is always comparable for keyset pagination.
+_PHOTO_SORT_KEYS = {
+    "date_desc": ("COALESCE(captured_at, modified_fs, created_fs, '')", True),
+    "date_asc": ("COALESCE(captured_at, modified_fs, created_fs, '')", False),
+    "name_asc": ("COALESCE(filename, '')", False),
+    "name_desc": ("COALESCE(filename, '')", True),
+    "size_desc": ("COALESCE(file_size, -1)", True),
+    "size_asc": ("COALESCE(file_size, -1)", False),
+}
+
+def _encode_photos_cursor(key: Any, photo_id: int) -> str:
+    raw = json.dumps([key, int(photo_id)], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_photos_cursor(token: Optional[str]) -> Optional[Tuple[Any, int]]:
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        key, pid = json.loads(raw.decode("utf-8"))
+        if not isinstance(key, (str, int, float)):
+            return None
+        return key, int(pid)
+    except Exception:
+        return None
+
+
+def query_photos(
+    view: str,
+    sort: str,
+    folder: Optional[str] = None,
+    fts_match: Optional[str] = None,
+    limit: Optional[int] = None,
+    after: Optional[Tuple[Any, int]] = None,
+    slim: bool = False,
+    fields: Optional[set[str]] = None,
+    acl: Optional[Tuple[str, list[Any]]] = None,
+) -> list[Dict[str, Any]]:
+    """Return photos for a list view.
+
+    With ``limit``/``after`` the query is a keyset page ordered by (sort key, id);
+    each item then carries ``_sort_key`` so the caller can build the next cursor.
+    ``slim`` drops raw EXIF and embeddings from the projection; ``fields``
+    narrows it further (see _photo_select_columns). ``acl`` is a predicate
+    from _current_user_acl_sql.
+    """
+    sort_expr, sort_desc = _PHOTO_SORT_KEYS.get(sort, _PHOTO_SORT_KEYS["date_desc"])
+    direction = "DESC" if sort_desc else "ASC"
+    order_by = f"{sort_expr} {direction}, photos.id {direction}"
 
     where = []
     params: list[Any] = []
@@ -5723,10 +8014,23 @@ def query_photos(view: str, sort: str, folder: Optional[str] = None) -> list[Dic
             where.append("(" + " OR ".join(["rel_path LIKE ? || '/%'"] * len(uniq_prefixes)) + ")")
             params.extend(uniq_prefixes)
 
+    # Text search via the FTS5 index (see _fts_match_query)
+    if fts_match:
+        where.append("photos.id IN (SELECT rowid FROM photos_fts WHERE photos_fts MATCH ?)")
+        params.append(fts_match)
+
+    if acl is not None:
+        where.append(acl[0])
+        params.extend(acl[1])
+
+    if after is not None:
+        # Spelled out (rather than a row-value comparison) so SQLite can seek the sort index
+        op = "<" if sort_desc else ">"
+        where.append(f"({sort_expr} {op}= ? AND ({sort_expr} {op} ? OR photos.id {op} ?))")
+        params.extend([after[0], after[0], after[1]])
+
     where_sql = ("WHERE " + " AND ".join(where)) if where else ""
-    sql = f"""
-        SELECT
-            photos.*,
+    people_sql = """,
             COALESCE((
                 SELECT GROUP_CONCAT(name, ' ')
                 FROM (
@@ -5736,143 +8040,1035 @@ def query_photos(view: str, sort: str, folder: Optional[str] = None) -> list[Dic
                     WHERE f2.photo_id = photos.id
                       AND COALESCE(p2.hidden, 0) = 0
                 )
-            ), '') AS people_names
+            ), '') AS people_names""" if fields is None or "people_names" in fields else ""
+    sql = f"""
+        SELECT
+            {{columns}},
+            {sort_expr} AS _sort_key{people_sql}
         FROM photos
         {where_sql}
         ORDER BY {order_by}
     """
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(int(limit))
+
+    with db_conn() as conn:
+        if fts_match:
+            _fts_refresh_for_search(conn)
+        columns = _photo_select_columns(conn, fields) if (slim or fields is not None) else "photos.*"
+        rows = conn.execute(sql.replace("{columns}", columns), params).fetchall()
+    items = [row_to_public(r, fields) for r in rows]
+    if limit is None and after is None:
+        for it in items:
+            it.pop("_sort_key", None)
+    return items
+
+
+# --- Full-file checksums (tiered hashing) ---
+# Scans store only quick_hash (size + head/tail blocks). checksum_sha256 is filled
+# lazily for exact-duplicate candidates in api_duplicates, or by the throttled
+# backfill job. A stored checksum belongs to the row's (rel_path, modified_fs,
+# file_size): it is only written while those still match the file on disk.
+checksum_thread = None
+_checksum_stop_event = threading.Event()
+checksum_counts: Dict[str, int] = {"hashed": 0, "failed": 0, "total": 0}
+last_checksum_result: Optional[Dict[str, Any]] = None
+
+
+def _store_full_checksums(rows: Iterable[Dict[str, Any]], stop_event=None, throttle: float = 0.0) -> Tuple[int, int]:
+    """Hash and persist checksum_sha256 for photo row dicts (id, rel_path, modified_fs, file_size).
+
+    Rows whose file changed since it was indexed are skipped. Hashed rows get
+    ``checksum_sha256`` set in place. Returns (hashed, failed).
+    """
+    hashed = failed = 0
+    for row in rows:
+        if stop_event and stop_event.is_set():
+            break
+        rel = str(row.get("rel_path") or "")
+        path = _disk_path_from_rel_path(rel)
+        try:
+            st = path.stat()
+            if (datetime.fromtimestamp(st.st_mtime).isoformat(timespec="seconds") != row.get("modified_fs")
+                    or st.st_size != row.get("file_size")):
+                continue
+            digest = sha256_file(path)
+        except OSError as e:
+            failed += 1
+            log_event("error", rel_path=rel, error=f"checksum: {e}")
+            continue
+        with db_conn() as conn:
+            conn.execute(
+                "UPDATE photos SET checksum_sha256=? WHERE id=? AND modified_fs IS ? AND file_size IS ?",
+                (digest, row["id"], row.get("modified_fs"), row.get("file_size")),
+            )
+            conn.commit()
+        row["checksum_sha256"] = digest
+        hashed += 1
+        if throttle > 0:
+            time.sleep(throttle)
+    return hashed, failed
+
+
+def _fill_duplicate_checksums(rows: list[Dict[str, Any]]) -> int:
+    """Compute missing full checksums, but only for rows that could be exact duplicates.
+
+    That is rows sharing file_size and quick_hash with another row; a size group
+    containing rows without quick_hash (indexed before it existed) is hashed whole.
+    """
+    by_size: Dict[Any, list[Dict[str, Any]]] = {}
+    for r in rows:
+        if r.get("file_size"):
+            by_size.setdefault(r["file_size"], []).append(r)
+    need: list[Dict[str, Any]] = []
+    for grp in by_size.values():
+        if len(grp) < 2:
+            continue
+        if any(not r.get("quick_hash") for r in grp):
+            cands = grp
+        else:
+            seen: Dict[str, int] = {}
+            for r in grp:
+                seen[r["quick_hash"]] = seen.get(r["quick_hash"], 0) + 1
+            cands = [r for r in grp if seen[r["quick_hash"]] > 1]
+        need.extend(r for r in cands if not r.get("checksum_sha256"))
+    if not need:
+        return 0
+    hashed, _ = _store_full_checksums(need)
+    return hashed
+
+
+def checksum_backfill(stop_event=None) -> Dict[str, Any]:
+    init_db()
+    log_event("checksum_start")
+    with db_conn() as conn:
+        rows = [dict(r) for r in conn.execute(
+            "SELECT id, rel_path, modified_fs, file_size FROM photos WHERE checksum_sha256 IS NULL ORDER BY id"
+        ).fetchall()]
+    checksum_counts.update({"hashed": 0, "failed": 0, "total": len(rows)})
+    for i in range(0, len(rows), 50):
+        if stop_event and stop_event.is_set():
+            break
+        hashed, failed = _store_full_checksums(rows[i:i + 50], stop_event=stop_event, throttle=CHECKSUM_THROTTLE_SEC)
+        checksum_counts["hashed"] += hashed
+        checksum_counts["failed"] += failed
+    res = {"ok": True, **checksum_counts, "stopped": bool(stop_event and stop_event.is_set())}
+    log_event("checksum_done", hashed=res["hashed"], failed=res["failed"], total=res["total"])
+    return res
+
+
+def _start_checksum_backfill() -> bool:
+    global checksum_thread, last_checksum_result
+    if checksum_thread and checksum_thread.is_alive():
+        return False
+    _checksum_stop_event.clear()
+    last_checksum_result = None
+
+    def run_checksums():
+        global last_checksum_result
+        try:
+            last_checksum_result = checksum_backfill(stop_event=_checksum_stop_event)
+        except Exception as e:
+            log_event("error", rel_path="checksum", error=str(e))
+            last_checksum_result = {"ok": False, "error": str(e)}
+
+    checksum_thread = threading.Thread(target=run_checksums, name="checksum-backfill", daemon=True)
+    checksum_thread.start()
+    return True
+
+
+@app.route("/api/checksums/start", methods=["POST"])
+def api_checksums_start():
+    fb = _forbid_user_role_for_maintenance()
+    if fb:
+        return jsonify(fb[0]), fb[1]
+    if not _start_checksum_backfill():
+        return jsonify({"ok": False, "error": "Checksum job already running"}), 409
+    return jsonify({"ok": True, "started": True})
+
+
+@app.route("/api/checksums/stop", methods=["POST"])
+def api_checksums_stop():
+    fb = _forbid_user_role_for_maintenance()
+    if fb:
+        return jsonify(fb[0]), fb[1]
+    _checksum_stop_event.set()
+    return jsonify({"ok": True, "stopped": True})
+
+
+@app.route("/api/checksums/status")
+def api_checksums_status():
+    running = bool(checksum_thread and checksum_thread.is_alive())
+    resp: Dict[str, Any] = {"ok": True, "running": running, **checksum_counts}
+    if not running and last_checksum_result is not None:
+        resp["result"] = last_checksum_result
+    return jsonify(resp)
+
+
+# --- Perceptual hash backfill ---
+# Rows indexed before phash64/dhash64 existed get them from their stored thumbnail;
+# originals are never re-read. Rows without a thumbnail file are left alone.
+phash_thread = None
+_phash_stop_event = threading.Event()
+phash_counts: Dict[str, int] = {"hashed": 0, "missing": 0, "total": 0}
+last_phash_result: Optional[Dict[str, Any]] = None
+
+
+def _hash_thumbnail_rows(rows: list[Dict[str, Any]]) -> Tuple[int, int]:
+    """Compute and store phash64/dhash64 for row dicts (id, thumb_name). Returns (hashed, missing)."""
+    images: list[Image.Image] = []
+    found: list[Dict[str, Any]] = []
+    missing = 0
+    for row in rows:
+        try:
+            with Image.open(THUMB_DIR / str(row["thumb_name"])) as im:
+                images.append(im.convert("L"))
+            found.append(row)
+        except Exception:
+            missing += 1
+    hashes = perceptual_hashes_batch(images)
+    if found:
+        with db_conn() as conn:
+            conn.executemany(
+                "UPDATE photos SET phash64=?, dhash64=? WHERE id=? AND thumb_name IS ?",
+                [(ph, dh, row["id"], row["thumb_name"]) for row, (ph, dh) in zip(found, hashes)],
+            )
+            conn.commit()
+    return len(found), missing
+
+
+def phash_backfill(stop_event=None, batch_size: int = 200) -> Dict[str, Any]:
+    init_db()
+    log_event("phash_start")
+    video_exts = sorted(VIDEO_EXTS)
+    with db_conn() as conn:
+        rows = [dict(r) for r in conn.execute(
+            "SELECT id, thumb_name FROM photos WHERE phash64 IS NULL AND thumb_name IS NOT NULL"
+            f" AND COALESCE(ext, '') NOT IN ({','.join('?' * len(video_exts))}) ORDER BY id",
+            video_exts,
+        ).fetchall()]
+    phash_counts.update({"hashed": 0, "missing": 0, "total": len(rows)})
+    for i in range(0, len(rows), batch_size):
+        if stop_event and stop_event.is_set():
+            break
+        hashed, missing = _hash_thumbnail_rows(rows[i:i + batch_size])
+        phash_counts["hashed"] += hashed
+        phash_counts["missing"] += missing
+    res = {"ok": True, **phash_counts, "stopped": bool(stop_event and stop_event.is_set())}
+    log_event("phash_done", hashed=res["hashed"], missing=res["missing"], total=res["total"])
+    return res
+
+
+def _start_phash_backfill() -> bool:
+    global phash_thread, last_phash_result
+    if phash_thread and phash_thread.is_alive():
+        return False
+    _phash_stop_event.clear()
+    last_phash_result = None
+
+    def run_phash():
+        global last_phash_result
+        try:
+            last_phash_result = phash_backfill(stop_event=_phash_stop_event)
+        except Exception as e:
+            log_event("error", rel_path="phash", error=str(e))
+            last_phash_result = {"ok": False, "error": str(e)}
+
+    phash_thread = threading.Thread(target=run_phash, name="phash-backfill", daemon=True)
+    phash_thread.start()
+    return True
+
+
+@app.route("/api/phash/start", methods=["POST"])
+def api_phash_start():
+    fb = _forbid_user_role_for_maintenance()
+    if fb:
+        return jsonify(fb[0]), fb[1]
+    if not _start_phash_backfill():
+        return jsonify({"ok": False, "error": "pHash job already running"}), 409
+    return jsonify({"ok": True, "started": True})
+
+
+@app.route("/api/phash/stop", methods=["POST"])
+def api_phash_stop():
+    fb = _forbid_user_role_for_maintenance()
+    if fb:
+        return jsonify(fb[0]), fb[1]
+    _phash_stop_event.set()
+    return jsonify({"ok": True, "stopped": True})
+
+
+@app.route("/api/phash/status")
+def api_phash_status():
+    running = bool(phash_thread and phash_thread.is_alive())
+    resp: Dict[str, Any] = {"ok": True, "running": running, **phash_counts}
+    if not running and last_phash_result is not None:
+        resp["result"] = last_phash_result
+    return jsonify(resp)
+
+
+def _phash_near_groups(rows: list[dict], radius: int) -> list[list[dict]]:
+    """Connected components of rows (carrying an integer hash in ``_h``) over pairs within ``radius``.
+
+    Rows with identical hashes are collapsed before the search; only components
+    spanning at least two distinct hashes are returned.
+    """
+    by_hash: dict[int, list[dict]] = {}
+    for r in rows:
+        by_hash.setdefault(r["_h"], []).append(r)
+    if len(by_hash) < 2:
+        return []
+    uniq = list(by_hash)
+    a, b = _phash_near_pairs(np.array(uniq, dtype=np.uint64), radius)
+    parent = list(range(len(uniq)))
+
+    def _root(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in zip(a.tolist(), b.tolist()):
+        ri, rj = _root(i), _root(j)
+        if ri != rj:
+            parent[max(ri, rj)] = min(ri, rj)
+    comps: dict[int, list[int]] = {}
+    for i in set(a.tolist()) | set(b.tolist()):
+        comps.setdefault(_root(i), []).append(i)
+    return [[r for i in sorted(members) for r in by_hash[uniq[i]]] for members in comps.values()]
+
+
+def _union_components(n: int, pairs: Iterable[Tuple[np.ndarray, np.ndarray]]) -> list[list[int]]:
+    """Connected components (as sorted index lists, size >= 2) over edge chunks (a, b)."""
+    parent = list(range(n))
+
+    def _root(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    linked: set[int] = set()
+    for a, b in pairs:
+        for i, j in zip(a.tolist(), b.tolist()):
+            ri, rj = _root(i), _root(j)
+            if ri != rj:
+                parent[max(ri, rj)] = min(ri, rj)
+            linked.add(i)
+            linked.add(j)
+    comps: dict[int, list[int]] = {}
+    for i in sorted(linked):
+        comps.setdefault(_root(i), []).append(i)
+    return list(comps.values())
+
+
+def _captured_ts(value: Any) -> Optional[float]:
+    """captured_at (naive ISO text) as seconds, for time differences only."""
+    if not value:
+        return None
+    try:
+        return (datetime.fromisoformat(str(value)[:19]) - datetime(1970, 1, 1)).total_seconds()
+    except ValueError:
+        return None
+
+
+def _embedding_rows(photo_ids: Any) -> np.ndarray:
+    """Normalized CLIP vectors for photo_ids from the in-memory index (zero rows where missing).
+
+    Looked up by id on every call, so rows moved by concurrent index writes stay correct.
+    """
+    ids = np.asarray(photo_ids, dtype=np.int64).reshape(-1)
+    with _EMB_INDEX_LOCK:
+        _embedding_index_ensure_locked()
+        if _EMB_INDEX_MAT is None or not _EMB_INDEX_N:
+            return np.zeros((ids.size, 1), dtype=np.float32)
+        pos = np.fromiter((_EMB_INDEX_POS.get(int(p), -1) for p in ids), dtype=np.int64, count=ids.size)
+        out = np.zeros((ids.size, _EMB_INDEX_MAT.shape[1]), dtype=np.float32)
+        found = pos >= 0
+        out[found] = _EMB_INDEX_MAT[pos[found]]
+    return out
+
+
+def _embedding_similar_pairs(photo_ids: np.ndarray, threshold: float, stop_event=None) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """Blocked self-join: yield index pairs (i < j) into photo_ids with cosine >= threshold.
+
+    Only one DUPES_EMBED_TILE x DUPES_EMBED_TILE score block exists at a time.
+    """
+    n = len(photo_ids)
+    tile = DUPES_EMBED_TILE
+    for a in range(0, n, tile):
+        xa = _embedding_rows(photo_ids[a:a + tile])
+        for b in range(a, n, tile):
+            if stop_event and stop_event.is_set():
+                return
+            xb = xa if b == a else _embedding_rows(photo_ids[b:b + tile])
+            i, j = np.nonzero(xa @ xb.T >= threshold)
+            if b == a:
+                keep = i < j
+                i, j = i[keep], j[keep]
+            if i.size:
+                yield i + a, j + b
+
+
+def _burst_pairs(photo_ids: np.ndarray, ts: np.ndarray, threshold: float, window: float, stop_event=None) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """Like _embedding_similar_pairs, restricted to photos at most ``window`` seconds apart.
+
+    photo_ids must be sorted by ts; each block is only scored against the band of
+    later photos inside the window.
+    """
+    n = len(photo_ids)
+    tile = DUPES_EMBED_TILE
+    for a in range(0, n, tile):
+        a_end = min(a + tile, n)
+        band_end = int(np.searchsorted(ts, ts[a_end - 1] + window, side="right"))
+        xa = _embedding_rows(photo_ids[a:a_end])
+        for b in range(a, band_end, tile):
+            if stop_event and stop_event.is_set():
+                return
+            b_end = min(b + tile, band_end)
+            xb = xa if b == a and b_end == a_end else _embedding_rows(photo_ids[b:b_end])
+            hit = xa @ xb.T >= threshold
+            hit &= (ts[b:b_end][None, :] - ts[a:a_end][:, None]) <= window
+            hit &= np.arange(a, a_end)[:, None] < np.arange(b, b_end)[None, :]
+            i, j = np.nonzero(hit)
+            if i.size:
+                yield i + a, j + b
+
+
+def _embedding_groups(rows: list[dict], similarity: float, burst_seconds: int, stop_event=None) -> list[Tuple[str, list[int]]]:
+    """("similar" | "burst", photo ids) groups over rows (``id``, ``captured_at``) that have a CLIP vector."""
+    with _EMB_INDEX_LOCK:
+        _embedding_index_ensure_locked()
+        indexed = set(_EMB_INDEX_POS)
+    rows = [r for r in rows if int(r["id"]) in indexed]
+    ids = np.array(sorted(int(r["id"]) for r in rows), dtype=np.int64)
+    out = [("similar", ids[c].tolist()) for c in _union_components(len(ids), _embedding_similar_pairs(ids, similarity, stop_event))]
+    if burst_seconds > 0:
+        timed = sorted((t, int(r["id"])) for r in rows for t in [_captured_ts(r.get("captured_at"))] if t is not None)
+        ts = np.array([t for t, _ in timed], dtype=np.float64)
+        bids = np.array([pid for _, pid in timed], dtype=np.int64)
+        pairs = _burst_pairs(bids, ts, DUPES_BURST_SIMILARITY, float(burst_seconds), stop_event)
+        out.extend(("burst", sorted(bids[c].tolist())) for c in _union_components(len(bids), pairs))
+    return out
+
+
+# --- Persisted duplicate groups ---
+# /api/duplicates serves groups from duplicate_groups / duplicate_group_members.
+# A full rebuild (background job) computes them at the configured pHash distance.
+# With the embedding mode enabled it also stores "similar" (CLIP cosine) and "burst"
+# (cosine plus captured_at proximity) groups.
+# After that, SQL triggers queue photos in duplicate_dirty: photos whose phash64,
+# checksum or embedding changed, and the remaining members of a group that lost a photo.
+# _refresh_duplicate_groups then regroups only the components those photos touch.
+DUPES_REFRESH_BATCH = 200
+DUPES_INCREMENTAL_MAX_HASHES = 5000
+DUPES_PAGE_MAX_LIMIT = 1000
+_DUPES_REASONS = ("checksum", "phash_equal", "phash_near")
+_DUPES_EMBED_REASONS = ("similar", "burst")
+dupes_thread = None
+_dupes_stop_event = threading.Event()
+dupes_counts: Dict[str, int] = {"photos": 0, "groups": 0, "refreshed": 0}
+last_dupes_result: Optional[Dict[str, Any]] = None
+
+_DUPES_TRIGGERS_SQL = """
+    CREATE TRIGGER trg_photos_dupes_ins AFTER INSERT ON photos
+    WHEN new.phash64 IS NOT NULL OR new.checksum_sha256 IS NOT NULL OR (
+        new.embedding IS NOT NULL AND EXISTS (SELECT 1 FROM settings WHERE key = 'duplicates_embed' AND value = '1')
+    ) BEGIN
+        INSERT INTO duplicate_dirty(photo_id) VALUES (new.id);
+    END;
+    CREATE TRIGGER trg_photos_dupes_upd AFTER UPDATE OF phash64, checksum_sha256 ON photos
+    WHEN new.phash64 IS NOT old.phash64 OR new.checksum_sha256 IS NOT old.checksum_sha256 BEGIN
+        INSERT INTO duplicate_dirty(photo_id) VALUES (new.id);
+    END;
+    CREATE TRIGGER trg_photos_dupes_emb AFTER UPDATE OF embedding, captured_at ON photos
+    WHEN (new.embedding IS NOT old.embedding OR new.captured_at IS NOT old.captured_at)
+        AND EXISTS (SELECT 1 FROM settings WHERE key = 'duplicates_embed' AND value = '1') BEGIN
+        INSERT INTO duplicate_dirty(photo_id) VALUES (new.id);
+    END;
+    CREATE TRIGGER trg_photos_dupes_del AFTER DELETE ON photos BEGIN
+        INSERT INTO duplicate_dirty(photo_id)
+        SELECT DISTINCT m.photo_id FROM duplicate_group_members m
+        WHERE m.group_id IN (SELECT group_id FROM duplicate_group_members WHERE photo_id = old.id)
+          AND m.photo_id != old.id;
+        DELETE FROM duplicate_group_members WHERE photo_id = old.id;
+    END;
+"""
+
+
+def _init_duplicate_groups(conn: sqlite3.Connection) -> None:
+    conn.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS duplicate_groups (
+            id INTEGER PRIMARY KEY,
+            reason TEXT NOT NULL,
+            group_key TEXT,
+            member_count INTEGER NOT NULL,
+            updated_at TEXT
+        );
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_duplicate_groups_key ON duplicate_groups(reason, group_key)
+            WHERE group_key IS NOT NULL;
+        CREATE INDEX IF NOT EXISTS idx_duplicate_groups_reason ON duplicate_groups(reason, member_count, id);
+        CREATE TABLE IF NOT EXISTS duplicate_group_members (
+            group_id INTEGER NOT NULL,
+            photo_id INTEGER NOT NULL,
+            PRIMARY KEY (group_id, photo_id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_duplicate_members_photo ON duplicate_group_members(photo_id);
+        -- seq orders the queue: a refresh only deletes the entries it has read
+        CREATE TABLE IF NOT EXISTS duplicate_dirty (seq INTEGER PRIMARY KEY, photo_id INTEGER NOT NULL);
+        CREATE INDEX IF NOT EXISTS idx_photos_checksum ON photos(checksum_sha256) WHERE checksum_sha256 IS NOT NULL;
+        """
+    )
+    _sync_triggers(conn, "trg\\_%\\_dupes\\_%", _DUPES_TRIGGERS_SQL)
+
+
+def _duplicates_distance() -> int:
+    try:
+        return max(0, min(int(_get_setting("duplicates_distance", "5") or 5), _PHASH_MAX_RADIUS))
+    except ValueError:
+        return 5
+
+
+def _duplicates_embed_params() -> Tuple[bool, float, int]:
+    """(enabled, similarity, burst_seconds) of the stored embedding groups."""
+    try:
+        sim = float(_get_setting("duplicates_similarity", str(DUPES_SIMILARITY)) or DUPES_SIMILARITY)
+        burst = int(_get_setting("duplicates_burst_seconds", str(DUPES_BURST_SECONDS)) or 0)
+    except ValueError:
+        sim, burst = DUPES_SIMILARITY, DUPES_BURST_SECONDS
+    return _get_setting_bool("duplicates_embed", False), sim, burst
+
+
+def _dupes_delete_groups(conn: sqlite3.Connection, group_ids: Iterable[int]) -> None:
+    gids = sorted(set(int(g) for g in group_ids))
+    for i in range(0, len(gids), 500):
+        part = gids[i:i + 500]
+        ph = ",".join("?" * len(part))
+        conn.execute(f"DELETE FROM duplicate_group_members WHERE group_id IN ({ph})", part)
+        conn.execute(f"DELETE FROM duplicate_groups WHERE id IN ({ph})", part)
+
+
+def _dupes_replace_group(conn: sqlite3.Connection, reason: str, key: Optional[str], photo_ids: Iterable[int], now: str) -> None:
+    """Store one group (dropping the previous group with the same reason/key); groups under 2 photos are not stored."""
+    if key is not None:
+        old = conn.execute("SELECT id FROM duplicate_groups WHERE reason=? AND group_key=?", (reason, key)).fetchall()
+        _dupes_delete_groups(conn, [r["id"] for r in old])
+    ids = sorted(set(int(p) for p in photo_ids))
+    if len(ids) < 2:
+        return
+    cur = conn.execute(
+        "INSERT INTO duplicate_groups(reason, group_key, member_count, updated_at) VALUES (?,?,?,?)",
+        (reason, key, len(ids), now),
+    )
+    conn.executemany(
+        "INSERT INTO duplicate_group_members(group_id, photo_id) VALUES (?,?)",
+        [(cur.lastrowid, pid) for pid in ids],
+    )
+
+
+def _dupes_hash_missing(stop_event=None) -> int:
+    """Give rows that only have the legacy aHash a phash64 from their thumbnail."""
+    with db_conn() as conn:
+        rows = [dict(r) for r in conn.execute(
+            "SELECT id, thumb_name FROM photos WHERE phash64 IS NULL AND phash IS NOT NULL AND thumb_name IS NOT NULL"
+        ).fetchall()]
+    hashed = 0
+    for i in range(0, len(rows), 200):
+        if stop_event and stop_event.is_set():
+            break
+        hashed += _hash_thumbnail_rows(rows[i:i + 200])[0]
+    return hashed
+
+
+def duplicates_rebuild(
+    distance: Optional[int] = None,
+    stop_event=None,
+    embeddings: Optional[bool] = None,
+    similarity: Optional[float] = None,
+    burst_seconds: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Recompute every duplicate group from scratch and replace the stored ones.
+
+    Parameters left as None keep their stored values; ``embeddings=True`` enables
+    the similar/burst groups for this and all later builds.
+    """
+    init_db()
+    distance = _duplicates_distance() if distance is None else max(0, min(int(distance), _PHASH_MAX_RADIUS))
+    emb_on, emb_sim, emb_burst = _duplicates_embed_params()
+    emb_on = emb_on if embeddings is None else bool(embeddings)
+    emb_sim = emb_sim if similarity is None else min(1.0, max(0.5, float(similarity)))
+    emb_burst = emb_burst if burst_seconds is None else max(0, int(burst_seconds))
+    log_event("dupes_start", distance=distance, embeddings=emb_on)
+    dupes_counts.update({"photos": 0, "groups": 0, "refreshed": 0})
+    _dupes_hash_missing(stop_event)
+    with db_conn() as conn:
+        max_seq = conn.execute("SELECT COALESCE(MAX(seq), 0) AS m FROM duplicate_dirty").fetchone()["m"]
+        rows = [dict(r) for r in conn.execute(
+            "SELECT id, rel_path, file_size, modified_fs, quick_hash, checksum_sha256, phash64, captured_at FROM photos"
+            " WHERE phash64 IS NOT NULL OR file_size IS NOT NULL OR embedding IS NOT NULL"
+        ).fetchall()]
+    dupes_counts["photos"] = len(rows)
+    _fill_duplicate_checksums(rows)
+    if stop_event and stop_event.is_set():
+        return {"ok": True, **dupes_counts, "distance": distance, "stopped": True}
+
+    groups: list[Tuple[str, Optional[str], list[int]]] = []
+    by_checksum: Dict[str, list[int]] = {}
+    by_phash: Dict[int, list[int]] = {}
+    hashed: list[dict] = []
+    for r in rows:
+        if r.get("checksum_sha256"):
+            by_checksum.setdefault(r["checksum_sha256"], []).append(int(r["id"]))
+        if r.get("phash64") is not None:
+            by_phash.setdefault(int(r["phash64"]), []).append(int(r["id"]))
+            hashed.append({"id": int(r["id"]), "_h": int(r["phash64"]) & _HASH64_MASK})
+    groups.extend(("checksum", k, v) for k, v in by_checksum.items() if len(v) >= 2)
+    groups.extend(("phash_equal", str(k), v) for k, v in by_phash.items() if len(v) >= 2)
+    groups.extend(("phash_near", None, [r["id"] for r in g]) for g in _phash_near_groups(hashed, distance))
+    if emb_on:
+        groups.extend((reason, None, ids) for reason, ids in _embedding_groups(rows, emb_sim, emb_burst, stop_event))
+    if stop_event and stop_event.is_set():
+        return {"ok": True, **dupes_counts, "distance": distance, "stopped": True}
+
+    now = now_iso()
+    with db_conn() as conn:
+        conn.execute("DELETE FROM duplicate_group_members")
+        conn.execute("DELETE FROM duplicate_groups")
+        for reason, key, ids in groups:
+            _dupes_replace_group(conn, reason, key, ids, now)
+        # Changes queued while this ran stay queued for the incremental refresh
+        conn.execute("DELETE FROM duplicate_dirty WHERE seq <= ?", (max_seq,))
+        conn.commit()
+    _set_setting("duplicates_distance", str(distance))
+    _set_setting("duplicates_embed", "1" if emb_on else "0")
+    _set_setting("duplicates_similarity", str(emb_sim))
+    _set_setting("duplicates_burst_seconds", str(emb_burst))
+    _set_setting("duplicates_built_at", now)
+    dupes_counts["groups"] = len(groups)
+    res = {"ok": True, **dupes_counts, "distance": distance, "stopped": False}
+    log_event("dupes_done", groups=len(groups), photos=len(rows), distance=distance)
+    return res
+
+
+class _DupesComponentTooLarge(Exception):
+    pass
+
+
+def _dupes_drop_overlapping(conn: sqlite3.Connection, reason: str, photo_ids: Iterable[int]) -> None:
+    ids = sorted(set(photo_ids))
+    for i in range(0, len(ids), 500):
+        part = ids[i:i + 500]
+        stale = conn.execute(
+            "SELECT DISTINCT g.id FROM duplicate_groups g JOIN duplicate_group_members m ON m.group_id = g.id"
+            f" WHERE g.reason = ? AND m.photo_id IN ({','.join('?' * len(part))})",
+            [reason, *part],
+        ).fetchall()
+        _dupes_delete_groups(conn, [r["id"] for r in stale])
+
+
+def _existing_photo_ids(conn: sqlite3.Connection, photo_ids: Iterable[int]) -> set[int]:
+    ids = sorted(set(int(p) for p in photo_ids))
+    out: set[int] = set()
+    for i in range(0, len(ids), 500):
+        part = ids[i:i + 500]
+        out.update(int(r["id"]) for r in conn.execute(
+            f"SELECT id FROM photos WHERE id IN ({','.join('?' * len(part))})", part
+        ).fetchall())
+    return out
+
+
+def _dupes_store_components(conn: sqlite3.Connection, reason: str, nodes: set[int], edges: list[Tuple[int, int]], now: str) -> None:
+    """Replace the ``reason`` groups overlapping nodes with the components of edges."""
+    _dupes_drop_overlapping(conn, reason, nodes)
+    order = sorted(nodes)
+    pos = {pid: i for i, pid in enumerate(order)}
+    a = np.array([pos[x] for x, _ in edges], dtype=np.int64)
+    b = np.array([pos[y] for _, y in edges], dtype=np.int64)
+    for comp in _union_components(len(order), [(a, b)]):
+        _dupes_replace_group(conn, reason, None, [order[i] for i in comp], now)
+
+
+def _embedding_neighbors(q: np.ndarray, similarity: float) -> list[np.ndarray]:
+    """Index ids with cosine >= similarity for each row of q.
+
+    With a trained IVF index only the probed lists are scored (under the index lock, like
+    _embedding_index_topk). Otherwise the library is copied out DUPES_EMBED_TILE rows at a
+    time and scored outside the lock, so searches are not blocked by a component walk.
+    """
+    empty = np.empty(0, dtype=np.int64)
+    hits: list[list[np.ndarray]] = [[] for _ in range(q.shape[0])]
+    with _EMB_INDEX_LOCK:
+        _embedding_index_ensure_locked()
+        if _EMB_INDEX_MAT is None or _EMB_INDEX_IDS is None or not _EMB_INDEX_N or int(_EMB_INDEX_MAT.shape[1]) != int(q.shape[1]):
+            return [empty] * q.shape[0]
+        probed = [_ann_candidate_rows_locked(v, AI_ANN_NPROBE) for v in q] if AI_ANN_ENABLED else [None]
+        if all(rows is not None for rows in probed):
+            for k, rows in enumerate(probed):
+                hits[k].append(_EMB_INDEX_IDS[rows[(_EMB_INDEX_MAT[rows] @ q[k]) >= similarity]])
+            return [np.concatenate(h) for h in hits]
+    a = 0
+    while True:
+        with _EMB_INDEX_LOCK:
+            if _EMB_INDEX_MAT is None or _EMB_INDEX_IDS is None or a >= _EMB_INDEX_N:
+                break
+            tile = _EMB_INDEX_MAT[a:min(a + DUPES_EMBED_TILE, _EMB_INDEX_N)].copy()
+            tile_ids = _EMB_INDEX_IDS[a:a + tile.shape[0]].copy()
+        if tile.shape[1] != q.shape[1]:
+            break
+        scores = tile @ q.T
+        for k in range(q.shape[0]):
+            hits[k].append(tile_ids[scores[:, k] >= similarity])
+        a += tile.shape[0]
+    return [np.concatenate(h) if h else empty for h in hits]
+
+
+def _regroup_embedding(conn: sqlite3.Connection, photo_ids: set[int], similarity: float, burst_seconds: int, now: str) -> None:
+    """Incremental counterpart of _embedding_groups: walk the similar/burst components of photo_ids."""
+    with _EMB_INDEX_LOCK:
+        _embedding_index_ensure_locked()
+        indexed = set(_EMB_INDEX_POS)
+    start = sorted(p for p in _existing_photo_ids(conn, photo_ids) if p in indexed)
+
+    seen = set(start)
+    frontier = list(start)
+    edges: list[Tuple[int, int]] = []
+    while frontier:
+        chunk, frontier = frontier[:256], frontier[256:]
+        hits = _embedding_neighbors(_embedding_rows(chunk), similarity)
+        found = {k: [int(x) for x in hits[k] if int(x) != pid] for k, pid in enumerate(chunk)}
+        live = _existing_photo_ids(conn, [x for xs in found.values() for x in xs])
+        for k, pid in enumerate(chunk):
+            for nb in found[k]:
+                if nb not in live:
+                    continue
+                edges.append((pid, nb))
+                if nb not in seen:
+                    seen.add(nb)
+                    frontier.append(nb)
+        if len(seen) > DUPES_INCREMENTAL_MAX_HASHES:
+            raise _DupesComponentTooLarge()
+    _dupes_store_components(conn, "similar", seen, edges, now)
+
+    if burst_seconds <= 0:
+        return
+    window = float(burst_seconds)
+    seen = set(start)
+    frontier = list(start)
+    edges = []
+    while frontier:
+        pid = frontier.pop()
+        row = conn.execute("SELECT captured_at FROM photos WHERE id=?", (pid,)).fetchone()
+        t = _captured_ts(row["captured_at"]) if row else None
+        if t is None:
+            continue
+        # Text range on the captured_at index first, then the exact difference
+        lo = (datetime(1970, 1, 1) + timedelta(seconds=t - window - 1)).isoformat(timespec="seconds")
+        hi = (datetime(1970, 1, 1) + timedelta(seconds=t + window + 1)).isoformat(timespec="seconds")
+        cands = [
+            int(r["id"]) for r in conn.execute(
+                "SELECT id, captured_at FROM photos WHERE captured_at BETWEEN ? AND ? AND id != ?", (lo, hi, pid)
+            ).fetchall()
+            if int(r["id"]) in indexed and (ct := _captured_ts(r["captured_at"])) is not None and abs(ct - t) <= window
+        ]
+        if not cands:
+            continue
+        sims = _embedding_rows(cands) @ _embedding_rows([pid])[0]
+        for nb, sim in zip(cands, sims.tolist()):
+            if sim < DUPES_BURST_SIMILARITY:
+                continue
+            edges.append((pid, nb))
+            if nb not in seen:
+                seen.add(nb)
+                frontier.append(nb)
+        if len(seen) > DUPES_INCREMENTAL_MAX_HASHES:
+            raise _DupesComponentTooLarge()
+    _dupes_store_components(conn, "burst", seen, edges, now)
+
+
+def _regroup_photos(
+    conn: sqlite3.Connection,
+    photo_ids: set[int],
+    distance: int,
+    now: str,
+    embed: Optional[Tuple[float, int]] = None,
+) -> None:
+    """Recompute the stored groups touching photo_ids (caller holds the write transaction)."""
+    ph = ",".join("?" * len(photo_ids))
+    old_groups = [r["group_id"] for r in conn.execute(
+        f"SELECT DISTINCT group_id FROM duplicate_group_members WHERE photo_id IN ({ph})", list(photo_ids)
+    ).fetchall()]
+    affected = set(photo_ids)
+    for i in range(0, len(old_groups), 500):
+        part = old_groups[i:i + 500]
+        affected.update(int(r["photo_id"]) for r in conn.execute(
+            f"SELECT photo_id FROM duplicate_group_members WHERE group_id IN ({','.join('?' * len(part))})", part
+        ).fetchall())
+    _dupes_delete_groups(conn, old_groups)
+    aff = sorted(affected)
+    rows = []
+    for i in range(0, len(aff), 500):
+        part = aff[i:i + 500]
+        rows.extend(conn.execute(
+            f"SELECT id, checksum_sha256, phash64 FROM photos WHERE id IN ({','.join('?' * len(part))})", part
+        ).fetchall())
+
+    for cs in {r["checksum_sha256"] for r in rows if r["checksum_sha256"]}:
+        ids = [r["id"] for r in conn.execute("SELECT id FROM photos WHERE checksum_sha256=?", (cs,)).fetchall()]
+        _dupes_replace_group(conn, "checksum", cs, ids, now)
+
+    # Walk the whole near-duplicate component of every affected hash
+    by_hash: Dict[int, set[int]] = {}
+    frontier = list({int(r["phash64"]) for r in rows if r["phash64"] is not None})
+    queued = set(frontier)
+    while frontier:
+        h = frontier.pop()
+        for pid, h2, _ in _phash_radius_rows(conn, h, distance):
+            by_hash.setdefault(h2, set()).add(pid)
+            if h2 not in queued:
+                queued.add(h2)
+                frontier.append(h2)
+        if len(queued) > DUPES_INCREMENTAL_MAX_HASHES:
+            raise _DupesComponentTooLarge()
+    for h, ids in by_hash.items():
+        _dupes_replace_group(conn, "phash_equal", str(h), ids, now)
+    _dupes_drop_overlapping(conn, "phash_near", (pid for ids in by_hash.values() for pid in ids))
+    hashed = [{"id": pid, "_h": h & _HASH64_MASK} for h, ids in by_hash.items() for pid in ids]
+    for g in _phash_near_groups(hashed, distance):
+        _dupes_replace_group(conn, "phash_near", None, [r["id"] for r in g], now)
+    if embed is not None:
+        _regroup_embedding(conn, affected, embed[0], embed[1], now)
+
+
+def _refresh_duplicate_groups(stop_event=None) -> int:
+    """Apply queued photo changes to the stored groups. Returns the number of photos regrouped.
+
+    Falls back to a full rebuild when a change reaches an oversized component.
+    """
+    if not _get_setting("duplicates_built_at"):
+        return 0
+    distance = _duplicates_distance()
+    emb_on, emb_sim, emb_burst = _duplicates_embed_params()
+    embed = (emb_sim, emb_burst) if emb_on else None
+    done = 0
+    while not (stop_event and stop_event.is_set()):
+        with db_conn() as conn:
+            batch = conn.execute(
+                "SELECT seq, photo_id FROM duplicate_dirty ORDER BY seq LIMIT ?", (DUPES_REFRESH_BATCH,)
+            ).fetchall()
+            if not batch:
+                break
+            ids = {int(r["photo_id"]) for r in batch}
+            ph = ",".join("?" * len(ids))
+            # Full checksums for new exact-duplicate candidates (same file size); these
+            # updates queue the rows again, which the next round handles cheaply
+            cands = [dict(r) for r in conn.execute(
+                "SELECT id, rel_path, file_size, modified_fs, quick_hash, checksum_sha256 FROM photos"
+                f" WHERE file_size IN (SELECT file_size FROM photos WHERE id IN ({ph}))",
+                list(ids),
+            ).fetchall()]
+        _fill_duplicate_checksums(cands)
+        with db_conn() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Re-read under the write lock; another worker may have handled the batch
+                batch = conn.execute(
+                    "SELECT seq, photo_id FROM duplicate_dirty ORDER BY seq LIMIT ?", (DUPES_REFRESH_BATCH,)
+                ).fetchall()
+                if batch:
+                    _regroup_photos(conn, {int(r["photo_id"]) for r in batch}, distance, now_iso(), embed)
+                    conn.execute("DELETE FROM duplicate_dirty WHERE seq <= ?", (batch[-1]["seq"],))
+                conn.commit()
+            except _DupesComponentTooLarge:
+                conn.rollback()
+                log_event("dupes_incremental_overflow", photos=len(batch))
+                duplicates_rebuild(distance, stop_event=stop_event)
+                return done
+            except Exception:
+                conn.rollback()
+                raise
+        done += len(batch)
+        dupes_counts["refreshed"] = dupes_counts.get("refreshed", 0) + len(batch)
+    return done
 
-    with closing(get_conn()) as conn:
-        rows = conn.execute(sql, params).fetchall()
-        return [row_to_public(r) for r in rows]
 
+def _start_duplicates_job(full: bool = True, **rebuild_args: Any) -> bool:
+    global dupes_thread, last_dupes_result
+    if dupes_thread and dupes_thread.is_alive():
+        return False
+    _dupes_stop_event.clear()
+    last_dupes_result = None
 
-def _hamdist_hex(a: str, b: str) -> int:
-    try:
-        va = int(a, 16)
-        vb = int(b, 16)
-        return (va ^ vb).bit_count()
-    except Exception:
-        return 64  # max for 64-bit pHash
+    def run_dupes():
+        global last_dupes_result
+        try:
+            if full:
+                last_dupes_result = duplicates_rebuild(stop_event=_dupes_stop_event, **rebuild_args)
+            else:
+                n = _refresh_duplicate_groups(stop_event=_dupes_stop_event)
+                last_dupes_result = {"ok": True, "refreshed": n, "stopped": _dupes_stop_event.is_set()}
+        except Exception as e:
+            log_event("error", rel_path="duplicates", error=str(e))
+            last_dupes_result = {"ok": False, "error": str(e)}
+
+    dupes_thread = threading.Thread(target=run_dupes, name="duplicates", daemon=True)
+    dupes_thread.start()
+    return True
 
 
-@app.route("/api/duplicates")
-def api_duplicates():
+def _dupes_state(conn: sqlite3.Connection) -> Dict[str, Any]:
+    pending = conn.execute("SELECT COUNT(DISTINCT photo_id) AS c FROM duplicate_dirty").fetchone()["c"]
+    emb_on, emb_sim, emb_burst = _duplicates_embed_params()
+    return {
+        "running": bool(dupes_thread and dupes_thread.is_alive()),
+        "distance": _duplicates_distance(),
+        "embeddings": emb_on,
+        "similarity": emb_sim,
+        "burst_seconds": emb_burst,
+        "built_at": _get_setting("duplicates_built_at"),
+        "pending": int(pending or 0),
+    }
+
+
+@app.route("/api/duplicates/start", methods=["POST"])
+def api_duplicates_start():
     fb = _forbid_user_role_for_maintenance()
     if fb:
         return jsonify(fb[0]), fb[1]
+    data = request.get_json(silent=True) or {}
     try:
-        dist_thr = int(request.args.get("distance", "5"))
-    except ValueError:
-        dist_thr = 5
-    min_group = max(2, int(request.args.get("min", "2")))
+        rebuild_args = {
+            "distance": int(data["distance"]) if data.get("distance") is not None else None,
+            "similarity": float(data["similarity"]) if data.get("similarity") is not None else None,
+            "burst_seconds": int(data["burst_seconds"]) if data.get("burst_seconds") is not None else None,
+            "embeddings": True if data.get("mode") == "embedding" else None,
+        }
+    except (TypeError, ValueError):
+        return jsonify({"ok": False, "error": "Invalid parameters"}), 400
+    full = bool(data.get("full", True))
+    if not _start_duplicates_job(full=full, **(rebuild_args if full else {})):
+        return jsonify({"ok": False, "error": "Duplicate job already running"}), 409
+    return jsonify({"ok": True, "started": True, "full": full})
 
-    with closing(get_conn()) as conn:
-        rows = [dict(r) for r in conn.execute(
-            "SELECT id, filename, rel_path, file_size, phash, checksum_sha256, thumb_name, captured_at FROM photos WHERE phash IS NOT NULL"
-        ).fetchall()]
 
-    # Exact duplicates by checksum
-    by_checksum: dict[str, list[dict]] = {}
-    for r in rows:
-        c = r.get("checksum_sha256")
-        if c:
-            by_checksum.setdefault(c, []).append(r)
-    checksum_groups = [v for v in by_checksum.values() if len(v) >= min_group]
+@app.route("/api/duplicates/stop", methods=["POST"])
+def api_duplicates_stop():
+    fb = _forbid_user_role_for_maintenance()
+    if fb:
+        return jsonify(fb[0]), fb[1]
+    _dupes_stop_event.set()
+    return jsonify({"ok": True, "stopped": True})
 
-    # Exact duplicates by equal phash
-    by_phash: dict[str, list[dict]] = {}
-    for r in rows:
-        p = r.get("phash")
-        if p:
-            by_phash.setdefault(p, []).append(r)
-    phash_exact_groups = [v for v in by_phash.values() if len(v) >= min_group]
 
-    # Near duplicates by small Hamming distance of pHash
-    # Bucket by first 4 hex chars to avoid O(n^2)
-    buckets: dict[str, list[dict]] = {}
-    for r in rows:
-        p = r.get("phash")
-        if not p:
-            continue
-        key = p[:4]
-        buckets.setdefault(key, []).append(r)
-
-    visited: set[int] = set()
-    # exclude items already in exact groups
-    for g in checksum_groups + phash_exact_groups:
-        for it in g:
-            visited.add(int(it["id"]))
-
-    near_groups: list[list[dict]] = []
-    for arr in buckets.values():
-        n = len(arr)
-        if n < 2:
-            continue
-        # Build adjacency by threshold
-        comp_map: dict[int, set[int]] = {}
-        ids = [int(x["id"]) for x in arr]
-        for i in range(n):
-            for j in range(i + 1, n):
-                a, b = arr[i], arr[j]
-                if int(a["id"]) in visited and int(b["id"]) in visited:
-                    continue
-                d = _hamdist_hex(a["phash"], b["phash"])
-                if d <= dist_thr:
-                    comp_map.setdefault(int(a["id"]), set()).add(int(b["id"]))
-                    comp_map.setdefault(int(b["id"]), set()).add(int(a["id"]))
-        # Connected components
-        seen: set[int] = set()
-        for root in ids:
-            if root in seen or root not in comp_map:
-                continue
-            stack = [root]
-            comp_ids: set[int] = set()
-            while stack:
-                cur = stack.pop()
-                if cur in seen:
-                    continue
-                seen.add(cur)
-                comp_ids.add(cur)
-                for nb in comp_map.get(cur, set()):
-                    if nb not in seen:
-                        stack.append(nb)
-            if len(comp_ids) >= min_group:
-                group_items = [next(x for x in arr if int(x["id"]) == cid) for cid in comp_ids]
-                near_groups.append(group_items)
-
-    # Prepare payload (limit size in thumbs only)
-    def _pub(it: dict) -> dict:
-        out = {
+@app.route("/api/duplicates/status")
+def api_duplicates_status():
+    fb = _forbid_user_role_for_maintenance()
+    if fb:
+        return jsonify(fb[0]), fb[1]
+    with db_conn() as conn:
+        resp: Dict[str, Any] = {"ok": True, **dupes_counts, **_dupes_state(conn)}
+    if not resp["running"] and last_dupes_result is not None:
+        resp["result"] = last_dupes_result
+    return jsonify(resp)
+
+
+@app.route("/api/duplicates")
+def api_duplicates():
+    """Stored duplicate groups, paginated per reason (``offset``/``limit`` groups each).
+
+    ``mode=phash`` (default) returns checksum/pHash groups, ``mode=embedding`` the
+    CLIP similar/burst groups. Changed photos and a first build are always handled
+    by the background dupes job; ``running``/``pending`` tell the client to reload
+    once it finishes, and ``stale`` to start a rebuild for another
+    distance/similarity/burst window.
+    """
+    fb = _forbid_user_role_for_maintenance()
+    if fb:
+        return jsonify(fb[0]), fb[1]
+    try:
+        min_group = max(2, int(request.args.get("min", "2")))
+        limit = max(1, min(int(request.args.get("limit", "200")), DUPES_PAGE_MAX_LIMIT))
+        offset = max(0, int(request.args.get("offset", "0")))
+        want_distance = request.args.get("distance")
+        want_distance = max(0, min(int(want_distance), _PHASH_MAX_RADIUS)) if want_distance not in (None, "") else None
+        want_sim = request.args.get("similarity")
+        want_sim = min(1.0, max(0.5, float(want_sim))) if want_sim not in (None, "") else None
+        want_burst = request.args.get("burst_seconds")
+        want_burst = max(0, int(want_burst)) if want_burst not in (None, "") else None
+    except ValueError:
+        return jsonify({"ok": False, "error": "Invalid parameters"}), 400
+    mode = "embedding" if request.args.get("mode") == "embedding" else "phash"
+    mode_reasons = _DUPES_EMBED_REASONS if mode == "embedding" else _DUPES_REASONS
+    reason_arg = (request.args.get("reason") or "").strip()
+    reasons = [reason_arg] if reason_arg in mode_reasons else list(mode_reasons)
+
+    with db_conn() as conn:
+        state = _dupes_state(conn)
+    if not state["running"]:
+        if not state["built_at"]:
+            _start_duplicates_job(full=True, distance=want_distance, embeddings=(mode == "embedding") or None)
+        elif state["pending"]:
+            _start_duplicates_job(full=False)
+
+    def _pub(it: sqlite3.Row) -> dict:
+        return {
             "id": it["id"],
             "filename": it["filename"],
             "rel_path": it["rel_path"],
             "file_size": it["file_size"],
-            "phash": it["phash"],
+            "phash": f"{int(it['phash64']) & _HASH64_MASK:016x}" if it["phash64"] is not None else it["phash"],
             "checksum": it["checksum_sha256"],
-            "captured_at": it.get("captured_at"),
+            "captured_at": it["captured_at"],
+            "thumb_url": f"/api/thumbs/{it['thumb_name']}" if it["thumb_name"] else None,
         }
-        if it.get("thumb_name"):
-            out["thumb_url"] = f"/api/thumbs/{it['thumb_name']}"
-        else:
-            out["thumb_url"] = None
-        return out
 
-    resp = {
+    groups = []
+    counts: Dict[str, int] = {}
+    with db_conn() as conn:
+        state = _dupes_state(conn)
+        for reason in reasons:
+            total = conn.execute(
+                "SELECT COUNT(*) AS c FROM duplicate_groups WHERE reason=? AND member_count>=?", (reason, min_group)
+            ).fetchone()["c"]
+            gids = [r["id"] for r in conn.execute(
+                "SELECT id FROM duplicate_groups WHERE reason=? AND member_count>=? ORDER BY id LIMIT ? OFFSET ?",
+                (reason, min_group, limit, offset),
+            ).fetchall()]
+            members: Dict[int, list[dict]] = {g: [] for g in gids}
+            if gids:
+                for r in conn.execute(
+                    "SELECT m.group_id, p.id, p.filename, p.rel_path, p.file_size, p.phash, p.phash64,"
+                    " p.checksum_sha256, p.captured_at, p.thumb_name"
+                    " FROM duplicate_group_members m JOIN photos p ON p.id = m.photo_id"
+                    f" WHERE m.group_id IN ({','.join('?' * len(gids))}) ORDER BY m.group_id, p.id",
+                    gids,
+                ):
+                    members[int(r["group_id"])].append(_pub(r))
+            counts[reason] = int(total or 0)
+            groups.append({
+                "reason": reason,
+                "items": [members[g] for g in gids if len(members[g]) >= 2],
+                "total": counts[reason],
+                "has_more": offset + len(gids) < counts[reason],
+            })
+
+    if mode == "embedding":
+        stale = not state["built_at"] or not state["embeddings"] or (
+            want_sim is not None and abs(want_sim - state["similarity"]) > 1e-6
+        ) or (want_burst is not None and want_burst != state["burst_seconds"])
+    else:
+        stale = not state["built_at"] or (want_distance is not None and want_distance != state["distance"])
+    return jsonify({
         "ok": True,
-        "distance": dist_thr,
-        "groups": [
-            {"reason": "checksum", "items": [[_pub(it) for it in g] for g in checksum_groups]},
-            {"reason": "phash_equal", "items": [[_pub(it) for it in g] for g in phash_exact_groups]},
-            {"reason": "phash_near", "items": [[_pub(it) for it in g] for g in near_groups]},
-        ],
-        "counts": {
-            "checksum": len(checksum_groups),
-            "phash_equal": len(phash_exact_groups),
-            "phash_near": len(near_groups),
-        },
-    }
-    return jsonify(resp)
+        "mode": mode,
+        "groups": groups,
+        "counts": counts,
+        "offset": offset,
+        "limit": limit,
+        "stale": stale,
+        **state,
+    })
 
 
 @app.route("/api/duplicates/merge", methods=["POST"])
@@ -5888,7 +9084,7 @@ def api_duplicates_merge():
     if not keep_id or not drop_id or keep_id == drop_id:
         return jsonify({"ok": False, "error": "Invalid keep/drop ids"}), 400
     try:
-        with closing(get_conn()) as conn:
+        with db_conn() as conn:
             keep = conn.execute("SELECT * FROM photos WHERE id=?", (keep_id,)).fetchone()
             drop = conn.execute("SELECT * FROM photos WHERE id=?", (drop_id,)).fetchone()
             if not keep or not drop:
@@ -5918,8 +9114,10 @@ def api_duplicates_merge():
                     upd["ai_desc_tags"] = ai_desc_drop
                 if (keep["ai_desc_caption"] in (None, "")) and _first(drop["ai_desc_caption"]):
                     upd["ai_desc_caption"] = drop["ai_desc_caption"]
-                if (keep["embedding_json"] in (None, "")) and _first(drop["embedding_json"]):
-                    upd["embedding_json"] = drop["embedding_json"]
+                if keep["embedding"] is None and drop["embedding"] is not None:
+                    upd["embedding"] = drop["embedding"]
+                    upd["embedding_dim"] = drop["embedding_dim"]
+                    upd["embedding_model"] = drop["embedding_model"]
                 if (keep["metadata_json"] in (None, "")) and _first(drop["metadata_json"]):
                     upd["metadata_json"] = drop["metadata_json"]
                 if (keep["exif_json"] in (None, "")) and _first(drop["exif_json"]):
@@ -5944,6 +9142,9 @@ def api_duplicates_merge():
             drop_rel = str(drop["rel_path"] or "")
             conn.execute("DELETE FROM photos WHERE id=?", (drop_id,))
             conn.commit()
+        _embedding_index_remove([drop_id])
+        if copy_meta and "embedding" in upd:
+            _embedding_index_upsert(keep_id, _embedding_from_blob(upd["embedding"]))
         # Optionally remove file from disk
         if delete_file and drop_rel:
             try:
@@ -5967,7 +9168,7 @@ def _metadata_score_row(row: sqlite3.Row) -> int:
         "iso", "focal_length", "f_number", "exposure_time",
         "gps_lat", "gps_lon", "gps_name",
         "ai_tags", "ai_desc_tags", "ai_desc_caption",
-        "embedding_json", "metadata_json", "exif_json",
+        "embedding", "metadata_json", "exif_json",
     ]
     sc = 0
     for f in fields:
@@ -5999,7 +9200,7 @@ def api_duplicates_merge_auto():
     if not a_id or not b_id or a_id == b_id:
         return jsonify({"ok": False, "error": "Invalid ids"}), 400
     try:
-        with closing(get_conn()) as conn:
+        with db_conn() as conn:
             a = conn.execute("SELECT * FROM photos WHERE id=?", (a_id,)).fetchone()
             b = conn.execute("SELECT * FROM photos WHERE id=?", (b_id,)).fetchone()
             if not a or not b:
@@ -6038,7 +9239,7 @@ def api_duplicates_merge_auto():
 
 def api_duplicates_merge_impl(keep_id: int, drop_id: int):
     try:
-        with closing(get_conn()) as conn:
+        with db_conn() as conn:
             keep = conn.execute("SELECT * FROM photos WHERE id=?", (keep_id,)).fetchone()
             drop = conn.execute("SELECT * FROM photos WHERE id=?", (drop_id,)).fetchone()
             if not keep or not drop:
@@ -6061,8 +9262,10 @@ def api_duplicates_merge_impl(keep_id: int, drop_id: int):
                 upd["ai_desc_tags"] = drop["ai_desc_tags"]
             if _first(drop["ai_desc_caption"]) and not _first(keep["ai_desc_caption"]):
                 upd["ai_desc_caption"] = drop["ai_desc_caption"]
-            if _first(drop["embedding_json"]) and not _first(keep["embedding_json"]):
-                upd["embedding_json"] = drop["embedding_json"]
+            if drop["embedding"] is not None and keep["embedding"] is None:
+                upd["embedding"] = drop["embedding"]
+                upd["embedding_dim"] = drop["embedding_dim"]
+                upd["embedding_model"] = drop["embedding_model"]
             if _first(drop["metadata_json"]) and not _first(keep["metadata_json"]):
                 upd["metadata_json"] = drop["metadata_json"]
             if _first(drop["exif_json"]) and not _first(keep["exif_json"]):
@@ -6086,6 +9289,9 @@ def api_duplicates_merge_impl(keep_id: int, drop_id: int):
             drop_rel = str(drop["rel_path"] or "")
             conn.execute("DELETE FROM photos WHERE id=?", (drop_id,))
             conn.commit()
+        _embedding_index_remove([drop_id])
+        if "embedding" in upd:
+            _embedding_index_upsert(keep_id, _embedding_from_blob(upd["embedding"]))
         # Remove file from disk if exists
         try:
             if drop_rel:
@@ -6102,7 +9308,7 @@ def api_duplicates_merge_impl(keep_id: int, drop_id: int):
 @app.route("/")
 def index():
     try:
-        with closing(get_conn()) as conn:
+        with db_conn() as conn:
             row = conn.execute(
                 "SELECT id, username, role, ui_language, search_language, theme_mode FROM users WHERE id=?",
                 (current_user.id,),
@@ -6261,7 +9467,7 @@ def api_create_share():
     token_hash = _share_token_digest(token)
     created_at = now_iso()
     primary_folder_path = folder_paths[0]
-    with closing(get_conn()) as conn:
+    with db_conn() as conn:
         cur = conn.execute(
             """
             INSERT INTO share_links(token_hash, token_plain, share_name, folder_path, can_upload, can_delete, require_visitor_name, link_use_duckdns, password_hash, expires_at, revoked, created_by_user_id, created_at)
@@ -6323,7 +9529,7 @@ def api_share_info(token: str):
             "name_required": _share_requires_visitor_name(share),
             "error": "Adgang kræves",
         }), 401
-    with closing(get_conn()) as conn:
+    with db_conn() as conn:
         folder_paths = _share_folder_paths(conn, share)
     folder_label = f"uploads/{folder_paths[0]}" if len(folder_paths) == 1 else f"{len(folder_paths)} mapper"
     share_name = str(share["share_name"] or "").strip() if "share_name" in share.keys() else ""
@@ -6362,17 +9568,18 @@ def api_share_photos(token: str):
             "error": "Adgang kræves",
         }), 401
 
-    with closing(get_conn()) as conn:
+    with db_conn() as conn:
         folder_paths = _share_folder_paths(conn, share)
     prefixes = _share_rel_prefixes(folder_paths)
     if not prefixes:
         return jsonify({"ok": False, "error": "Ugyldig share-mappe"}), 400
     where_sql, where_params = _share_scope_sql(prefixes)
+    fields = _parse_photo_fields(request.args.get("fields"))
 
-    with closing(get_conn()) as conn:
+    with db_conn() as conn:
         rows = conn.execute(
             f"""
-            SELECT *
+            SELECT {_photo_select_columns(conn, fields)}
             FROM photos
             WHERE ({where_sql})
             ORDER BY COALESCE(captured_at, modified_fs, created_fs) DESC, id DESC
@@ -6380,8 +9587,8 @@ def api_share_photos(token: str):
             tuple(where_params),
         ).fetchall()
 
-    items = [_row_to_share_public(r, token) for r in rows]
-    return jsonify({"ok": True, "items": items})
+    items = [_row_to_share_public(r, token, fields) for r in rows]
+    return jsonify({"ok": True, "items": _project_photo_fields(items, fields)})
 
 
 @app.route("/api/share/<token>/thumb/<int:photo_id>")
@@ -6389,7 +9596,7 @@ def api_share_thumb(token: str, photo_id: int):
     share = _load_share_from_token(token)
     if not share or not _share_is_authorized(share):
         return ("Forbidden", 403)
-    with closing(get_conn()) as conn:
+    with db_conn() as conn:
         row = _get_share_scoped_photo_row(conn, share, photo_id)
     if not row or not row["thumb_name"]:
         return ("Not found", 404)
@@ -6401,7 +9608,7 @@ def api_share_original(token: str, photo_id: int):
     share = _load_share_from_token(token)
     if not share or not _share_is_authorized(share):
         return ("Forbidden", 403)
-    with closing(get_conn()) as conn:
+    with db_conn() as conn:
         row = _get_share_scoped_photo_row(conn, share, photo_id)
     if not row:
         return ("Not found", 404)
@@ -6417,7 +9624,7 @@ def api_share_viewable(token: str, photo_id: int):
     share = _load_share_from_token(token)
     if not share or not _share_is_authorized(share):
         return ("Forbidden", 403)
-    with closing(get_conn()) as conn:
+    with db_conn() as conn:
         row = _get_share_scoped_photo_row(conn, share, photo_id)
     if not row:
         return ("Not found", 404)
@@ -6455,7 +9662,7 @@ def api_share_upload(token: str):
     if int(share["can_upload"] or 0) != 1:
         return jsonify({"ok": False, "error": "Upload ikke tilladt"}), 403
 
-    with closing(get_conn()) as conn:
+    with db_conn() as conn:
         folder_paths = _share_folder_paths(conn, share)
     folder_path = folder_paths[0] if folder_paths else ""
     if not folder_path:
@@ -6574,7 +9781,7 @@ def api_share_tus_create(token: str):
         return jsonify({"ok": False, "error": "Missing filename"}), 400, _tus_headers()
 
     # Determine target dir from share's primary folder
-    with closing(get_conn()) as conn:
+    with db_conn() as conn:
         folder_paths = _share_folder_paths(conn, share)
     folder_path = folder_paths[0] if folder_paths else ""
     try:
@@ -6785,7 +9992,7 @@ def api_share_delete(token: str):
     if not ids:
         return jsonify({"ok": False, "error": "Ingen billeder valgt"}), 400
 
-    with closing(get_conn()) as conn:
+    with db_conn() as conn:
         allowed_ids: list[int] = []
         for pid in ids:
             row = _get_share_scoped_photo_row(conn, share, pid)
@@ -6829,11 +10036,16 @@ def api_scan():
     if scan_thread and scan_thread.is_alive():
         return jsonify({"ok": False, "error": "Scan already running"}), 409
     scan_stop_event.clear()
+    full = (request.args.get("full") or "").strip().lower() in {"1", "true", "yes"}
     def run_scan():
-        scan_library(stop_event=scan_stop_event)
+        res = scan_library(stop_event=scan_stop_event, full=full)
+        if res.get("ok") and not res.get("stopped"):
+            _start_phash_backfill()
+            if CHECKSUM_BACKFILL_AUTO:
+                _start_checksum_backfill()
     scan_thread = threading.Thread(target=run_scan, daemon=True)
     scan_thread.start()
-    return jsonify({"ok": True, "started": True})
+    return jsonify({"ok": True, "started": True, "full": full})
 
 # Stop scan
 @app.route("/api/scan/stop", methods=["POST"])
@@ -6885,7 +10097,7 @@ def rethumb_all(stop_event=None) -> Dict[str, Any]:
     log_event("rethumb_start")
     total = 0
     errors = 0
-    with closing(get_conn()) as conn:
+    with db_conn() as conn:
         rows = conn.execute("SELECT rel_path FROM photos").fetchall()
     for row in rows:
         if stop_event and stop_event.is_set():
@@ -6897,11 +10109,7 @@ def rethumb_all(stop_event=None) -> Dict[str, Any]:
         try:
             stat = p.stat()
             with Image.open(p) as img:
-                try:
-                    img = ImageOps.exif_transpose(img)
-                except Exception:
-                    pass
-                make_thumb(img, rel_path, stat.st_mtime, stat.st_size, force=True)
+                make_thumb(_decode_reduced(img), rel_path, stat.st_mtime, stat.st_size, force=True)
             total += 1
             log_event("rethumb_ok", rel_path=rel_path)
         except Exception as e:
@@ -6946,7 +10154,7 @@ def rethumb_missing(stop_event=None) -> Dict[str, Any]:
     log_event("rethumb_missing_start")
     total = 0
     errors = 0
-    with closing(get_conn()) as conn:
+    with db_conn() as conn:
         rows = conn.execute(
             "SELECT rel_path, thumb_name FROM photos"
         ).fetchall()
@@ -6975,13 +10183,9 @@ def rethumb_missing(stop_event=None) -> Dict[str, Any]:
                 tn = _make_video_thumb(p, rel_path, stat.st_mtime, stat.st_size)
             else:
                 with Image.open(p) as img:
-                    try:
-                        img = ImageOps.exif_transpose(img)
-                    except Exception:
-                        pass
-                    tn = make_thumb(img, rel_path, stat.st_mtime, stat.st_size)
+                    tn = make_thumb(_decode_reduced(img), rel_path, stat.st_mtime, stat.st_size)
             if tn:
-                with closing(get_conn()) as conn:
+                with db_conn() as conn:
                     conn.execute("UPDATE photos SET thumb_name=?, last_scanned_at=? WHERE rel_path=?", (tn, now_iso(), rel_path))
                     conn.commit()
                 total += 1
@@ -7007,271 +10211,1173 @@ def api_rethumb_missing():
     scan_stop_event.clear()
     last_rethumb_result = None
 
-    def run_rethumb_missing():
-        global last_rethumb_result
-        last_rethumb_result = rethumb_missing(stop_event=scan_stop_event)
+    def run_rethumb_missing():
+        global last_rethumb_result
+        last_rethumb_result = rethumb_missing(stop_event=scan_stop_event)
+
+    rethumb_thread = threading.Thread(target=run_rethumb_missing, daemon=True)
+    rethumb_thread.start()
+    return jsonify({"ok": True, "started": True})
+
+
+# --- AI: in-memory embedding index ---
+# One contiguous float32 matrix of L2-normalized CLIP vectors (rows [0, n) are live)
+# plus a parallel photo-id array. Loaded lazily, updated in place on writes/deletes.
+# When the optional IVF index is enabled, _EMB_INDEX_LIST holds each row's coarse
+# cluster so queries only score the rows in the nprobe nearest clusters.
+# Triggers log every embedding insert/change/delete to embedding_changes; each
+# process replays the log past _EMB_INDEX_SEQ on its periodic re-check, so rows
+# written by other gunicorn workers (including re-embeds) are picked up.
+_EMB_INDEX_LOCK = threading.RLock()
+_EMB_INDEX_MAT: Optional[np.ndarray] = None
+_EMB_INDEX_IDS: Optional[np.ndarray] = None
+_EMB_INDEX_LIST: Optional[np.ndarray] = None
+_EMB_INDEX_POS: Dict[int, int] = {}
+_EMB_INDEX_N = 0
+_EMB_INDEX_CHECKED_AT = 0.0
+_EMB_INDEX_SEQ = 0
+_ANN_CENTROIDS: Optional[np.ndarray] = None
+# Replaying more changes than this at once is slower than a reload; older log rows are pruned
+EMBED_CHANGES_REPLAY_MAX = 5000
+EMBED_CHANGES_KEEP = 50000
+
+_EMBED_CHANGES_TRIGGERS_SQL = """
+    CREATE TRIGGER trg_photos_embidx_ins AFTER INSERT ON photos WHEN new.embedding IS NOT NULL BEGIN
+        INSERT INTO embedding_changes(photo_id) VALUES (new.id);
+    END;
+    CREATE TRIGGER trg_photos_embidx_upd AFTER UPDATE OF embedding ON photos
+    WHEN new.embedding IS NOT old.embedding BEGIN
+        INSERT INTO embedding_changes(photo_id) VALUES (new.id);
+    END;
+    CREATE TRIGGER trg_photos_embidx_del AFTER DELETE ON photos WHEN old.embedding IS NOT NULL BEGIN
+        INSERT INTO embedding_changes(photo_id) VALUES (old.id);
+    END;
+"""
+
+
+def _init_embedding_changes(conn: sqlite3.Connection) -> None:
+    # AUTOINCREMENT: seq never goes back after pruning, so a stored position stays valid
+    conn.execute("CREATE TABLE IF NOT EXISTS embedding_changes (seq INTEGER PRIMARY KEY AUTOINCREMENT, photo_id INTEGER NOT NULL)")
+    conn.commit()
+    _sync_triggers(conn, "trg\\_%\\_embidx\\_%", _EMBED_CHANGES_TRIGGERS_SQL)
+
+
+def _normalize_embedding(vec: Any) -> Optional[np.ndarray]:
+    """Return vec as a 1-D L2-normalized float32 array (None if empty/invalid)."""
+    if vec is None:
+        return None
+    try:
+        arr = np.asarray(vec, dtype=np.float32).reshape(-1)
+    except Exception:
+        return None
+    if arr.size == 0:
+        return None
+    n = float(np.linalg.norm(arr))
+    if not np.isfinite(n) or n <= 0.0:
+        return None
+    return arr / n
+
+
+def _embedding_changes_seq(conn: sqlite3.Connection) -> int:
+    row = conn.execute("SELECT MAX(seq) AS s FROM embedding_changes").fetchone()
+    return int(row["s"] or 0) if row else 0
+
+
+def _embedding_index_load_locked() -> None:
+    global _EMB_INDEX_MAT, _EMB_INDEX_IDS, _EMB_INDEX_LIST, _EMB_INDEX_POS, _EMB_INDEX_N, _EMB_INDEX_CHECKED_AT, _EMB_INDEX_SEQ
+    ids: list[int] = []
+    vecs: list[np.ndarray] = []
+    dim = 0
+    with db_conn() as conn:
+        # Read the log position first: changes racing with the load are replayed (idempotently)
+        seq = _embedding_changes_seq(conn)
+        cur = conn.execute("SELECT id, embedding FROM photos WHERE embedding IS NOT NULL")
+        for r in cur:
+            v = _normalize_embedding(_embedding_from_blob(r["embedding"]))
+            if v is None:
+                continue
+            if not dim:
+                dim = int(v.size)
+            if int(v.size) != dim:
+                continue
+            ids.append(int(r["id"]))
+            vecs.append(v)
+    n = len(ids)
+    cap = max(64, n + n // 4)
+    mat = np.zeros((cap, dim or 1), dtype=np.float32)
+    if n:
+        mat[:n] = np.stack(vecs)
+    id_arr = np.zeros(cap, dtype=np.int64)
+    id_arr[:n] = ids
+    _EMB_INDEX_MAT = mat
+    _EMB_INDEX_IDS = id_arr
+    _EMB_INDEX_LIST = np.full(cap, -1, dtype=np.int32)
+    _EMB_INDEX_POS = {pid: i for i, pid in enumerate(ids)}
+    _EMB_INDEX_N = n
+    _EMB_INDEX_CHECKED_AT = time.time()
+    _EMB_INDEX_SEQ = seq
+    log_event("embed_index_loaded", count=n, dim=dim)
+    if AI_ANN_ENABLED:
+        try:
+            _ann_attach_locked()
+        except Exception as e:
+            log_event("error", rel_path="ann_index", error=str(e))
+
+
+def _embedding_index_ensure_locked() -> None:
+    global _EMB_INDEX_CHECKED_AT
+    if _EMB_INDEX_MAT is None:
+        _embedding_index_load_locked()
+        return
+    # Other gunicorn workers write embeddings too; replay their changes from the log
+    now = time.time()
+    if EMBED_INDEX_RECHECK_SEC and (now - _EMB_INDEX_CHECKED_AT) >= EMBED_INDEX_RECHECK_SEC:
+        _EMB_INDEX_CHECKED_AT = now
+        try:
+            _embedding_index_replay_locked()
+        except Exception as e:
+            log_event("error", rel_path="embed_index", error=f"replay: {e}")
+
+
+def _embedding_index_replay_locked() -> None:
+    """Apply embedding_changes past _EMB_INDEX_SEQ (reload when the gap is too large or pruned)."""
+    global _EMB_INDEX_SEQ
+    with db_conn() as conn:
+        lo = conn.execute("SELECT MIN(seq) AS lo, MAX(seq) AS hi FROM embedding_changes").fetchone()
+        first, last = int(lo["lo"] or 0), int(lo["hi"] or 0)
+        if last <= _EMB_INDEX_SEQ:
+            return
+        if (first and first > _EMB_INDEX_SEQ + 1) or last - _EMB_INDEX_SEQ > EMBED_CHANGES_REPLAY_MAX:
+            _embedding_index_load_locked()
+            return
+        changed = sorted({int(r["photo_id"]) for r in conn.execute(
+            "SELECT photo_id FROM embedding_changes WHERE seq > ? AND seq <= ?", (_EMB_INDEX_SEQ, last)
+        ).fetchall()})
+        rows: Dict[int, Any] = {}
+        for i in range(0, len(changed), 500):
+            part = changed[i:i + 500]
+            for r in conn.execute(
+                f"SELECT id, embedding FROM photos WHERE id IN ({','.join('?' * len(part))}) AND embedding IS NOT NULL", part
+            ).fetchall():
+                rows[int(r["id"])] = r["embedding"]
+        if last - first > 2 * EMBED_CHANGES_KEEP:
+            conn.execute("DELETE FROM embedding_changes WHERE seq <= ?", (last - EMBED_CHANGES_KEEP,))
+            conn.commit()
+    _embedding_index_remove([pid for pid in changed if pid not in rows])
+    for pid, blob in rows.items():
+        _embedding_index_upsert(pid, _embedding_from_blob(blob))
+        if _EMB_INDEX_MAT is None:
+            return  # dimension change: the upsert dropped the index for a full reload
+    _EMB_INDEX_SEQ = last
+
+
+def _embedding_index_reset() -> None:
+    """Drop the in-memory index; it is reloaded on next use."""
+    global _EMB_INDEX_MAT, _EMB_INDEX_IDS, _EMB_INDEX_LIST, _EMB_INDEX_POS, _EMB_INDEX_N, _ANN_CENTROIDS
+    with _EMB_INDEX_LOCK:
+        _EMB_INDEX_MAT = None
+        _EMB_INDEX_IDS = None
+        _EMB_INDEX_LIST = None
+        _EMB_INDEX_POS = {}
+        _EMB_INDEX_N = 0
+        _ANN_CENTROIDS = None
+
+
+def _embedding_index_upsert(photo_id: int, vec: Any) -> None:
+    global _EMB_INDEX_MAT, _EMB_INDEX_IDS, _EMB_INDEX_LIST, _EMB_INDEX_N
+    with _EMB_INDEX_LOCK:
+        # Not loaded yet: the next load picks the row up from the DB
+        if _EMB_INDEX_MAT is None or _EMB_INDEX_IDS is None or _EMB_INDEX_LIST is None:
+            return
+        v = _normalize_embedding(vec)
+        if v is None:
+            _embedding_index_remove([photo_id])
+            return
+        if _EMB_INDEX_N == 0 and int(_EMB_INDEX_MAT.shape[1]) != int(v.size):
+            _EMB_INDEX_MAT = np.zeros((_EMB_INDEX_MAT.shape[0], v.size), dtype=np.float32)
+        if int(_EMB_INDEX_MAT.shape[1]) != int(v.size):
+            # Embedding model changed dimension; rebuild from DB on next use
+            _embedding_index_reset()
+            return
+        pid = int(photo_id)
+        pos = _EMB_INDEX_POS.get(pid)
+        if pos is None:
+            if _EMB_INDEX_N >= _EMB_INDEX_MAT.shape[0]:
+                cap = max(64, _EMB_INDEX_MAT.shape[0] * 2)
+                mat = np.zeros((cap, _EMB_INDEX_MAT.shape[1]), dtype=np.float32)
+                mat[:_EMB_INDEX_N] = _EMB_INDEX_MAT[:_EMB_INDEX_N]
+                id_arr = np.zeros(cap, dtype=np.int64)
+                id_arr[:_EMB_INDEX_N] = _EMB_INDEX_IDS[:_EMB_INDEX_N]
+                list_arr = np.full(cap, -1, dtype=np.int32)
+                list_arr[:_EMB_INDEX_N] = _EMB_INDEX_LIST[:_EMB_INDEX_N]
+                _EMB_INDEX_MAT, _EMB_INDEX_IDS, _EMB_INDEX_LIST = mat, id_arr, list_arr
+            pos = _EMB_INDEX_N
+            _EMB_INDEX_N += 1
+            _EMB_INDEX_POS[pid] = pos
+            _EMB_INDEX_IDS[pos] = pid
+        _EMB_INDEX_MAT[pos] = v
+        if _ANN_CENTROIDS is not None:
+            _EMB_INDEX_LIST[pos] = int(np.argmax(_ANN_CENTROIDS @ v))
+
+
+def _embedding_index_remove(photo_ids: Iterable[int]) -> None:
+    global _EMB_INDEX_N
+    with _EMB_INDEX_LOCK:
+        if _EMB_INDEX_MAT is None or _EMB_INDEX_IDS is None or _EMB_INDEX_LIST is None:
+            return
+        for pid in photo_ids or []:
+            pos = _EMB_INDEX_POS.pop(int(pid), None)
+            if pos is None:
+                continue
+            # Swap the last live row into the hole to keep rows contiguous
+            last = _EMB_INDEX_N - 1
+            if pos != last:
+                moved = int(_EMB_INDEX_IDS[last])
+                _EMB_INDEX_MAT[pos] = _EMB_INDEX_MAT[last]
+                _EMB_INDEX_IDS[pos] = moved
+                _EMB_INDEX_LIST[pos] = _EMB_INDEX_LIST[last]
+                _EMB_INDEX_POS[moved] = pos
+            _EMB_INDEX_LIST[last] = -1
+            _EMB_INDEX_N = last
+
+
+def _ann_assign(mat: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Nearest coarse cluster for each row, computed in chunks to bound memory."""
+    out = np.empty(mat.shape[0], dtype=np.int32)
+    step = 8192
+    for a in range(0, mat.shape[0], step):
+        out[a:a + step] = np.argmax(mat[a:a + step] @ centroids.T, axis=1)
+    return out
+
+
+def _ann_attach_locked() -> None:
+    """Load persisted IVF centroids/assignments and map them onto the loaded matrix."""
+    global _ANN_CENTROIDS
+    _ANN_CENTROIDS = None
+    if not ANN_INDEX_PATH.exists() or _EMB_INDEX_MAT is None or _EMB_INDEX_IDS is None or _EMB_INDEX_LIST is None:
+        return
+    with np.load(ANN_INDEX_PATH, allow_pickle=False) as data:
+        centroids = np.asarray(data["centroids"], dtype=np.float32)
+        saved_ids = np.asarray(data["ids"], dtype=np.int64)
+        saved_lists = np.asarray(data["lists"], dtype=np.int32)
+        model = str(data["model"]) if "model" in data.files else ""
+    n = _EMB_INDEX_N
+    if model != CLIP_EMBED_MODEL_TAG or centroids.ndim != 2 or int(centroids.shape[1]) != int(_EMB_INDEX_MAT.shape[1]):
+        log_event("ann_index_stale", model=model)
+        return
+    lists = np.full(n, -1, dtype=np.int32)
+    if saved_ids.size and n:
+        order = np.argsort(saved_ids)
+        sid, slist = saved_ids[order], saved_lists[order]
+        live = _EMB_INDEX_IDS[:n]
+        idx = np.clip(np.searchsorted(sid, live), 0, sid.size - 1)
+        hit = sid[idx] == live
+        lists[hit] = slist[idx[hit]]
+    missing = np.flatnonzero(lists < 0)
+    if missing.size:
+        lists[missing] = _ann_assign(_EMB_INDEX_MAT[missing], centroids)
+    _EMB_INDEX_LIST[:n] = lists
+    _ANN_CENTROIDS = centroids
+    log_event("ann_index_loaded", nlist=int(centroids.shape[0]), rows=n, assigned_now=int(missing.size))
+
+
+def _ann_save() -> bool:
+    """Persist IVF centroids and current row assignments under DATA_DIR."""
+    with _EMB_INDEX_LOCK:
+        if _ANN_CENTROIDS is None or _EMB_INDEX_IDS is None or _EMB_INDEX_LIST is None:
+            return False
+        n = _EMB_INDEX_N
+        centroids = _ANN_CENTROIDS
+        ids = _EMB_INDEX_IDS[:n].copy()
+        lists = _EMB_INDEX_LIST[:n].copy()
+    tmp = ANN_INDEX_PATH.with_suffix(".tmp.npz")
+    np.savez(tmp, centroids=centroids, ids=ids, lists=lists, model=np.array(CLIP_EMBED_MODEL_TAG))
+    os.replace(tmp, ANN_INDEX_PATH)
+    return True
+
+
+def _ann_status() -> Dict[str, Any]:
+    with _EMB_INDEX_LOCK:
+        trained = _ANN_CENTROIDS is not None
+        return {
+            "enabled": AI_ANN_ENABLED,
+            "trained": trained,
+            "nlist": int(_ANN_CENTROIDS.shape[0]) if trained else 0,
+            "nprobe": AI_ANN_NPROBE,
+            "min_rows": AI_ANN_MIN_ROWS,
+            "rows": int(_EMB_INDEX_N),
+            "active": bool(trained and _EMB_INDEX_N >= AI_ANN_MIN_ROWS),
+        }
+
+
+def _ann_candidate_rows_locked(q: np.ndarray, nprobe: int) -> Optional[np.ndarray]:
+    """Row positions in the nprobe clusters nearest to q (None = use exact search)."""
+    n = _EMB_INDEX_N
+    if _ANN_CENTROIDS is None or _EMB_INDEX_LIST is None or n < AI_ANN_MIN_ROWS:
+        return None
+    nlist = int(_ANN_CENTROIDS.shape[0])
+    nprobe = max(1, min(int(nprobe), nlist))
+    if nprobe >= nlist:
+        return None
+    cs = _ANN_CENTROIDS @ q
+    probe = np.argpartition(-cs, nprobe - 1)[:nprobe]
+    # Lookup table indexed by cluster; the extra last slot catches unassigned rows (-1)
+    sel = np.zeros(nlist + 1, dtype=bool)
+    sel[probe] = True
+    sel[-1] = True
+    return np.flatnonzero(sel[_EMB_INDEX_LIST[:n]])
+
+
+def _embedding_index_topk(vec: Any, k: int, exclude_id: Optional[int] = None, nprobe: Optional[int] = None, exact: bool = False) -> list[Tuple[int, float]]:
+    """Return [(photo_id, cosine)] for the k best matches, best first."""
+    q = _normalize_embedding(vec)
+    if q is None or k <= 0:
+        return []
+    with _EMB_INDEX_LOCK:
+        _embedding_index_ensure_locked()
+        n = _EMB_INDEX_N
+        if not n or _EMB_INDEX_MAT is None or _EMB_INDEX_IDS is None or int(_EMB_INDEX_MAT.shape[1]) != int(q.size):
+            return []
+        rows = None if (exact or not AI_ANN_ENABLED) else _ann_candidate_rows_locked(q, nprobe or AI_ANN_NPROBE)
+        if rows is not None and rows.size > k:
+            scores = _EMB_INDEX_MAT[rows] @ q
+            ids = _EMB_INDEX_IDS[rows]
+        else:
+            scores = _EMB_INDEX_MAT[:n] @ q
+            ids = _EMB_INDEX_IDS[:n].copy()
+    if exclude_id is not None:
+        scores[ids == int(exclude_id)] = -np.inf
+    m = int(scores.size)
+    k = min(int(k), m)
+    if k < m:
+        top = np.argpartition(-scores, k - 1)[:k]
+    else:
+        top = np.arange(m)
+    top = top[np.argsort(-scores[top], kind="stable")]
+    return [(int(ids[i]), float(scores[i])) for i in top if np.isfinite(scores[i])]
+
+
+def ann_rebuild(stop_event=None) -> Dict[str, Any]:
+    """Train IVF centroids with spherical k-means on a sample, then assign every row."""
+    global _ANN_CENTROIDS
+    log_event("ann_rebuild_start")
+    with _EMB_INDEX_LOCK:
+        _embedding_index_ensure_locked()
+        n = _EMB_INDEX_N
+        if _EMB_INDEX_MAT is None or _EMB_INDEX_IDS is None or n == 0:
+            return {"ok": False, "error": "no_embeddings"}
+        nlist = AI_ANN_NLIST or int(max(1, min(65536, round(4 * (n ** 0.5)))))
+        nlist = max(1, min(nlist, n))
+        rng = np.random.default_rng(0)
+        sample_n = min(n, max(nlist * 64, 10000))
+        sample = _EMB_INDEX_MAT[np.sort(rng.choice(n, size=sample_n, replace=False))].copy()
+    centroids = sample[rng.choice(sample_n, size=nlist, replace=False)].copy()
+    for _ in range(AI_ANN_TRAIN_ITERS):
+        if stop_event and stop_event.is_set():
+            return {"ok": False, "stopped": True}
+        assign = _ann_assign(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, sample)
+        norms = np.linalg.norm(sums, axis=1)
+        # Empty clusters keep their previous centroid
+        filled = norms > 0
+        centroids[filled] = sums[filled] / norms[filled, None]
+    # Assign all rows chunk by chunk without holding the lock for the whole pass;
+    # rows added or moved meanwhile are picked up by the final pass below.
+    assigned: Dict[int, int] = {}
+    step = 65536
+    a = 0
+    while True:
+        if stop_event and stop_event.is_set():
+            return {"ok": False, "stopped": True}
+        with _EMB_INDEX_LOCK:
+            if _EMB_INDEX_MAT is None or _EMB_INDEX_IDS is None or a >= _EMB_INDEX_N:
+                break
+            chunk = _EMB_INDEX_MAT[a:min(a + step, _EMB_INDEX_N)].copy()
+            chunk_ids = _EMB_INDEX_IDS[a:a + chunk.shape[0]].copy()
+        for pid, li in zip(chunk_ids.tolist(), _ann_assign(chunk, centroids).tolist()):
+            assigned[pid] = li
+        a += step
+    with _EMB_INDEX_LOCK:
+        if _EMB_INDEX_MAT is None or _EMB_INDEX_IDS is None or _EMB_INDEX_LIST is None:
+            return {"ok": False, "error": "index_reset"}
+        n = _EMB_INDEX_N
+        lists = np.array([assigned.get(int(pid), -1) for pid in _EMB_INDEX_IDS[:n]], dtype=np.int32)
+        missing = np.flatnonzero(lists < 0)
+        if missing.size:
+            lists[missing] = _ann_assign(_EMB_INDEX_MAT[missing], centroids)
+        _EMB_INDEX_LIST[:n] = lists
+        _ANN_CENTROIDS = centroids
+    _ann_save()
+    res = {"ok": True, "rows": int(n), "nlist": int(nlist), "sample": int(sample_n)}
+    log_event("ann_rebuild_done", **res)
+    return res
+
+
+def _photo_rows_by_ids(
+    ids: list[int],
+    fields: Optional[set[str]] = None,
+    acl: Optional[Tuple[str, list[Any]]] = None,
+) -> Dict[int, sqlite3.Row]:
+    if not ids:
+        return {}
+    ph = ",".join(["?"] * len(ids))
+    params: list[Any] = list(ids)
+    acl_sql = ""
+    if acl is not None:
+        acl_sql = f" AND {acl[0]}"
+        params.extend(acl[1])
+    with db_conn() as conn:
+        rows = conn.execute(f"SELECT {_photo_select_columns(conn, fields)} FROM photos WHERE id IN ({ph}){acl_sql}", params).fetchall()
+    return {int(r["id"]): r for r in rows}
+
+
+def _store_photo_embedding(conn: sqlite3.Connection, photo_id: int, emb: Any) -> None:
+    conn.execute(
+        "UPDATE photos SET embedding=?, embedding_dim=?, embedding_model=?, embedding_json=NULL WHERE id=?",
+        (_embedding_to_blob(emb), len(emb), CLIP_EMBED_MODEL_TAG, photo_id),
+    )
+
+
+def _embed_one_photo(photo_id: int, rel_path: str) -> bool:
+    disk_path = _disk_path_from_rel_path(rel_path)
+    if not disk_path.exists():
+        return False
+    emb = _ai_embed_image_path(disk_path)
+    if not emb:
+        return False
+
+    with db_conn() as conn:
+        _store_photo_embedding(conn, photo_id, emb)
+        conn.commit()
+    _embedding_index_upsert(photo_id, emb)
+
+    try:
+        tags = _classify_labels(emb)
+    except Exception:
+        tags = []
+
+    if tags:
+        try:
+            with db_conn() as conn:
+                cur = conn.execute("SELECT ai_tags FROM photos WHERE id=?", (photo_id,)).fetchone()
+                prev = []
+                if cur and cur["ai_tags"]:
+                    try:
+                        prev = json.loads(cur["ai_tags"]) or []
+                    except Exception:
+                        prev = []
+                merged = sorted({*(prev or []), *tags})
+                conn.execute("UPDATE photos SET ai_tags=? WHERE id=?", (json.dumps(merged, ensure_ascii=False), photo_id))
+                conn.commit()
+        except Exception:
+            pass
+
+    return True
+
+
+def _embed_uploaded_photo_if_needed(rel_path: str) -> bool:
+    """Embed the photo unless it already has a vector; False only when embedding failed."""
+    try:
+        with db_conn() as conn:
+            row = conn.execute("SELECT id, embedding IS NOT NULL AS has_embedding FROM photos WHERE rel_path=?", (rel_path,)).fetchone()
+        if not row:
+            return True
+        if row["has_embedding"]:
+            return True
+        pid = int(row["id"])
+        if _embed_one_photo(pid, rel_path):
+            log_event("ai_embed_ok", rel_path=rel_path, source="upload")
+            return True
+        log_event("ai_embed_fail", rel_path=rel_path, source="upload")
+    except Exception as e:
+        log_event("ai_embed_fail", rel_path=rel_path, source="upload", error=str(e))
+    return False
+
+
+def _describe_one_photo(photo_id: int, rel_path: str) -> bool:
+    emb = None
+    with db_conn() as conn:
+        row = conn.execute("SELECT embedding FROM photos WHERE id=?", (photo_id,)).fetchone()
+    if row:
+        emb = _row_embedding(row)
+
+    if emb is None:
+        if not _embed_one_photo(photo_id, rel_path):
+            return False
+        with db_conn() as conn:
+            row2 = conn.execute("SELECT embedding FROM photos WHERE id=?", (photo_id,)).fetchone()
+        if row2:
+            emb = _row_embedding(row2)
+    if emb is None:
+        return False
+
+    tags = _classify_descriptive_tags(emb)
+    caption = _build_desc_caption(tags)
+    with db_conn() as conn:
+        conn.execute(
+            "UPDATE photos SET ai_desc_tags=?, ai_desc_caption=? WHERE id=?",
+            (json.dumps(tags or [], ensure_ascii=False), caption, photo_id),
+        )
+        conn.commit()
+    return True
+
+
+def _describe_uploaded_photo_if_needed(rel_path: str) -> bool:
+    """Describe the photo unless it already has tags; False only when describing failed."""
+    try:
+        with db_conn() as conn:
+            row = conn.execute("SELECT id, ai_desc_tags FROM photos WHERE rel_path=?", (rel_path,)).fetchone()
+        if not row:
+            return True
+        if row["ai_desc_tags"] is not None and str(row["ai_desc_tags"]).strip() != "":
+            return True
+        pid = int(row["id"])
+        if _describe_one_photo(pid, rel_path):
+            log_event("ai_desc_ok", rel_path=rel_path, source="upload")
+            return True
+        log_event("ai_desc_fail", rel_path=rel_path, source="upload")
+    except Exception as e:
+        log_event("ai_desc_fail", rel_path=rel_path, source="upload", error=str(e))
+    return False
+
+
+# --- Persistent work queue ---
+# Per-photo AI work (embeddings, descriptions, faces) and upload post-processing run
+# as rows in work_queue instead of in-process threads, so queued work survives restarts
+# and any number of web/worker processes can share it. A worker claims the best task
+# (priority, then age) by taking a lease; the lease is renewed while the task runs and
+# an expired lease makes the task claimable again. Failures are retried with
+# exponential backoff. task_key is unique among queued rows, so enqueueing the same
+# work twice is a no-op.
+WORK_PRIORITY_UPLOAD = 20
+WORK_PRIORITY_PHOTO = 10
+WORK_PRIORITY_BULK = 0
+WORK_POLL_SEC = 2.0
+_WORK_HANDLERS: Dict[str, Callable[[Dict[str, Any], Dict[str, Any]], Any]] = {}
+_work_wake = threading.Event()
+_work_worker_thread = None
+_work_worker_lock = threading.Lock()
+_work_worker_stop = threading.Event()
+_work_inflight: Dict[str, int] = {}
+_work_inflight_lock = threading.Lock()
+_work_loops_here = 0  # run_work_queue_worker loops in this process (worker.py runs one in the main thread)
+
+
+def _init_work_queue(conn: sqlite3.Connection) -> None:
+    conn.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS work_queue (
+            id INTEGER PRIMARY KEY,
+            kind TEXT NOT NULL,
+            task_key TEXT NOT NULL,
+            payload TEXT,
+            priority INTEGER NOT NULL DEFAULT 0,
+            batch TEXT,
+            state TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL DEFAULT 5,
+            run_after REAL NOT NULL DEFAULT 0,
+            lease_owner TEXT,
+            lease_until REAL,
+            progress TEXT,
+            last_error TEXT,
+            created_at TEXT,
+            updated_at TEXT,
+            finished_at TEXT
+        );
+        -- state: queued -> running -> done | failed | cancelled (a retry goes back to queued)
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_work_queue_key ON work_queue(task_key) WHERE state = 'queued';
+        CREATE INDEX IF NOT EXISTS idx_work_queue_claim ON work_queue(state, priority DESC, id);
+        CREATE INDEX IF NOT EXISTS idx_work_queue_task ON work_queue(task_key, id);
+        CREATE INDEX IF NOT EXISTS idx_work_queue_batch ON work_queue(kind, batch, state);
+        """
+    )
+    conn.commit()
+
+
+def _work_enqueue_many(
+    kind: str,
+    items: Iterable[Tuple[str, Dict[str, Any]]],
+    priority: int = WORK_PRIORITY_PHOTO,
+    batch: Optional[str] = None,
+) -> int:
+    """Queue (task_key, payload) items; a key that is already queued only gets its priority raised."""
+    now = now_iso()
+    rows = [(kind, key, json.dumps(payload), int(priority), batch, WORK_MAX_ATTEMPTS, now, now) for key, payload in items]
+    if not rows:
+        return 0
+    with db_conn() as conn:
+        conn.executemany(
+            """
+            INSERT INTO work_queue(kind, task_key, payload, priority, batch, max_attempts, created_at, updated_at)
+            VALUES (?,?,?,?,?,?,?,?)
+            ON CONFLICT(task_key) WHERE state = 'queued' DO UPDATE SET
+                priority = MAX(work_queue.priority, excluded.priority),
+                batch = COALESCE(excluded.batch, work_queue.batch),
+                updated_at = excluded.updated_at
+            """,
+            rows,
+        )
+        conn.commit()
+    _work_wake.set()
+    _ensure_work_worker()
+    return len(rows)
+
+
+def _work_enqueue(kind: str, task_key: str, payload: Dict[str, Any], priority: int = WORK_PRIORITY_PHOTO, batch: Optional[str] = None) -> None:
+    _work_enqueue_many(kind, [(task_key, payload)], priority=priority, batch=batch)
+
+
+def _work_enqueue_follow_up(rel_paths: list[str]) -> Dict[str, int]:
+    """Queue the enabled auto embed/describe/faces tasks for newly indexed photos (one transaction per kind)."""
+    queued: Dict[str, int] = {}
+    for kind, enabled in (
+        ("embed", ai_auto_ingest_enabled()),
+        ("describe", ai_desc_auto_ingest_enabled()),
+        ("faces", faces_auto_index_enabled()),
+    ):
+        if not enabled:
+            continue
+        queued[kind] = _work_enqueue_many(kind, [(f"{kind}:{rel}", {"rel_path": rel}) for rel in rel_paths], priority=WORK_PRIORITY_PHOTO)
+        if queued[kind]:
+            log_event({"embed": "ai_embed_queued", "describe": "ai_desc_queued"}.get(kind, f"{kind}_queued"), count=queued[kind])
+    return queued
+
+
+def _work_append(kind: str, task_key: str, base: Dict[str, Any], list_field: str, values: list[str], priority: int) -> None:
+    """Add values to ``payload[list_field]`` of the queued task_key, creating the task if needed."""
+    now = now_iso()
+    with db_conn() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT id, payload FROM work_queue WHERE task_key=? AND state='queued'", (task_key,)).fetchone()
+            if row:
+                payload = json.loads(row["payload"] or "{}")
+                have = list(payload.get(list_field) or [])
+                payload[list_field] = have + [v for v in values if v not in have]
+                conn.execute("UPDATE work_queue SET payload=?, updated_at=? WHERE id=?", (json.dumps(payload), now, row["id"]))
+            else:
+                payload = {**base, list_field: list(dict.fromkeys(values))}
+                conn.execute(
+                    "INSERT INTO work_queue(kind, task_key, payload, priority, max_attempts, created_at, updated_at) VALUES (?,?,?,?,?,?,?)",
+                    (kind, task_key, json.dumps(payload), int(priority), WORK_MAX_ATTEMPTS, now, now),
+                )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    _work_wake.set()
+    _ensure_work_worker()
+
 
-    rethumb_thread = threading.Thread(target=run_rethumb_missing, daemon=True)
-    rethumb_thread.start()
-    return jsonify({"ok": True, "started": True})
+def _work_take_queued(task_key: str, into_task_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """Remove and return the payload of the queued task_key (a running handler absorbing it).
 
+    With into_task_id, the taken list fields are appended to that task's payload in the same
+    transaction, so a retry or lease takeover of the running task still covers them.
+    """
+    with db_conn() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("DELETE FROM work_queue WHERE task_key=? AND state='queued' RETURNING payload", (task_key,)).fetchone()
+            taken = json.loads(row["payload"] or "{}") if row else None
+            if taken and into_task_id is not None:
+                cur = conn.execute("SELECT payload FROM work_queue WHERE id=?", (int(into_task_id),)).fetchone()
+                if cur:
+                    payload = json.loads(cur["payload"] or "{}")
+                    for field, values in taken.items():
+                        if isinstance(values, list):
+                            payload[field] = list(dict.fromkeys(list(payload.get(field) or []) + values))
+                    conn.execute("UPDATE work_queue SET payload=?, updated_at=? WHERE id=?", (json.dumps(payload), now_iso(), int(into_task_id)))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return taken
 
-# --- AI: embeddings + search ---
-ai_thread = None
-ai_running = False
-ai_counts: Dict[str, int] = {"embedded": 0, "failed": 0, "total": 0}
-last_ai_result: Optional[Dict[str, Any]] = None
-ai_desc_thread = None
-ai_desc_running = False
-ai_desc_counts: Dict[str, int] = {"described": 0, "failed": 0, "total": 0}
-last_ai_desc_result: Optional[Dict[str, Any]] = None
 
+def _work_claim(owner: str, kinds: Optional[Iterable[str]] = None) -> Optional[Dict[str, Any]]:
+    """Lease the best runnable task, skipping kinds already at their WORK_CONCURRENCY cap.
 
-def _embed_one_photo(photo_id: int, rel_path: str) -> bool:
-    disk_path = _disk_path_from_rel_path(rel_path)
-    if not disk_path.exists():
-        return False
-    emb = _ai_embed_image_path(disk_path)
-    if not emb:
-        return False
+    The cap counts live leases of every process, checked and taken in one BEGIN IMMEDIATE
+    transaction, so it holds across gunicorn workers and worker.py instances.
+    """
+    now = time.time()
+    with db_conn() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            full = [
+                r["kind"] for r in conn.execute(
+                    "SELECT kind, COUNT(*) AS c FROM work_queue WHERE state='running' AND lease_until >= ? GROUP BY kind", (now,)
+                ).fetchall()
+                if int(r["c"]) >= WORK_CONCURRENCY.get(r["kind"], 1)
+            ]
+            if kinds is not None:
+                kind_list = [k for k in kinds if k not in full]
+                if not kind_list:
+                    conn.rollback()
+                    return None
+                kind_sql = f" AND kind IN ({','.join('?' * len(kind_list))})"
+            else:
+                kind_list = full
+                kind_sql = f" AND kind NOT IN ({','.join('?' * len(full))})" if full else ""
+            row = conn.execute(
+                f"""
+                UPDATE work_queue SET state='running', lease_owner=?, lease_until=?, attempts=attempts+1, updated_at=?
+                WHERE id = (
+                    SELECT id FROM work_queue
+                    WHERE ((state='queued' AND run_after <= ?) OR (state='running' AND lease_until < ?)){kind_sql}
+                    ORDER BY priority DESC, id LIMIT 1
+                )
+                RETURNING id, kind, task_key, payload, batch, attempts, max_attempts
+                """,
+                (owner, now + WORK_LEASE_SEC, now_iso(), now, now, *kind_list),
+            ).fetchone()
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return dict(row) if row else None
 
-    with closing(get_conn()) as conn:
-        conn.execute("UPDATE photos SET embedding_json=? WHERE id=?", (json.dumps(emb), photo_id))
+
+def _work_renew(task_ids: list[int], owner: str) -> None:
+    if not task_ids:
+        return
+    with db_conn() as conn:
+        conn.execute(
+            f"UPDATE work_queue SET lease_until=? WHERE lease_owner=? AND state='running' AND id IN ({','.join('?' * len(task_ids))})",
+            (time.time() + WORK_LEASE_SEC, owner, *task_ids),
+        )
         conn.commit()
 
-    try:
-        tags = _classify_labels(emb)
-    except Exception:
-        tags = []
 
-    if tags:
+def _work_finish(task: Dict[str, Any], owner: str, error: Optional[str] = None) -> None:
+    """Mark a claimed task done, or (with error) queue its retry / mark it failed."""
+    now = now_iso()
+    with db_conn() as conn:
+        conn.execute("BEGIN IMMEDIATE")
         try:
-            with closing(get_conn()) as conn:
-                cur = conn.execute("SELECT ai_tags FROM photos WHERE id=?", (photo_id,)).fetchone()
-                prev = []
-                if cur and cur["ai_tags"]:
-                    try:
-                        prev = json.loads(cur["ai_tags"]) or []
-                    except Exception:
-                        prev = []
-                merged = sorted({*(prev or []), *tags})
-                conn.execute("UPDATE photos SET ai_tags=? WHERE id=?", (json.dumps(merged, ensure_ascii=False), photo_id))
-                conn.commit()
+            if error is None:
+                conn.execute(
+                    "UPDATE work_queue SET state='done', lease_owner=NULL, lease_until=NULL, finished_at=?, updated_at=? WHERE id=? AND lease_owner=?",
+                    (now, now, task["id"], owner),
+                )
+            elif int(task["attempts"]) >= int(task["max_attempts"]):
+                conn.execute(
+                    "UPDATE work_queue SET state='failed', lease_owner=NULL, lease_until=NULL, last_error=?, finished_at=?, updated_at=? WHERE id=? AND lease_owner=?",
+                    (error[:500], now, now, task["id"], owner),
+                )
+            else:
+                dup = conn.execute("SELECT id, payload FROM work_queue WHERE task_key=? AND state='queued'", (task["task_key"],)).fetchone()
+                if dup:
+                    # The same work was queued again meanwhile; fold list payloads into it
+                    # Re-read: a running postprocess task appends absorbed rel_paths to its payload
+                    cur = conn.execute("SELECT payload FROM work_queue WHERE id=?", (task["id"],)).fetchone()
+                    mine = json.loads((cur["payload"] if cur else task["payload"]) or "{}")
+                    theirs = json.loads(dup["payload"] or "{}")
+                    if isinstance(mine.get("rel_paths"), list):
+                        theirs["rel_paths"] = list(dict.fromkeys(list(mine["rel_paths"]) + list(theirs.get("rel_paths") or [])))
+                        conn.execute("UPDATE work_queue SET payload=? WHERE id=?", (json.dumps(theirs), dup["id"]))
+                    conn.execute(
+                        "UPDATE work_queue SET state='failed', lease_owner=NULL, lease_until=NULL, last_error=?, finished_at=?, updated_at=? WHERE id=? AND lease_owner=?",
+                        (f"{error[:450]} (superseded by #{dup['id']})", now, now, task["id"], owner),
+                    )
+                else:
+                    backoff = min(3600.0, WORK_RETRY_BASE_SEC * (2 ** (int(task["attempts"]) - 1)))
+                    conn.execute(
+                        "UPDATE work_queue SET state='queued', lease_owner=NULL, lease_until=NULL, run_after=?, last_error=?, updated_at=? WHERE id=? AND lease_owner=?",
+                        (time.time() + backoff, error[:500], now, task["id"], owner),
+                    )
+            conn.commit()
         except Exception:
-            pass
+            conn.rollback()
+            raise
 
-    return True
 
+def _work_set_progress(task_key: str, patch: Dict[str, Any]) -> None:
+    """Merge patch into the progress JSON of the newest running task_key."""
+    with db_conn() as conn:
+        conn.execute(
+            """
+            UPDATE work_queue SET progress = json_patch(COALESCE(progress, '{}'), ?), updated_at = ?
+            WHERE id = (SELECT id FROM work_queue WHERE task_key=? AND state='running' ORDER BY id DESC LIMIT 1)
+            """,
+            (json.dumps(patch), now_iso(), task_key),
+        )
+        conn.commit()
 
-def _embed_missing_photos(stop_event=None) -> Dict[str, Any]:
-    global ai_running, ai_counts, last_ai_result
-    ai_running = True
-    ai_counts = {"embedded": 0, "failed": 0, "total": 0}
-    log_event("ai_embed_start")
-    with closing(get_conn()) as conn:
-        rows = conn.execute("SELECT id, rel_path FROM photos WHERE (embedding_json IS NULL OR embedding_json = '')").fetchall()
-    for row in rows:
-        if stop_event and stop_event.is_set():
-            break
-        pid = int(row["id"])
-        rel = row["rel_path"]
-        ai_counts["total"] += 1
-        try:
-            if _embed_one_photo(pid, rel):
-                ai_counts["embedded"] += 1
-                log_event("ai_embed_ok", rel_path=rel)
-            else:
-                ai_counts["failed"] += 1
-                log_event("ai_embed_fail", rel_path=rel)
-        except Exception:
-            ai_counts["failed"] += 1
-            log_event("ai_embed_fail", rel_path=rel)
-        ai_delay = ai_ingest_throttle_enabled_sec()
-        if ai_delay > 0:
-            time.sleep(ai_delay)
-    ai_running = False
-    last_ai_result = {"ok": True, **ai_counts}
-    log_event("ai_embed_done", **ai_counts)
-    return last_ai_result
+
+def _work_batch_status(kind: str) -> Tuple[bool, Dict[str, int]]:
+    """(active, counts per state) for the latest bulk batch of kind."""
+    batch = _get_setting(f"work_batch_{kind}")
+    counts = {"queued": 0, "running": 0, "done": 0, "failed": 0, "cancelled": 0}
+    if not batch:
+        return False, counts
+    with db_conn() as conn:
+        for r in conn.execute("SELECT state, COUNT(*) AS c FROM work_queue WHERE kind=? AND batch=? GROUP BY state", (kind, batch)):
+            counts[r["state"]] = int(r["c"] or 0)
+    return bool(counts["queued"] or counts["running"]), counts
+
+
+def _work_start_batch(kind: str, items: Iterable[Tuple[str, Dict[str, Any]]]) -> int:
+    batch = f"{kind}-{now_iso()}-{secrets.token_hex(3)}"
+    _set_setting(f"work_batch_{kind}", batch)
+    return _work_enqueue_many(kind, items, priority=WORK_PRIORITY_BULK, batch=batch)
+
+
+def _work_cancel_batch(kind: str) -> int:
+    batch = _get_setting(f"work_batch_{kind}")
+    if not batch:
+        return 0
+    with db_conn() as conn:
+        cur = conn.execute(
+            "UPDATE work_queue SET state='cancelled', finished_at=?, updated_at=? WHERE kind=? AND batch=? AND state='queued'",
+            (now_iso(), now_iso(), kind, batch),
+        )
+        conn.commit()
+    return int(cur.rowcount or 0)
+
+
+def _work_prune() -> None:
+    if not WORK_KEEP_DONE_SEC:
+        return
+    cutoff = (datetime.utcnow() - timedelta(seconds=WORK_KEEP_DONE_SEC)).isoformat(timespec="seconds") + "Z"
+    with db_conn() as conn:
+        conn.execute("DELETE FROM work_queue WHERE state IN ('done','failed','cancelled') AND finished_at < ?", (cutoff,))
+        conn.commit()
 
 
-def _embed_uploaded_photo_if_needed(rel_path: str) -> None:
+def _work_run_task(task: Dict[str, Any], owner: str) -> None:
+    handler = _WORK_HANDLERS.get(task["kind"])
+    if handler is None:
+        _work_finish(task, owner, error=f"no handler for {task['kind']}")
+        return
+    if int(task["attempts"]) > int(task["max_attempts"]):
+        # Claimed again after its lease expired on every attempt (worker killed mid-task)
+        _work_finish({**task, "attempts": task["max_attempts"]}, owner, error="lease expired")
+        return
     try:
-        with closing(get_conn()) as conn:
-            row = conn.execute("SELECT id, embedding_json FROM photos WHERE rel_path=?", (rel_path,)).fetchone()
-        if not row:
-            return
-        if row["embedding_json"]:
-            return
-        pid = int(row["id"])
-        if _embed_one_photo(pid, rel_path):
-            log_event("ai_embed_ok", rel_path=rel_path, source="upload")
-        else:
-            log_event("ai_embed_fail", rel_path=rel_path, source="upload")
+        handler(json.loads(task["payload"] or "{}"), task)
     except Exception as e:
-        log_event("ai_embed_fail", rel_path=rel_path, source="upload", error=str(e))
+        log_event("work_failed", kind=task["kind"], key=task["task_key"], attempt=task["attempts"], error=str(e))
+        _work_finish(task, owner, error=str(e) or type(e).__name__)
+    else:
+        _work_finish(task, owner)
 
 
-def _describe_one_photo(photo_id: int, rel_path: str) -> bool:
-    emb = None
-    with closing(get_conn()) as conn:
-        row = conn.execute("SELECT embedding_json FROM photos WHERE id=?", (photo_id,)).fetchone()
-    if row and row["embedding_json"]:
-        try:
-            emb = json.loads(row["embedding_json"])
-        except Exception:
-            emb = None
+def run_work_queue_worker(stop_event: Optional[threading.Event] = None, kinds: Optional[Iterable[str]] = None, idle_exit: bool = False) -> None:
+    """Claim queued tasks and run them on a bounded pool until stop_event is set (or the queue drains with idle_exit).
 
-    if not emb:
-        if not _embed_one_photo(photo_id, rel_path):
-            return False
-        with closing(get_conn()) as conn:
-            row2 = conn.execute("SELECT embedding_json FROM photos WHERE id=?", (photo_id,)).fetchone()
-        if row2 and row2["embedding_json"]:
+    At most WORK_CONCURRENCY[kind] tasks of a kind run at once, counted over every process
+    (see _work_claim). Kinds without a free slot are not claimed, so a burst of uploads stays
+    in work_queue instead of piling up in memory.
+    """
+    global _work_loops_here
+    stop_event = stop_event or threading.Event()
+    owner = f"{os.getpid()}-{secrets.token_hex(4)}"
+    init_db()
+    limits = {k: WORK_CONCURRENCY.get(k, 1) for k in (kinds or list(_WORK_HANDLERS))}
+    running: Dict[int, str] = {}
+    running_lock = threading.Lock()
+    finished = threading.Event()
+
+    def _heartbeat():
+        while not finished.wait(WORK_LEASE_SEC / 3):
             try:
-                emb = json.loads(row2["embedding_json"])
-            except Exception:
-                emb = None
-    if not emb:
-        return False
+                with running_lock:
+                    ids = list(running)
+                _work_renew(ids, owner)
+            except Exception as e:
+                log_event("error", rel_path="work_queue", error=f"lease renew: {e}")
 
-    tags = _classify_descriptive_tags(emb)
-    caption = _build_desc_caption(tags)
-    with closing(get_conn()) as conn:
-        conn.execute(
-            "UPDATE photos SET ai_desc_tags=?, ai_desc_caption=? WHERE id=?",
-            (json.dumps(tags or [], ensure_ascii=False), caption, photo_id),
+    def _run(task: Dict[str, Any]) -> None:
+        try:
+            _work_run_task(task, owner)
+        except Exception as e:
+            log_event("error", rel_path="work_queue", error=f"{task['kind']} {task['task_key']}: {e}")
+        finally:
+            with running_lock:
+                running.pop(int(task["id"]), None)
+            with _work_inflight_lock:
+                _work_inflight[task["kind"]] = max(0, _work_inflight.get(task["kind"], 0) - 1)
+            _work_wake.set()
+
+    threading.Thread(target=_heartbeat, name="work-heartbeat", daemon=True).start()
+    pool = ThreadPoolExecutor(max_workers=max(1, sum(limits.values())), thread_name_prefix="work")
+    log_event("work_worker_start", owner=owner, concurrency=limits)
+    last_prune = 0.0
+    with _work_worker_lock:
+        _work_loops_here += 1
+    try:
+        # Photos queued for FTS at first creation (or left by an interrupted refresh)
+        _fts_schedule()
+        while not stop_event.is_set():
+            _work_wake.clear()
+            if time.time() - last_prune > 3600:
+                last_prune = time.time()
+                _work_prune()
+            with running_lock:
+                busy = list(running.values())
+            free = [k for k, n in limits.items() if busy.count(k) < n]
+            task = _work_claim(owner, free) if free else None
+            if task is None:
+                if idle_exit and not busy:
+                    break
+                _work_wake.wait(WORK_POLL_SEC)
+                continue
+            with running_lock:
+                running[int(task["id"])] = task["kind"]
+            with _work_inflight_lock:
+                _work_inflight[task["kind"]] = _work_inflight.get(task["kind"], 0) + 1
+            pool.submit(_run, task)
+    finally:
+        pool.shutdown(wait=True)
+        finished.set()
+        with _work_worker_lock:
+            _work_loops_here -= 1
+        log_event("work_worker_stop", owner=owner)
+
+
+def _ensure_work_worker() -> None:
+    """Start this process's worker thread (WORK_QUEUE_WORKER=embedded) if it is not running."""
+    global _work_worker_thread
+    if WORK_QUEUE_WORKER != "embedded":
+        return
+    with _work_worker_lock:
+        if (_work_worker_thread and _work_worker_thread.is_alive()) or _work_loops_here:
+            # Tasks that queue follow-up work must not start a second loop next to their own
+            return
+        _work_worker_stop.clear()
+        _work_worker_thread = threading.Thread(
+            target=run_work_queue_worker, args=(_work_worker_stop,), name="work-queue", daemon=True
         )
-        conn.commit()
-    return True
+        _work_worker_thread.start()
 
 
-def _describe_missing_photos(stop_event=None) -> Dict[str, Any]:
-    global ai_desc_running, ai_desc_counts, last_ai_desc_result
-    ai_desc_running = True
-    ai_desc_counts = {"described": 0, "failed": 0, "total": 0}
-    log_event("ai_desc_start")
-    with closing(get_conn()) as conn:
-        rows = conn.execute(
-            "SELECT id, rel_path FROM photos WHERE (ai_desc_tags IS NULL OR ai_desc_tags = '')"
-        ).fetchall()
-    for row in rows:
-        if stop_event and stop_event.is_set():
-            break
-        pid = int(row["id"])
-        rel = row["rel_path"]
-        ai_desc_counts["total"] += 1
-        try:
-            if _describe_one_photo(pid, rel):
-                ai_desc_counts["described"] += 1
-                log_event("ai_desc_ok", rel_path=rel)
-            else:
-                ai_desc_counts["failed"] += 1
-                log_event("ai_desc_fail", rel_path=rel)
-        except Exception:
-            ai_desc_counts["failed"] += 1
-            log_event("ai_desc_fail", rel_path=rel)
+@app.before_request
+def _autostart_work_worker():
+    # Picks up work queued before a restart; a no-op once the thread runs
+    if WORK_QUEUE_WORKER == "embedded" and not (_work_worker_thread and _work_worker_thread.is_alive()):
+        _ensure_work_worker()
+
+
+def _work_embed(payload: Dict[str, Any], task: Dict[str, Any]) -> None:
+    if not _embed_uploaded_photo_if_needed(payload["rel_path"]):
+        raise RuntimeError("embedding failed")
+    if task.get("batch"):
         ai_delay = ai_ingest_throttle_enabled_sec()
         if ai_delay > 0:
             time.sleep(ai_delay)
-    ai_desc_running = False
-    last_ai_desc_result = {"ok": True, **ai_desc_counts}
-    log_event("ai_desc_done", **ai_desc_counts)
-    return last_ai_desc_result
+        if not _work_batch_status("embed")[1]["queued"]:
+            # Last of the batch: persist the IVF assignments of the new rows
+            try:
+                _ann_save()
+            except Exception as e:
+                log_event("error", rel_path="ann_index", error=str(e))
+            _fts_schedule()
 
 
-def _describe_uploaded_photo_if_needed(rel_path: str) -> None:
-    try:
-        with closing(get_conn()) as conn:
-            row = conn.execute("SELECT id, ai_desc_tags FROM photos WHERE rel_path=?", (rel_path,)).fetchone()
-        if not row:
-            return
-        if row["ai_desc_tags"] is not None and str(row["ai_desc_tags"]).strip() != "":
-            return
-        pid = int(row["id"])
-        if _describe_one_photo(pid, rel_path):
-            log_event("ai_desc_ok", rel_path=rel_path, source="upload")
-        else:
-            log_event("ai_desc_fail", rel_path=rel_path, source="upload")
-    except Exception as e:
-        log_event("ai_desc_fail", rel_path=rel_path, source="upload", error=str(e))
+def _work_describe(payload: Dict[str, Any], task: Dict[str, Any]) -> None:
+    if not _describe_uploaded_photo_if_needed(payload["rel_path"]):
+        raise RuntimeError("description failed")
+    if task.get("batch"):
+        ai_delay = ai_ingest_throttle_enabled_sec()
+        if ai_delay > 0:
+            time.sleep(ai_delay)
+        if not _work_batch_status("describe")[1]["queued"]:
+            _fts_schedule()
+
+
+def _work_faces(payload: Dict[str, Any], task: Dict[str, Any]) -> None:
+    index_faces_for_photo(payload["rel_path"])
+    if task.get("batch"):
+        face_delay = faces_index_throttle_enabled_sec()
+        if face_delay > 0:
+            time.sleep(face_delay)
+        if not _work_batch_status("faces")[1]["queued"]:
+            _fts_schedule()
+
+
+def _work_postprocess(payload: Dict[str, Any], task: Dict[str, Any]) -> None:
+    _upload_postprocess_worker(payload.get("uploaded_by") or "", list(payload.get("rel_paths") or []), task_id=task.get("id"))
+    _fts_schedule()
+
+
+def _work_fts(payload: Dict[str, Any], task: Dict[str, Any]) -> None:
+    with db_conn() as conn:
+        indexed = _fts_refresh(conn)
+    if indexed:
+        log_event("fts_refresh_done", indexed=indexed)
+
+
+_WORK_HANDLERS.update({
+    "embed": _work_embed,
+    "describe": _work_describe,
+    "faces": _work_faces,
+    "postprocess": _work_postprocess,
+    "fts": _work_fts,
+})
+
+
+@app.route("/api/work/status")
+def api_work_status():
+    fb = _forbid_user_role_for_maintenance()
+    if fb:
+        return jsonify(fb[0]), fb[1]
+    out: Dict[str, Dict[str, int]] = {}
+    depth: Dict[str, Dict[str, int]] = {}
+    with db_conn() as conn:
+        for r in conn.execute("SELECT kind, state, COUNT(*) AS c FROM work_queue GROUP BY kind, state"):
+            out.setdefault(r["kind"], {})[r["state"]] = int(r["c"] or 0)
+        for r in conn.execute(
+            "SELECT kind, SUM(run_after <= ?) AS ready, SUM(run_after > ?) AS delayed FROM work_queue WHERE state='queued' GROUP BY kind",
+            (time.time(), time.time()),
+        ):
+            depth[r["kind"]] = {"ready": int(r["ready"] or 0), "delayed": int(r["delayed"] or 0)}
+        failed = [dict(r) for r in conn.execute(
+            "SELECT id, kind, task_key, attempts, last_error, finished_at FROM work_queue WHERE state='failed' ORDER BY id DESC LIMIT 20"
+        ).fetchall()]
+    with _work_inflight_lock:
+        inflight = {k: n for k, n in _work_inflight.items() if n}
+    return jsonify({
+        "ok": True,
+        "mode": WORK_QUEUE_WORKER,
+        "embedded_worker": bool(_work_worker_thread and _work_worker_thread.is_alive()),
+        "kinds": out,
+        "depth": depth,
+        "inflight": inflight,
+        "concurrency": WORK_CONCURRENCY,
+        "concurrency_scope": "all_processes",
+        "recent_failures": failed,
+    })
 
 
 @app.route("/api/ai/ingest", methods=["POST"])
 def api_ai_ingest():
-    global ai_thread
-    if ai_thread and ai_thread.is_alive():
+    if _work_batch_status("embed")[0]:
         return jsonify({"ok": False, "error": "AI ingest already running"}), 409
     scope = (request.args.get("scope") or "").strip().lower()
     _set_setting("ai_auto_ingest", "1")
     if scope == "new":
         return jsonify({"ok": True, "started": False, "running": False, "auto_ingest": True, "scope": "new"})
-    scan_stop_event.clear()
-    def run():
-        _embed_missing_photos(stop_event=scan_stop_event)
-    ai_thread = threading.Thread(target=run, daemon=True)
-    ai_thread.start()
-    return jsonify({"ok": True, "started": True, "auto_ingest": True, "scope": (scope or "all")})
+    with db_conn() as conn:
+        rels = [r["rel_path"] for r in conn.execute("SELECT rel_path FROM photos WHERE embedding IS NULL").fetchall()]
+    queued = _work_start_batch("embed", ((f"embed:{rel}", {"rel_path": rel}) for rel in rels))
+    log_event("ai_embed_start", queued=queued)
+    return jsonify({"ok": True, "started": True, "auto_ingest": True, "scope": (scope or "all"), "queued": queued})
 
 
 @app.route("/api/ai/stop", methods=["POST"])
 def api_ai_stop():
     _set_setting("ai_auto_ingest", "0")
-    if not ai_running:
+    if not _work_batch_status("embed")[0]:
         return jsonify({"ok": True, "running": False, "auto_ingest": False})
-    scan_stop_event.set()
+    _work_cancel_batch("embed")
     return jsonify({"ok": True, "running": True, "stopping": True, "auto_ingest": False})
 
 
 @app.route("/api/ai/status")
 def api_ai_status():
-    resp: Dict[str, Any] = {"ok": True, "running": ai_running, "auto_ingest": ai_auto_ingest_enabled(), **ai_counts}
-    if not ai_running and last_ai_result:
-        resp["last"] = last_ai_result
+    running, c = _work_batch_status("embed")
+    counts = {"embedded": c["done"], "failed": c["failed"], "total": c["queued"] + c["running"] + c["done"] + c["failed"]}
+    resp: Dict[str, Any] = {"ok": True, "running": running, "auto_ingest": ai_auto_ingest_enabled(), **counts}
+    if not running and counts["total"]:
+        resp["last"] = {"ok": True, **counts}
     return jsonify(resp)
 
 
 @app.route("/api/ai/describe/ingest", methods=["POST"])
 def api_ai_describe_ingest():
-    global ai_desc_thread
-    if ai_desc_thread and ai_desc_thread.is_alive():
+    if _work_batch_status("describe")[0]:
         return jsonify({"ok": False, "error": "AI description ingest already running"}), 409
     scope = (request.args.get("scope") or "").strip().lower()
     _set_setting("ai_desc_auto_ingest", "1")
     if scope == "new":
         return jsonify({"ok": True, "started": False, "running": False, "auto_ingest": True, "scope": "new"})
-    scan_stop_event.clear()
-
-    def run():
-        _describe_missing_photos(stop_event=scan_stop_event)
-
-    ai_desc_thread = threading.Thread(target=run, daemon=True)
-    ai_desc_thread.start()
-    return jsonify({"ok": True, "started": True, "auto_ingest": True, "scope": (scope or "all")})
+    with db_conn() as conn:
+        rels = [r["rel_path"] for r in conn.execute(
+            "SELECT rel_path FROM photos WHERE (ai_desc_tags IS NULL OR ai_desc_tags = '')"
+        ).fetchall()]
+    queued = _work_start_batch("describe", ((f"describe:{rel}", {"rel_path": rel}) for rel in rels))
+    log_event("ai_desc_start", queued=queued)
+    return jsonify({"ok": True, "started": True, "auto_ingest": True, "scope": (scope or "all"), "queued": queued})
 
 
 @app.route("/api/ai/describe/stop", methods=["POST"])
 def api_ai_describe_stop():
     _set_setting("ai_desc_auto_ingest", "0")
-    if not ai_desc_running:
+    if not _work_batch_status("describe")[0]:
         return jsonify({"ok": True, "running": False, "auto_ingest": False})
-    scan_stop_event.set()
+    _work_cancel_batch("describe")
     return jsonify({"ok": True, "running": True, "stopping": True, "auto_ingest": False})
 
 
 @app.route("/api/ai/describe/status")
 def api_ai_describe_status():
+    running, c = _work_batch_status("describe")
+    counts = {"described": c["done"], "failed": c["failed"], "total": c["queued"] + c["running"] + c["done"] + c["failed"]}
     resp: Dict[str, Any] = {
         "ok": True,
-        "running": ai_desc_running,
+        "running": running,
         "auto_ingest": ai_desc_auto_ingest_enabled(),
-        **ai_desc_counts,
+        **counts,
     }
-    if not ai_desc_running and last_ai_desc_result:
-        resp["last"] = last_ai_desc_result
+    if not running and counts["total"]:
+        resp["last"] = {"ok": True, **counts}
+    return jsonify(resp)
+
+
+ann_rebuild_thread = None
+last_ann_rebuild_result: Optional[Dict[str, Any]] = None
+
+
+@app.route("/api/ai/ann/rebuild", methods=["POST"])
+def api_ai_ann_rebuild():
+    fb = _forbid_user_role_for_maintenance()
+    if fb:
+        return jsonify(fb[0]), fb[1]
+    global ann_rebuild_thread, last_ann_rebuild_result
+    if not AI_ANN_ENABLED:
+        return jsonify({"ok": False, "error": "ANN index disabled (AI_ANN_ENABLED=0)"}), 400
+    if ann_rebuild_thread and ann_rebuild_thread.is_alive():
+        return jsonify({"ok": False, "error": "ANN rebuild already running"}), 409
+    scan_stop_event.clear()
+    last_ann_rebuild_result = None
+
+    def run_ann_rebuild():
+        global last_ann_rebuild_result
+        try:
+            last_ann_rebuild_result = ann_rebuild(stop_event=scan_stop_event)
+        except Exception as e:
+            log_event("error", rel_path="ann_index", error=str(e))
+            last_ann_rebuild_result = {"ok": False, "error": str(e)}
+
+    ann_rebuild_thread = threading.Thread(target=run_ann_rebuild, daemon=True)
+    ann_rebuild_thread.start()
+    return jsonify({"ok": True, "started": True})
+
+
+@app.route("/api/ai/ann/status")
+def api_ai_ann_status():
+    running = bool(ann_rebuild_thread and ann_rebuild_thread.is_alive())
+    resp: Dict[str, Any] = {"ok": True, "running": running, **_ann_status()}
+    if not running and last_ann_rebuild_result is not None:
+        resp["result"] = last_ann_rebuild_result
     return jsonify(resp)
 
 
+def _ann_query_args() -> Dict[str, Any]:
+    """Per-request recall/latency knobs: ?nprobe=N and ?exact=1."""
+    out: Dict[str, Any] = {"exact": str(request.args.get("exact") or "").lower() in {"1", "true", "yes"}}
+    try:
+        if request.args.get("nprobe"):
+            out["nprobe"] = max(1, int(request.args.get("nprobe", "0")))
+    except ValueError:
+        pass
+    return out
+
+
 @app.route("/api/ai/search")
 def api_ai_search():
     q = (request.args.get("q") or "").strip()
@@ -7281,81 +11387,87 @@ def api_ai_search():
     vec = _ai_embed_text(q)
     if not vec:
         return jsonify({"items": [], "count": 0, "error": "embed_failed"})
-    with closing(get_conn()) as conn:
-        rows = conn.execute("SELECT * FROM photos WHERE embedding_json IS NOT NULL AND embedding_json != ''").fetchall()
-    scored = []
-    for r in rows:
-        try:
-            emb = json.loads(r["embedding_json"]) if r["embedding_json"] else None
-            sc = _cosine(vec, emb) if emb else -1.0
-            scored.append((sc, r))
-        except Exception:
-            continue
-    scored.sort(key=lambda x: x[0], reverse=True)
-    items = [row_to_public(r) for (s, r) in scored[:limit] if s > -0.5]
-    items = _filter_public_items_by_current_user_acl(items)
+    fields = _parse_photo_fields(request.args.get("fields"))
+    top = _embedding_index_topk(vec, limit, **_ann_query_args())
+    rows_by_id = _photo_rows_by_ids([pid for (pid, s) in top if s > -0.5], fields, acl=_current_user_acl_sql())
+    items = [row_to_public(rows_by_id[pid], fields) for (pid, s) in top if s > -0.5 and pid in rows_by_id]
+    items = _project_photo_fields(items, fields)
     return jsonify({"items": items, "count": len(items), "q": q})
 
 
 @app.route("/api/photos/<int:photo_id>/similar")
 def api_similar(photo_id: int):
     limit = max(1, min(200, int(request.args.get("limit", "60"))))
-    with closing(get_conn()) as conn:
+    with db_conn() as conn:
         row = conn.execute("SELECT * FROM photos WHERE id=?", (photo_id,)).fetchone()
     if not row:
         return jsonify({"ok": False, "error": "not_found"}), 404
     if not _is_rel_path_allowed_for_current_user(row["rel_path"]):
         return jsonify({"ok": False, "error": "not_found"}), 404
-    emb = None
-    try:
-        emb = json.loads(row["embedding_json"]) if row["embedding_json"] else None
-    except Exception:
-        emb = None
-    if not emb:
+    emb = _row_embedding(row)
+    if emb is None:
         # compute on the fly
         p = PHOTO_DIR / row["rel_path"]
         emb = _ai_embed_image_path(p)
         if not emb:
             return jsonify({"ok": False, "error": "embed_failed"}), 500
-        with closing(get_conn()) as conn:
-            conn.execute("UPDATE photos SET embedding_json=? WHERE id=?", (json.dumps(emb), photo_id))
+        with db_conn() as conn:
+            _store_photo_embedding(conn, photo_id, emb)
             conn.commit()
-    with closing(get_conn()) as conn:
-        rows = conn.execute("SELECT * FROM photos WHERE embedding_json IS NOT NULL AND embedding_json != '' AND id<>?", (photo_id,)).fetchall()
-    scored = []
-    for r in rows:
-        try:
-            e2 = json.loads(r["embedding_json"]) if r["embedding_json"] else None
-            s = _cosine(emb, e2) if e2 else -1.0
-            scored.append((s, r))
-        except Exception:
-            continue
-    scored.sort(key=lambda x: x[0], reverse=True)
-    items = [row_to_public(r) for (s, r) in scored[:limit] if s > -0.5]
-    items = _filter_public_items_by_current_user_acl(items)
+        _embedding_index_upsert(photo_id, emb)
+    top = _embedding_index_topk(emb, limit, exclude_id=photo_id, **_ann_query_args())
+    rows_by_id = _photo_rows_by_ids([pid for (pid, s) in top if s > -0.5], acl=_current_user_acl_sql())
+    items = [row_to_public(rows_by_id[pid]) for (pid, s) in top if s > -0.5 and pid in rows_by_id]
     return jsonify({"items": items, "count": len(items)})
 
 
+@app.route("/api/photos/<int:photo_id>/duplicates")
+def api_photo_duplicates(photo_id: int):
+    """Photos whose DCT pHash is within ``distance`` bits of this one (nearest first)."""
+    try:
+        dist_thr = max(0, min(int(request.args.get("distance", "5")), _PHASH_MAX_RADIUS))
+    except ValueError:
+        dist_thr = 5
+    with db_conn() as conn:
+        row = conn.execute("SELECT id, rel_path, phash64 FROM photos WHERE id=?", (photo_id,)).fetchone()
+        if not row:
+            return jsonify({"ok": False, "error": "not_found"}), 404
+        if not _is_rel_path_allowed_for_current_user(row["rel_path"]):
+            return jsonify({"ok": False, "error": "not_found"}), 404
+        if row["phash64"] is None:
+            return jsonify({"items": [], "count": 0, "distance": dist_thr})
+        near = phash_neighbors(conn, int(row["phash64"]), dist_thr, exclude_id=photo_id)
+    rows_by_id = _photo_rows_by_ids([pid for pid, _ in near], acl=_current_user_acl_sql())
+    items = []
+    for pid, d in near:
+        if pid in rows_by_id:
+            it = row_to_public(rows_by_id[pid])
+            it["hash_distance"] = d
+            items.append(it)
+    return jsonify({"items": items, "count": len(items), "distance": dist_thr})
+
+
 @app.route("/api/photos/<int:photo_id>/ai-tags", methods=["POST"])
 def api_ai_tags(photo_id: int):
-    with closing(get_conn()) as conn:
-        row = conn.execute("SELECT id, rel_path, embedding_json, ai_tags FROM photos WHERE id=?", (photo_id,)).fetchone()
+    with db_conn() as conn:
+        row = conn.execute("SELECT id, rel_path, embedding, ai_tags FROM photos WHERE id=?", (photo_id,)).fetchone()
     if not row:
         return jsonify({"ok": False, "error": "not_found"}), 404
     if not _is_rel_path_allowed_for_current_user(row["rel_path"]):
         return jsonify({"ok": False, "error": "not_found"}), 404
     try:
-        emb = json.loads(row["embedding_json"]) if row["embedding_json"] else None
-        if not emb:
+        emb = _row_embedding(row)
+        if emb is None:
             p = PHOTO_DIR / row["rel_path"]
             emb = _ai_embed_image_path(p)
             if not emb:
                 return jsonify({"ok": False, "error": "embed_failed"}), 500
-            with closing(get_conn()) as conn:
-                conn.execute("UPDATE photos SET embedding_json=? WHERE id=?", (json.dumps(emb), photo_id))
+            with db_conn() as conn:
+                _store_photo_embedding(conn, photo_id, emb)
                 conn.commit()
+            _embedding_index_upsert(photo_id, emb)
         tags = _classify_labels(emb)
-        with closing(get_conn()) as conn:
+        with db_conn() as conn:
             prev = []
             if row["ai_tags"]:
                 try:
@@ -7403,17 +11515,27 @@ def clear_index() -> Dict[str, Any]:
         log_event("error", rel_path="converted_clear", error=str(e))
 
     try:
-        with closing(get_conn()) as conn:
+        with db_conn() as conn:
             photos = conn.execute("SELECT COUNT(*) AS c FROM photos").fetchone()["c"]
             faces = conn.execute("SELECT COUNT(*) AS c FROM faces").fetchone()["c"]
             people = conn.execute("SELECT COUNT(*) AS c FROM people").fetchone()["c"]
             conn.execute("DELETE FROM faces")
             conn.execute("DELETE FROM people")
+            conn.execute("DELETE FROM duplicate_group_members")
+            conn.execute("DELETE FROM duplicate_groups")
             conn.execute("DELETE FROM photos")
+            conn.execute("DELETE FROM duplicate_dirty")
+            conn.execute("DELETE FROM scan_dirs")
             # Commit deletes before VACUUM (cannot VACUUM inside a transaction)
             conn.commit()
             conn.execute("VACUUM")
             conn.commit()
+        _embedding_index_reset()
+        _face_cache_invalidate()
+        try:
+            ANN_INDEX_PATH.unlink(missing_ok=True)
+        except Exception:
+            pass
     except Exception as e:
         log_event("error", rel_path="db_clear", error=str(e))
         return {"ok": False, "error": str(e)}
@@ -7475,10 +11597,11 @@ def api_factory_reset():
         except Exception:
             pass
 
-        # Clear runtime upload queues
+        # Drop queued uploads/AI work (tasks already running finish on their own)
         try:
-            with UPLOAD_PENDING_LOCK:
-                UPLOAD_PENDING_BY_USER.clear()
+            with db_conn() as conn:
+                conn.execute("UPDATE work_queue SET state='cancelled', finished_at=?, updated_at=? WHERE state='queued'", (now_iso(), now_iso()))
+                conn.commit()
         except Exception:
             pass
 
@@ -7497,7 +11620,7 @@ def api_factory_reset():
         share_folders_deleted = 0
         login_audit_deleted = 0
         try:
-            with closing(get_conn()) as conn:
+            with db_conn() as conn:
                 try:
                     row = conn.execute("SELECT COUNT(*) AS c FROM geo_cache").fetchone()
                     geo_deleted = int(row["c"]) if row else 0
@@ -7579,25 +11702,75 @@ def api_photos():
     _, user_lang = _current_user_pref_languages()
     search_language = _normalize_language(requested_lang, user_lang)
 
-    items = query_photos(view, sort, folder=folder)
-    if q:
-        items = [p for p in items if matches_search(p, q, search_language=search_language)]
-    items = _filter_public_items_by_current_user_acl(items)
+    fts_match = _fts_match_query(q, search_language) if q else None
+    fields = _parse_photo_fields(request.args.get("fields"))
+    # The Python search fallback needs the searchable columns too; the
+    # response is trimmed to the requested fields afterwards.
+    query_fields = (fields | _PHOTO_SEARCH_FIELDS) if (fields is not None and q and fts_match is None) else fields
+    acl = _current_user_acl_sql()
+    limit_raw = request.args.get("limit")
+    if not limit_raw:
+        # Legacy: full list in one response (slim projection)
+        items = query_photos(view, sort, folder=folder, fts_match=fts_match, slim=True, fields=query_fields, acl=acl)
+        if q and fts_match is None:
+            items = [p for p in items if matches_search(p, q, search_language=search_language)]
+        items = _project_photo_fields(items, fields)
+        return jsonify({
+            "items": items,
+            "count": len(items),
+            "query": q,
+            "view": view,
+            "sort": sort,
+            "folder": folder,
+            "search_lang": search_language,
+        })
+
+    try:
+        limit = max(1, min(PHOTOS_PAGE_MAX_LIMIT, int(limit_raw)))
+    except Exception:
+        return jsonify({"ok": False, "error": "Ugyldig limit"}), 400
+    cursor_raw = request.args.get("cursor")
+    after = _decode_photos_cursor(cursor_raw)
+    if cursor_raw and after is None:
+        return jsonify({"ok": False, "error": "Ugyldig cursor"}), 400
+
+    # The non-FTS search fallback filters in Python, so keep reading keyset
+    # batches until the page is full or the result set is exhausted.
+    batch_size = max(limit * 2, 200)
+    items: list[Dict[str, Any]] = []
+    last_key: Optional[Tuple[Any, int]] = None
+    has_more = False
+    while True:
+        batch = query_photos(view, sort, folder=folder, fts_match=fts_match, limit=batch_size, after=after, slim=True, fields=query_fields, acl=acl)
+        for idx, p in enumerate(batch):
+            last_key = (p.pop("_sort_key", None), int(p["id"]))
+            if q and fts_match is None and not matches_search(p, q, search_language=search_language):
+                continue
+            items.append(p)
+            if len(items) >= limit:
+                has_more = idx < len(batch) - 1 or len(batch) >= batch_size
+                break
+        if len(items) >= limit or len(batch) < batch_size:
+            break
+        after = last_key
 
     return jsonify({
-        "items": items,
+        "items": _project_photo_fields(items, fields),
         "count": len(items),
         "query": q,
         "view": view,
         "sort": sort,
         "folder": folder,
         "search_lang": search_language,
+        "limit": limit,
+        "has_more": has_more,
+        "next_cursor": _encode_photos_cursor(*last_key) if has_more and last_key else None,
     })
 
 
 @app.route("/api/photos/<int:photo_id>")
 def api_photo_detail(photo_id: int):
-    with closing(get_conn()) as conn:
+    with db_conn() as conn:
         row = conn.execute("SELECT * FROM photos WHERE id = ?", (photo_id,)).fetchone()
     if not row:
         return jsonify({"ok": False, "error": "Not found"}), 404
@@ -7622,7 +11795,7 @@ def api_update_captured_at(photo_id: int):
         except Exception:
             return jsonify({"ok": False, "error": "Invalid date format"}), 400
         iso = dt.isoformat(timespec="seconds")
-        with closing(get_conn()) as conn:
+        with db_conn() as conn:
             # Update DB
             conn.execute("UPDATE photos SET captured_at=? WHERE id=?", (iso, photo_id))
             row = conn.execute("SELECT rel_path FROM photos WHERE id=?", (photo_id,)).fetchone()
@@ -7641,7 +11814,7 @@ def api_update_captured_at(photo_id: int):
                     os.utime(fpath, (ts, ts))
         except Exception:
             pass
-        with closing(get_conn()) as conn:
+        with db_conn() as conn:
             row = conn.execute("SELECT * FROM photos WHERE id=?", (photo_id,)).fetchone()
         return jsonify({"ok": True, "item": row_to_public(row)})
     except Exception as e:
@@ -7664,7 +11837,7 @@ def api_update_gps(photo_id: int):
             return jsonify({"ok": False, "error": "Invalid coordinates"}), 400
         country, city = reverse_geocode_with_cache(lat_f, lon_f)
         name = ", ".join([x for x in [city, country] if x]) if (country or city) else None
-        with closing(get_conn()) as conn:
+        with db_conn() as conn:
             # Update columns + metadata_json.geo
             row0 = conn.execute("SELECT metadata_json FROM photos WHERE id=?", (photo_id,)).fetchone()
             mj = {}
@@ -7689,7 +11862,7 @@ def api_update_gps(photo_id: int):
 
 @app.route("/api/photos/<int:photo_id>/favorite", methods=["POST"])
 def api_toggle_favorite(photo_id: int):
-    with closing(get_conn()) as conn:
+    with db_conn() as conn:
         row = conn.execute("SELECT favorite FROM photos WHERE id = ?", (photo_id,)).fetchone()
         if not row:
             return jsonify({"ok": False, "error": "Not found"}), 404
@@ -7711,7 +11884,7 @@ def api_delete_photos():
         if not ids:
             return jsonify({"ok": False, "error": "Ingen billeder valgt"}), 400
         allowed: list[int] = []
-        with closing(get_conn()) as conn:
+        with db_conn() as conn:
             ph = ",".join(["?"] * len(ids))
             rows = conn.execute(f"SELECT id, rel_path FROM photos WHERE id IN ({ph})", ids).fetchall()
             for r in rows:
@@ -7729,9 +11902,9 @@ def api_delete_photos():
 
 @app.route("/api/filters")
 def api_filters():
-    with closing(get_conn()) as conn:
-        acl_prefixes = _current_user_acl_prefixes(conn)
-        if acl_prefixes is None:
+    with db_conn() as conn:
+        acl = _current_user_acl_sql(conn, owned=False)
+        if acl is None:
             total = conn.execute("SELECT COUNT(*) AS c FROM photos").fetchone()["c"]
             favorites = conn.execute("SELECT COUNT(*) AS c FROM photos WHERE favorite = 1").fetchone()["c"]
             places = conn.execute("SELECT COUNT(*) AS c FROM photos WHERE gps_lat IS NOT NULL OR gps_name IS NOT NULL").fetchone()["c"]
@@ -7739,12 +11912,7 @@ def api_filters():
                 "SELECT DISTINCT camera_model FROM photos WHERE camera_model IS NOT NULL AND camera_model != '' ORDER BY camera_model"
             ).fetchall()]
         else:
-            conds = []
-            params: list[Any] = []
-            for pref in acl_prefixes:
-                conds.append("(rel_path=? OR rel_path LIKE ?)")
-                params.extend([pref, pref + "/%"])
-            acl_where = " OR ".join(conds) if conds else "0=1"
+            acl_where, params = acl
             total = conn.execute(f"SELECT COUNT(*) AS c FROM photos WHERE ({acl_where})", params).fetchone()["c"]
             favorites = conn.execute(f"SELECT COUNT(*) AS c FROM photos WHERE favorite = 1 AND ({acl_where})", params).fetchone()["c"]
             places = conn.execute(f"SELECT COUNT(*) AS c FROM photos WHERE (gps_lat IS NOT NULL OR gps_name IS NOT NULL) AND ({acl_where})", params).fetchone()["c"]
@@ -7783,7 +11951,7 @@ def _cleanup_orphan_thumbs(dry_run: bool = False) -> dict:
     Returns {removed, bytes_freed}.
     """
     used: set[str] = set()
-    with closing(get_conn()) as conn:
+    with db_conn() as conn:
         rows = conn.execute("SELECT thumb_name FROM photos WHERE thumb_name IS NOT NULL").fetchall()
         for r in rows:
             tn = str(r["thumb_name"] or "").strip()
@@ -7835,7 +12003,7 @@ def api_thumbs_cleanup():
     res = _cleanup_orphan_thumbs(dry_run=dry)
     return jsonify({"ok": True, **res, "dry_run": dry})
 def api_thumbs(thumb_name: str):
-    with closing(get_conn()) as conn:
+    with db_conn() as conn:
         row = conn.execute("SELECT rel_path FROM photos WHERE thumb_name=? LIMIT 1", (thumb_name,)).fetchone()
     if row and not _is_rel_path_allowed_for_current_user(row["rel_path"]):
         return ("Forbidden", 403)
@@ -7976,7 +12144,7 @@ def api_photo_download(photo_id: int):
     if available, otherwise falls back to the original.
     """
     mode = str(request.args.get("mode") or "converted").strip().lower()
-    with closing(get_conn()) as conn:
+    with db_conn() as conn:
         row = conn.execute("SELECT * FROM photos WHERE id=?", (photo_id,)).fetchone()
     if not row:
         return ("Not found", 404)
@@ -8011,7 +12179,7 @@ def api_photos_download_zip():
     if not ids:
         return jsonify({"ok": False, "error": "Ingen gyldige billeder valgt"}), 400
 
-    with closing(get_conn()) as conn:
+    with db_conn() as conn:
         rows = conn.execute(
             f"SELECT * FROM photos WHERE id IN ({','.join(['?']*len(ids))})",
             tuple(ids),
@@ -8062,7 +12230,7 @@ def api_photos_download_zip():
 
 @app.route("/api/debug/sample")
 def api_debug_sample():
-    with closing(get_conn()) as conn:
+    with db_conn() as conn:
         row = conn.execute("SELECT * FROM photos ORDER BY id DESC LIMIT 1").fetchone()
     return jsonify(row_to_public(row) if row else {"empty": True})
 
@@ -8198,9 +12366,11 @@ def api_settings_upload_folder():
     # Record folder owner for access control (owner and admins can always see; others need explicit ACL)
     try:
         owner_path = f"uploads/{new_subdir}" if destination == UPLOAD_DEST_UPLOADS else new_subdir
-        with closing(get_conn()) as conn:
+        with db_conn() as conn:
             conn.execute("INSERT OR REPLACE INTO folder_owners(folder_path, user_id) VALUES (?,?)", (owner_path, int(getattr(current_user, 'id', 0) or 0)))
+            _bump_acl_generation(conn)
             conn.commit()
+        _acl_after_write()
     except Exception:
         pass
     payload = _upload_settings_payload(destination)
@@ -8342,7 +12512,7 @@ def api_settings_upload_folder_delete():
         rel_prefixes.extend([f"uploads/{d}" for d in cleanup_folders])
     removed = _delete_indexed_photos_for_prefixes(rel_prefixes)
     try:
-        with closing(get_conn()) as conn:
+        with db_conn() as conn:
             for folder in cleanup_folders:
                 conn.execute(
                     "DELETE FROM folder_previews WHERE folder_path=? OR folder_path LIKE ?",
@@ -8461,7 +12631,7 @@ def _convert_existing_heic(stop_event=None) -> Dict[str, Any]:
     processed = 0
     errors = 0
     # HEIC/HEIF only in this function
-    with closing(get_conn()) as conn:
+    with db_conn() as conn:
         rows = conn.execute("SELECT rel_path, uploaded_by FROM photos WHERE LOWER(rel_path) LIKE '%.heic' OR LOWER(rel_path) LIKE '%.heif'").fetchall()
     # initialize global progress snapshot
     try:
@@ -8553,7 +12723,7 @@ def _convert_existing_heic(stop_event=None) -> Dict[str, Any]:
                 meta["uploaded_by"] = str(up_by)
             upsert_photo(meta)
             try:
-                with closing(get_conn()) as conn2:
+                with db_conn() as conn2:
                     conn2.execute("DELETE FROM photos WHERE rel_path=?", (orig_rel,))
                     conn2.commit()
             except Exception:
@@ -8631,7 +12801,7 @@ def _convert_existing_raw(stop_event=None) -> Dict[str, Any]:
     errors = 0
     patterns = [f"%{ext.lower()}" for ext in RAW_EXTS]
     where = " OR ".join(["LOWER(rel_path) LIKE ?" for _ in patterns])
-    with closing(get_conn()) as conn:
+    with db_conn() as conn:
         rows = conn.execute(f"SELECT rel_path, uploaded_by FROM photos WHERE {where}", tuple(patterns)).fetchall()
     global raw_convert_progress
     try:
@@ -8709,7 +12879,7 @@ def _convert_existing_raw(stop_event=None) -> Dict[str, Any]:
                 meta["uploaded_by"] = str(up_by)
             upsert_photo(meta)
             try:
-                with closing(get_conn()) as conn2:
+                with db_conn() as conn2:
                     conn2.execute("DELETE FROM photos WHERE rel_path=?", (orig_rel,))
                     conn2.commit()
             except Exception:
@@ -9086,6 +13256,8 @@ def api_upload():
                     client_meta[n] = lm
     except Exception:
         client_meta = {}
+    # Per-photo AI work is queued once for the whole request (one transaction per kind)
+    indexed_rels: list[str] = []
     for f in files:
         try:
             name = secure_filename(f.filename or "")
@@ -9124,30 +13296,7 @@ def api_upload():
                 upsert_photo(meta)
                 try: log_event("upload_indexed", rel_path=rel, width=meta.get("width"), height=meta.get("height"), has_gps=bool(meta.get("gps_lat") and meta.get("gps_lon")))
                 except Exception: pass
-                if ai_auto_ingest_enabled():
-                    try:
-                        threading.Thread(target=_embed_uploaded_photo_if_needed, args=(rel,), daemon=True).start()
-                        try: log_event("ai_embed_queued", rel_path=rel)
-                        except Exception: pass
-                    except Exception as e:
-                        try: log_event("error", rel_path=rel, error=f"ai_embed_queue: {e}")
-                        except Exception: pass
-                if ai_desc_auto_ingest_enabled():
-                    try:
-                        threading.Thread(target=_describe_uploaded_photo_if_needed, args=(rel,), daemon=True).start()
-                        try: log_event("ai_desc_queued", rel_path=rel)
-                        except Exception: pass
-                    except Exception as e:
-                        try: log_event("error", rel_path=rel, error=f"ai_desc_queue: {e}")
-                        except Exception: pass
-                if faces_auto_index_enabled():
-                    try:
-                        threading.Thread(target=index_faces_for_photo, args=(rel,), daemon=True).start()
-                        try: log_event("faces_queued", rel_path=rel)
-                        except Exception: pass
-                    except Exception as e:
-                        try: log_event("error", rel_path=rel, error=f"faces_queue: {e}")
-                        except Exception: pass
+                indexed_rels.append(rel)
             except Exception as e:
                 errors.append(f"Index fail: {target.name}: {e}")
                 try: log_event("error", filename=target.name, rel_path=rel, error=str(e))
@@ -9157,6 +13306,12 @@ def api_upload():
             errors.append(str(e))
             try: log_event("error", filename=(f.filename if f else None), error=str(e))
             except Exception: pass
+    if indexed_rels:
+        try:
+            _work_enqueue_follow_up(indexed_rels)
+        except Exception as e:
+            try: log_event("error", error=f"follow_up_queue: {e}")
+            except Exception: pass
     try:
         log_event("upload_done", saved=len(saved), errors=len(errors))
     except Exception:
@@ -9168,27 +13323,20 @@ def api_upload():
 @login_required
 def api_upload_postprocess():
     uploaded_by = str(getattr(current_user, "username", "") or "")
-    rels = _pop_uploaded_rels(uploaded_by)
+    pending_count = _upload_pending_count(uploaded_by)
 
     if _is_upload_postprocess_running(uploaded_by):
-        for rel in rels:
-            _queue_uploaded_rel(uploaded_by, rel)
-        with UPLOAD_PENDING_LOCK:
-            pending_count = len(UPLOAD_PENDING_BY_USER.get((uploaded_by or "").strip() or "__unknown__", []))
         return jsonify({"ok": True, "started": False, "running": True, "pending": pending_count})
 
-    if not rels:
+    if not pending_count:
         state = _get_upload_postprocess_state(uploaded_by)
         if state:
-            with UPLOAD_PENDING_LOCK:
-                pending_count = len(UPLOAD_PENDING_BY_USER.get((uploaded_by or "").strip() or "__unknown__", []))
-            return jsonify({"ok": True, "started": False, "running": bool(state.get("running")), "pending": pending_count, "result": state.get("result"), "error": state.get("error")})
-        return jsonify({"ok": True, "started": False, "running": False, "pending": 0, "result": {"ok": True, "received": 0, "indexed": 0, "index_errors": 0, "faces_enabled": faces_auto_index_enabled(), "faces_done": 0, "faces_errors": 0, "ai_enabled": ai_auto_ingest_enabled(), "ai_done": 0, "ai_errors": 0, "ai_desc_enabled": ai_desc_auto_ingest_enabled(), "ai_desc_done": 0, "ai_desc_errors": 0}})
+            return jsonify({"ok": True, "started": False, "running": bool(state.get("running")), "pending": 0, "result": state.get("result"), "error": state.get("error")})
+        return jsonify({"ok": True, "started": False, "running": False, "pending": 0, "result": {"ok": True, "received": 0, "indexed": 0, "index_errors": 0, "faces_enabled": faces_auto_index_enabled(), "faces_queued": 0, "ai_enabled": ai_auto_ingest_enabled(), "ai_queued": 0, "ai_desc_enabled": ai_desc_auto_ingest_enabled(), "ai_desc_queued": 0}})
 
-    threading.Thread(target=_upload_postprocess_worker, args=(uploaded_by, rels), daemon=True).start()
-    with UPLOAD_PENDING_LOCK:
-        pending_count = len(UPLOAD_PENDING_BY_USER.get((uploaded_by or "").strip() or "__unknown__", []))
-    return jsonify({"ok": True, "started": True, "running": True, "pending": pending_count, "queued": len(rels)})
+    # Already queued by the uploads themselves; make sure a worker picks it up
+    _ensure_upload_postprocess_running(uploaded_by)
+    return jsonify({"ok": True, "started": True, "running": True, "pending": pending_count, "queued": pending_count})
 
 
 @app.route("/api/upload/postprocess/status")
@@ -9196,8 +13344,7 @@ def api_upload_postprocess():
 def api_upload_postprocess_status():
     uploaded_by = str(getattr(current_user, "username", "") or "")
     state = _get_upload_postprocess_state(uploaded_by)
-    with UPLOAD_PENDING_LOCK:
-        pending_count = len(UPLOAD_PENDING_BY_USER.get((uploaded_by or "").strip() or "__unknown__", []))
+    pending_count = _upload_pending_count(uploaded_by)
     if not state:
         return jsonify({"ok": True, "running": False, "pending": pending_count, "result": None, "error": None, "phase": None, "current_rel": None, "stage_processed": 0, "stage_total": 0})
     return jsonify(
@@ -9234,7 +13381,7 @@ def login():
     if request.method == "POST":
         username = (request.form.get("username") or "").strip()
         password = request.form.get("password") or ""
-        with closing(get_conn()) as conn:
+        with db_conn() as conn:
             row = conn.execute(
                 "SELECT id, username, password_hash, is_admin, role, totp_enabled, totp_secret, totp_setup_done, totp_remember_days FROM users WHERE username=?",
                 (username,),
@@ -9290,7 +13437,7 @@ def verify_2fa():
         return redirect(url_for("login"))
     if request.method == "POST":
         code = (request.form.get("code") or "").strip()
-        with closing(get_conn()) as conn:
+        with db_conn() as conn:
             row = conn.execute("SELECT id, username, is_admin, role, totp_secret, totp_remember_days FROM users WHERE id= ?", (uid,)).fetchone()
         if not row or not row["totp_secret"]:
             return redirect(url_for("login"))
@@ -9301,7 +13448,7 @@ def verify_2fa():
             resp = redirect(request.args.get("next") or url_for("index"))
             login_user(user)
             # mark that initial setup is completed
-            with closing(get_conn()) as conn:
+            with db_conn() as conn:
                 conn.execute("UPDATE users SET totp_setup_done=1 WHERE id=?", (current_user.id,))
                 conn.commit()
             session.pop("2fa_user_id", None)
@@ -9322,7 +13469,7 @@ def verify_2fa():
 @login_required
 def setup_2fa():
     # Generate secret if missing
-    with closing(get_conn()) as conn:
+    with db_conn() as conn:
         row = conn.execute(
             "SELECT totp_secret, totp_enabled, totp_remember_days FROM users WHERE id=?",
             (current_user.id,),
@@ -9330,7 +13477,7 @@ def setup_2fa():
     secret = row["totp_secret"] if row else None
     if not secret:
         secret = pyotp.random_base32()
-        with closing(get_conn()) as conn:
+        with db_conn() as conn:
             conn.execute("UPDATE users SET totp_secret=? WHERE id=?", (secret, current_user.id))
             conn.commit()
     enabled_flag = int(row["totp_enabled"] or 0) if row else 0
@@ -9356,7 +13503,7 @@ def setup_2fa():
                 if action != "save":
                     return render_template("2fa_setup.html", qrcode_url=data_url, secret=None, enabled=row["totp_enabled"], error=_ui_text("invalid_code"), remember_days=rdays)
         if action == "disable":
-            with closing(get_conn()) as conn:
+            with db_conn() as conn:
                 conn.execute("UPDATE users SET totp_enabled=0 WHERE id=?", (current_user.id,))
                 conn.commit()
             rdays = int(row["totp_remember_days"] or 0) if row else 0
@@ -9376,7 +13523,7 @@ def setup_2fa():
             if needs_code and not pyotp.TOTP(secret).verify(code, valid_window=1):
                 return render_template("2fa_setup.html", qrcode_url=(data_url if enabled_flag == 0 else None), secret=(secret if enabled_flag == 0 else None), enabled=cur_enabled, error=_ui_text("invalid_code"), remember_days=cur_days)
             enabled_after = cur_enabled
-            with closing(get_conn()) as conn:
+            with db_conn() as conn:
                 if disable and cur_enabled == 1:
                     conn.execute("UPDATE users SET totp_enabled=0 WHERE id=?", (current_user.id,))
                     enabled_after = 0
@@ -9397,7 +13544,7 @@ def setup_2fa():
                 days = max(0, min(30, int(request.form.get("days") or 0)))
             except ValueError:
                 days = 0
-            with closing(get_conn()) as conn:
+            with db_conn() as conn:
                 conn.execute("UPDATE users SET totp_remember_days=? WHERE id=?", (days, current_user.id))
                 conn.commit()
             # Set/refresh trusted-device cookie immediately after successful verification
@@ -9415,7 +13562,7 @@ def setup_2fa():
                 days = max(0, min(30, int(request.form.get("days") or 0)))
             except ValueError:
                 days = 0
-            with closing(get_conn()) as conn:
+            with db_conn() as conn:
                 conn.execute("UPDATE users SET totp_enabled=1, totp_setup_done=1, totp_remember_days=? WHERE id=?", (days, current_user.id))
                 conn.commit()
             resp = make_response(render_template("2fa_setup.html", qrcode_url=None, secret=None, enabled=True, ok=True, remember_days=days))
@@ -9447,7 +13594,7 @@ def admin_users():
                 role = "user"
             if u and p:
                 try:
-                    with closing(get_conn()) as conn:
+                    with db_conn() as conn:
                         conn.execute(
                             "INSERT INTO users(username, password_hash, is_admin, role, totp_enabled, totp_setup_done, created_at) VALUES (?,?,?,?,?,?,?)",
                             (u, generate_password_hash(p), 1 if role == "admin" else 0, role, enforce_2fa, 0, now_iso()),
@@ -9466,7 +13613,7 @@ def admin_users():
                     msg = _ui_text("admin_cannot_delete_self")
                 else:
                     try:
-                        with closing(get_conn()) as conn:
+                        with db_conn() as conn:
                             row = conn.execute("SELECT role FROM users WHERE id=?", (uid,)).fetchone()
                             if not row:
                                 msg = _ui_text("admin_user_not_found")
@@ -9478,15 +13625,17 @@ def admin_users():
                                         msg = _ui_text("admin_cannot_delete_last_admin")
                                     else:
                                         conn.execute("DELETE FROM users WHERE id=?", (uid,))
+                                        _bump_acl_generation(conn)
                                         conn.commit()
                                         msg = _ui_text("admin_user_deleted")
                                 else:
                                     conn.execute("DELETE FROM users WHERE id=?", (uid,))
+                                    _bump_acl_generation(conn)
                                     conn.commit()
                                     msg = _ui_text("admin_user_deleted")
                     except Exception as e:
                         msg = f"{_ui_text('error_prefix')} {e}"
-    with closing(get_conn()) as conn:
+    with db_conn() as conn:
         users = conn.execute("SELECT id, username, is_admin, role, totp_enabled, created_at FROM users ORDER BY id").fetchall()
     return render_template("admin_users.html", users=users, msg=msg)
 
@@ -9498,7 +13647,7 @@ def api_admin_users():
     if not getattr(current_user, "is_admin", False):
         return jsonify({"ok": False, "error": "Forbidden"}), 403
     if request.method == "GET":
-        with closing(get_conn()) as conn:
+        with db_conn() as conn:
             rows = conn.execute("SELECT id, username, role, is_admin, totp_enabled, ui_language, search_language, created_at FROM users ORDER BY id").fetchall()
             all_folders = _list_all_photo_folders(conn)
             # Be robust across older DBs that may miss the 'permission' column
@@ -9581,7 +13730,7 @@ def api_admin_users():
     if not u or not p:
         return jsonify({"ok": False, "error": "username_password_required"}), 400
     try:
-        with closing(get_conn()) as conn:
+        with db_conn() as conn:
             cur = conn.execute(
                 "INSERT INTO users(username, password_hash, is_admin, role, ui_language, search_language, created_at) VALUES (?,?,?,?,?,?,?)",
                 (u, generate_password_hash(p), 1 if role == "admin" else 0, role, ui_language, search_language, now_iso()),
@@ -9602,6 +13751,7 @@ def api_admin_users():
                 pass
             _set_user_allowed_folders(conn, uid, allowed_folders)
             conn.commit()
+        _acl_after_write()
         return jsonify({"ok": True})
     except Exception as e:
         return jsonify({"ok": False, "error": str(e)}), 400
@@ -9614,7 +13764,7 @@ def api_admin_shares_list():
         return jsonify({"ok": False, "error": "Forbidden"}), 403
 
     include_inactive = request.args.get("include_inactive") in {"1", "true", "True"}
-    with closing(get_conn()) as conn:
+    with db_conn() as conn:
         rows = conn.execute(
             """
              SELECT s.id, s.share_name, s.folder_path, s.can_upload, s.can_delete, s.password_hash,
@@ -9707,7 +13857,7 @@ def api_admin_shares_revoke(share_id: int):
     if not getattr(current_user, "is_admin", False):
         return jsonify({"ok": False, "error": "Forbidden"}), 403
 
-    with closing(get_conn()) as conn:
+    with db_conn() as conn:
         row = conn.execute("SELECT id, revoked FROM share_links WHERE id=?", (int(share_id),)).fetchone()
         if not row:
             return jsonify({"ok": False, "error": "Share-link findes ikke"}), 404
@@ -9738,7 +13888,7 @@ def api_admin_shares_extend(share_id: int):
     expires_hours = max(1, min(expires_hours, 24 * 365))
     expires_at = (datetime.utcnow() + timedelta(hours=expires_hours)).isoformat(timespec="seconds") + "Z"
 
-    with closing(get_conn()) as conn:
+    with db_conn() as conn:
         row = conn.execute("SELECT id, revoked FROM share_links WHERE id=?", (int(share_id),)).fetchone()
         if not row:
             return jsonify({"ok": False, "error": "Share-link findes ikke"}), 404
@@ -9770,7 +13920,7 @@ def api_admin_shares_activate(share_id: int):
     expires_hours = max(1, min(expires_hours, 24 * 365))
     expires_at = (datetime.utcnow() + timedelta(hours=expires_hours)).isoformat(timespec="seconds") + "Z"
 
-    with closing(get_conn()) as conn:
+    with db_conn() as conn:
         row = conn.execute("SELECT id FROM share_links WHERE id=?", (int(share_id),)).fetchone()
         if not row:
             return jsonify({"ok": False, "error": "Share-link findes ikke"}), 404
@@ -9786,7 +13936,7 @@ def api_admin_shares_delete(share_id: int):
     if not getattr(current_user, "is_admin", False):
         return jsonify({"ok": False, "error": "Forbidden"}), 403
 
-    with closing(get_conn()) as conn:
+    with db_conn() as conn:
         row = conn.execute("SELECT id FROM share_links WHERE id=?", (int(share_id),)).fetchone()
         if not row:
             return jsonify({"ok": False, "error": "Share-link findes ikke"}), 404
@@ -9819,7 +13969,7 @@ def api_admin_users_delete(uid: int):
         if not new_username:
             return jsonify({"ok": False, "error": "username_required"}), 400
         try:
-            with closing(get_conn()) as conn:
+            with db_conn() as conn:
                 row = conn.execute("SELECT id, role FROM users WHERE id=?", (uid,)).fetchone()
                 if not row:
                     return jsonify({"ok": False, "error": "not_found"}), 404
@@ -9860,6 +14010,7 @@ def api_admin_users_delete(uid: int):
                 if allowed_folders is not None:
                     _set_user_allowed_folders(conn, uid, allowed_folders)
                 conn.commit()
+            _acl_after_write()
             return jsonify({"ok": True})
         except sqlite3.IntegrityError:
             return jsonify({"ok": False, "error": "username_exists"}), 409
@@ -9869,7 +14020,7 @@ def api_admin_users_delete(uid: int):
     if str(uid) == str(current_user.id):
         return jsonify({"ok": False, "error": "cannot_delete_self"}), 400
     try:
-        with closing(get_conn()) as conn:
+        with db_conn() as conn:
             row = conn.execute("SELECT role FROM users WHERE id=?", (uid,)).fetchone()
             if not row:
                 return jsonify({"ok": False, "error": "not_found"}), 404
@@ -9880,7 +14031,9 @@ def api_admin_users_delete(uid: int):
                     return jsonify({"ok": False, "error": "last_admin"}), 400
             conn.execute("DELETE FROM user_folder_access WHERE user_id=?", (uid,))
             conn.execute("DELETE FROM users WHERE id=?", (uid,))
+            _bump_acl_generation(conn)
             conn.commit()
+        _acl_after_write()
         return jsonify({"ok": True})
     except Exception as e:
         return jsonify({"ok": False, "error": str(e)}), 400
@@ -9896,7 +14049,7 @@ def api_admin_user_folders(uid: int):
     if not isinstance(raw_allowed, list):
         return jsonify({"ok": False, "error": "invalid_allowed_folders"}), 400
     try:
-        with closing(get_conn()) as conn:
+        with db_conn() as conn:
             row = conn.execute("SELECT id FROM users WHERE id=?", (uid,)).fetchone()
             if not row:
                 return jsonify({"ok": False, "error": "not_found"}), 404
@@ -9909,6 +14062,7 @@ def api_admin_user_folders(uid: int):
                 pass
             reduced = _set_user_allowed_folders(conn, uid, raw_allowed)
             conn.commit()
+        _acl_after_write()
         return jsonify({"ok": True, "allowed_folders": reduced})
     except Exception as e:
         return jsonify({"ok": False, "error": str(e)}), 400
@@ -9918,7 +14072,7 @@ def api_admin_user_folders(uid: int):
 @login_required
 def api_me():
     try:
-        with closing(get_conn()) as conn:
+        with db_conn() as conn:
             try:
                 row = conn.execute(
                     "SELECT id, username, role, ui_language, search_language, theme_mode FROM users WHERE id=?",
@@ -9968,7 +14122,7 @@ def api_me_profile():
         return jsonify({"ok": False, "error": "username_required"}), 400
 
     try:
-        with closing(get_conn()) as conn:
+        with db_conn() as conn:
             try:
                 if new_password:
                     conn.execute(
@@ -10041,7 +14195,7 @@ def api_me_profile():
 @login_required
 def api_me_2fa():
     # fetch current state
-    with closing(get_conn()) as conn:
+    with db_conn() as conn:
         row = conn.execute(
             "SELECT totp_secret, totp_enabled, totp_remember_days FROM users WHERE id=?",
             (current_user.id,),
@@ -10057,7 +14211,7 @@ def api_me_2fa():
         if not enabled:
             if not secret:
                 secret = pyotp.random_base32()
-                with closing(get_conn()) as conn:
+                with db_conn() as conn:
                     conn.execute("UPDATE users SET totp_secret=? WHERE id=?", (secret, current_user.id))
                     conn.commit()
             issuer = "FjordLens"
@@ -10083,7 +14237,7 @@ def api_me_2fa():
     code = (data.get("code") or "").strip()
     days = int(data.get("days") or 0)
 
-    with closing(get_conn()) as conn:
+    with db_conn() as conn:
         row = conn.execute(
             "SELECT totp_secret, totp_enabled, totp_remember_days FROM users WHERE id=?",
             (current_user.id,),
@@ -10091,7 +14245,7 @@ def api_me_2fa():
     secret = row["totp_secret"] if row else None
     if not secret:
         secret = pyotp.random_base32()
-        with closing(get_conn()) as conn:
+        with db_conn() as conn:
             conn.execute("UPDATE users SET totp_secret=? WHERE id=?", (secret, current_user.id))
             conn.commit()
 
@@ -10101,7 +14255,7 @@ def api_me_2fa():
             if not pyotp.TOTP(secret).verify(code, valid_window=1):
                 return jsonify({"ok": False, "error": "invalid_code"}), 400
         secret = pyotp.random_base32()
-        with closing(get_conn()) as conn:
+        with db_conn() as conn:
             conn.execute("UPDATE users SET totp_secret=?, totp_enabled=0, totp_setup_done=0 WHERE id=?", (secret, current_user.id))
             conn.commit()
         issuer = "FjordLens"
@@ -10116,7 +14270,7 @@ def api_me_2fa():
     if action in {"enable", "disable", "remember", "save"}:
         if not pyotp.TOTP(secret).verify(code, valid_window=1):
             return jsonify({"ok": False, "error": "invalid_code"}), 400
-        with closing(get_conn()) as conn:
+        with db_conn() as conn:
             if action == "disable":
                 conn.execute("UPDATE users SET totp_enabled=0 WHERE id=?", (current_user.id,))
             elif action in {"enable", "save", "remember"}:
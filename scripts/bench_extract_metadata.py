@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""Time extract_metadata() on camera-sized JPEGs.
+
+Writes BENCH_N (default 12) synthetic 4000x3000 JPEGs with EXIF and GPS
+into PHOTO_DIR, warms up once, then reports CPU and wall time per file for
+metadata, pHash and thumbnail extraction (reverse geocoding off).
+
+Run from the repo root:
+
+    python scripts/bench_extract_metadata.py
+
+Uses a throwaway DATA_DIR/PHOTO_DIR unless they are set. The script
+imports app.py from its parent directory, so to compare with an older
+revision copy it into a worktree of that revision and run it there:
+
+    git worktree add /tmp/before <rev>
+    mkdir -p /tmp/before/scripts
+    cp scripts/bench_extract_metadata.py /tmp/before/scripts/
+    python /tmp/before/scripts/bench_extract_metadata.py
+
+Needs piexif to write the test files.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+
+def make_files(lib: Path, n: int) -> None:
+    import numpy as np
+    import piexif
+    from PIL import Image
+
+    lib.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(1)
+    for i in range(n):
+        p = lib / f"IMG_{i:04d}.jpg"
+        if p.exists():
+            continue
+        # Upscaled noise gives smooth, photo-like content and a realistic JPEG size
+        base = rng.integers(0, 255, (60, 80, 3), dtype=np.uint8)
+        img = Image.fromarray(base).resize((4000, 3000), Image.BICUBIC)
+        exif = piexif.dump({
+            "0th": {
+                piexif.ImageIFD.Make: b"Canon",
+                piexif.ImageIFD.Model: b"EOS R6",
+                piexif.ImageIFD.Orientation: 6 if i % 2 else 1,
+            },
+            "Exif": {
+                piexif.ExifIFD.DateTimeOriginal: b"2023:05:01 12:00:00",
+                piexif.ExifIFD.FNumber: (28, 10),
+            },
+            "GPS": {
+                piexif.GPSIFD.GPSLatitudeRef: b"N",
+                piexif.GPSIFD.GPSLatitude: ((55, 1), (40, 1), (0, 1)),
+                piexif.GPSIFD.GPSLongitudeRef: b"E",
+                piexif.GPSIFD.GPSLongitude: ((12, 1), (34, 1), (0, 1)),
+            },
+        })
+        img.save(p, format="JPEG", quality=90, exif=exif)
+
+
+def main():
+    if "DATA_DIR" not in os.environ:
+        tmp = tempfile.mkdtemp(prefix="fjordlens-bench-")
+        os.environ["DATA_DIR"] = tmp
+        os.environ.setdefault("PHOTO_DIR", str(Path(tmp) / "library"))
+    os.environ.setdefault("PHOTO_DIR", str(Path(os.environ["DATA_DIR"]) / "library"))
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+    lib = Path(os.environ["PHOTO_DIR"])
+    n = int(os.environ.get("BENCH_N", "12"))
+    make_files(lib, n)
+
+    import app
+
+    files = sorted(lib.glob("IMG_*.jpg"))[:n]
+    app.extract_metadata(files[0], files[0].name, geocode=False)  # warm imports
+    shutil.rmtree(app.THUMB_DIR, ignore_errors=True)
+    app.THUMB_DIR.mkdir(parents=True, exist_ok=True)
+
+    cpu0 = time.process_time()
+    wall0 = time.perf_counter()
+    metas = [app.extract_metadata(f, f.name, geocode=False) for f in files]
+    cpu = time.process_time() - cpu0
+    wall = time.perf_counter() - wall0
+
+    print(f"files={n} cpu_per_file_ms={cpu / n * 1000:.1f} wall_per_file_ms={wall / n * 1000:.1f}")
+    m = metas[-1]
+    print({k: m.get(k) for k in ("width", "height", "camera_make", "camera_model", "gps_lat", "gps_lon", "captured_at", "phash", "thumb_name")})
+
+
+if __name__ == "__main__":
+    main()
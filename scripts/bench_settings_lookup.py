@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""Time the per-photo settings lookups done by the ingest and face workers.
+
+Compares a fresh sqlite3 connection per lookup (what _get_setting did
+before the settings cache), a pooled db_conn() with one query per lookup,
+and the cached _get_setting snapshot. Each iteration reads the throttle
+and the auto flag, like the workers do once per photo.
+
+Run from the repo root:
+
+    python scripts/bench_settings_lookup.py
+
+Uses a throwaway DATA_DIR unless DATA_DIR is set. BENCH_ITERATIONS
+defaults to 20000.
+"""
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+KEYS = ("ai_ingest_throttle_sec", "ai_auto_ingest")
+
+
+def _bench(label, fn, iterations):
+    fn()
+    t0 = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    us = (time.perf_counter() - t0) / iterations * 1e6
+    print(f"{label:<40} {us:10.1f} us")
+
+
+def main():
+    if "DATA_DIR" not in os.environ:
+        tmp = tempfile.mkdtemp(prefix="fjordlens-bench-")
+        os.environ["DATA_DIR"] = tmp
+        os.environ.setdefault("PHOTO_DIR", str(Path(tmp) / "library"))
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    import sqlite3
+
+    import app
+
+    app.init_db()
+    iterations = int(os.environ.get("BENCH_ITERATIONS", "20000"))
+
+    def new_connection():
+        for key in KEYS:
+            conn = sqlite3.connect(app.DB_PATH)
+            try:
+                conn.execute("SELECT value FROM settings WHERE key=?", (key,)).fetchone()
+            finally:
+                conn.close()
+
+    def pooled_connection():
+        for key in KEYS:
+            with app.db_conn() as conn:
+                conn.execute("SELECT value FROM settings WHERE key=?", (key,)).fetchone()
+
+    def cached_snapshot():
+        for key in KEYS:
+            app._get_setting(key)
+
+    print(f"db={app.DB_PATH} iterations={iterations} (two lookups each)")
+    _bench("new sqlite3 connection per lookup", new_connection, iterations)
+    _bench("pooled connection, one query each", pooled_connection, iterations)
+    _bench("cached snapshot", cached_snapshot, iterations)
+
+
+if __name__ == "__main__":
+    main()
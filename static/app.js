@@ -129,6 +129,7 @@ const els = {
   dupesRun: document.getElementById("dupesRun"),
   dupeDist: document.getElementById("dupeDist"),
   dupeMin: document.getElementById("dupeMin"),
+  dupeMode: document.getElementById("dupeMode"),
   dupeStatus: document.getElementById("dupeStatus"),
   dupeResults: document.getElementById("dupeResults"),
   // viewer
@@ -1349,6 +1350,10 @@ let state = {
   scanning: false,
   selectedIndex: -1,
   folder: null,
+  // timeline paging (keyset cursor from /api/photos)
+  photosCursor: null,
+  photosLoadSeq: 0,
+  photosLoadingMore: 0,
   // logs
   // Default off; enable only for authorized users
   logsRunning: false,
@@ -1946,6 +1951,41 @@ function appendPeopleInChunks(people, chunkSize = 48) {
   step();
 }
 
+// Timeline month groups; the tail is where the next streamed page continues
+let timelineTail = { key: null, wrap: null };
+
+function timelineGroupOf(it) {
+  const d = new Date(it.captured_at || it.modified_fs || it.created_fs || Date.now());
+  const y = d.getFullYear();
+  const m = d.toLocaleString((state.uiLanguage === 'en') ? 'en-GB' : 'da-DK', { month: "long" });
+  return { key: `${y}-${String(d.getMonth()+1).padStart(2,'0')}`, label: `${m} ${y}` };
+}
+
+function appendTimelineGroup(key, label) {
+  const h = document.createElement('div');
+  h.className = 'timeline-header';
+  h.textContent = label;
+  const wrap = document.createElement('div');
+  wrap.className = 'timeline-grid';
+  els.grid.appendChild(h);
+  els.grid.appendChild(wrap);
+  timelineTail = { key, wrap };
+  return wrap;
+}
+
+// Append a streamed page to the rendered timeline without rebuilding it.
+// Pages arrive in sort order, so with date sorting new items either continue
+// the last month group or open a new one below it.
+function appendTimelineItems(items) {
+  if (state.sort !== 'date_desc' && state.sort !== 'date_asc') { renderGrid(); return; }
+  for (const it of items) {
+    const { key, label } = timelineGroupOf(it);
+    const wrap = (timelineTail.key === key && timelineTail.wrap) ? timelineTail.wrap : appendTimelineGroup(key, label);
+    appendCardTo(it, wrap);
+  }
+  renderStats();
+}
+
 function renderGrid() {
   // Toggle fixed-width columns for folder view
   if (els.grid) els.grid.classList.toggle("folders-view", state.view === "mapper");
@@ -2074,11 +2114,7 @@ function renderGrid() {
     }
     const groups = new Map(); // key: YYYY-MM label
     for (const it of items) {
-      const d = new Date(it.captured_at || it.modified_fs || it.created_fs || Date.now());
-      const y = d.getFullYear();
-      const m = d.toLocaleString((state.uiLanguage === 'en') ? 'en-GB' : 'da-DK', { month: "long" });
-      const key = `${y}-${String(d.getMonth()+1).padStart(2,'0')}`;
-      const label = `${m} ${y}`;
+      const { key, label } = timelineGroupOf(it);
       if (!groups.has(key)) groups.set(key, { label, arr: [] });
       groups.get(key).arr.push(it);
     }
@@ -2088,14 +2124,9 @@ function renderGrid() {
       if (a[0] === b[0]) return 0;
       return asc ? (a[0] > b[0] ? 1 : -1) : (a[0] < b[0] ? 1 : -1);
     });
-    for (const [, grp] of ordered) {
-      const h = document.createElement('div');
-      h.className = 'timeline-header';
-      h.textContent = grp.label;
-      const wrap = document.createElement('div');
-      wrap.className = 'timeline-grid';
-      els.grid.appendChild(h);
-      els.grid.appendChild(wrap);
+    timelineTail = { key: null, wrap: null };
+    for (const [key, grp] of ordered) {
+      const wrap = appendTimelineGroup(key, grp.label);
       grp.arr.forEach(it => appendCardTo(it, wrap));
     }
     if (!state.items.some(i => i.id === state.selectedId)) {
@@ -2578,13 +2609,25 @@ async function renameOrMergePerson(pid, name) {
     } catch {}
     // Optionally kick off a quick unknown-face re-match pass (non-blocking)
     fetch('/api/faces/match-unknown', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ limit: 1000 }) })
-      .then(r=>r.json().catch(()=>({}))).then((d2)=>{ if (d2 && d2.ok && d2.matched>0) showStatus(`Matchede ${d2.matched} ukendte ansigt(er).`, 'ok'); }).catch(()=>{});
+      .then(r=>r.json().catch(()=>({}))).then((d1)=> (d1 && d1.ok) ? waitForMatchUnknownDone() : null)
+      .then((d2)=>{ if (d2 && d2.ok && d2.matched>0) showStatus(`Matchede ${d2.matched} ukendte ansigt(er).`, 'ok'); }).catch(()=>{});
     closePersonRenameMenu();
   } catch {
     showStatus(tr('person_rename_merge_error'), 'err');
   }
 }
 
+// Poll the background unknown-face matching job until it finishes; resolves to its result
+async function waitForMatchUnknownDone(intervalMs = 1000) {
+  for (;;) {
+    await new Promise((resolve) => setTimeout(resolve, intervalMs));
+    const r = await fetch('/api/faces/match-unknown/status');
+    const d = await r.json().catch(() => ({}));
+    if (!r.ok || !d || !d.ok) return null;
+    if (!d.running) return d.last || d;
+  }
+}
+
 async function matchUnknownFaces(limit = 1000) {
   const btn = document.getElementById('peopleMatchScanBtn');
   const orig = btn ? btn.textContent : tr('people_match_btn');
@@ -2598,8 +2641,10 @@ async function matchUnknownFaces(limit = 1000) {
       headers: { 'Content-Type': 'application/json' },
       body: JSON.stringify({ limit: Number(limit) || 1000 }),
     });
-    const data = await res.json().catch(() => ({}));
-    if (!res.ok || !data || !data.ok) {
+    const started = await res.json().catch(() => ({}));
+    // 409 = a pass is already running; just wait for that one
+    const data = (res.ok && started && started.ok) || res.status === 409 ? await waitForMatchUnknownDone() : started;
+    if (!data || !data.ok) {
       showStatus((data && data.error) || tr('people_match_failed'), 'err');
       setTopStatusIndeterminate(false);
       hideTopStatusMessage();
@@ -2975,14 +3020,25 @@ function nextViewer(step=1) {
   animateViewerSlideTransition(step, () => openViewer(state.selectedIndex));
 }
 
-async function loadPhotos() {
-  const qs = new URLSearchParams({
+const PHOTOS_PAGE_SIZE = 300;
+const PHOTOS_PREFETCH_PX = 1500;
+
+function photosQueryParams() {
+  return new URLSearchParams({
     q: state.q,
     view: state.view,
     sort: state.sort,
     folder: state.folder || "",
     search_lang: state.searchLanguage || 'da',
   });
+}
+
+async function loadPhotos() {
+  const seq = ++state.photosLoadSeq;
+  // Timeline streams pages as the user scrolls; other views (map, folders) need the full list
+  const paged = state.view === 'timeline';
+  const qs = photosQueryParams();
+  if (paged) qs.set('limit', String(PHOTOS_PAGE_SIZE));
 
   const res = await fetch(`/api/photos?${qs.toString()}`);
   let data;
@@ -2992,6 +3048,9 @@ async function loadPhotos() {
   } catch (_) {
     data = null;
   }
+  // A newer loadPhotos() (view/search/sort change) has taken over
+  if (seq !== state.photosLoadSeq) return;
+  state.photosCursor = null;
   if (!data) {
     const text = await res.text().catch(()=> '');
     console.warn('photos non-JSON svar', { status: res.status, text: text?.slice(0, 200) });
@@ -2999,6 +3058,7 @@ async function loadPhotos() {
     state.items = [];
   } else {
     state.items = data.items || [];
+    if (paged && data.next_cursor) state.photosCursor = data.next_cursor;
   }
 
   const labels = navLabels();
@@ -3007,8 +3067,43 @@ async function loadPhotos() {
   els.viewSubtitle.textContent = subtitle;
 
   renderGrid();
+  if (paged) maybeLoadMorePhotos();
+}
+
+async function maybeLoadMorePhotos() {
+  if (state.view !== 'timeline' || !state.photosCursor || !els.grid) return;
+  const seq = state.photosLoadSeq;
+  if (state.photosLoadingMore === seq) return;
+  if (els.grid.getBoundingClientRect().bottom - window.innerHeight > PHOTOS_PREFETCH_PX) return;
+  state.photosLoadingMore = seq;
+  let more = null;
+  try {
+    const qs = photosQueryParams();
+    qs.set('limit', String(PHOTOS_PAGE_SIZE));
+    qs.set('cursor', state.photosCursor);
+    const res = await fetch(`/api/photos?${qs.toString()}`);
+    const data = await res.json();
+    if (seq !== state.photosLoadSeq) return;
+    if (!res.ok || !data || !Array.isArray(data.items)) return;
+    state.photosCursor = data.next_cursor || null;
+    more = data.items;
+  } catch (e) {
+    console.warn('photos page failed', e);
+  } finally {
+    if (state.photosLoadingMore === seq) state.photosLoadingMore = 0;
+  }
+  if (!more || seq !== state.photosLoadSeq || state.view !== 'timeline') return;
+  const known = new Set(state.items.map(i => i.id));
+  const fresh = more.filter(i => !known.has(i.id));
+  state.items = state.items.concat(fresh);
+  appendTimelineItems(fresh);
+  // Keep filling while the bottom of the timeline is still in view
+  (window.requestAnimationFrame || setTimeout)(() => maybeLoadMorePhotos());
 }
 
+document.addEventListener('scroll', () => { maybeLoadMorePhotos(); }, { passive: true, capture: true });
+window.addEventListener('resize', () => { maybeLoadMorePhotos(); });
+
 async function loadPeople(useCache = true) {
   closePersonRenameMenu();
   try {
@@ -3596,14 +3691,11 @@ async function runUploadPostprocess(onProgress = null) {
       indexed: 0,
       index_errors: 0,
       faces_enabled: false,
-      faces_done: 0,
-      faces_errors: 0,
+      faces_queued: 0,
       ai_enabled: false,
-      ai_done: 0,
-      ai_errors: 0,
+      ai_queued: 0,
       ai_desc_enabled: false,
-      ai_desc_done: 0,
-      ai_desc_errors: 0,
+      ai_desc_queued: 0,
     };
   }
 
@@ -3628,14 +3720,11 @@ async function runUploadPostprocess(onProgress = null) {
         indexed: 0,
         index_errors: 0,
         faces_enabled: false,
-        faces_done: 0,
-        faces_errors: 0,
+        faces_queued: 0,
         ai_enabled: false,
-        ai_done: 0,
-        ai_errors: 0,
+        ai_queued: 0,
         ai_desc_enabled: false,
-        ai_desc_done: 0,
-        ai_desc_errors: 0,
+        ai_desc_queued: 0,
       };
     }
   }
@@ -4032,13 +4121,13 @@ async function uploadFiles(fileList, options = {}) {
           const postParts = [
             `thumbs: ${thumbsDone}${Number(post.thumb_errors || 0) ? ` (fejl: ${Number(post.thumb_errors || 0)})` : ''}`,
             `${Number(post.heic_converted || 0) ? `konverteret: ${Number(post.heic_converted || 0)}` : ''}`,
-            `ansigter: ${Number(post.faces_done || 0)}${Number(post.faces_errors || 0) ? ` (fejl: ${Number(post.faces_errors || 0)})` : ''}`,
-            `embeddings: ${Number(post.ai_done || 0)}${Number(post.ai_errors || 0) ? ` (fejl: ${Number(post.ai_errors || 0)})` : ''}`,
-            `beskrivelser: ${Number(post.ai_desc_done || 0)}${Number(post.ai_desc_errors || 0) ? ` (fejl: ${Number(post.ai_desc_errors || 0)})` : ''}`,
+            `${Number(post.faces_queued || 0) ? `ansigter i kø: ${Number(post.faces_queued || 0)}` : ''}`,
+            `${Number(post.ai_queued || 0) ? `embeddings i kø: ${Number(post.ai_queued || 0)}` : ''}`,
+            `${Number(post.ai_desc_queued || 0) ? `beskrivelser i kø: ${Number(post.ai_desc_queued || 0)}` : ''}`,
           ];
           showStatus(
             `${uploadWasStopped ? 'Upload stoppet' : 'Upload færdig'}: ${uploadSessionSavedTotal} fil(er)${uploadUiState.failedFiles ? `, fejl: ${uploadUiState.failedFiles}` : ''} · ${postParts.filter(Boolean).join(' · ')}`,
-            (uploadUiState.failedFiles || Number(post.index_errors || 0) || Number(post.faces_errors || 0) || Number(post.ai_errors || 0) || Number(post.ai_desc_errors || 0)) ? 'err' : 'ok'
+            (uploadUiState.failedFiles || Number(post.index_errors || 0)) ? 'err' : 'ok'
           );
         } else {
           showStatus(
@@ -9124,16 +9213,59 @@ async function renderProfilePanel() {
 }
 
 // Duplicates UI
-async function fetchDuplicates() {
+let dupeData = null;
+
+async function waitForDuplicateJob(dist) {
+  for (;;) {
+    await new Promise(r => setTimeout(r, 1500));
+    const st = await (await fetch('/api/duplicates/status')).json();
+    if (!st || !st.running) return st;
+    if (els.dupeStatus) els.dupeStatus.textContent = `Bygger duplet-grupper (afstand=${dist})... ${st.photos || 0} billeder`;
+  }
+}
+
+async function fetchDuplicates(ev, more = false) {
   const dist = parseInt(els.dupeDist ? els.dupeDist.value : 5, 10) || 5;
   const min = parseInt(els.dupeMin ? els.dupeMin.value : 2, 10) || 2;
+  const mode = els.dupeMode ? els.dupeMode.value : 'phash';
+  if (dupeData && dupeData.mode !== mode) more = false;
+  const offset = more && dupeData ? (dupeData.offset || 0) + (dupeData.limit || 0) : 0;
   try {
     if (els.dupeStatus) { els.dupeStatus.textContent = `Søger efter dupletter (afstand=${dist}, min=${min})...`; els.dupeStatus.classList.remove("hidden", "err"); els.dupeStatus.classList.add("ok"); }
-    if (els.dupeResults) els.dupeResults.innerHTML = "";
-    const res = await fetch(`/api/duplicates?distance=${encodeURIComponent(dist)}&min=${encodeURIComponent(min)}`);
-    const data = await res.json();
-    renderDuplicates(data);
-    if (els.dupeStatus) { els.dupeStatus.textContent = `Færdig. Checksum-grupper: ${data?.counts?.checksum || 0}, pHash-lige: ${data?.counts?.phash_equal || 0}, pHash-nære: ${data?.counts?.phash_near || 0}`; }
+    if (!more && els.dupeResults) els.dupeResults.innerHTML = "";
+    const url = () => `/api/duplicates?mode=${encodeURIComponent(mode)}&distance=${encodeURIComponent(dist)}&min=${encodeURIComponent(min)}&offset=${offset}`;
+    let data = await (await fetch(url())).json();
+    if (data && data.stale) {
+      // Stored groups were built at another distance (or never): rebuild, then reload
+      if (!data.running) await fetch('/api/duplicates/start', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ mode, distance: dist, full: true }) });
+      await waitForDuplicateJob(dist);
+      data = await (await fetch(url())).json();
+    }
+    if (more && dupeData && data && data.groups) {
+      for (const g of data.groups) {
+        const prev = dupeData.groups.find(x => x.reason === g.reason);
+        if (prev) { prev.items = prev.items.concat(g.items); prev.has_more = g.has_more; } else dupeData.groups.push(g);
+      }
+      dupeData.offset = data.offset; dupeData.limit = data.limit; dupeData.counts = data.counts;
+    } else {
+      dupeData = data;
+    }
+    renderDuplicates(dupeData);
+    if (dupeData && (dupeData.groups || []).some(g => g.has_more) && els.dupeResults) {
+      const moreBtn = document.createElement('button');
+      moreBtn.className = 'btn';
+      moreBtn.textContent = 'Vis flere';
+      moreBtn.addEventListener('click', () => fetchDuplicates(null, true));
+      els.dupeResults.appendChild(moreBtn);
+    }
+    const summary = mode === 'embedding'
+      ? `Lignende: ${data?.counts?.similar || 0}, serier: ${data?.counts?.burst || 0}`
+      : `Checksum-grupper: ${data?.counts?.checksum || 0}, pHash-lige: ${data?.counts?.phash_equal || 0}, pHash-nære: ${data?.counts?.phash_near || 0}`;
+    if (els.dupeStatus) { els.dupeStatus.textContent = `Færdig. ${summary}${data?.pending ? ` (${data.pending} ændringer venter)` : ''}`; }
+    if (!more && data && data.running && data.pending && !data.stale) {
+      // Changed photos are being applied in the background: show the stored groups now, reload after
+      waitForDuplicateJob(dist).then(() => fetchDuplicates(null)).catch(() => {});
+    }
   } catch (e) {
     if (els.dupeStatus) { els.dupeStatus.textContent = `Fejl ved duplet-søgning.`; els.dupeStatus.classList.remove("ok"); els.dupeStatus.classList.add("err"); }
   }
@@ -9231,7 +9363,7 @@ function renderDuplicates(data) {
     if (!sets.length) continue;
     const sec = document.createElement("section");
     sec.className = "dupe-group";
-    const titleMap = { checksum: "Checksum", phash_equal: "pHash (ens)", phash_near: `pHash (nær)` };
+    const titleMap = { checksum: "Checksum", phash_equal: "pHash (ens)", phash_near: `pHash (nær)`, similar: "Lignende (AI)", burst: "Serier" };
     const name = titleMap[grp.reason] || grp.reason;
     const header = document.createElement('h4');
     header.textContent = `${name} · ${sets.length} grupper`;
@@ -9350,6 +9482,9 @@ async function pollLogs() {
         if (typeof it.ai_errors !== "undefined") extra += ` ai_errors=${it.ai_errors}`;
         if (typeof it.ai_desc_done !== "undefined") extra += ` ai_desc=${it.ai_desc_done}`;
         if (typeof it.ai_desc_errors !== "undefined") extra += ` ai_desc_errors=${it.ai_desc_errors}`;
+        if (typeof it.faces_queued !== "undefined") extra += ` faces_queued=${it.faces_queued}`;
+        if (typeof it.ai_queued !== "undefined") extra += ` ai_queued=${it.ai_queued}`;
+        if (typeof it.ai_desc_queued !== "undefined") extra += ` ai_desc_queued=${it.ai_desc_queued}`;
         if (it.error) extra += ` :: ${it.error}`;
         const label = (it.event === 'skip_unchanged' || it.event === 'no_new') ? 'no new' : it.event;
         const msg = `[${fmtLogTime(it.t)}] ${label}${extra}`;
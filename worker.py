@@ -0,0 +1,20 @@
+import signal
+import threading
+
+from app import init_db, log_event, run_work_queue_worker
+
+# Standalone work-queue worker (AI embeddings/descriptions, faces, upload post-processing).
+# Run next to the web service with WORK_QUEUE_WORKER=external there:  python worker.py
+# Several workers (and web processes with the embedded worker) can share one queue.
+
+if __name__ == "__main__":
+    stop = threading.Event()
+
+    def _stop(signum, frame):
+        log_event("work_worker_signal", signal=signum)
+        stop.set()
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+    init_db()
+    run_work_queue_worker(stop)